@@ -116,6 +116,15 @@ class Classifier:
 	    items.append((k, v))
 	return items
 
+    def partition_stats(self, iterable):
+	# Like partition but gives (kind, count, size, set) tuples,
+	# counted and sized while classifying.
+	ps = self.call_with_referrers(
+	    iterable,
+	    lambda a: self.cli.partition_stats(a, self.mod.hv, 1))
+	return [(self.get_kind(k), count, size, self.mod.Use.idset(v, er=self.er))
+		for k, (count, size, v) in ps.items()]
+
     def partition_cli(self, a):
 	ep = self.call_with_referrers(
 	    a,
@@ -383,6 +392,59 @@ The classification will be individual memory size of the object."""
 	    return '%9d'%cla.arg
 
 
+class SiteFamily:
+    def __init__(self, mod, classifier):
+	self.defrefining(mod.Use.Anything)
+	self.classifier = classifier
+
+    def c_alt(self, a, alt):
+	return self.classifier.get_alt(a, alt)
+
+    def c_contains(self, a, b):
+	return a.arg == self.classifier.cli.classify(b)
+
+    def c_get_brief(self, a):
+	return '<site %s>'%self.classifier.get_tabrendering(a)
+
+    def c_repr(self, a):
+	return '%s(%s)'%(self.classifier.get_reprname(),
+			 self.classifier.get_userkindargrepr(a))
+
+
+class BySite(Classifier):
+    """bysite
+Classify by <allocation site>.
+The classification will be the (filename, lineno) where the object was
+allocated, or None if no site was recorded for it."""
+    def __init__(self, mod, name):
+	Classifier.__init__(self, mod, name)
+	self.family = mod.fam_mixin_argatom(SiteFamily, self)
+
+    def get_byname(self):
+	return 'allocation site'
+
+    def get_cli(self):
+	return self.mod.hv.cli_site(self.mod.View.site_horizons[0], {})
+
+    def get_tabheader(self, ctx=''):
+	return 'Allocation Site'
+
+    def get_tabrendering(self, cla, ctx=''):
+	if cla.arg is None:
+	    return '<unknown>'
+	return '%s:%d'%cla.arg
+
+    def get_userkind(self, filename=None, lineno=None):
+	if filename is None:
+	    return self.family(None)
+	return self.family((filename, int(lineno)))
+
+    def get_userkindargrepr(self, kind):
+	if kind.arg is None:
+	    return ''
+	return '%r, %d'%kind.arg
+
+
 class TypeFamily:
     def __init__(self, mod, classifier):
 	self.defrefining(mod.Use.Anything)
@@ -1332,6 +1394,9 @@ the object.
     def _get_Size(self):
 	return self._er_by_(ByIndiSize, self, 'Size')
 
+    def _get_Site(self):
+	return self._er_by_(BySite, self, 'Site')
+
     def _get_Type(self):
 	return self._er_by_(ByType, self, 'Type')
 
@@ -0,0 +1,761 @@
+#._cv_part guppy.heapy.HeapGraph
+
+# Reading of the heap graph files written by HeapView.export_graph,
+# for analysis of a heap outside of the process it was taken from.
+# The objects can be classified, by the names of their types and classes
+# and the owners of dicts written in the file, and their referrers and
+# dominators found, as for the IdentitySet of a heap in the process.
+
+# The kinds of reference, indexed by the relation kind in the file
+
+kindnames = ('', 'attribute', 'indexval', 'indexkey', 'interattr', 'hasattr',
+	     'local_var', 'cell', 'stack', 'relsrc')
+
+class HeapGraph:
+    # The objects and references of a heap graph file. An object is
+    # represented by its index in the file, the root being 0. Like a
+    # NodeGraph that is not a mapping, the graph maps each object to
+    # the objects it refers to, as a tuple, and iterates over the
+    # references as pairs. It is frozen; the columns are read from the
+    # memory mapped file into arrays once, and the referrers, dominator
+    # tree and index of addresses are computed by the _get_ methods
+    # when first needed.
+
+    def __init__(self, mod, fn, columns, eoff, edst, ekind, inv=None):
+	self.mod = mod
+	self._hiding_tag_ = mod._hiding_tag_
+	self.fn = fn
+	self.columns = columns
+	self.numnodes = len(columns['ADDR'])
+	self.eoff = eoff
+	self.edst = edst
+	self.ekind = ekind
+	if inv is not None:
+	    self.inv = inv
+
+    def __getattr__(self, name):
+	if name.startswith('_'):
+	    raise AttributeError, name
+	x = getattr(self, '_get_' + name)()
+	setattr(self, name, x)
+	return x
+
+    def __getitem__(self, i):
+	return tuple(self.edst[self.eoff[i]:self.eoff[i+1]])
+
+    def __iter__(self):
+	eoff = self.eoff
+	edst = self.edst
+	for i in xrange(self.numnodes):
+	    for e in xrange(eoff[i], eoff[i+1]):
+		yield (i, edst[e])
+
+    def __len__(self):
+	return len(self.edst)
+
+    def __repr__(self):
+	return '<%s of %d objects and %d references from %r>'%(
+	    self.__class__.__name__, self.numnodes, len(self), self.fn)
+
+    def _get_addrindex(self):
+	return dict([(a, i) for (i, a) in enumerate(self.columns['ADDR'])])
+
+    def _get_inv(self):
+	# The inverted graph, mapping each object to its referrers.
+	n = self.numnodes
+	edst = self.edst
+	count = self.mod.array_of('EOFF', [0] * (n + 1))
+	for d in edst:
+	    count[d + 1] += 1
+	for i in xrange(n):
+	    count[i + 1] += count[i]
+	pos = count[:]
+	src = self.mod.array_of('EDST', [0] * len(edst))
+	kind = self.mod.array_of('EKND', [0] * len(edst))
+	eoff = self.eoff
+	ekind = self.ekind
+	for i in xrange(n):
+	    for e in xrange(eoff[i], eoff[i+1]):
+		d = edst[e]
+		p = pos[d]
+		src[p] = i
+		kind[p] = ekind[e]
+		pos[d] = p + 1
+	return self.__class__(self.mod, self.fn, self.columns, count, src, kind,
+			      self)
+
+    def address(self, i):
+	return self.columns['ADDR'][i]
+
+    def brief(self, i):
+	# The kind and address of i; for a dict, the address of its owner.
+	o = -1
+	if self.columns['FLAG'][i] & self.mod.graph_dict:
+	    o = self.owner(i)
+	if o == -1:
+	    o = i
+	return '%s: %#x'%(self.clodoname(i), self.address(o))
+
+    def classname(self, i):
+	return self.columns['TNAM'][self.classes[i]]
+
+    def _get_classes(self):
+	# Files without classes have the types of old-style instances.
+	return self.columns.get('CLAS', self.columns['TYPE'])
+
+    def clodoname(self, i):
+	# The name of the kind of i as by Clodo, the class or dict of class.
+	if not self.columns['FLAG'][i] & self.mod.graph_dict:
+	    return self.classname(i)
+	o = self.owner(i)
+	if o == -1:
+	    return 'dict (no owner)'
+	return 'dict of ' + self.classname(o)
+
+    def heap(self):
+	# The objects in the visible heap, as a GraphSet.
+	return self.idset(self.nodes())
+
+    def idset(self, nodes):
+	return GraphSet(self, nodes)
+
+    def index(self, address):
+	# The index of the object at address, or -1 if there is none.
+	return self.addrindex.get(address, -1)
+
+    def is_hidden(self, i):
+	return bool(self.columns['FLAG'][i] & self.mod.graph_hidden)
+
+    def is_stopkind(self, i):
+	# Whether a reference pattern is to stop at i, as by RefPat.stopkind.
+	stoptypes = self.mod.graph_stoptypes
+	if self.typename(i) in stoptypes[0]:
+	    return True
+	if self.columns['FLAG'][i] & self.mod.graph_dict:
+	    o = self.owner(i)
+	    return o != -1 and self.typename(o) in stoptypes[1]
+	return False
+
+    def iso(self, *addresses):
+	# The objects at addresses, as a GraphSet.
+	nodes = []
+	for a in addresses:
+	    i = self.index(a)
+	    if i == -1:
+		raise ValueError, 'No object at address %#x in the graph.'%a
+	    nodes.append(i)
+	return self.idset(nodes)
+
+    def owner(self, i):
+	# The object that the dict i is the __dict__ of, or -1 if none.
+	owners = self.columns.get('OWNR')
+	if owners is None:
+	    return -1
+	return owners[i] - 1
+
+    def relations(self, i):
+	# The objects i refers to, as pairs of index and kind of reference.
+	return [(self.edst[e], kindnames[self.ekind[e]])
+		for e in xrange(self.eoff[i], self.eoff[i+1])]
+
+    def size(self, i):
+	return self.columns['SIZE'][i]
+
+    def typename(self, i):
+	return self.columns['TNAM'][self.columns['TYPE'][i]]
+
+    def kindname(self, by, i):
+	# The name of the kind of i by classifier by, as in a partition table.
+	if by == 'clodo':
+	    return self.clodoname(i)
+	if by == 'class':
+	    return self.classname(i)
+	if by == 'type':
+	    return self.typename(i)
+	if by == 'size':
+	    return '%9d'%self.size(i)
+	if by == 'id':
+	    return self.brief(i)
+	raise ValueError, 'No such classifier: %r.'%by
+
+    def nodes(self):
+	# The indexes of the objects that are in the visible heap,
+	# as in HeapView.heap().
+	flag = self.columns['FLAG']
+	hidden = self.mod.graph_hidden
+	return [i for i in xrange(self.numnodes) if not flag[i] & hidden]
+
+    def _levels(self, src, dsts):
+	# Breadth first from src, until one of the objects in dsts is
+	# found. Return the distance of each object found and the objects
+	# in dsts at the least distance, or None if none was reached.
+	dist = {src:0}
+	if src in dsts:
+	    return dist, [src]
+	level = [src]
+	d = 0
+	while level:
+	    d += 1
+	    next = []
+	    found = []
+	    for u in level:
+		for v in self[u]:
+		    if v not in dist:
+			dist[v] = d
+			next.append(v)
+			if v in dsts:
+			    found.append(v)
+	    if found:
+		return dist, found
+	    level = next
+	return None
+
+    def shpath(self, dst, src=0):
+	# A shortest path from src to dst, as a list of indexes, or None.
+	for p in self.shpaths(dst, src):
+	    return p
+	return None
+
+    def shpaths(self, dst, src=0):
+	# Generate the shortest paths from src to dst, as lists of indexes.
+	levels = self._levels(src, (dst,))
+	if levels is not None:
+	    for p in self._shpaths(levels[0], src, dst):
+		yield p
+
+    def _shpaths(self, dist, src, dst):
+	inv = self.inv
+	def nearer(v):
+	    # The referrers of v one step nearer to src, each taken once.
+	    d = dist[v] - 1
+	    refs = []
+	    for u in inv[v]:
+		if dist.get(u, -1) == d and u not in refs:
+		    refs.append(u)
+	    return refs
+	# Walk back from dst along referrers one step nearer to src;
+	# each stack entry is the referrers to take of its object and
+	# the position of the next one.
+	path = [dst]
+	stack = [(nearer(dst), 0)]
+	while stack:
+	    v = path[-1]
+	    refs, i = stack[-1]
+	    if v == src:
+		yield path[::-1]
+	    elif i < len(refs):
+		stack[-1] = (refs, i + 1)
+		path.append(refs[i])
+		stack.append((nearer(refs[i]), 0))
+		continue
+	    path.pop()
+	    stack.pop()
+
+    def _get_imdom(self):
+	# The immediate dominator of each object, -1 for the root,
+	# computed with the iterative algorithm of Cooper, Harvey and
+	# Kennedy in reverse postorder from the root.
+	n = self.numnodes
+	eoff = self.eoff
+	edst = self.edst
+	post = []
+	seen = [False] * n
+	seen[0] = True
+	stack = [(0, eoff[0])]
+	while stack:
+	    v, e = stack[-1]
+	    if e == eoff[v+1]:
+		post.append(v)
+		stack.pop()
+		continue
+	    stack[-1] = (v, e + 1)
+	    w = edst[e]
+	    if not seen[w]:
+		seen[w] = True
+		stack.append((w, eoff[w]))
+	order = post[::-1]
+	rpo = [0] * n
+	for i, v in enumerate(order):
+	    rpo[v] = i
+	inv = self.inv
+	ioff = inv.eoff
+	isrc = inv.edst
+	idom = [-1] * n
+	idom[0] = 0
+	changed = True
+	while changed:
+	    changed = False
+	    for v in order[1:]:
+		new = -1
+		for e in xrange(ioff[v], ioff[v+1]):
+		    p = isrc[e]
+		    if idom[p] == -1:
+			continue
+		    if new == -1:
+			new = p
+			continue
+		    a = p
+		    while a != new:
+			while rpo[a] > rpo[new]:
+			    a = idom[a]
+			while rpo[new] > rpo[a]:
+			    new = idom[new]
+		if idom[v] != new:
+		    idom[v] = new
+		    changed = True
+	idom[0] = -1
+	self.rpo = order
+	return idom
+
+    def _get_rpo(self):
+	# The objects in reverse postorder from the root.
+	self.imdom
+	return self.rpo
+
+    def _get_retained(self):
+	# The total size of the objects dominated by each object.
+	idom = self.imdom
+	retained = list(self.columns['SIZE'])
+	for v in reversed(self.rpo):
+	    if v:
+		retained[idom[v]] += retained[v]
+	return retained
+
+    def _get_domchildren(self):
+	# The objects immediately dominated by each object.
+	children = {}
+	idom = self.imdom
+	for v in self.rpo[1:]:
+	    children.setdefault(idom[v], []).append(v)
+	return children
+
+    def dominos(self, i):
+	# The indexes of the objects dominated by i, including i.
+	children = self.domchildren
+	res = [i]
+	for v in res:
+	    res.extend(children.get(v, ()))
+	return res
+
+    def domisize(self, i):
+	return self.retained[i]
+
+class GraphSet:
+    # A set of objects of a HeapGraph, by their indexes, with the
+    # attributes of an IdentitySet that can be found from the graph.
+    # Like an IdentitySet it is presented as a table partitioned by an
+    # equivalence relation, by default Clodo, and indexing gives the
+    # set of a row of that table. The byclodo, byclass, bytype, bysize
+    # and byid attributes give the same set partitioned by another
+    # relation.
+
+    def __init__(self, graph, nodes, by='clodo'):
+	self.graph = graph
+	self._hiding_tag_ = graph._hiding_tag_
+	self.nodes = frozenset(nodes)
+	self.by = by
+
+    def __getattr__(self, name):
+	if name.startswith('_'):
+	    raise AttributeError, name
+	x = getattr(self, '_get_' + name)()
+	setattr(self, name, x)
+	return x
+
+    def __and__(self, other):
+	return self.graph.idset(self.nodes & other.nodes)
+
+    def __contains__(self, i):
+	return i in self.nodes
+
+    def __eq__(self, other):
+	return isinstance(other, GraphSet) and self.nodes == other.nodes
+
+    def __hash__(self):
+	return hash(self.nodes)
+
+    def __getitem__(self, idx):
+	if isinstance(idx, slice):
+	    nodes = []
+	    for row in self.partition[idx]:
+		nodes.extend(row[1].nodes)
+	    return self.graph.idset(nodes)
+	return self.partition[idx][1]
+
+    def __iter__(self):
+	return iter(sorted(self.nodes))
+
+    def __len__(self):
+	return len(self.nodes)
+
+    def __ne__(self, other):
+	return not self == other
+
+    def __or__(self, other):
+	return self.graph.idset(self.nodes | other.nodes)
+
+    def __repr__(self):
+	return repr(self.stat)
+
+    __str__ = __repr__
+
+    def __sub__(self, other):
+	return self.graph.idset(self.nodes - other.nodes)
+
+    def _get_byclass(self):	return self.__class__(self.graph, self.nodes, 'class')
+    def _get_byclodo(self):	return self.__class__(self.graph, self.nodes, 'clodo')
+    def _get_byid(self):	return self.__class__(self.graph, self.nodes, 'id')
+    def _get_bysize(self):	return self.__class__(self.graph, self.nodes, 'size')
+    def _get_bytype(self):	return self.__class__(self.graph, self.nodes, 'type')
+
+    def _get_count(self):
+	return len(self.nodes)
+
+    def _get_dominos(self):
+	# The objects dominated by the set: those that can not be
+	# reached from the root without passing through one of them.
+	g = self.graph
+	if len(self.nodes) == 1:
+	    return g.idset([i for i in g.dominos(iter(self.nodes).next())
+			    if not g.is_hidden(i)])
+	if 0 in self.nodes:
+	    return g.heap()
+	seen = set(self.nodes)
+	seen.add(0)
+	stack = [0]
+	while stack:
+	    for v in g[stack.pop()]:
+		if v not in seen:
+		    seen.add(v)
+		    stack.append(v)
+	seen.difference_update(self.nodes)
+	return g.idset([i for i in xrange(g.numnodes)
+			if i not in seen and not g.is_hidden(i)])
+
+    def _get_domisize(self):
+	return self.dominos.size
+
+    def _get_imdom(self):
+	imdom = self.graph.imdom
+	return self.graph.idset([imdom[i] for i in self.nodes
+				 if imdom[i] != -1 and
+				 not self.graph.is_hidden(imdom[i])])
+
+    def _get_indisize(self):
+	return self.size
+
+    def _get_kindheader(self):
+	return self.graph.mod.graph_kindheaders[self.by]
+
+    def _get_more(self):
+	return self.stat.more
+
+    def _get_partition(self):
+	# The rows of the table, as (name, set) pairs ordered as in a
+	# SetPartition, by size and then name.
+	g = self.graph
+	by = self.by
+	if by == 'id':
+	    rows = [(-g.size(i), g.kindname(by, i), (i,)) for i in self.nodes]
+	else:
+	    parts = {}
+	    for i in self.nodes:
+		parts.setdefault(g.kindname(by, i), []).append(i)
+	    rows = [(-sum([g.size(i) for i in nodes]), name, nodes)
+		    for (name, nodes) in parts.items()]
+	rows.sort()
+	return [(name, g.idset(nodes)) for (minusize, name, nodes) in rows]
+
+    def _get_referents(self):
+	return self.graph.idset(self.relimg(self.graph))
+
+    def _get_referrers(self):
+	return self.graph.idset(self.relimg(self.graph.inv))
+
+    def _get_rp(self):
+	return self.get_rp()
+
+    def _get_size(self):
+	size = self.graph.size
+	return sum([size(i) for i in self.nodes])
+
+    def _get_sp(self):
+	return self.get_shpaths()
+
+    def _get_stat(self):
+	g = self.graph
+	if self.by == 'id':
+	    kinds = set([g.clodoname(i) for i in self.nodes])
+	    if len(kinds) == 1:
+		kindname = '<%s>'%kinds.pop()
+	    else:
+		kindname = '<mixed>'
+	    format = 'IdFormat'
+	    rows = ['.r: %d %s'%(s.size, name) for (name, s) in self.partition]
+	else:
+	    kindname = ''
+	    format = 'SetFormat'
+	    rows = ['.r: %d %d %s'%(s.count, s.size, name)
+		    for (name, s) in self.partition]
+	trows = [
+	    '.loader: _load_stat',
+	    '.format: %s'%format,
+	    '.timemade: %f'%g.mod.time.time(),
+	    '.count: %d'%self.count,
+	    '.size: %d'%self.size,
+	    '.kindname: %s'%kindname,
+	    '.kindheader: %s'%self.kindheader,
+	    '.numrows: %d'%len(rows)] + rows
+	return g.mod._load_stat(lambda: trows)
+
+    def relimg(self, graph):
+	# The visible objects that the objects of the set map to in graph.
+	nodes = set()
+	for i in self.nodes:
+	    nodes.update(graph[i])
+	return [i for i in nodes if not graph.is_hidden(i)]
+
+    def get_rp(self, depth=None):
+	if depth is None:
+	    depth = self.graph.mod.RefPat.depth
+	return GraphRefPat(self, depth)
+
+    def get_shpaths(self, src=0):
+	return GraphPaths(self.graph, src, self.nodes)
+
+class GraphPaths:
+    # The shortest paths from src to the objects in dsts nearest to it.
+
+    def __init__(self, graph, src, dsts):
+	self.graph = graph
+	self._hiding_tag_ = graph._hiding_tag_
+	self.paths = []
+	levels = graph._levels(src, dsts)
+	if levels is not None:
+	    dist, found = levels
+	    for dst in found:
+		self.paths.extend(graph._shpaths(dist, src, dst))
+
+    def __getitem__(self, idx):
+	return self.paths[idx]
+
+    def __len__(self):
+	return len(self.paths)
+
+    def __repr__(self):
+	return '\n'.join(['%2d: %s'%(i, self.pp(p))
+			  for (i, p) in enumerate(self.paths)])
+
+    __str__ = __repr__
+
+    def pp(self, path):
+	# A path written with the kinds and addresses of the objects,
+	# and the kind of each reference when it is known.
+	g = self.graph
+	strs = ['Root']
+	for u, v in zip(path, path[1:]):
+	    kinds = [k for (w, k) in g.relations(u) if w == v and k]
+	    if kinds:
+		strs.append('-%s->'%kinds[0])
+	    else:
+		strs.append('->')
+	    strs.append('<%s>'%g.brief(v))
+	return ' '.join(strs)
+
+class GraphRefPat:
+    # A reference pattern of a GraphSet, formed and presented as by
+    # RefPat.ReferencePattern: the referrers of the set partitioned by
+    # Clodo, their referrers in turn, and so on to depth.
+
+    def __init__(self, set, depth):
+	self.set = set
+	self.graph = set.graph
+	self._hiding_tag_ = set._hiding_tag_
+	self.depth = depth
+	self.lines = []
+	seen = {}
+	stack = [(set, [], None)]
+	while stack:
+	    (s, ixl, parent) = stack.pop()
+	    seenline = seen.get(s.nodes)
+	    line = GraphRefPatRow(self, s, ixl, parent, seenline)
+	    line.index = len(self.lines)
+	    self.lines.append(line)
+	    if seenline is None:
+		seen[s.nodes] = line
+	    children = s.referrers.partition
+	    line.isroot = not children
+	    if (seenline is None and line.depth < depth and
+		(line.depth == 0 or not line.isstop)):
+		for i in range(len(children) - 1, -1, -1):
+		    stack.append((children[i][1], ixl + [i], line))
+
+    def __getitem__(self, idx):
+	return self.lines[idx].set
+
+    def __len__(self):
+	return len(self.lines)
+
+    def __repr__(self):
+	return '\n'.join(['Reference Pattern by <[dict of] class>.'] +
+			 [str(line) for line in self.lines])
+
+    __str__ = __repr__
+
+class GraphRefPatRow:
+    def __init__(self, rp, set, ixl, parent, seenline):
+	self.rp = rp
+	self.set = set
+	self.ixl = ixl
+	self.parent = parent
+	self.seenline = seenline
+	if parent is None:
+	    self.depth = 0
+	else:
+	    self.depth = parent.depth + 1
+	g = set.graph
+	self.isstop = False not in [g.is_stopkind(i) for i in set.nodes]
+
+    def __str__(self):
+	# Formatted as RefPat.RefPatRow.__str__
+	mod = self.rp.graph.mod
+	prestr = '%2d: %s '%(self.index, mod.RefPat.ixl_as_str(self.ixl))
+	if self.index & 1:
+	    fillpat = ' ' * 100
+	else:
+	    fillpat = '-' * 100
+	fill = fillpat[len(prestr):9 + self.depth]
+	if self.seenline:
+	    ref = '[^ %s]'%self.seenline.index
+	elif self.isroot:
+	    ref = '[R]'
+	elif self.depth > 0 and self.isstop:
+	    ref = '[S]'
+	elif self.depth < self.rp.depth:
+	    ref = '[-]'
+	else:
+	    ref = '[+]'
+	prefix = '%s%s %s '%(prestr, fill, ref)
+	return prefix + self.getsummary(mod.RefPat.line_length - len(prefix))
+
+    def getsummary(self, max_len):
+	# As UniSet get_str_refpat, with the objects as addresses.
+	g = self.set.graph
+	part = self.set.byclodo.partition
+	if len(part) == 1:
+	    kind = part[0][0]
+	else:
+	    kind = '<mixed>'
+	s = '%d %s: '%(self.set.count, kind)
+	strs = []
+	lens = 0
+	for i in self.set.nodes:
+	    rs = '%#x'%g.address(i)
+	    if lens and lens + len(rs) + 2 >= max_len - len(s):
+		strs[-1] += '...'
+		break
+	    lens += len(rs) + 2
+	    strs.append(rs)
+	strs.sort()
+	s += ', '.join(strs)
+	if len(s) > max_len:
+	    s = s[:max_len - 3] + '...'
+	return s
+
+class _GLUECLAMP_:
+    _preload_ = ('_hiding_tag_',)
+    _imports_ = (
+	'_parent:RefPat',
+	'_parent.Part:_load_stat',
+	'_parent.View:_hiding_tag_',
+	'_root:array',
+	'_root:mmap',
+	'_root:struct',
+	'_root:sys',
+	'_root:time',
+	)
+
+    # The graph file format, see src/heapy/hv_export.c
+
+    graph_magic = 'HPYGRAPH'
+    graph_version = 1
+    graph_hidden = 1
+    graph_dict = 2
+
+    # The table headers of the classifications of a GraphSet
+
+    graph_kindheaders = {
+	'class':'Class',
+	'clodo':'Kind (class / dict of class)',
+	'id':'Brief',
+	'size':'Individual Size',
+	'type':'Type'}
+
+    # The names of the types that reference patterns stop at, and of the
+    # types of the owners of dicts they stop at, as RefPat.stopkind; they
+    # are the names written by Use.export_graph.
+
+    graph_stoptypes = (
+	('class', 'module', 'type', 'types.CodeType', 'types.FrameType'),
+	('class', 'module', 'type'))
+
+    # The struct code each column is read with, and its item size.
+    # The unsigned indexes and addresses are read as signed, so they
+    # are ints rather than longs; they are never that large.
+
+    graph_columns = {
+	'ADDR':('q', 8), 'SIZE':('q', 8), 'TYPE':('i', 4), 'CLAS':('i', 4),
+	'FLAG':('B', 1), 'OWNR':('i', 4), 'EOFF':('q', 8), 'EDST':('i', 4),
+	'EKND':('B', 1), 'TADR':('q', 8), 'TNAM':('s', 1)}
+
+    def array_of(self, tag, data):
+	# A new array for column tag, with the items in data.
+	code, itemsize = self.graph_columns[tag]
+	for c in 'BhilL':
+	    if (c.isupper() == code.isupper() and
+		self.array.array(c).itemsize == itemsize):
+		return self.array.array(c, data)
+	return list(data)
+
+    def load(self, fn):
+	"""load(fn) -> HeapGraph
+Load the heap graph file fn written by HeapView.export_graph."""
+	f = open(fn, 'rb')
+	try:
+	    buf = self.mmap.mmap(f.fileno(), 0, access=self.mmap.ACCESS_READ)
+	finally:
+	    f.close()
+	try:
+	    if buf[:8] != self.graph_magic:
+		raise ValueError, 'Format error in %r: not a heap graph file.'%fn
+	    for order in '<>':
+		version, nsections = self.struct.unpack_from(order+'II', buf, 8)
+		if version == self.graph_version:
+		    break
+	    else:
+		raise ValueError, 'Format error in %r: unsupported version.'%fn
+	    swap = order != {'little':'<', 'big':'>'}[self.sys.byteorder]
+	    section = self.struct.Struct(order+'4sIQQ')
+	    columns = {}
+	    for i in range(nsections):
+		tag, itemsize, offset, count = section.unpack_from(
+		    buf, 16 + i * section.size)
+		data = buf[offset:offset + itemsize * count]
+		if tag == 'TNAM':
+		    columns[tag] = data.split('\0')[:-1]
+		    continue
+		if tag not in self.graph_columns:
+		    continue	# Written by a later version
+		code, size = self.graph_columns[tag]
+		a = self.array_of(tag, ())
+		if isinstance(a, list):
+		    a = list(self.struct.unpack(order+code*count, data))
+		else:
+		    a.fromstring(data)
+		    if swap:
+			a.byteswap()
+		columns[tag] = a
+	finally:
+	    buf.close()
+	return HeapGraph(self, fn, columns, columns['EOFF'], columns['EDST'],
+			 columns['EKND'])
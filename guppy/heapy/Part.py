@@ -48,6 +48,33 @@ class Format(object):
 	impl.cum_size += size
 	return StatRow(count, size, kind, impl.cur_index, impl.cum_size)
 	
+    def load_statrow_csrk(self, r):
+	impl = self.impl
+	count, size, retained, kind = r.split(' ', 3)
+	count = int(count)
+	size = int(size)
+	impl.cum_size += size
+	return StatRow(count, size, kind, impl.cur_index, impl.cum_size,
+		       int(retained))
+
+    def load_statrow_cseek(self, r):
+	impl = self.impl
+	count, size, counterr, sizeerr, kind = r.split(' ', 4)
+	count = int(count)
+	size = int(size)
+	impl.cum_size += size
+	return StatRow(count, size, kind, impl.cur_index, impl.cum_size,
+		       counterr=int(counterr), sizeerr=int(sizeerr))
+
+    def load_statrow_cstk(self, r):
+	impl = self.impl
+	count, size, site, kind = r.split(' ', 3)
+	count = int(count)
+	size = int(size)
+	impl.cum_size += size
+	return StatRow(count, size, kind, impl.cur_index, impl.cum_size,
+		       site=site)
+
     def load_statrow_sk(self, r):
 	impl = self.impl
 	size, kind = r.split(' ', 1)
@@ -113,6 +140,93 @@ class SetFormat(Format):
     def load_statrow(self, r):
 	return self.load_statrow_csk(r)
 
+class RetainedFormat(SetFormat):
+    # A SetFormat with a column for the retained size of each row,
+    # as found by View.retained.
+    __slots__ = ()
+
+    def get_rowdata(self, row):
+	return '%d %d %d %s'%(row.count, row.size, row.retained, row.name)
+
+    def get_stat_header(self):
+	return (
+' Index  Count   %     Size   % Cumulative  %  Retained   % ')
+
+    def get_stat_data(self, row):
+	impl = self.impl
+	return SetFormat.get_stat_data(self, row) + '%9d %3d '%(
+	    row.retained, int('%.0f'%(row.retained * 100.0/impl.size)))
+
+    def load_statrow(self, r):
+	return self.load_statrow_csrk(r)
+
+class SitesFormat(SetFormat):
+    # A SetFormat with a column for the most common allocation site of
+    # the objects of each row, as classified by Site. The site has no
+    # spaces, so it can be a field of the row data.
+    __slots__ = ()
+
+    site_width = 24
+
+    def get_rowdata(self, row):
+	return '%d %d %s %s'%(row.count, row.size, row.site, row.name)
+
+    def get_stat_header(self):
+	return SetFormat.get_stat_header(self) + '%-*s '%(
+	    self.site_width, 'Site')
+
+    def get_stat_data(self, row):
+	site = row.site
+	if len(site) > self.site_width:
+	    # Keep the end, with the file name and line number
+	    site = '..' + site[2-self.site_width:]
+	return SetFormat.get_stat_data(self, row) + '%-*s '%(
+	    self.site_width, site)
+
+    def load_statrow(self, r):
+	return self.load_statrow_cstk(r)
+
+class SampleFormat(SetFormat):
+    # A SetFormat for the estimates of a sampling census, with the error
+    # bounds of the count and size of each row as percentages of them.
+    __slots__ = ()
+
+    def _percent_of(self, err, est):
+	if est:
+	    return min(int('%.0f'%(err * 100.0/est)), 999)
+	return 0
+
+    def get_label(self):
+	impl = self.impl
+	return (
+'Estimated partition of a set of %d+-%d objects, from a sample of %d.\n'
+'Total size = %d+-%d bytes. The bounds are for 95%% confidence.'%(
+    impl.count, impl.counterr, impl.samplesize, impl.size, impl.sizeerr))
+
+    def get_rowdata(self, row):
+	return '%d %d %d %d %s'%(row.count, row.size, row.counterr, row.sizeerr,
+				 row.name)
+
+    def get_stat_header(self):
+	return (
+' Index  Count   %  +-%     Size   %  +-% Cumulative  % ')
+
+    def get_stat_data(self, row):
+	format = '%6d %6d %3d %4d %8d %3d %4d %9d %3d '
+	impl = self.impl
+	fr = format % (
+	    row.index,
+	    row.count, int('%.0f'%(row.count * 100.0/impl.count)),
+	    self._percent_of(row.counterr, row.count),
+	    row.size, int('%.0f'%(row.size * 100.0/impl.size)),
+	    self._percent_of(row.sizeerr, row.size),
+	    row.cumulsize, int('%.0f'%(row.cumulsize * 100.0/impl.size)),
+	    )
+	return fr
+
+    def load_statrow(self, r):
+	return self.load_statrow_cseek(r)
+
 class IdFormat(Format):
     __slots__ = ()
     def get_label(self):
@@ -191,19 +305,26 @@ class DiffFormat(Format):
 	return self.load_statrow_csk(r)
 
 class StatRow(object):
-    __slots__ = 'count', 'size', 'name', 'index', 'cumulsize'
+    __slots__ = ('count', 'size', 'name', 'index', 'cumulsize', 'retained',
+		 'counterr', 'sizeerr', 'site')
 
-    def __init__(self, count, size, name, index=None, cumulsize=None):
+    def __init__(self, count, size, name, index=None, cumulsize=None,
+		 retained=None, counterr=None, sizeerr=None, site=None):
 	self.count = count
 	self.size = size
 	self.name = name
 	self.index = index
 	self.cumulsize = cumulsize
+	self.retained = retained
+	self.counterr = counterr
+	self.sizeerr = sizeerr
+	self.site = site
 
 class PartRow(StatRow):
     __slots__ = 'set', 'kind'
 
-    def __init__(self, count, size, name, index, cumulsize, set, kind):
+    def __init__(self, count, size, name, index, cumulsize, set, kind,
+		 retained=None):
 	self.count = count
 	self.size = size
 	self.name = name
@@ -211,6 +332,8 @@ class PartRow(StatRow):
 	self.cumulsize = cumulsize
 	self.set = set
 	self.kind = kind
+	self.retained = retained
+	self.site = None
 
 class Stat:
     def __init__(self, mod, get_trows, firstheader=''):
@@ -274,6 +397,13 @@ class Stat:
 	if getattr(self, 'b_count', None) is not None:
 	    trows.append('.b_count: %d'%self.b_count)
 	    trows.append('.b_size: %d'%self.b_size)
+	if getattr(self, 'samplesize', None) is not None:
+	    # The bounds of the rows are combined as if they were independent
+	    trows.append('.samplesize: %d'%self.samplesize)
+	    trows.append('.counterr: %d'%round(
+		sum([r.counterr**2 for r in rows])**0.5))
+	    trows.append('.sizeerr: %d'%round(
+		sum([r.sizeerr**2 for r in rows])**0.5))
 	for r in rows:
 	    trows.append('.r: %s'%self.format.get_rowdata(r))
 	return self.mod.load(trows)
@@ -349,12 +479,19 @@ class Stat:
 	    trows.append('.r: %d %d %s'%(r.count, r.size, r.name))
 	return self.mod.load(trows)
 	   
-    def dump(self, fn, mode='a'):
+    def dump(self, fn, mode='a', format='text'):
+	if format not in ('text', 'binary'):
+	    raise ValueError, "Argument 'format' must be 'text' or 'binary'."
 	if not hasattr(fn, 'write'):
+	    if format == 'binary' and 'b' not in mode:
+		mode += 'b'
 	    f = open(fn, mode)
 	else:
 	    f = fn
 	try:
+	    if format == 'binary':
+		f.write(self.mod.pack_binary_stat(self))
+		return
 	    for r in self.get_trows():
 		if not r[-1:] == '\n':
 		    r += '\n'
@@ -544,6 +681,16 @@ class Partition:
 	for idx in range(self.numrows):
 	    yield self.get_rowset(idx)
 
+    def get_shpaths_all(self, k=None, src=None, avoid_nodes=None,
+			avoid_edges=(), first=None):
+	# The shortest paths to each of the first k rows, all by default,
+	# searched for together rather than row by row.
+	if k is None or k > self.numrows:
+	    k = self.numrows
+	rows = [self.get_row(i) for i in range(k)]
+	return self.mod.Path.shpgraph_rows(self, rows, src, avoid_nodes,
+					   avoid_edges, first)
+
     def get_stat(self):
         # Avoid any references into the set!
         trows = list(self.get_trows())
@@ -690,23 +837,59 @@ class IdentityPartition(Partition):
 
 
 class SetPartition(Partition):
-    def __init__(self, mod, set, er):
+    def __init__(self, mod, set, er, retained=False, sortby='size',
+		 sites=False):
 	Partition.__init__(self, mod, set, er)
 
+	if sortby not in ('size', 'retained'):
+	    raise ValueError, "Argument 'sortby' must be 'size' or 'retained'."
+	if sortby == 'retained':
+	    retained = True
+	if retained and sites:
+	    raise ValueError, \
+		  'Retained sizes and sites can not be shown in the same table.'
+
 	classifier = er.classifier
-	tosort = [(-part.size, classifier.get_tabrendering(kind, ''), kind, part)
-		  for (kind, part) in classifier.partition(set.nodes)]
+	if retained:
+	    # The retained sizes of all the kinds are found in one pass over
+	    # the dominator tree. They are looked up by the low-level kinds,
+	    # which are the same objects as in the partition since both
+	    # are memoized by the same low-level classifier.
+	    cli = classifier.cli
+	    rets = {}
+	    for (k, count, size) in classifier.call_with_referrers(
+		set.nodes, lambda X: set.fam.View.retained(cli, X)):
+		rets[id(k)] = size
+	    ep = classifier.call_with_referrers(set.nodes, cli.epartition)
+	    items = []
+	    for k in ep.get_domain():
+		part = mod.idset(ep[k], er=er)
+		items.append((classifier.get_kind(k), part.count, part.size,
+			      part, rets.get(id(k), 0)))
+	else:
+	    # The counts and sizes come from the same pass as the classification
+	    items = [(kind, count, size, part, None)
+		     for (kind, count, size, part) in
+		     classifier.partition_stats(set.nodes)]
+	if sortby == 'retained':
+	    tosort = [(-ret, -size, classifier.get_tabrendering(kind, ''),
+		       kind, count, part, ret)
+		      for (kind, count, size, part, ret) in items]
+	else:
+	    tosort = [(0, -size, classifier.get_tabrendering(kind, ''),
+		       kind, count, part, ret)
+		      for (kind, count, size, part, ret) in items]
 	tosort.sort()
 	cumulsize = 0
 	rows = []
-	for (minusize, name, kind, part) in tosort:
+	for (minusret, minusize, name, kind, count, part, ret) in tosort:
 	    size = -minusize
 	    cumulsize += size
 	    # assert size == part.size
 	    rows.append(PartRow(
-		part.count, size, name,
+		count, size, name,
 		len(rows), cumulsize,
-		part, kind))
+		part, kind, ret))
 	    
         # No check. Sizes may change. Note feb 8 2006.
         #assert cumulsize == set.size
@@ -718,16 +901,29 @@ class SetPartition(Partition):
 	self.rows = rows
 	self.size = cumulsize
 
-	self.init_format(SetFormat)
+	if sites:
+	    # The site of the row is the one with most of its size
+	    site = mod.Site.classifier
+	    for row in rows:
+		best = None
+		for (kind, count, size, part) in site.partition_stats(
+		    row.set.nodes):
+		    if best is None or size > best[0]:
+			best = (size, site.get_tabrendering(kind, ''))
+		row.site = best[1].replace(' ', '_')
+
+	if retained:
+	    self.init_format(RetainedFormat)
+	elif sites:
+	    self.init_format(SitesFormat)
+	else:
+	    self.init_format(SetFormat)
 
     def get_nodeset(self, start, stop, step):
 	if step <= 0:
 	    raise ValueError, 'Step must be positive.'
-	ns = self.mod.mutnodeset()	
-	while start < stop:
-	    ns |= self.rows[start].set.nodes
-	    start += step
-	return ns
+	return self.mod.immnodeset_union(
+	    [row.set.nodes for row in self.rows[start:stop:step]])
 
     def get_row(self, idx):
 	try:
@@ -739,20 +935,266 @@ class SetPartition(Partition):
 	return self.get_row(idx).set
 
 
+class BinaryStat(Stat):
+    # A Stat backed by one record of a binary stat file.
+    # The header is decoded when created, the rows when requested,
+    # directly from the buffer (typically an mmap) at their fixed offsets.
+    # See _GLUECLAMP_.pack_binary_stat for the record layout.
+
+    def __init__(self, mod, buf, pos, firstheader=''):
+	self.mod = mod
+	self._hiding_tag_ = mod._hiding_tag_
+	self.firstheader = firstheader
+	self.buf = buf
+	self.loader = '_load_stat'
+
+	(magic, version, flags, reclen, self.timemade, self.count, self.size,
+	 b_count, b_size, self.numrows, numstrings) = mod.binstat_header.unpack_from(
+	     buf, pos)
+	if flags & mod.binstat_has_b:
+	    self.b_count = b_count
+	    self.b_size = b_size
+
+	self.rowpos = pos + mod.binstat_header.size
+	self.strpos = self.rowpos + self.numrows * mod.binstat_row.size
+	if flags & mod.binstat_has_r:
+	    self.retpos = self.strpos
+	    self.strpos += self.numrows * mod.binstat_retained.size
+	else:
+	    self.retpos = None
+	if flags & mod.binstat_has_s:
+	    self.sitepos = self.strpos
+	    self.strpos += self.numrows * mod.binstat_offset.size
+	else:
+	    self.sitepos = None
+	self.blobpos = self.strpos + numstrings * mod.binstat_offset.size
+	self.cumulsizes = None
+
+	self.format_name = self.get_string(0)
+	self.kindheader = self.get_string(1)
+	self.kindname = self.get_string(2)
+	self.format_class = getattr(self.mod, self.format_name)
+	self.format = self.format_class(self)
+
+    def get_cumulsize(self, idx):
+	if self.cumulsizes is None:
+	    row = self.mod.binstat_row
+	    cumulsize = 0
+	    cumulsizes = []
+	    for i in range(self.numrows):
+		cumulsize += row.unpack_from(self.buf, self.rowpos + i * row.size)[1]
+		cumulsizes.append(cumulsize)
+	    self.cumulsizes = cumulsizes
+	return self.cumulsizes[idx]
+
+    def get_row(self, idx):
+	if not (0 <= idx < self.numrows):
+	    raise IndexError, 'Row index out of range.'
+	row = self.mod.binstat_row
+	count, size, name = row.unpack_from(self.buf, self.rowpos + idx * row.size)
+	if self.retpos is not None:
+	    ret = self.mod.binstat_retained
+	    retained = ret.unpack_from(self.buf, self.retpos + idx * ret.size)[0]
+	else:
+	    retained = None
+	if self.sitepos is not None:
+	    off = self.mod.binstat_offset
+	    site = self.get_string(
+		off.unpack_from(self.buf, self.sitepos + idx * off.size)[0])
+	else:
+	    site = None
+	return StatRow(count, size, self.get_string(name), idx,
+		       self.get_cumulsize(idx), retained, site=site)
+
+    def get_string(self, idx):
+	offset = self.mod.binstat_offset
+	if idx:
+	    start = offset.unpack_from(self.buf, self.strpos + (idx - 1) * offset.size)[0]
+	else:
+	    start = 0
+	end = offset.unpack_from(self.buf, self.strpos + idx * offset.size)[0]
+	return self.buf[self.blobpos + start : self.blobpos + end]
+
+    def get_trows(self):
+	yield '.loader: %s'%self.loader
+	yield '.format: %s'%self.format_name
+	yield '.timemade: %f'%self.timemade
+	if getattr(self, 'b_count', None) is not None:
+	    yield '.b_count: %d'%self.b_count
+	    yield '.b_size: %d'%self.b_size
+	yield '.count: %d'%self.count
+	yield '.size: %d'%self.size
+	yield '.kindname: %s'%self.kindname
+	yield '.kindheader: %s'%self.kindheader
+	yield '.numrows: %d'%self.numrows
+	for row in self.get_rows():
+	    yield '.r: %s'%self.format.get_rowdata(row)
+
+class StatFile(object):
+    # The samples in a file of dumped stats, as a sequence of Stat objects.
+    # The file may be appended to while it is in use; refresh() indexes
+    # the samples that have been completely written since last time,
+    # starting at the end of those indexed before.
+
+    tail_size = 64	# Bytes compared to detect that a file was rewritten
+
+    def __init__(self, mod, fn):
+	self.mod = mod
+	self._hiding_tag_ = mod._hiding_tag_
+	self.fn = fn
+	self.f = None
+	self.refresh()
+
+    def __getitem__(self, idx):
+	if isinstance(idx, slice):
+	    return [self[i] for i in range(*idx.indices(len(self.offsets)))]
+	if idx < 0:
+	    idx += len(self.offsets)
+	if not (0 <= idx < len(self.offsets)):
+	    raise IndexError, 'Sample index out of range.'
+	return self.get_sample(idx)
+
+    def __iter__(self):
+	idx = 0
+	while idx < len(self.offsets):
+	    yield self[idx]
+	    idx += 1
+
+    def __len__(self):
+	return len(self.offsets)
+
+    def is_rewritten(self):
+	# True if fn is not the file indexed anymore,
+	# or if the data indexed has been written over.
+	try:
+	    st = self.mod.stat(self.fn)
+	except OSError:
+	    return False	# Keep what we have.
+	fst = self.mod.fstat(self.f.fileno())
+	if ((st.st_ino, st.st_dev) != (fst.st_ino, fst.st_dev) or
+	    fst.st_size < self.end):
+	    return True
+	self.f.seek(self.end - len(self.tail))
+	return self.f.read(len(self.tail)) != self.tail
+
+    def news(self):
+	# Generate the samples appended since last time.
+	numold, numnew = self.refresh()
+	for idx in range(numold, numold + numnew):
+	    yield self[idx]
+
+    def open(self):
+	if self.f is not None:
+	    self.f.close()
+	self.f = open(self.fn, 'rb')
+	self.offsets = []
+	self.end = 0
+	self.tail = ''
+
+    def refresh(self):
+	# Index the complete samples appended since last time.
+	# Returns (numold, numnew) where numold is the number of samples
+	# indexed before, or 0 if the file was rewritten and reindexed.
+	if self.f is None or self.is_rewritten():
+	    self.open()
+	numold = len(self.offsets)
+	self.index_new()
+	start = max(0, self.end - self.tail_size)
+	self.f.seek(start)
+	self.tail = self.f.read(self.end - start)
+	return numold, len(self.offsets) - numold
+
+class BinaryStatFile(StatFile):
+    # The file is memory mapped and indexed by following the record
+    # length fields, so only the record headers are read until a sample
+    # is actually looked at.
+
+    def get_sample(self, idx):
+	return BinaryStat(self.mod, self.buf, self.offsets[idx])
+
+    def index_new(self):
+	mod = self.mod
+	size = mod.fstat(self.f.fileno()).st_size
+	if size > self.bufsize:
+	    # Stats made from a previous map keep that map alive.
+	    self.buf = mod.mmap.mmap(self.f.fileno(), size,
+				     access=mod.mmap.ACCESS_READ)
+	    self.bufsize = size
+	pos = self.end
+	prefix = mod.binstat_prefix
+	while pos + mod.binstat_header.size <= self.bufsize:
+	    magic, version, flags, reclen = prefix.unpack_from(self.buf, pos)
+	    if magic != mod.binstat_magic:
+		raise ValueError, 'Format error in %r: no record at offset %d.'%(
+		    self.fn, pos)
+	    if version > mod.binstat_version:
+		raise ValueError, 'Format error in %r: unsupported version %d.'%(
+		    self.fn, version)
+	    if pos + reclen > self.bufsize:
+		break		# Not completely written yet
+	    self.offsets.append(pos)
+	    pos += reclen
+	self.end = pos
+
+    def open(self):
+	StatFile.open(self)
+	self.buf = None
+	self.bufsize = 0
+
+class TextStatFile(StatFile):
+    # The samples are parsed when indexed and kept,
+    # only the data appended is read by refresh().
+
+    def get_sample(self, idx):
+	return self.stats[idx]
+
+    def index_new(self):
+	self.f.seek(self.end)
+	data = self.f.read()
+	lines = []
+	start = pos = 0
+	while 1:
+	    nl = data.find('\n', pos)
+	    if nl < 0:
+		break		# The rest is not completely written yet
+	    line = data[pos:nl+1]
+	    pos = nl + 1
+	    if not lines and not line.strip():
+		start = pos
+		continue
+	    lines.append(line)
+	    if line.startswith('.end:'):
+		self.stats.append(self.mod.load(lines))
+		self.offsets.append(self.end + start)
+		lines = []
+		start = pos
+	self.end += start
+
+    def open(self):
+	StatFile.open(self)
+	self.stats = []
+
 class _GLUECLAMP_:
     _preload_ = ('_hiding_tag_',)
     _chgable_ = ('line_length', 'backup_suffix')
     _imports_ = (
+	'_parent:Path',
 	'_parent.OutputHandling:output_buffer',
 	'_parent.OutputHandling:basic_more_printer',
+	'_parent.ImpSet:immnodeset_union',
 	'_parent.ImpSet:mutnodeset',
 	'_parent.Use:Id',
+	'_parent.Use:Site',
 	'_parent.Use:Size',
 	'_parent.Use:idset',
 	'_parent.Use:load',
 	'_parent.View:_hiding_tag_',
 	'_parent.View:observation_list',
+	'_root.os:fstat',
 	'_root.os:rename',
+	'_root.os:stat',
+	'_root:mmap',
+	'_root:struct',
 	'_root.textwrap:fill',
 	'_root.textwrap:wrap',
 	'_root.textwrap:wrap',
@@ -763,16 +1205,190 @@ class _GLUECLAMP_:
 
     line_length = 100
     backup_suffix = '.old'
+
+    # Binary stat format, see pack_binary_stat
+
+    binstat_magic = 'HPYB'
+    binstat_version = 1
+    binstat_has_b = 1		# Flag: has b_count and b_size (DiffFormat)
+    binstat_has_r = 2		# Flag: has retained sizes (RetainedFormat)
+    binstat_has_s = 4		# Flag: has sites (SitesFormat)
     
 
     # Factory method
 
-    def partition(self, set, er):
+    def partition(self, set, er, retained=False, sortby='size', sites=False):
 	if er.classifier is self.Id.classifier:
+	    if retained or sortby != 'size':
+		raise ValueError, \
+		      'Retained sizes are not supported by the identity partition.'
+	    if sites:
+		raise ValueError, \
+		      'Sites are not supported by the identity partition.'
 	    return IdentityPartition(self, set, er)
 	else:
-	    return SetPartition(self, set, er)
+	    return SetPartition(self, set, er, retained, sortby, sites)
     
+    def census_stat(self, er, census):
+	# Make a Stat from the (kind, count, size) tuples of View.census,
+	# with the rows ordered as they would be in a SetPartition.
+	classifier = er.classifier
+	tosort = [(-size, classifier.get_tabrendering(classifier.get_kind(k), ''),
+		   count) for (k, count, size) in census]
+	tosort.sort()
+	totcount = 0
+	totsize = 0
+	rows = []
+	for (minusize, name, count) in tosort:
+	    totcount += count
+	    totsize -= minusize
+	    rows.append('.r: %d %d %s'%(count, -minusize, name))
+	trows = [
+	    '.loader: _load_stat',
+	    '.format: SetFormat',
+	    '.timemade: %f'%self.time.time(),
+	    '.count: %d'%totcount,
+	    '.size: %d'%totsize,
+	    '.kindname: ',
+	    '.kindheader: %s'%classifier.get_tabheader(''),
+	    '.numrows: %d'%len(rows)] + rows
+	def get_trows():
+	    return trows
+	return self._load_stat(get_trows)
+
+    def sample_stat(self, er, sample):
+	# Make a Stat from the (rows, totals) of View.census_sample, with
+	# the estimates rounded and bounds of 1.96 standard deviations,
+	# which is for 95% confidence. Rows estimated to nothing are left out.
+	classifier = er.classifier
+	rows, (samplesize, count, size, countvar, sizevar) = sample
+	def bound(var):
+	    return int(round(1.96 * var**0.5))
+	tosort = []
+	for (k, c, s, cv, sv) in rows:
+	    c = int(round(c))
+	    s = int(round(s))
+	    if c or s:
+		tosort.append((-s, classifier.get_tabrendering(
+		    classifier.get_kind(k), ''), c, bound(cv), bound(sv)))
+	tosort.sort()
+	totcount = 0
+	totsize = 0
+	rows = []
+	for (minusize, name, count, counterr, sizeerr) in tosort:
+	    totcount += count
+	    totsize -= minusize
+	    rows.append('.r: %d %d %d %d %s'%(count, -minusize, counterr, sizeerr,
+					     name))
+	trows = [
+	    '.loader: _load_stat',
+	    '.format: SampleFormat',
+	    '.timemade: %f'%self.time.time(),
+	    '.count: %d'%totcount,
+	    '.size: %d'%totsize,
+	    '.samplesize: %d'%samplesize,
+	    '.counterr: %d'%bound(countvar),
+	    '.sizeerr: %d'%bound(sizevar),
+	    '.kindname: ',
+	    '.kindheader: %s'%classifier.get_tabheader(''),
+	    '.numrows: %d'%len(rows)] + rows
+	def get_trows():
+	    return trows
+	return self._load_stat(get_trows)
+
+    def _get_binstat_header(self):
+	return self.struct.Struct('<4sHHQdqqqqII')
+
+    def _get_binstat_offset(self):
+	return self.struct.Struct('<I')
+
+    def _get_binstat_prefix(self):
+	return self.struct.Struct('<4sHHQ')
+
+    def _get_binstat_retained(self):
+	return self.struct.Struct('<q')
+
+    def _get_binstat_row(self):
+	return self.struct.Struct('<qqI')
+
+    def open_binary_stat(self, fn):
+	# Return a BinaryStatFile if fn names a binary stat file, else None.
+	f = open(fn, 'rb')
+	try:
+	    magic = f.read(len(self.binstat_magic))
+	finally:
+	    f.close()
+	if magic != self.binstat_magic:
+	    return None
+	return BinaryStatFile(self, fn)
+
+    def open_stat_file(self, fn):
+	# Return a StatFile with the samples in file fn, in either format.
+	sf = self.open_binary_stat(fn)
+	if sf is None:
+	    sf = TextStatFile(self, fn)
+	return sf
+
+    def pack_binary_stat(self, stat):
+	# Return a string with stat as a self-contained binary record:
+	#
+	# header	binstat_header: magic, version, flags, record length,
+	#		timemade, count, size, b_count, b_size,
+	#		number of rows, number of strings
+	# rows		binstat_row: count, size, string index of kind name
+	# retained	binstat_retained: retained size of each row,
+	#		only if flag binstat_has_r is set
+	# sites		binstat_offset: string index of the site of each row,
+	#		only if flag binstat_has_s is set
+	# offsets	binstat_offset: end offset in blob of each string
+	# blob		the strings; 0, 1 and 2 are the format name,
+	#		kindheader and kindname, the rest are kind names
+	if getattr(stat, 'samplesize', None) is not None:
+	    raise ValueError, \
+		  'Estimated stats from a sample can only be dumped as text.'
+	strings = [stat.format_name, stat.kindheader, stat.kindname]
+	stringindex = {}
+	rows = []
+	rets = []
+	sites = []
+	row = self.binstat_row
+	for r in stat.get_rows():
+	    for name in (r.name, r.site):
+		if name is not None and name not in stringindex:
+		    stringindex[name] = len(strings)
+		    strings.append(name)
+	    rows.append(row.pack(r.count, r.size, stringindex[r.name]))
+	    if r.retained is not None:
+		rets.append(self.binstat_retained.pack(r.retained))
+	    if r.site is not None:
+		sites.append(self.binstat_offset.pack(stringindex[r.site]))
+	offsets = []
+	end = 0
+	for string in strings:
+	    end += len(string)
+	    offsets.append(self.binstat_offset.pack(end))
+	b_count = getattr(stat, 'b_count', None)
+	if b_count is not None:
+	    flags = self.binstat_has_b
+	    b_size = stat.b_size
+	else:
+	    flags = 0
+	    b_count = b_size = 0
+	if rets:
+	    assert len(rets) == len(rows)
+	    flags |= self.binstat_has_r
+	if sites:
+	    assert len(sites) == len(rows)
+	    flags |= self.binstat_has_s
+	body = (''.join(rows) + ''.join(rets) + ''.join(sites) +
+		''.join(offsets) + ''.join(strings))
+	header = self.binstat_header.pack(
+	    self.binstat_magic, self.binstat_version, flags,
+	    self.binstat_header.size + len(body),
+	    stat.timemade, stat.count, stat.size, b_count, b_size,
+	    len(rows), len(strings))
+	return header + body
+
     # Private - Use.load is intended to be used directly.
     def _load_stat(self, get_trows):
 	return Stat(self, get_trows)
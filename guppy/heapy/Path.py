@@ -433,15 +433,53 @@ class ShortestGraph:
 	
 
 
+class RowPaths:
+    # The shortest paths to the row sets of a partition, from one search,
+    # printed under each row as in the partition table.
+    def __init__(self, sg, partition, rows):
+	self.sg = sg
+	self.mod = sg.mod
+	self._hiding_tag_ = self.mod._hiding_tag_
+	self.partition = partition
+	self.rows = rows
+
+    def __getitem__(self, idx):
+	return self.sg[idx]
+
+    def __len__(self):
+	return len(self.sg)
+
+    def __repr__(self):
+	f = self.mod._root.StringIO.StringIO()
+	self.pp(f)
+	return f.getvalue().rstrip()
+
+    def __str__(self):
+	return self.__repr__()
+
+    def pp(self, output=None):
+	if output is None:
+	    output = self.mod.output
+	format = self.partition.format
+	print >>output, format.get_row_header()
+	for i, row in enumerate(self.rows):
+	    print >>output, format.get_formatted_row(row)
+	    self.sg[i].pp(output=output)
+
+
 class _GLUECLAMP_:
     _preload_ = ('_hiding_tag_',)
-    _chgable_ = ('output', 'srcname_1', 'srcname_n')
+    _chgable_ = ('output', 'srcname_1', 'srcname_n', 'shpath_threshold')
 
     srcname_1 = 'Src'
     srcname_n = '_str_of_src_'
     dstname = 'Dst'
+    # The size the forward frontier of a shortest path search may grow to
+    # before the search is made also backward from the destinations
+    shpath_threshold = 1000
 
     _imports_ = (
+	'_parent.ImpSet:immnodeset',
 	'_parent.ImpSet:mutnodeset',
 	'_parent.Use:idset',
 	'_parent.Use:iso',
@@ -469,6 +507,7 @@ class _GLUECLAMP_:
     def _get_norelation(self):	return R_NORELATION()
     def _get_output(self):	return self._parent.OutputHandling.stdout
     def _get_saferepr(self):	return self._root.repr.repr
+    def _get_shpathsearch(self):	return self.hv.shpathsearch
     def _get_shpathstep(self):	return self.hv.shpathstep
 
 
@@ -515,11 +554,13 @@ class _GLUECLAMP_:
 	    tab = [self.norelation]
 	return tab
 
-    def shpaths(self, dst, src=None, avoid_nodes=None, avoid_edges=()):
-	return self.shpgraph([dst], src, avoid_nodes, avoid_edges)[0]
+    def shpaths(self, dst, src=None, avoid_nodes=None, avoid_edges=(),
+		first=None):
+	return self.shpgraph([dst], src, avoid_nodes, avoid_edges,
+			     first=first)[0]
 
     def shpgraph(self, DstSets, src=None, avoid_nodes=None, avoid_edges=(),
-		 srcname=None, dstname=None):
+		 srcname=None, dstname=None, first=None):
 	if src is None:
 	    Src = self.iso(self.View.root)
             if srcname is None and self.View.root is self.View.heapyc.RootState:
@@ -531,24 +572,74 @@ class _GLUECLAMP_:
 	else:
 	    AvoidNodes = self.idset_adapt(avoid_nodes)
 	AvoidEdges = self.nodegraph(avoid_edges)
-	G, DstSets = self.shpgraph_algorithm(DstSets, Src, AvoidNodes, AvoidEdges)
+	G, DstSets = self.shpgraph_algorithm(DstSets, Src, AvoidNodes, AvoidEdges,
+					     first)
 
 	return self.ShortestGraph(self, G, DstSets, Src, AvoidEdges,
 				  srcname, dstname)
 
-    def shpgraph_algorithm(self, DstSets, Src, AvoidNodes, AvoidEdges):
+    def shpgraph_rows(self, partition, rows, src=None, avoid_nodes=None,
+		      avoid_edges=(), first=None):
+	sg = self.shpgraph([row.set for row in rows], src, avoid_nodes,
+			   avoid_edges, first=first)
+	return RowPaths(sg, partition, rows)
+
+    def shpgraph_algorithm(self, DstSets, Src, AvoidNodes, AvoidEdges,
+			   first=None):
+	# Search forward, and when the frontier gets large, backward from the
+	# destinations too, with the referrers in View.rg. It is held by the
+	# referrers lock, since a gc would clear it while being searched.
+	# If it is updated, the frames more recent than this one are hidden,
+	# so it has the frames as the search finds them from the root.
+	View = self.View
+	G = self.nodegraph()
+	DstSets = [View.nodeset_adapt(D) for D in DstSets]
+	if first is None:
+	    first = -1
+	frame = self._root.sys._getframe()
+
+	def referrers():
+	    Dst = self.mutnodeset()
+	    for D in DstSets:
+		Dst |= D
+	    hv = View.hv
+	    limitframe = hv.limitframe
+	    if limitframe is None:
+		hv.limitframe = frame
+	    try:
+		View.update_referrers(Dst)
+	    finally:
+		hv.limitframe = limitframe
+	    return View.rg
+
+	View.referrers_lock += 1
+	try:
+	    DstSets = self.shpathsearch(G, Src.nodes, DstSets, AvoidNodes.nodes,
+					AvoidEdges, first, referrers,
+					self.shpath_threshold)
+	finally:
+	    View.referrers_lock -= 1
+	    frame = None
+	return G, [self.idset_adapt(D) for D in DstSets]
+
+    def shpgraph_forward(self, DstSets, Src, AvoidNodes, AvoidEdges,
+			 first=None):
 	U = (Src - AvoidNodes).nodes
 	S = self.mutnodeset(AvoidNodes.nodes)
 	G = self.nodegraph()
 	unseen = list(enumerate(DstSets))
 	DstSets = [self.Nothing]*len(DstSets)
+	find_one = first is not None
 	while U and unseen:
 	    S |= U
-	    U = self.shpathstep(G, U, S, AvoidEdges)
+	    U = self.shpathstep(G, U, S, AvoidEdges, find_one)
 	    unseen_ = []
 	    for i, D in unseen:
 		D_ = D & U
 		if D_:
+		    if find_one:
+			D_ = self.View.nodeset_adapt(D_)
+			D_ = self.immnodeset(list(D_)[:first])
 		    DstSets[i] = D_
 		else:
 		    unseen_.append((i, D))
@@ -124,7 +124,6 @@ class Stats:
     def __init__(self, mod, fn=None):
 	self.mod = mod
 	self.os = mod.os
-	self.md5 = mod.md5
 	self.fn = fn
 
     def clear_cache(self):
@@ -147,28 +146,11 @@ class Stats:
 	if stat == self.laststat:
 	    return len(self), 0
 
-	f = open(self.fn)
-	str = f.read(self.lastfilesize)
-	md5 = self.md5.md5(str)
-	digest = md5.digest()
-	if digest == self.lastdigest:
-	    numoldstats = len(self)
-	else:
-	    self.loadstr(str, reset=1)
-	    numoldstats = 0
-
-	str = f.read()
-	    
-	self.laststat = self.os.fstat(f.fileno())
-	f.close()
-	self.lastfilesize = self.laststat.st_size
-
-	md5.update(str)
-	self.lastdigest = md5.digest()
-	self.loadstr(str)
-
-	numnewstats = len(self.stats)-numoldstats
-
+	# Only the samples appended since last time are read,
+	# unless the file was rewritten, which makes numoldstats 0.
+	numoldstats, numnewstats = self.stats.refresh()
+	self.laststat = stat
+	self.update(numoldstats)
 	return numoldstats, numnewstats
 
     def open(self, fn):
@@ -179,45 +161,24 @@ class Stats:
 	    self.fn = fn
 	    return
 
-	f = open(fn)
-	str = f.read()
-	lastdigest = self.md5.md5(str).digest()
-	laststat = self.os.fstat(f.fileno())
-	f.close()
-	self.loadstr(str, reset=1)
+	laststat = self.os.stat(fn)
+	stats = self.mod.open_stat_file(fn)
 	    
 	# Update these only if there was no exception so far.
 	self.fn = fn
-	self.lastdigest = lastdigest
+	self.stats = stats
 	self.laststat = laststat
-	self.lastfilesize = laststat.st_size
-
-    def loadstr(self, str, reset=0):
-	stats = []
-	lines = str.split('\n')
-	del str
-	linesiter = iter(lines)
-	max_size = 0
-	while 1:
-	    try:
-		st = self.mod.Use.load(linesiter)
-	    except StopIteration:
-		break
-	    stats.append(st)
-	    if st.size > max_size:
-		max_size = st.size
-
-	# Only update self if there were no exception so far
+	self.update(0)
 
-	if reset:
-	    self.stats = []
+    def update(self, start):
+	# Update for the samples from index start.
+	if not start:
 	    self.max_size = 0
-
-	self.max_size = max(self.max_size, max_size)
-	self.stats.extend(stats)
+	for st in self.stats[start:]:
+	    if st.size > self.max_size:
+		self.max_size = st.size
 	self.len_stats = len(self.stats)
 
-
     def __getitem__(self, idx):
 	return self.stats[idx]
 	
@@ -3123,10 +3084,10 @@ class ProfileBrowser:
 class _GLUECLAMP_:
     _imports_ = (
 	'_parent:Use',
+	'_parent.Part:open_stat_file',
 	'_parent:pbhelp',
 	'_root.guppy.etc:textView',
 	'_root.guppy:specs',
-	'_root:md5',
 	'_root:os',
 	'_root.os:path',
 	'_root:time',
@@ -307,6 +307,7 @@ class RefPatRow:
 	self.max_str_len = rp.mod.line_length
 	self.ixlstr = ixl_as_str(ixl)
 	self.isready = 0
+	self.isbounded = 0
 	self.children = []
 
     def __str__(self):
@@ -322,6 +323,8 @@ class RefPatRow:
 
 	if self.seenline:
 	    ref = '[^ %s]'%self.seenline.index
+	elif self.isbounded:
+	    ref = '[+]'
 	elif self.isroot:
 	    ref = '[R]'
 	elif self.depth > 0 and self.set <= self.rp.stopkind:
@@ -355,7 +358,8 @@ Methods
 
 """
     maxprint = 10
-    def __init__(self, mod, set, depth, er, relimg, bf, stopkind, nocyc):
+    def __init__(self, mod, set, depth, er, relimg, bf, stopkind, nocyc,
+		 maxnodes=None, timeout=None):
 	self.mod = mod
 	self._hiding_tag_ = mod._hiding_tag_
 	self.View = mod.View
@@ -365,6 +369,8 @@ Methods
 	self.bf = bf
 	self.stopkind = stopkind
 	self.nocyc = nocyc
+	self.maxnodes = maxnodes
+	self.timeout = timeout
 	self.is_initialized = 0
 
 	self.totcount = set.count
@@ -484,17 +490,27 @@ Methods
 	ixl = list(ixl)
 	line = RefPatRow(self, (kind, set), seenline=seenline,
 			 ixl=ixl, parent=parent)
-	children = self.get_children(line)
-	line.isroot = not children
+	depth = line.depth
+	isexpanded = (not seenline and depth < self.depth and
+		      (depth == 0 or not (set <= self.stopkind)))
+	children = []
+	if not self.is_within_budget():
+	    # Out of budget: the line is shown as not expanded
+	    line.isroot = 0
+	    line.isbounded = 1
+	elif isexpanded:
+	    children = self.get_children(line)
+	    line.isroot = not children
+	elif not seenline:
+	    # Only whether it has referrers is shown, they need no partition
+	    line.isroot = not self.get_referrers(line)
 	if seenline is None:
 	    self.seensets[set.nodes] = line
 	if parent is not None:
 	    parent.children.append(line)
 	yield line
 	
-	depth = line.depth
-	if (not seenline and depth < self.depth and
-            (depth == 0 or not (set <= self.stopkind))):
+	if isexpanded:
 	    for i, cs in enumerate(children):
 		ixl.append( i )
 		for rl in self.linegenerator(cs, ixl, line):
@@ -503,18 +519,29 @@ Methods
 	line.isready = 1	    
 
     def get_children(self, line):
-	(kind, set) = line.kindset
-	chset = self.relimg(set)
+	chset = self.get_referrers(line)
+	self.numnodes += chset.count
+	return self.mod.partition_kinds(chset, self.er)
+
+    def get_partition(self, set, er):
+	p = self.mod.Part.partition(set, er)
+	return p
+
+    def get_referrers(self, line):
+	chset = self.relimg(line.set)
 	if self.nocyc:
 	    while line is not None:
 		chset -= line.set
 		line = line.parent
-	return [(row.kind, row.set)
-		for row in self.get_partition(chset, self.er).get_rows()]
+	return chset
 
-    def get_partition(self, set, er):
-	p = self.mod.Part.partition(set, er)
-	return p
+    def is_within_budget(self):
+	if self.maxnodes is not None and self.numnodes >= self.maxnodes:
+	    return False
+	if (self.timeout is not None and
+	    self.mod._root.time.time() - self.starttime >= self.timeout):
+	    return False
+	return True
 
     def paths(self, key, **kwds):
 	return Paths(self.mod, self, key, **kwds)
@@ -526,6 +553,8 @@ Methods
 
     def reset_nogc(self):
 	self.isfullygenerated = 0
+	self.numnodes = 0
+	self.starttime = self.mod._root.time.time()
 	self.seensets = {}
 	self.lines = []
 	self.lg = self.linegenerator(self.kindset, [])
@@ -559,6 +588,13 @@ class _GLUECLAMP_:
     #
 
     def _get_er(self):	 return self.Use.Clodo
+
+    def _get__partition_memo(self):
+	# Like the referrer graph, the memo is valid until the next gc.
+	memo = {}
+	self.View.clear_register_method(memo.clear)
+	return memo
+
     def _get_stopkind(self):
 	hp = self.Use
 	return (
@@ -573,9 +609,44 @@ class _GLUECLAMP_:
 	    )
 
 
+    def partition_kinds(self, set, er):
+	# The (kind, set) pairs of the partition of set by er, in the
+	# order of the rows of Part.partition, but without making the rows
+	# and their tabular renderings. The renderings are used only to
+	# order kinds of equal size. Memoized by the nodes and classifier,
+	# across reference patterns. The memo is cleared at each gc, like
+	# the referrer graph, so it helps only when patterns are made or
+	# reset between collections; reset itself makes one. Each call
+	# classifies the whole set, and makes the sets of the kinds, since
+	# the rows of the kinds are expanded from them.
+	classifier = er.classifier
+	key = (set.nodes, classifier)
+	memo = self._partition_memo
+	try:
+	    return memo[key]
+	except KeyError:
+	    pass
+	items = [(-size, kind, part)
+		 for (kind, count, size, part) in
+		 classifier.partition_stats(set.nodes)]
+	items.sort(key=lambda x:x[0])
+	kindsets = []
+	i = 0
+	while i < len(items):
+	    j = i + 1
+	    while j < len(items) and items[j][0] == items[i][0]:
+		j += 1
+	    tied = items[i:j]
+	    if len(tied) > 1:
+		tied.sort(key=lambda x:classifier.get_tabrendering(x[1], ''))
+	    kindsets.extend([(kind, part) for (minusize, kind, part) in tied])
+	    i = j
+	memo[key] = kindsets
+	return kindsets
+
     def rp(self, X, depth=None, er=None, imdom=0, bf=0, src=None, stopkind=None,
-           nocyc=False, ref=None):
-	"""rp(X, depth=None, er=None, imdom=0, bf=0, src=None, stopkind=None, nocyc=False, ref=None)
+           nocyc=False, ref=None, maxnodes=None, timeout=None):
+	"""rp(X, depth=None, er=None, imdom=0, bf=0, src=None, stopkind=None, nocyc=False, ref=None, maxnodes=None, timeout=None)
 Reference pattern forming.
 Arguments
 	X	Set of objects for which a reference pattern is sought.
@@ -594,6 +665,12 @@ Arguments
         stopkind
 	nocyc
         ref
+	maxnodes
+		If specified, no more rows will be expanded when the
+		referrers of this many objects have been partitioned.
+		Such rows are marked [+].
+	timeout	If specified, no more rows will be expanded when this many
+		seconds have passed since the pattern was created or reset.
 
 Description
 	Return a reference pattern object based on the objects in the set X.
@@ -635,5 +712,6 @@ Description
 	    relimg = lambda X:X.referrers
 	if stopkind is None:
 	    stopkind = self.stopkind
-	rp = ReferencePattern(self, X, depth, er, relimg, bf, stopkind, nocyc)
+	rp = ReferencePattern(self, X, depth, er, relimg, bf, stopkind, nocyc,
+			      maxnodes, timeout)
 	return rp
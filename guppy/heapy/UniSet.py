@@ -349,10 +349,11 @@ attribute in that it is a tabular representation.
 
 
     def get_rp(self, depth=None, er=None, imdom=0, bf=0, src=None,
-               stopkind=None, nocyc=False, ref=None):
+               stopkind=None, nocyc=False, ref=None, maxnodes=None,
+	       timeout=None):
 	"""
 x.get_rp(depth=None, er=None, imdom=0, bf=0, src=None, stopkind=None,
-	nocyc=False, ref=None)
+	nocyc=False, ref=None, maxnodes=None, timeout=None)
 
 Return an object representing the pattern of references to the objects in X.
 The returned object is of kind ReferencePattern.
@@ -377,17 +378,23 @@ Arguments
 		followed.
 	nocyc	When True, certain cycles will not be followed.
         ref
+	maxnodes
+		If specified, no more rows will be expanded when the
+		referrers of this many objects have been partitioned.
+	timeout	If specified, no more rows will be expanded when this
+		many seconds have passed since the pattern was created.
 
 See also
         rp (a shorthand for common cases)
 
 """
 	return self.fam.RefPat.rp(self, depth, er, imdom, bf, src, stopkind,
-                                  nocyc, ref)
+                                  nocyc, ref, maxnodes, timeout)
 
 
-    def get_shpaths(self, src=None, avoid_nodes=None, avoid_edges=()):
-	"""x.get_shpaths(draw:[src, avoid_nodes, avoid_edges]) -> Paths
+    def get_shpaths(self, src=None, avoid_nodes=None, avoid_edges=(),
+		    first=None):
+	"""x.get_shpaths(draw:[src, avoid_nodes, avoid_edges, first]) -> Paths
 
 Return an object containing the shortest paths to objects in x.
 The optional arguments are:
@@ -395,9 +402,49 @@ The optional arguments are:
     src:IdentitySet		An alternative source set of objects
     avoid_nodes:IdentitySet	Nodes to avoid           
     avoid_edges:NodeGraph       Edges to avoid                  
+    first:int                   Find only one path to each of at most
+                                this many of the nearest objects in x
 
 """
-	return self.fam.Path.shpaths(self, src, avoid_nodes, avoid_edges)
+	return self.fam.Path.shpaths(self, src, avoid_nodes, avoid_edges,
+				     first)
+
+    def get_shpaths_all(self, k=None, src=None, avoid_nodes=None,
+			avoid_edges=(), first=None):
+	"""x.get_shpaths_all(draw:[k, src, avoid_nodes, avoid_edges, first])
+	    -> RowPaths
+
+Return an object containing the shortest paths to the objects of each
+row of the partition of x, printed under each row as in the partition
+table. The paths to all the rows are found in one search of the heap.
+The optional arguments are:
+
+    k:int			The number of rows, from the first.
+				The default is all the rows.
+
+and the optional arguments of get_shpaths.
+"""
+	return self.partition.get_shpaths_all(k, src, avoid_nodes,
+					      avoid_edges, first)
+
+    def get_stat(self, retained=False, sortby='size', sites=False):
+	"""x.get_stat(draw:[retained, sortby, sites]) -> Stat
+
+Return an object summarizing the statistics of the partitioning of x,
+like x.stat. The optional arguments are:
+
+    retained:bool	If true, add a column with the retained size of
+			each row, the total size of the objects dominated
+			by some object of its kind. The retained sizes of
+			all rows are found in one pass over the heap.
+    sortby:str		Either 'size', to sort the rows by their size,
+			or 'retained', to sort them by their retained
+			size. The latter implies retained.
+    sites:bool		If true, add a column with the allocation site
+			of most of the size of each row, as classified
+			by Site. It can not be combined with retained.
+"""
+	return self.fam.get_stat(self, retained, sortby, sites)
 
     # 'Normal' methods
 
@@ -437,6 +484,9 @@ A copy of self, but with 'Module' as the equivalence relation.""")
     byrcs = property(lambda self: self.by('Rcs'), doc="""\
 A copy of self, but with 'Rcs' as the equivalence relation.""")
 
+    bysite = property(lambda self: self.by('Site'), doc="""\
+A copy of self, but with 'Site' as the equivalence relation.""")
+
     bysize = property(lambda self: self.by('Size'), doc="""\
 A copy of self, but with 'Size' as the equivalence relation.""")
 
@@ -591,6 +641,14 @@ See also
 
 
 
+    spall = property(get_shpaths_all, doc="""x.spall: RowPaths
+
+An object containing the shortest paths to the objects of each row of
+the partition of x, such as x.byclodo, found in one search of the heap.
+
+See also
+    get_shpaths_all""")
+
     stat = property(lambda self: self.partition.get_stat(), doc="""\
 x.stat: Stat
 
@@ -1705,6 +1763,12 @@ class IdentitySetFamily(AtomFamily):
 	    self._partition = p
 	return p
 
+    def get_stat(self, a, retained, sortby, sites):
+	if not retained and sortby == 'size' and not sites:
+	    return a.partition.get_stat()
+	a.fam.View.clear_check()
+	return a.fam.Part.partition(a, a.er, retained, sortby, sites).get_stat()
+
 
 
 
@@ -57,13 +57,15 @@ class _GLUECLAMP_:
 	)
 
 
-    _chgable_ =  ('is_rg_update_all', 'referrers_lock', '_is_clear_drg_enabled')
+    _chgable_ =  ('is_rg_update_all', 'is_domtree_cached', '_is_domtree_stale',
+		  'referrers_lock', '_is_clear_drg_enabled')
     _setable_ =  ('_hiding_tag_','target', 'is_hiding_calling_interpreter',
 
 		  )
 
     is_hiding_calling_interpreter = False
     is_rg_update_all = False
+    is_domtree_cached = False
     _is_clear_drg_enabled = 1 # Flag mainly for test, Note Apr 19 2005
     _hiding_tag_ = []
 
@@ -181,13 +183,27 @@ class _GLUECLAMP_:
 	    #print 'no clear', rg, len(rg), len(self.norefer)
 	    pass
 
+    def _get__is_domtree_stale(self):
+	self.clear_register_method(self._clear_domtree)
+	return True
+
+    def _clear_domtree(self):
+	# The tree holds the objects; let them go and compute it again when needed
+	if not self._is_domtree_stale:
+	    self.hv.clear_domtree()
+	    self._is_domtree_stale = True
+
     def _get_referrers_lock(self)	: return 0
 
     def _get_root(self):	return self.heapyc.RootState
+    def _get_site_horizons(self):
+	# The Horizon recording sites, in a list so it is hidden from the heap
+	return self.observation_list([self.heapyc.Horizon(())])
     def _get_target(self):	return self._parent.Target.Target()
 
     def _set_root(self, root):
 	self.clear_retainers()
+	self._clear_domtree()
 	self.hv.root = root
 
     def call_with_referrers(self, X, f):
@@ -198,6 +214,44 @@ class _GLUECLAMP_:
 	finally:
 	    self.referrers_lock -= 1
 
+    def census(self, cli, nthreads=1):
+	"""V.census(cli, nthreads=1) -> list of (kind, count, size)
+Classify the objects in the visible heap with the low-level classifier
+cli, in a single traversal that does not build the heap set. The kinds
+are those returned by cli, not yet turned into Kind objects. If
+nthreads is greater than 1, that many native threads classify the
+objects, if cli is of a kind that supports it; see HV.census.
+"""
+	self.gc.collect()
+	return self.enter(lambda:
+	    self.hv.census(cli, nthreads))
+
+    def census_sample(self, cli, fraction, seed=None):
+	"""V.census_sample(cli, fraction, seed=None) -> (rows, totals)
+Estimate the census of the heap, as made by census, from a random sample
+of the objects tracked by the garbage collector, each taken with
+probability fraction. See HV.census_sample for the result. The seed of
+the random generator is taken from the random module if not given.
+No garbage collection is made first, as census does, since it would
+take longer than the sample; the collector is disabled while sampling.
+"""
+	if seed is None:
+	    seed = self._root.random.getrandbits(31)
+	gc = self.gc
+	isenabled = gc.isenabled()
+	gc.disable()
+	objects = []
+	try:
+	    objects = gc.get_objects()
+	    return self.enter(lambda:
+		self.hv.census_sample(cli, objects, fraction, seed))
+	finally:
+	    # The list holds this frame, which holds the list; emptied,
+	    # it is not left for the next sample to find
+	    del objects[:]
+	    if isenabled:
+		gc.enable()
+
     def clear_retainers(self):
 	"""G.clear_retainers()
 Clear the retainer graph V.rg.
@@ -210,6 +264,11 @@ Clear the retainer graph V.rg.
 Return the dominos of a set of objects X. The dominos of X is the set
 of objects that are dominated by X, which is the objects that will become
 deallocated, directly or indirectly, when the objects in X are deallocated."""
+	if self.is_domtree_cached:
+	    D = self.nodeset_adapt(X)
+	    r = self.domtree_call(lambda: self.hv.domtree_dominos(D))
+	    if r is not None:
+		return self.retset(r)
 	return self.dominos_tuple((X,))[0]
 	
     def dominos_tuple(self, X):
@@ -228,6 +287,11 @@ Return the dominated size of a set of objects X. The dominated size of X
 is the total size of memory that will become deallocated, directly or
 indirectly, when the objects in X are deallocated. See also: indisize."""
 
+	if self.is_domtree_cached:
+	    D = self.nodeset_adapt(X)
+	    r = self.domtree_call(lambda: self.hv.domtree_domisize(D))
+	    if r is not None:
+		return r
 	return self.domisize_tuple((X,))[0]
 
     def domisize_tuple(self, X):
@@ -236,6 +300,22 @@ Return a tuple of dominated sizes for the tuple of sets of objects X."""
 	return tuple([self.indisize(dominos_i)
 		      for dominos_i in self.dominos_tuple(X)])
 
+    def domtree_call(self, func):
+	"""V.domtree_call(func) -> object
+Call func with the dominator tree of the view computed and kept in V.hv,
+to be used via the domtree_ methods of the HeapView. If
+V.is_domtree_cached is set, the tree is kept until the next garbage
+collection and used by dominos, domisize and imdom; otherwise it is
+cleared after the call."""
+	if self._is_domtree_stale:
+	    self._is_domtree_stale = False
+	    self.enter(self.hv.update_domtree)
+	try:
+	    return func()
+	finally:
+	    if not self.is_domtree_cached:
+		self._clear_domtree()
+
     def enter(self, func):
 	if self.hv.is_hiding_calling_interpreter:
 	    self.hv.limitframe = None
@@ -370,6 +450,9 @@ Return the immediate dominators of a set of objects X. The immediate
 dominators is a subset of the referrers. It includes only those
 referrers that are reachable directly, avoiding any other referrer."""
 	pred = self.nodeset_adapt(self.referrers(X))
+	if self.is_domtree_cached:
+	    return self.retset(self.domtree_call(lambda:
+		self.hv.domtree_imdom(pred)))
 	visit = self.hv.reachable_x(self.immnodeset([self.root]), pred)
 	return self.retset(pred & visit)
 
@@ -517,6 +600,42 @@ valid depending on viewpoint.
 	wr = self._root.weakref.ref(t, remove)
 	self.referrers_targets.append(wr)
 
+    def retained(self, cli, X=None):
+	"""V.retained(cli[, X]) -> list of (kind, count, size)
+Classify the objects in the visible heap, or in the set X, with the
+low-level classifier cli, and return for each kind the number of objects
+and their retained size. The retained size of a kind is the total size of
+the objects dominated by some object of the kind, as found from the
+dominator tree. It is at most the domisize of all the objects of the
+kind, which may also include objects that are dominated only by several
+of them together."""
+	if X is not None:
+	    X = self.nodeset_adapt(X)
+	    return self.domtree_call(lambda: self.hv.domtree_retained(cli, X))
+	return self.domtree_call(lambda: self.hv.domtree_retained(cli))
+
+    def track_sites(self, interval=1):
+	"""V.track_sites(interval=1)
+Record the allocation sites of objects allocated from now on in the
+current thread, of every interval'th object tracked by the garbage
+collector. If interval is 0, stop recording; the sites recorded are
+kept. The sites are used by the Site classifier. See also
+Horizon.start_sites.
+
+Recording slows the program down. As measured, a loop that made a call
+for each new object ran about 4 times slower with interval 1, and 2
+times slower with interval 10 or 100; calls that allocate nothing ran
+about 1.5 times slower. Between the objects recorded, only the count of
+generation 0 is looked at, so a bigger interval does not help much
+more: the rest is the cost of the profile function at each call and
+return, and of the patched destructors of the types of the objects
+recorded, which stay in effect while the horizon is.
+"""
+	if interval:
+	    self.site_horizons[0].start_sites(interval)
+	else:
+	    self.site_horizons[0].stop_sites()
+
     def update_referrers(self, X):
 	"""V.update_referrers(X)
 Update the view V from the set X. X must be adaptable to NodeSet. V.rg is
@@ -142,6 +142,110 @@ class StatCase(support.TestCase):
 	self.aseq(d[0].count, -2)
 	#print d
 
+    def test_binary(self):
+	# Test dumping and loading in binary format
+	import os, tempfile, StringIO
+	hp = self.Use
+	x = hp.iso(1, 'a', 'bc', [], {}).stat
+	d = x - hp.iso('a', []).stat
+	fd, fn = tempfile.mkstemp()
+	os.close(fd)
+	try:
+	    x.dump(fn, format='binary')
+	    d.dump(fn, format='binary')
+	    x.dump(fn, format='binary')
+	    s = hp.loadall(fn)
+	    self.aseq(len(s), 3)
+	    for a, b in ((x, s[0]), (d, s[1]), (x, s[-1])):
+		self.aseq(str(b), str(a))
+		self.aseq([(r.count, r.size, r.name) for r in b.get_rows()],
+			  [(r.count, r.size, r.name) for r in a.get_rows()])
+		f = StringIO.StringIO()
+		b.dump(f)
+		self.aseq(str(hp.load(f.getvalue().split('\n'))), str(a))
+	    self.aseq(str(hp.load(fn)), str(x))
+	    self.aseq(s[1].b_count, d.b_count)
+	    self.aseq(s[0][1:3].count, x[1:3].count)
+	    self.aseq((s[2] - s[0]).count, 0)
+	    self.aseq(s.refresh(), (3, 0))
+	    d.dump(fn, format='binary')
+	    self.aseq(s.refresh(), (3, 1))
+	    self.aseq(s[3].count, d.count)
+	finally:
+	    os.remove(fn)
+
+    def test_follow(self):
+	# Test following a text file being appended to
+	import os, tempfile
+	hp = self.Use
+	x = hp.iso(1, 'a', 'bc', [], {}).stat
+	d = x - hp.iso('a', []).stat
+	fd, fn = tempfile.mkstemp()
+	os.close(fd)
+	try:
+	    x.dump(fn)
+	    s = self.Part.open_stat_file(fn)
+	    self.aseq(len(s), 1)
+	    self.aseq(str(s[0]), str(x))
+	    d.dump(fn)
+	    # A partially written sample is not seen until completed
+	    f = open(fn, 'a')
+	    f.write('.loader: _load_stat\n.format: SetFormat\n')
+	    f.close()
+	    self.aseq([str(st) for st in s.news()], [str(d)])
+	    self.aseq(s.refresh(), (2, 0))
+	    f = open(fn, 'a')
+	    f.write('.timemade: 0\n.count: 1\n.size: 2\n.kindname: \n'
+		    '.kindheader: Kind\n.numrows: 1\n.r: 1 2 k\n'
+		    '.end: .loader: _load_stat\n')
+	    f.close()
+	    self.aseq(s.refresh(), (2, 1))
+	    self.aseq(s[2].size, 2)
+	    # A rewritten file is indexed again from the start
+	    x.dump(fn, mode='w')
+	    self.aseq(s.refresh(), (0, 1))
+	    self.aseq(str(s[0]), str(x))
+	finally:
+	    os.remove(fn)
+
+    def test_retained(self):
+	# Test the retained size column
+	import os, tempfile
+	hp = self.Use
+	iso = hp.iso
+	class T(object):
+	    pass
+	t = T()
+	t.a = [T(), T()]
+	t.b = [t.a[0]]
+	x = iso(t, t.a, t.b, *t.a).bytype
+	s = x.get_stat(sortby='retained')
+	self.aseq(s.format_name, 'RetainedFormat')
+	self.aseq([r.retained for r in s.get_rows()],
+		  [iso(t).domisize, iso(t.a).domisize + iso(t.b).domisize])
+	self.aseq([r.name for r in s.get_rows()][1:], ['list'])
+	self.aseq((s.count, s.size), (x.count, x.size))
+	u = x.get_stat(retained=True)
+	self.aseq(sorted([(r.name, r.retained) for r in u.get_rows()]),
+		  sorted([(r.name, r.retained) for r in s.get_rows()]))
+	self.aseq([(r.name, r.size) for r in u.get_rows()],
+		  [(r.name, r.size) for r in x.stat.get_rows()])
+	self.assertRaises(ValueError, x.get_stat, sortby='count')
+	self.assertRaises(ValueError, x.byid.get_stat, retained=True)
+
+	# The column is kept when dumped and loaded, in either format
+	fd, fn = tempfile.mkstemp()
+	os.close(fd)
+	try:
+	    for format in ('text', 'binary'):
+		s.dump(fn, mode='w', format=format)
+		l = hp.load(fn)
+		self.aseq(str(l), str(s))
+		self.aseq([r.retained for r in l.get_rows()],
+			  [r.retained for r in s.get_rows()])
+	finally:
+	    os.remove(fn)
+
 
 def test_main(debug = 0):
     support.run_unittest(StatCase, debug)
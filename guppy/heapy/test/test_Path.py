@@ -711,6 +711,38 @@ class MultiTestCase(TestCase):
  1: A[3]
 """)	
 	
+    def test_rows(self):
+	# Test the paths to every row of a partition, from one search
+	iso = self.iso
+	class C:
+	    pass
+	class D(object):
+	    pass
+	cs = [C(), C()]
+	ds = [D()]
+	src = [cs, {'d': ds}]
+	x = iso(*(cs + ds + [cs[1].__dict__])).byclodo
+	r = x.get_shpaths_all(src=iso(src))
+	self.aseq(len(r), 3)
+	for i, row in enumerate(x.partition.get_rows()):
+	    self.aseq(str(r[i]), str(row.set.get_shpaths(iso(src))))
+	part = x.partition
+	expected = [part.format.get_row_header()]
+	for row in part.get_rows():
+	    expected.append(part.format.get_formatted_row(row))
+	    expected.append(str(row.set.get_shpaths(iso(src))))
+	self.aseq(str(r), '\n'.join(expected))
+	self.aseq([str(p) for p in r], [' 0: Src[0][1].__dict__',
+					 ' 0: Src[0][0]\n 1: Src[0][1]',
+					 " 0: Src[1]['d'][0]"])
+	r = x.get_shpaths_all(2, iso(src), first=1)
+	self.aseq(len(r), 2)
+	self.aseq(r[1].numpaths, 1)
+	r = x.byid.get_shpaths_all(1, iso(src))
+	self.aseq(str(r[0]), ' 0: Src[0][1].__dict__')
+	self.aseq(len(x.spall), 3)
+	self.assert_(str(x.spall[2]).endswith("f_locals['ds'][0]"))
+
 
 class AvoidTestCase(TestCase):
     def test_1(self):
@@ -1024,6 +1056,112 @@ class NewTestCase(TestCase):
 
 	self.asis(p.more.top.top, p)
 
+    def test_4(self):
+	# Test that the paths searched also backward from the destination
+	# are those found searching forward only
+
+	iso = self.iso
+	Path = self.Path
+
+	class C:
+	    pass
+
+	cs = [C() for i in range(30)]
+	for i, c in enumerate(cs):
+	    c.a = cs[(i * 7 + 3) % len(cs)]
+	    if i % 3:
+		c.b = (cs[(i * 5 + 1) % len(cs)],)
+	x = [cs[0], [cs[10]], [cs[20]]]
+
+	def paths(G, D, Src):
+	    sg = Path.ShortestGraph(Path, G, D, Src, Path.nodegraph())
+	    r = []
+	    for i in range(len(sg)):
+		p = sg[i]
+		p.maxpaths = 1000
+		r.append((p.numpaths, sorted(str(p).split('\n'))))
+	    return r
+
+	AvoidEdges = Path.nodegraph()
+	threshold = Path.shpath_threshold
+	try:
+	    # With threshold 0, the search is made backward from the start
+	    for Path.shpath_threshold in (0, threshold):
+		for src, avoid in ((iso(self.View.root), iso()),
+				   (iso(x), iso()),
+				   (iso(x), iso(cs[1]))):
+		    for i in range(0, len(cs), 4):
+			DstSets = [iso(*cs[i:i+4]), iso(cs[-i-1])]
+			G, D = Path.shpgraph_algorithm(DstSets, src, avoid,
+						       AvoidEdges)
+			FG, FD = Path.shpgraph_forward(DstSets, src, avoid,
+						       AvoidEdges)
+			self.aseq(D, FD)
+			self.aseq(paths(G, D, src), paths(FG, FD, src))
+			G, D = Path.shpgraph_algorithm(DstSets, src, avoid,
+						       AvoidEdges, 2)
+			FG, FD = Path.shpgraph_forward(DstSets, src, avoid,
+						       AvoidEdges, 2)
+			self.aseq([len(d) for d in D], [len(d) for d in FD])
+			if src == iso(x):
+			    self.aseq([n for n, p in paths(G, D, src)],
+				      [len(d) for d in D])
+	finally:
+	    Path.shpath_threshold = threshold
+
+	# Src not on a path from the root is searched forward only
+
+	y = []
+	z = [y]
+	calls = []
+	def referrers():
+	    calls.append(1)
+	    rg = Path.nodegraph()
+	    self.View.hv.update_referrers(rg, iso(cs[0]).nodes)
+	    return rg
+	self.aseq(self.View.hv.shpathsearch(
+	    Path.nodegraph(), iso(z).nodes, [iso(y).nodes, iso(cs[0]).nodes],
+	    iso().nodes, AvoidEdges, -1, referrers, 0),
+		  [iso(y).nodes, iso().nodes])
+	self.aseq(calls, [1])
+	self.aseq(str(iso(y).get_shpaths(iso(z))), ' 0: Src[0]')
+	self.aseq(iso(*cs[1:]).get_shpaths(iso(x)).numpaths, 2)
+	self.aseq(iso(*cs[1:]).get_shpaths(iso(x), first=1).numpaths, 1)
+
+    def test_5(self):
+	# Test that a destination near the source is found without getting
+	# the referrers, and time it against a walk of the heap
+
+	iso = self.iso
+	Path = self.Path
+	hv = self.View.hv
+	clock = self.python.time.clock
+
+	heap = [[i] for i in range(100000)]
+	y = []
+	x = [[y]]
+	calls = []
+	def referrers():
+	    calls.append(1)
+	    return None
+
+	N = 100
+	t = clock()
+	for i in range(N):
+	    D = hv.shpathsearch(Path.nodegraph(), iso(x).nodes, [iso(y).nodes],
+				iso().nodes, Path.nodegraph(), -1, referrers)
+	fast = (clock() - t) / N
+	self.aseq(D, [iso(y).nodes])
+	self.aseq(calls, [])
+
+	t = clock()
+	hv.update_referrers(Path.nodegraph(), iso(y).nodes)
+	slow = clock() - t
+
+	# A search has been seen taking about 1/1000 of the walk; the
+	# calls above tell that no walk was made, so this is only printed
+	print 'search %.6f walk %.6f'%(fast, slow)
+	self.aseq(str(iso(y).get_shpaths(iso(x))), ' 0: Src[0][0]')
 
 def run_test(case, debug=0):
     support.run_unittest(case, debug)
@@ -528,6 +528,60 @@ Paths from source 'a3' to target '_'.
 
 	self.aseq( str(rp.paths('a3', andsets=[None, None, self.iso(a)])), expected)
 
+    def test_partition_kinds(self):
+	# The partitions of the referrers are memoized until the next gc,
+	# and ordered as the rows of a Part.partition.
+
+	import gc
+	dst = []
+	src = [[dst], [dst], (dst,), {'dst':dst}, [dst]*3]
+	X = self.iso(dst).referrers
+	er = self.RefPat.er
+	gc.disable()
+	try:
+	    ks = self.RefPat.partition_kinds(X, er)
+	    self.asis(self.RefPat.partition_kinds(X, er), ks)
+	finally:
+	    gc.enable()
+	self.aseq([k for (k, s) in ks],
+		  [r.kind for r in self.heapy.Part.partition(X, er).get_rows()])
+	self.aseq([s for (k, s) in ks],
+		  [r.set for r in self.heapy.Part.partition(X, er).get_rows()])
+	gc.collect()
+	self.assert_(self.RefPat.partition_kinds(X, er) is not ks)
+
+    def test_budget(self):
+	# Test the maxnodes and timeout arguments
+
+	dst = []
+	src = [[[dst]]]
+	rp = self.rp(dst, src)
+	self.assert_(len(rp) > 2)
+
+	rp = self.rp(dst, src, maxnodes=1)
+	self.aseq(len(rp), 2)
+	self.assert_('[+]' in str(rp.get_row(1)))
+	self.aseq(rp.a, rp.get_row(1).set)
+
+	rp = self.rp(dst, src, timeout=0)
+	self.aseq(len(rp), 1)
+	self.assert_('[+]' in str(rp.get_row(0)))
+
+    def test_unexpanded(self):
+	# Only the referrers of the rows that are expanded are partitioned
+
+	import gc
+	dst = []
+	src = [[[dst]]]
+	gc.disable()
+	try:
+	    rp = self.rp(dst, src, depth=1)
+	    self.aseq(len(rp), 2)
+	    self.aseq(len(rp.mod._partition_memo), 1)
+	finally:
+	    gc.enable()
+	self.assert_('[+]' in str(rp.get_row(1)))
+
 
 def test_main(debug=0):
     support.run_unittest(RefPatCase,debug)
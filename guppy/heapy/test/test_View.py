@@ -34,6 +34,83 @@ class FirstCase(TestCase):
 
 	self.assert_(cs.referrers.kind == type(self.guppy.sets.immnodeset()))
 
+    def test_census(self):
+	# Test that census classifies the same objects as heap does
+	class T(object):
+	    pass
+	x = [T() for i in range(10)]
+	cli = self.View.hv.cli_type()
+	c = dict([(k, (count, size)) for (k, count, size) in self.View.census(cli)])
+	self.aseq(c[T], (10, self.iso(*x).indisize))
+	s = self.Use.heapstat(self.Use.Type)
+	t = [r for r in s.get_rows() if r.name.endswith('.T')]
+	self.aseq(len(t), 1)
+	self.aseq(t[0].count, 10)
+	s = self.Use.heapstat(self.Use.Type, nthreads=3)
+	t = [r for r in s.get_rows() if r.name.endswith('.T')]
+	self.aseq(t[0].count, 10)
+
+    def test_census_sample(self):
+	# Test that the sampling census estimates the census
+	class T(object):
+	    __slots__ = 's',
+	class S(str):
+	    pass
+	x = [T() for i in range(4000)]
+	for i, t in enumerate(x):
+	    t.s = S(i)		# Not tracked, counted by reference from t
+	cli = self.View.hv.cli_type()
+	def sample(fraction):
+	    rows, totals = self.View.census_sample(cli, fraction, 17)
+	    return dict([(k, (c, s, cv, sv)) for (k, c, s, cv, sv) in rows])
+	c = sample(1.0)
+	self.aseq(c[T], (4000, self.iso(*x).indisize, 0, 0))
+	self.aseq(c[S][0], 4000)
+	c = sample(0.1)
+	for k in T, S:
+	    count, size, countvar, sizevar = c[k]
+	    self.assert_(0 < countvar)
+	    self.assert_(abs(count - 4000) <= 4 * countvar**0.5)
+	s = self.Use.heapstat(self.Use.Type, sample=0.2)
+	t = [r for r in s.get_rows() if r.name.endswith('.T')]
+	self.aseq(len(t), 1)
+	self.assert_(0 < t[0].counterr < t[0].count)
+	self.assert_(s.samplesize > 0)
+	self.assert_(str(s).startswith('Estimated partition'))
+	self.aseq(str(self.Use.load(list(s.get_trows()))), str(s))
+	self.assertRaises(ValueError, self.View.census_sample, cli, 0)
+
+    def test_census_sample_owners(self):
+	# Test that the sample finds dict owners without updating the
+	# owner graph, and leaves nothing behind for the next sample
+	class A(object):
+	    pass
+	class B:
+	    pass
+	def f(i):
+	    a = A(); a.s = str(i); b = B(); b.l = [i]
+	    return a, b
+	x = [f(i) for i in range(10000)]
+	cli = self.Use.Clodo.classifier.cli
+	drg = self.View.dict_ownership
+	c = dict([(k, n) for (k, n, s) in self.View.census(cli)])
+	drg.clear()
+	rows, totals = self.View.census_sample(cli, 0.1, 17)
+	self.aseq(len(drg), 0)
+	owners = []
+	for k, count, size, countvar, sizevar in rows:
+	    if k[0] is dict and k[1] in (A, B):
+		owners.append(k[1])
+		self.aseq(c[k], 10000)
+		self.assert_(abs(count - 10000) <= 4 * countvar**0.5)
+	self.aseq(len(owners), 2)
+	cli = self.View.hv.cli_type()
+	sizes = []
+	for i in range(3):
+	    rows, totals = self.View.census_sample(cli, 1.0, 17)
+	    sizes.append([s for (k, c, s, cv, sv) in rows if k is list][0])
+	self.assert_(max(sizes) - min(sizes) < 1000)
+
     def test_dominos(self):
 	# Test dominos and domisize
 	iso = self.iso
@@ -46,6 +123,38 @@ class FirstCase(TestCase):
 	del y
 	self.aseq(iso(z).dominos, iso(z, z[0], z[0][1]))
 
+    def test_domtree(self):
+	# Test that the dominator tree gives the same results
+	iso = self.iso
+	V = self.View
+	x = []
+	y = [x, []]
+	z = [x, y]
+	p = [[]]
+	q = [p[0]]	# p[0] is dominated by p and q together only
+	sets = [iso(x), iso(y), iso(z), iso(y, z), iso(x, y), iso(p), iso(p, q)]
+	expected = [(X.dominos, X.domisize, X.imdom) for X in sets]
+	V.is_domtree_cached = True
+	try:
+	    self.aseq([(X.dominos, X.domisize, X.imdom) for X in sets], expected)
+	    self.aseq(iso(p, q).dominos, iso(p, q, p[0]))
+	finally:
+	    V.is_domtree_cached = False
+	    V._clear_domtree()
+
+	# The retained size of a kind
+	class T(object):
+	    pass
+	t = T()
+	t.a = [T(), T()]
+	t.b = t.a[0]
+	cli = V.hv.cli_type()
+	r = dict([(k, (count, size)) for (k, count, size) in V.retained(cli)])
+	self.aseq(r[T], (3, iso(t).domisize))
+	r = V.retained(cli, iso(t.a[0], t.a[1], t.a))
+	self.aseq(sorted([(count, size) for (k, count, size) in r]),
+		  [(1, iso(t.a).domisize), (2, iso(t.a[0], t.a[1]).domisize)])
+
     def test_exports(self):
 	# Test a few exports; the other defined in _unp_exports use the same mechanism
 	iso = self.iso
@@ -55,6 +164,104 @@ class FirstCase(TestCase):
 	p = iso(z).referents.indisize
 	self.aseq(p, iso(y).indisize)
 
+    def test_export_graph(self):
+	# Test writing the heap graph to a file and analysing it when loaded
+	import os, tempfile
+	iso = self.iso
+	hp = self.Use
+	class T(object):
+	    pass
+	t = T()
+	t.a = [T(), T()]
+	t.b = [t.a[0]]
+	fd, fn = tempfile.mkstemp()
+	os.close(fd)
+	try:
+	    numnodes, numedges = hp.export_graph(fn)
+	    g = hp.load_graph(fn)
+	finally:
+	    os.remove(fn)
+	self.aseq((g.numnodes, len(g)), (numnodes, numedges))
+	self.aseq(len(list(g)), len(g))
+	self.aseq(g.typename(0), 'guppy.heapy.heapyc.RootStateType')
+	self.assert_(g.is_hidden(0))
+
+	ix = dict([(id(x), g.index(id(x))) for x in (t, t.a, t.b) + tuple(t.a)])
+	i = ix[id(t)]
+	self.aseq(g.typename(i), T.__module__ + '.T')
+	self.aseq(g.size(i), iso(t).indisize)
+	self.aseq(sorted([(g.typename(j), k) for (j, k) in g.relations(i)]),
+		  [('dict', 'attribute'), ('type', 'interattr')])
+	self.aseq(sorted(g.inv[ix[id(t.a[0])]]), sorted([ix[id(t.a)], ix[id(t.b)]]))
+	self.aseq(g.index(0), -1)
+
+	# The paths follow references; the dominators are the same as in
+	# the live heap
+	ps = list(g.shpaths(ix[id(t.a[0])]))
+	self.aseq(len(ps), 2)
+	for p in ps:
+	    self.aseq((p[0], p[-1]), (0, ix[id(t.a[0])]))
+	    self.aseq(len(p), len(ps[0]))
+	    for k in range(len(p) - 1):
+		self.assert_(p[k+1] in g[p[k]])
+	self.aseq(sorted([p[-2] for p in ps]), sorted([ix[id(t.a)], ix[id(t.b)]]))
+	self.aseq(g.shpath(i), ps[0][:-3])
+	self.aseq(sorted(g.dominos(ix[id(t.a)])), sorted([ix[id(t.a)], ix[id(t.a[1])]]))
+	self.aseq(g.domisize(ix[id(t.a)]), iso(t.a, t.a[1]).indisize)
+	self.aseq(g.domisize(i), sum([g.size(j) for j in g.dominos(i)]))
+	self.assert_(ix[id(t.a[0])] in g.dominos(i))
+	self.aseq(g.imdom[ix[id(t.a[0])]], g.index(id(t.__dict__)))
+
+    def test_export_graph_set(self):
+	# Test classifying the objects of a loaded heap graph
+	import os, tempfile
+	iso = self.iso
+	hp = self.Use
+	class T(object):
+	    pass
+	class C:
+	    pass
+	t = T()
+	t.a = [C(), C(), {}]
+	t.b = [t.a[0]]
+	t.a[0].x = 'abc'
+	fd, fn = tempfile.mkstemp()
+	os.close(fd)
+	try:
+	    hp.export_graph(fn)
+	    g = hp.load_graph(fn)
+	finally:
+	    os.remove(fn)
+	objs = (t, t.__dict__, t.a, t.b, T, C, t.a[0].__dict__) + tuple(t.a)
+	x = g.iso(*[id(o) for o in objs])
+	y = iso(*objs)
+	for by in ('byclodo', 'byclass', 'bytype', 'bysize'):
+	    self.aseq([(r.count, r.size, r.name)
+		       for r in getattr(x, by).stat.get_rows()],
+		      [(r.count, r.size, r.name)
+		       for r in getattr(y, by).stat.get_rows()])
+	self.aseq((x.count, x.size), (y.count, y.indisize))
+	self.aseq(x[0].count, y.byclodo[0].count)
+	self.aseq(x.byid.stat.numrows, len(objs))
+
+	a0 = g.iso(id(t.a[0]))
+	self.aseq(a0.referrers, g.iso(id(t.a), id(t.b)))
+	self.aseq(a0.referents, g.iso(id(t.a[0].__dict__), id(C)))
+	self.aseq(g.iso(id(t.a)).dominos,
+		  g.iso(id(t.a), id(t.a[1]), id(t.a[1].__dict__), id(t.a[2])))
+	d = g.iso(*[id(o) for o in (t.a, t.a[0], t.a[1], t.a[2],
+				    t.a[0].__dict__, t.a[1].__dict__)])
+	self.aseq((a0 | g.iso(id(t.a))).dominos, d)
+	self.aseq((a0 | g.iso(id(t.a))).domisize, d.size)
+	self.aseq(a0.imdom, g.iso(id(t.__dict__)))
+	self.aseq(sorted([p[-2] for p in a0.sp]),
+		  sorted([g.index(id(t.a)), g.index(id(t.b))]))
+	rp = str(a0.rp).split('\n')
+	self.aseq(rp[:2], ['Reference Pattern by <[dict of] class>.',
+			   ' 0: _ --- [-] 1 %s.C: %#x'%(C.__module__, id(t.a[0]))])
+	self.assert_(rp[2].startswith(' 1: a      [-] 2 list: '))
+	self.aseq(a0.rp[1], a0.referrers)
+
     def test_horizon(self):
 	iso = self.iso
 	h = self.View.horizon()
@@ -86,6 +293,60 @@ class FirstCase(TestCase):
 	self.aseq( iso(z).referents, iso(y))
 	self.aseq( iso(y, z).referents, iso(x, y, y[1]))
 
+    def test_sites(self):
+	import os, sys, tempfile
+	iso = self.iso
+	hp = self.Use
+	class T(object):
+	    pass
+	def make(n):
+	    return [T() for i in range(n)]
+	line = make.func_code.co_firstlineno + 1
+	hp.track_sites()
+	x = make(10)
+	hp.track_sites(0)
+	self.aseq(sys.getprofile(), None)
+	site = hp.Site(__file__.replace('.pyc', '.py'), line)
+	self.aseq(iso(*x).bysite.kind, site)
+	self.aseq(iso(*x) & site, iso(*x))
+	self.aseq(iso([]) & site, iso())
+	self.aseq(iso([]).bysite.kind, hp.Site())
+
+	# Every second object, when sampling
+	hp.track_sites(2)
+	y = make(10)
+	hp.track_sites(0)
+	self.aseq((iso(*y) & site).count, 5)
+
+	# Objects moved to an older generation by a collection before the
+	# next event are recorded too
+	def makelists(n):
+	    return [[i] for i in range(n)]
+	hp.track_sites()
+	y = makelists(1000)
+	hp.track_sites(0)
+	site = hp.Site(site.arg[0], makelists.func_code.co_firstlineno + 1)
+	self.aseq(iso(*y).bysite.kind, site)
+	site = hp.Site(site.arg[0], line)
+
+	# The site column of a partition table is kept when dumped and loaded
+	s = iso(x, *x).bytype.get_stat(sites=True)
+	self.aseq(s.format_name, 'SitesFormat')
+	self.aseq([r.site for r in s.get_rows()],
+		  ['%s:%d'%site.arg, '%s:%d'%site.arg])
+	self.assertRaises(ValueError, iso(x).get_stat, sites=True, retained=True)
+	fd, fn = tempfile.mkstemp()
+	os.close(fd)
+	try:
+	    for format in ('text', 'binary'):
+		os.remove(fn)
+		s.dump(fn, format=format)
+		t = hp.load(fn)
+		self.aseq([(r.name, r.site) for r in t.get_rows()],
+			  [(r.name, r.site) for r in s.get_rows()])
+	finally:
+	    os.remove(fn)
+
         
 
 
@@ -5,10 +5,15 @@ from setsc import ImmBitSet	# immutable bitset type
 from setsc import immbit	# immutable bitset singleton constructor
 from setsc import immbitrange	# immutable bitset range constructor
 from setsc import immbitset	# immutable bitset constructor
+from setsc import immbitset_union	# union of many bitsets
+from setsc import immbitset_intersection # intersection of many bitsets
+from setsc import immbitset_frombytes # bitset from ImmBitSet.tobytes()
 from setsc import MutBitSet	# mutable bitset
 from setsc import NodeSet	# base nodeset type
 from setsc import ImmNodeSet	# immmutable nodeset type
 from setsc import MutNodeSet	# mutable nodeset type
+from setsc import immnodeset_union	# union of many nodesets
+from setsc import immnodeset_intersection # intersection of many nodesets
 
 import copy_reg
 from setsc import _bs
@@ -34,15 +39,7 @@ mutnodeset = MutNodeSet
 
 def mutnodeset_union(iterable):
     "Return a mutable nodeset which is the union of all nodesets in iterable."
-    set = mutnodeset()
-    for it in iterable:
-	set |= it
-    return set
-
-def immnodeset_union(iterable, *args):
-    "Return an immmutable nodeset which is the union of all nodesets in iterable."
-    set = mutnodeset_union(iterable)
-    return immnodeset(set, *args)
+    return mutnodeset(immnodeset_union(iterable))
 
 def laxnodeset(v):
     """\
@@ -1695,6 +1695,439 @@ MutBitSet([])
 		    # See that we can pass a subtype to CplBitSet
 		    assert( str(guppy.sets.setsc.CplBitSet(x)) == "(~ImmBitSet(['red', 'blue']))" )
 		
+    def test36(self):
+	# Test hashed mutable nodesets against the bitset ones,
+	# and compare their timing on the addresses of a real heap.
+
+	# Spread the heap over more areas of memory, as a large program would,
+	# with objects from both the small object allocator and malloc.
+	keep = [[' ' * (1000 + i)] * (i % 100) for i in range(20000)]
+	objs = gc.get_objects() + keep + [x[0] for x in keep if x]
+	random.shuffle(objs)
+
+	for hashed in (True, False):
+	    ns = MutNodeSet(objs, hashed=hashed)
+	    assert ns.is_hashed == hashed
+	    assert len(ns) == len(MutNodeSet(objs))
+
+	ha = MutNodeSet(hashed=True)
+	bs = MutNodeSet()
+	for i in range(10):
+	    sample = random.sample(objs, 1000)
+	    for x in sample:
+		assert ha.tas(x) == bs.tas(x)
+	    for x in sample[::2]:
+		assert ha.tac(x) == bs.tac(x)
+	    assert len(ha) == len(bs)
+	    assert ha == bs
+	    assert list(ha) == list(bs)
+	    assert ImmNodeSet(ha) == ImmNodeSet(bs)
+	    for x in sample:
+		assert (x in ha) == (x in bs)
+	x = ha.pop()
+	assert x not in ha and x in bs
+	bs.remove(x)
+	assert len(ha) == len(bs)
+	ha &= sample
+	bs &= sample
+	assert ha == bs
+	ha.clear()
+	assert len(ha) == 0 and list(ha) == []
+
+	def f(objs, hashed):
+	    # Mark and test each object, as a heap traversal does
+	    ns = MutNodeSet(hashed=hashed)
+	    for i in range(3):
+		for x in objs:
+		    ns.tas(x)
+	    return len(ns)
+
+	th, v = eltime(f, (objs, True), retx=1)
+	tb, w = eltime(f, (objs, False), retx=1)
+	print 'marking %d objects: hashed %.3f bitset %.3f'%(len(objs), th, tb)
+	assert v == w
+
+    def test37(self):
+	# Test the buffer of addresses of an immutable nodeset
+	import struct
+	objs = [[] for i in range(10)]
+	ns = ImmNodeSet(objs)
+	m = memoryview(ns)
+	assert (m.ndim, m.shape, m.readonly) == (1, (10,), True)
+	assert m.itemsize == struct.calcsize(m.format)
+	assert list(struct.unpack('10' + m.format, m.tobytes())) == sorted(map(id, objs))
+	assert memoryview(ImmNodeSet()).tobytes() == ''
+	try:
+	    memoryview(MutNodeSet(objs))
+	except TypeError:
+	    pass
+	else:
+	    raise 'Expected TypeError'
+
+    def test38(self):
+	# Test the operations between nodesets of different kinds,
+	# including the in-place ones, against the sets of their ids.
+	kinds = (ImmNodeSet, MutNodeSet, lambda x: MutNodeSet(x, hashed=True))
+	objs = [[] for i in range(2000)]
+	ops = ('__and__', '__or__', '__sub__', '__xor__')
+	iops = ('__iand__', '__ior__', '__isub__', '__ixor__')
+	sops = (set.__and__, set.__or__, set.__sub__, set.__xor__)
+	for x, y in ((objs[:1000], objs[500:]),	# overlapping
+		     (objs[::2], objs[:40]),	# large and small
+		     (objs[:10], objs),
+		     (objs, []),
+		     ([], objs[:5])):
+	    x = x[:]
+	    random.shuffle(x)
+	    ids = set(map(id, x)), set(map(id, y))
+	    for kx in kinds:
+		for ky in kinds:
+		    for op, iop, sop in zip(ops, iops, sops):
+			a, b = kx(x), ky(y)
+			r = getattr(a, op)(b)
+			assert isinstance(r, ImmNodeSet)
+			assert [id(z) for z in r] == sorted(sop(*ids))
+			r = getattr(a, iop)(b)
+			if isinstance(a, MutNodeSet):
+			    assert r is a
+			assert sorted(map(id, r)) == sorted(sop(*ids))
+			assert len(r) == len(sop(*ids))
+		    a = kx(x)
+		    for op in iops:
+			r = getattr(a, op)(a)
+			if op in ('__isub__', '__ixor__'):
+			    assert not r
+			else:
+			    assert sorted(map(id, r)) == sorted(ids[0])
+	# The in-place operations keep the references to the elements
+	a = MutNodeSet()
+	b = ImmNodeSet([[] for i in range(100)])
+	a |= b
+	del b
+	a ^= ImmNodeSet(list(a)[:50])
+	assert len(a) == 50 and [len(z) for z in a] == [0] * 50
+	nodeset_op_times((1000, 10000), verbose=False)
+
+    def test39(self):
+	# Test the unions and intersections of many sets
+	for i in range(100):
+	    sets = []
+	    for j in range(random.randint(0, 5)):
+		base = random.choice((0, 1000000, -1000000))
+		span = random.choice((600, 5000, 1000000))
+		x = random.sample(xrange(base, base + span), random.randint(0, 200))
+		sets.append(random.choice((immbitset, mutbitset, list))(x))
+	    u = immbitset()
+	    for x in sets:
+		u |= immbitset(x)
+	    assert immbitset_union(sets) == u
+	    if sets:
+		a = immbitset(sets[0])
+		for x in sets[1:]:
+		    a &= immbitset(x)
+		assert immbitset_intersection(sets) == a
+	assert immbitset_intersection([]) == Omega
+	assert immbitset_union([~bitset([1, 2]), [2]]) == ~bitset([1])
+	assert immbitset_intersection([~bitset([1, 2]), [2, 3]]) == bitset([3])
+
+	objs = [[] for i in range(1000)]
+	kinds = (ImmNodeSet, MutNodeSet, lambda x: MutNodeSet(x, hashed=True), list)
+	for i in range(100):
+	    sets = []
+	    for j in range(random.randint(0, 5)):
+		sets.append(random.choice(kinds)(random.sample(objs, random.randint(0, 200))))
+	    ids = [set(map(id, x)) for x in sets]
+	    assert [id(x) for x in immnodeset_union(sets)] == sorted(set().union(*ids))
+	    if sets:
+		assert ([id(x) for x in immnodeset_intersection(sets)] ==
+			sorted(set.intersection(*ids)))
+	try:
+	    immnodeset_intersection([])
+	except ValueError:
+	    pass
+	else:
+	    raise 'Expected ValueError'
+	tag = []
+	assert immnodeset_union([objs], tag)._hiding_tag_ is tag
+	assert len(mutnodeset_union([objs[:10], ImmNodeSet(objs[5:20])])) == 20
+
+	# The union of many disjoint sets should take linear time
+	objs = [[] for i in range(200000)]
+	random.shuffle(objs)
+	rows = [ImmNodeSet(objs[i:i + 200]) for i in range(0, len(objs), 200)]
+	def f(rows):
+	    s = MutNodeSet()
+	    for x in rows:
+		s |= x
+	    return s
+	tu, u = eltime(immnodeset_union, (rows,), retx=1)
+	tf, v = eltime(f, (rows,), retx=1)
+	print 'union of %d nodesets: %.3f, one by one: %.3f'%(len(rows), tu, tf)
+	assert u == v
+	rows = [immbitset(random.sample(xrange(i * 1000000, (i + 1) * 1000000), 200))
+		for i in range(1000)]
+	def f(rows):
+	    s = immbitset()
+	    for x in rows:
+		s |= x
+	    return s
+	tu, u = eltime(immbitset_union, (rows,), retx=1)
+	tf, v = eltime(f, (rows,), retx=1)
+	print 'union of %d bitsets: %.3f, one by one: %.3f'%(len(rows), tu, tf)
+	assert u == v
+
+    def test40(self):
+	# Test the bitsets that are kept as runs of bits
+	def runs():
+	    s = set()
+	    for i in range(random.randint(0, 6)):
+		lo = random.randint(-3000, 3000)
+		s.update(range(lo, lo + random.randint(1, 1500)))
+	    return s
+	kinds = (immbitset, FieldBitSet, mutbitset, list)
+	for i in range(200):
+	    sa, sb = runs(), runs()
+	    a = immbitset(sa)
+	    assert list(a) == sorted(sa) and len(a) == len(sa)
+	    assert FieldBitSet(a) == a and hash(FieldBitSet(a)) == hash(a)
+	    assert a << 70 == immbitset([x + 70 for x in sa])
+	    assert a << -128 == immbitset([x - 128 for x in sa])
+	    if sa:
+		assert a[0] == min(sa) and a[-1] == max(sa)
+	    for x in random.sample(range(-3100, 4600), 20):
+		assert (x in a) == (x in sa)
+	    b = random.choice(kinds)(sb)
+	    assert set(a & b) == sa & sb
+	    assert set(a | b) == sa | sb
+	    assert set(a ^ b) == sa ^ sb
+	    assert set(a - b) == sa - sb
+	    assert set(~a & b) == sb - sa
+	    assert (a == immbitset(b)) == (sa == sb)
+	    assert (a <= immbitset(b)) == (sa <= sb)
+	    assert (~a == ~immbitset(b)) == (sa == sb)
+	    m = mutbitset(a)
+	    m ^= b
+	    assert set(m) == sa ^ sb and set(a) == sa
+	    assert cPickle.loads(cPickle.dumps(a)) == a
+	    assert immbitset_union([a, b]) == a | b
+	    assert immbitset_intersection([a, b]) == a & b
+
+	# A set of long runs takes less memory than its fields
+	a = immbitrange(10**8)
+	assert len(a) == 10**8 and a[-1] == 10**8 - 1 and 10**8 - 1 in a
+	assert a._indisize < 100
+	assert (a - immbitrange(10, 10**8 - 10) ==
+		immbitset(range(10) + range(10**8 - 10, 10**8)))
+	b = immbitset(range(100000))
+	assert b == immbitrange(100000) and b._indisize < 100
+	assert FieldBitSet(b)._indisize > 100000 // 8
+	assert immbitrange(0, 1000, 2)._indisize > 1000 // 8
+	bitset_layout_times((10000,), verbose=False)
+
+    def test41(self):
+	# Test the bit counting and searching at the ends of the fields,
+	# and the field loops of the operations
+	edges = [i * 64 + j for i in range(-3, 4) for j in (0, 1, 31, 32, 62, 63)]
+	for i in range(300):
+	    sa = set(random.sample(edges, random.randint(0, len(edges))))
+	    sb = set(random.sample(edges, random.randint(0, len(edges))))
+	    if random.random() < 0.5:
+		sb |= set(random.sample(xrange(-1000, 1000), 50))
+	    a, b = immbitset(sa), immbitset(sb)
+	    assert len(a) == len(sa) and len(mutbitset(a)) == len(sa)
+	    assert list(a) == sorted(sa)
+	    if sa:
+		assert a[0] == min(sa) and a[-1] == max(sa)
+		m = mutbitset(a)
+		assert m[0] == min(sa) and m[-1] == max(sa)
+	    assert list(a & b) == sorted(sa & sb)
+	    assert list(a | b) == sorted(sa | sb)
+	    assert list(a ^ b) == sorted(sa ^ sb)
+	    assert list(a - b) == sorted(sa - sb)
+	    assert list(b - a) == sorted(sb - sa)
+	bitset_op_rates((1000,), verbose=False)
+
+    def test42(self):
+	# Test the compact encoding of bitsets and nodesets
+	frombytes = immbitset_frombytes
+	for bs in (Empty, Omega, immbit(0), immbit(-1), ~immbit(5),
+		   immbitrange(-1000, 1000), immbitrange(0, 100000, 3),
+		   immbitset([sys.maxint, -sys.maxint-1]),
+		   immbitrange(10, 100000) | immbitrange(200000, 300000)):
+	    x = frombytes(bs.tobytes())
+	    assert x == bs and type(x) is type(bs)
+	for i in range(300):
+	    s = set(random.sample(xrange(-1000, 1000), random.randint(0, 100)))
+	    if random.random() < 0.5:
+		lo = random.randint(-1000, 1000)
+		s |= set(range(lo, lo + random.randint(0, 1000)))
+	    bs = immbitset(s)
+	    assert frombytes(bs.tobytes()) == bs
+	# Runs take a few bytes and sparse bits about 2 bytes each
+	assert len(immbitrange(10**6).tobytes()) < 10
+	assert len(immbitrange(0, 10**5, 100).tobytes()) <= 2 * 1000 + 2
+	bs = immbitset(range(0, 1000, 3))
+	assert len(bs.tobytes()) < len(cPickle.dumps(bs, 2))
+	# The buffer has the fields
+	for bs in (immbitrange(100000), immbitset(range(0, 1000, 3))):
+	    m = memoryview(bs)
+	    assert m.readonly and m.ndim == 1
+	    assert m.tobytes() == bs.__reduce__()[1][1]
+	for bad in ('', '\x02\x00', '\x01\x04', '\x01\x00\x00',
+		    '\x01\x00\x00\x03', '\x01\x00\x00\x22', '\x01\x00\x00\x04\x01',
+		    '\x01\x00' + '\xff' * 10 + '\x7f\x01'):
+	    try:
+		frombytes(bad)
+	    except ValueError:
+		pass
+	    else:
+		raise 'expected ValueError for frombytes'
+	# A record of a run is read as a run, however long it is, so a few
+	# bytes do not make a big set of fields
+	def varint(x):
+	    s = ''
+	    while x >= 0x80:
+		s += chr(x & 0x7f | 0x80)
+		x >>= 7
+	    return s + chr(x)
+	bs = frombytes('\x01\x00\x00' + varint((10**12 << 2) | 1))
+	assert len(bs) == 8 * (10**12 + 1) and bs[-1] == 8 * (10**12 + 1) - 1
+	bs = immbitrange(0, 8 * 10**8)
+	assert frombytes(bs.tobytes()) == bs
+	for i in range(1000):
+	    data = '\x01\x00' + ''.join([chr(random.randrange(256)) for j in range(6)])
+	    try:
+		frombytes(data)
+	    except ValueError:
+		pass
+	# A run up to the highest bit is made of fields, if they are few
+	top = sys.maxint // 8
+	bs = frombytes('\x01\x00' + varint((top - 10) << 1) + varint((10 << 2) | 1))
+	assert bs == immbitset(range(8 * (top - 10), sys.maxint)) | immbit(sys.maxint)
+	try:
+	    frombytes('\x01\x00\x00' + varint((top << 2) | 1))
+	except ValueError:
+	    pass
+	else:
+	    raise 'expected ValueError for frombytes'
+	# A nodeset exports the addresses of its elements
+	objs = [[] for i in range(100)]
+	ns = immnodeset(objs)
+	bs = frombytes(ns.tobytes())
+	align = min([id(o) for o in objs]) // bs[0]
+	assert [b * align for b in bs] == sorted([id(o) for o in objs])
+	assert mutnodeset(ns).tobytes() == ns.tobytes()
+	assert mutnodeset(ns, hashed=True).tobytes() == ns.tobytes()
+	assert frombytes(immnodeset(objs[:50]).tobytes()) < bs
+
+
+def nodeset_op_times(sizes=(1000, 10000, 100000, 1000000, 10000000), verbose=True):
+    # Time the operations and in-place operations between immutable and
+    # mutable nodesets of each size, where half of the elements of each
+    # set is in the other. The times are in milliseconds per operation.
+    # Run as: python test.py bench [size...]
+    import operator
+    kinds = (('Imm', ImmNodeSet), ('Mut', MutNodeSet))
+    ops = (('&', operator.and_, operator.iand),
+	   ('|', operator.or_, operator.ior),
+	   ('-', operator.sub, operator.isub),
+	   ('^', operator.xor, operator.ixor))
+    times = {}
+    for n in sizes:
+	objs = [[] for i in range(n)]
+	x, y = objs[:n * 2 // 3], objs[n // 3:]
+	random.shuffle(x)
+	random.shuffle(y)
+	if verbose:
+	    print '%d elements' % n
+	    print '%-10s' % '', ' '.join(['%7s' % op[0] for op in ops]), \
+		  ' '.join(['%7s' % (op[0] + '=') for op in ops])
+	N = max(1, 100000 // n)
+	for nx, kx in kinds:
+	    for ny, ky in kinds:
+		a, b = kx(x), ky(y)
+		row = [eltime(op, (a, b), N) for name, op, iop in ops]
+		for name, op, iop in ops:
+		    as_ = [kx(x) for i in range(N)]
+		    row.append(eltime(map, (iop, as_, [b] * N)))
+		row = [t * 1000 / N for t in row]
+		times[(n, nx, ny)] = row
+		if verbose:
+		    print '%-10s' % (nx + ' ' + ny), ' '.join(['%7.3f' % t for t in row])
+	del objs, x, y, a, b, as_
+    return times
+
+
+class FieldBitSet(ImmBitSet):
+    # An immutable bitset that is always kept as fields, not as runs
+    pass
+
+def bitset_layout_times(sizes=(10000, 100000, 1000000, 10000000), verbose=True):
+    # Compare immutable bitsets kept as runs with the same sets kept as
+    # fields. Each set of a size consists of 10 runs, and the other set
+    # is shifted by half a run. The memory is in bytes and the times are
+    # in milliseconds per operation.
+    # Run as: python test.py layout [size...]
+    import operator
+    ops = (('len', len), ('in', lambda a: 7 in a),
+	   ('hash', hash), ('iter', list),
+	   ('&', operator.and_), ('|', operator.or_),
+	   ('-', operator.sub), ('^', operator.xor), ('==', operator.eq))
+    times = {}
+    for n in sizes:
+	step = n // 10
+	x = immbitset_union([immbitrange(i, i + step // 2) for i in range(0, n, step)])
+	y = x << step // 4
+	if verbose:
+	    print '%d bits' % n
+	    print '%-7s %10s' % ('', 'bytes'), ' '.join(['%7s' % op[0] for op in ops])
+	N = max(1, 100000 // n)
+	for name, kind in (('runs', immbitset), ('fields', FieldBitSet)):
+	    a, b = kind(x), kind(y)
+	    row = []
+	    for op, f in ops:
+		if op in ('len', 'in', 'hash', 'iter'):
+		    # New sets, so the length is not cached
+		    row.append(eltime(map, (f, [kind(a) for i in range(N)])))
+		else:
+		    row.append(eltime(f, (a, b), N))
+	    row = [t * 1000 / N for t in row]
+	    times[(n, name)] = (a._indisize, row)
+	    if verbose:
+		print '%-7s %10d' % (name, a._indisize), ' '.join(['%7.3f' % t for t in row])
+    return times
+
+
+def bitset_op_rates(sizes=(10000, 100000, 1000000), verbose=True):
+    # Report the operations per second on bitsets with a size of bits
+    # each, dense ones with half of the bits of a range set, and sparse
+    # ones with about one bit per field.
+    # Run as: python test.py rates [size...]
+    import operator
+    ops = (('len', lambda a, b: len(mutbitset(a))), ('iter', lambda a, b: list(a)),
+	   ('&', operator.and_), ('|', operator.or_),
+	   ('-', operator.sub), ('^', operator.xor))
+    rates = {}
+    for n in sizes:
+	if verbose:
+	    print '%d bits' % n
+	    print '%-7s' % '', ' '.join(['%10s' % op[0] for op in ops])
+	for name, span in (('dense', 2 * n), ('sparse', 64 * n)):
+	    a, b = [immbitset(random.sample(xrange(span), n)) for i in range(2)]
+	    row = []
+	    for op, f in ops:
+		N = 1
+		while 1:
+		    t = eltime(f, (a, b), N)
+		    if t >= 0.1:
+			break
+		    N *= 4
+		row.append(N / t)
+	    rates[(n, name)] = row
+	    if verbose:
+		print '%-7s' % name, ' '.join(['%10.1f' % r for r in row])
+    return rates
+
 
 class MemStat:
     def __init__(self):
@@ -1782,11 +2215,20 @@ def test_leak():
 	#ms.dump()
 
 def test_main():
-    test_nums(range(36))
+    test_nums(range(43))
 
 t=Test()
 
 if __name__ == '__main__':	    
+    if sys.argv[1:2] == ['bench']:
+	nodeset_op_times(map(int, sys.argv[2:]) or nodeset_op_times.func_defaults[0])
+	sys.exit()
+    if sys.argv[1:2] == ['layout']:
+	bitset_layout_times(map(int, sys.argv[2:]) or bitset_layout_times.func_defaults[0])
+	sys.exit()
+    if sys.argv[1:2] == ['rates']:
+	bitset_op_rates(map(int, sys.argv[2:]) or bitset_op_rates.func_defaults[0])
+	sys.exit()
     #test_leak()
     #t.test25()
     #t.test30()
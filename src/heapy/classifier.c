@@ -172,6 +172,123 @@ cli_epartition(NyObjectClassifierObject *self, PyObject *iterable)
     return NULL;
 }
 
+static char cli_partition_stats_doc[] =
+"C.partition_stats(X:iterable, H:HeapView [, sets:bool]) -> dict\n"
+"\n"
+"Return the count and size of each kind of a set of objects.\n"
+"\n"
+"Each object in X is classified by C to get its kind. The dict\n"
+"returned maps each different kind to a tuple (count, size), where\n"
+"count is the number of objects of that kind and size is the sum of\n"
+"their individual size as seen by the heap view H. If sets is true,\n"
+"the tuples are (count, size, nodeset), the nodeset containing the\n"
+"objects of that kind. This is done in a single pass over X.";
+
+typedef struct {
+    CensusTravArg ct;
+    int sets;
+    PyTypeObject *type;		/* Type of the last object sized, */
+    ExtraType *xt;		/* and its extra type. */
+} PSTravArg;
+
+static int
+cli_partition_stats_iter(PyObject *obj, PSTravArg *ta)
+{
+    CensusEntry *e;
+    PyObject *kind = ta->ct.cli->def->classify(ta->ct.cli->self, obj);
+    if (!kind)
+      return -1;
+    e = census_lookup(ta->ct.table, ta->ct.mask, kind);
+    if (!e->kind) {
+	if ((ta->ct.used + 1) * 3 >= (ta->ct.mask + 1) * 2) {
+	    if (census_grow(&ta->ct) == -1) {
+		Py_DECREF(kind);
+		return -1;
+	    }
+	    e = census_lookup(ta->ct.table, ta->ct.mask, kind);
+	}
+	e->kind = kind;		/* Steals the reference */
+	ta->ct.used++;
+	if (ta->sets) {
+	    e->set = hv_mutnodeset_new(ta->ct.hv);
+	    if (!e->set)
+	      return -1;
+	}
+    } else {
+	Py_DECREF(kind);
+    }
+    if (e->set && NyNodeSet_setobj(e->set, obj) == -1)
+      return -1;
+    /* Objects of the same type tend to come together, eg in a nodeset
+       which is ordered by address, so the extra type is looked up
+       only when the type changes. */
+    if (obj->ob_type != ta->type) {
+	ta->type = obj->ob_type;
+	ta->xt = hv_extra_type(ta->ct.hv, ta->type);
+    }
+    e->count++;
+    e->size += xt_size(ta->xt, obj);
+    return 0;
+}
+
+static PyObject *
+cli_partition_stats(NyObjectClassifierObject *self, PyObject *args)
+{
+    PSTravArg ta;
+    PyObject *iterable, *result = 0;
+    int i;
+    ta.sets = 0;
+    ta.type = 0;
+    ta.xt = 0;
+    ta.ct.cli = self;
+    ta.ct.table = 0;
+    ta.ct.used = 0;
+    if (!PyArg_ParseTuple(args, "OO!|i:partition_stats",
+			  &iterable, &NyHeapView_Type, &ta.ct.hv, &ta.sets))
+      return 0;
+    ta.ct.mask = CENSUS_INITIAL_SIZE - 1;
+    ta.ct.table = PyMem_New(CensusEntry, CENSUS_INITIAL_SIZE);
+    if (!ta.ct.table) {
+	PyErr_NoMemory();
+	goto err;
+    }
+    memset(ta.ct.table, 0, CENSUS_INITIAL_SIZE * sizeof(CensusEntry));
+    if (iterable_iterate(iterable, (visitproc)cli_partition_stats_iter, &ta) == -1)
+      goto err;
+    result = PyDict_New();
+    if (!result)
+      goto err;
+    for (i = 0; i <= ta.ct.mask; i++) {
+	CensusEntry *e = &ta.ct.table[i];
+	PyObject *cs;
+	if (!e->kind)
+	  continue;
+	if (e->set) {
+	    if (NyNodeSet_be_immutable(&e->set) == -1)
+	      goto err1;
+	    cs = Py_BuildValue("(llO)", e->count, e->size, e->set);
+	} else
+	  cs = Py_BuildValue("(ll)", e->count, e->size);
+	if (!cs || PyDict_SetItem(result, e->kind, cs) == -1) {
+	    Py_XDECREF(cs);
+	    goto err1;
+	}
+	Py_DECREF(cs);
+    }
+    goto err;
+  err1:
+    Py_CLEAR(result);
+  err:
+    if (ta.ct.table) {
+	for (i = 0; i <= ta.ct.mask; i++) {
+	    Py_XDECREF(ta.ct.table[i].kind);
+	    Py_XDECREF(ta.ct.table[i].set);
+	}
+	PyMem_Del(ta.ct.table);
+    }
+    return result;
+}
+
 static char cli_select_doc[] =
 "C.select(X:iterable, kind:object, cmp:string) -> list\n"
 "\n"
@@ -305,6 +422,8 @@ static PyMethodDef cli_methods[] = {
     {"classify",(PyCFunction)cli_classify, METH_O, cli_classify_doc},
     {"partition",(PyCFunction)cli_partition, METH_VARARGS, cli_partition_doc},
     {"epartition",(PyCFunction)cli_epartition, METH_O, cli_partition_doc},
+    {"partition_stats",(PyCFunction)cli_partition_stats, METH_VARARGS,
+     cli_partition_stats_doc},
     {"select",(PyCFunction)cli_select, METH_VARARGS, cli_select_doc},
     {NULL,		NULL}		/* sentinel */
 };
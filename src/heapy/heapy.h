@@ -19,9 +19,12 @@ typedef struct {
     PyObject *weak_type_callback;
     char is_hiding_calling_interpreter;
     char is_using_traversing_owner_update;
+    char is_using_hashed_nodesets;
     struct ExtraType **xt_table;
     int xt_mask;
     int xt_size;
+    struct NyDomTree *domtree;
+    struct NyDictOwners *sample_owners;	/* Set during census_sample */
 } NyHeapViewObject;
 
 #define NyHeapView_Check(op) PyObject_TypeCheck(op, &NyHeapView_Type)
@@ -13,16 +13,41 @@ char horizon_doc[]=
 "another set of objects via the news() method. This can be used to see\n"
 "what objects have been allocated but not deallocated since the Horizon\n"
 "object was created.\n"
+"\n"
+"A Horizon object can also record where new objects are allocated;\n"
+"see H.start_sites().\n"
 ;
 
 
 
+typedef struct {
+    PyObject *obj;		/* 0 if the entry is free */
+    int site;			/* Index in sites */
+} NyHorizonSite;
+
 typedef struct _NyHorizonObject {
     PyObject_HEAD
     struct _NyHorizonObject *next;
     NyNodeSetObject *hs;
+
+    /* Allocation sites, see horizon_site_profile */
+    NyHorizonSite *sitetab;	/* From object to its site */
+    int sitemask, siteused;
+    PyObject *sites;		/* List of (filename, lineno) */
+    PyObject *siteindex;	/* Dict from (code, lineno) to index in sites */
+    PyObject *sentinel;		/* Tracked object marking what is seen */
+    PyObject **news;		/* New objects found at an event */
+    int nnews, maxnews;
+    int interval, countdown;
+    int lastcount;		/* Count of generation 0 after the last event */
+    int lastcount1;		/* Count of generation 1, changed by collections */
+    PyCodeObject *lastcode;	/* Memo of the last site found */
+    int lastline, lastsite;
 } NyHorizonObject;
 
+static void horizon_site_remove(NyHorizonObject *hz, PyObject *obj);
+static void horizon_patched_dealloc(PyObject *v);
+
 /* Horizon Management
    The struct rm must be a static/global singleton, since it is intimately bound to patching
  */
@@ -35,11 +60,25 @@ static struct {
 static destructor
 horizon_get_org_dealloc(PyTypeObject *t)
 {
-    PyObject *d = PyDict_GetItem(rm.types, (PyObject *)t);
-    if (!d) {
-	Py_FatalError("horizon_get_org_dealloc: no original destructor found");
+    PyObject *d = rm.types ? PyDict_GetItem(rm.types, (PyObject *)t) : 0;
+    PyTypeObject *b;
+    if (d)
+      return (destructor)PyInt_AsLong(d);
+    /* A type made ready while its base was patched has inherited the
+       patched destructor, so its original is that of the base: as
+       remembered, or as restored when the horizons were removed. */
+    for (b = t->tp_base; b; b = b->tp_base) {
+	if (rm.types && (d = PyDict_GetItem(rm.types, (PyObject *)b))) {
+	    /* Remembered for t, to be restored with the others */
+	    if (PyDict_SetItem(rm.types, (PyObject *)t, d) == -1)
+	      break;
+	    return (destructor)PyInt_AsLong(d);
+	}
+	if (b->tp_dealloc != horizon_patched_dealloc)
+	  return b->tp_dealloc;
     }
-    return (destructor)PyInt_AsLong(d);
+    Py_FatalError("horizon_get_org_dealloc: no original destructor found");
+    return 0;
 }
 
 static void
@@ -68,6 +107,11 @@ horizon_dealloc(NyHorizonObject *rg)
 {
     horizon_remove(rg);
     Py_XDECREF(rg->hs);
+    PyMem_Del(rg->sitetab);
+    PyMem_Del(rg->news);
+    Py_XDECREF(rg->sites);
+    Py_XDECREF(rg->siteindex);
+    Py_XDECREF(rg->sentinel);
     rg->ob_type->tp_free((PyObject *)rg);
 }
 
@@ -93,6 +137,8 @@ horizon_patched_dealloc(PyObject *v)
     for (r = rm.horizons; r; r = r->next) {
 	if (NyNodeSet_clrobj(r->hs, v) == -1)
 	  Py_FatalError("horizon_patched_dealloc: could not clear object in nodeset");
+	if (r->siteused)
+	  horizon_site_remove(r, v);
     }
     horizon_get_org_dealloc(horizon_base(v))(v);
 }
@@ -207,8 +253,355 @@ horizon_news(NyHorizonObject *self, PyObject *arg)
 }
 
 
+/* Allocation sites
+
+   While H.start_sites() is in effect, horizon_site_profile is the
+   profile function of the thread, called at each call and return of
+   Python and builtin functions. Objects tracked by the garbage collector
+   are added at the end of the list of generation 0 when they are
+   created. The sentinel, a tracked object of the horizon, is moved to
+   the end of that list after each event, so the objects after it at the
+   next event are those created meanwhile. They are recorded with the
+   site of the event: the line being executed in the frame of the
+   event, or in the calling frame for a call event.
+
+   Only every interval'th new object is recorded, to save time and
+   space. The count of generation 0, which the collector increments at
+   each allocation and decrements at each deallocation, then tells about
+   how many objects were allocated since the last event; if fewer than
+   are left to the next one to record, and no collection has changed
+   the count of generation 1, the list is not walked, but the sentinel
+   is just moved. Objects deallocated meanwhile make the count
+   smaller, so somewhat fewer objects may be recorded than every
+   interval'th one.
+
+   A collection before the next event moves the surviving objects of
+   generation 0, the sentinel among them, to the end of an older
+   generation, keeping those created after the sentinel after it. The
+   new objects are then those after the sentinel in the list that holds
+   it, and all of generation 0. An older object that the collection
+   found reachable only from a new one is moved after the sentinel as
+   well, so it is taken to be allocated at the event, if it was not
+   recorded before. So is an object that is tracked anew, as a dict may
+   be. The objects recorded are removed from the table when they are
+   deallocated, the same way as objects are removed from the set of the
+   horizon. */
+
+/* The layout of the generations in gcmodule.c, to read the count of
+   generation 0 and find the heads of the lists from _PyGC_generation0 */
+
+typedef struct {
+    PyGC_Head head;
+    int threshold;
+    int count;
+} NyGCGeneration;
+
+#define HZ_NGENERATIONS	3
+#define HZ_GENERATIONS	((NyGCGeneration *)_PyGC_generation0)
+#define HZ_GEN0_COUNT	(HZ_GENERATIONS[0].count)
+
+#define HZ_SITE_HASH(obj)	((int)(((Py_uintptr_t)(obj) >> 3) * 2654435761UL))
+#define HZ_SITE_INITIAL_SIZE	1024
+
+static NyHorizonSite *
+horizon_site_lookup(NyHorizonSite *tab, int mask, PyObject *obj)
+{
+    int i = HZ_SITE_HASH(obj) & mask;
+    while (tab[i].obj && tab[i].obj != obj)
+      i = (i + 1) & mask;
+    return &tab[i];
+}
+
+static int
+horizon_site_add(NyHorizonObject *hz, PyObject *obj, int site)
+{
+    NyHorizonSite *e;
+    PyTypeObject *t;
+    if ((hz->siteused + 1) * 3 >= (hz->sitemask + 1) * 2) {
+	int i, osize = hz->sitemask + 1, nsize = osize * 2;
+	NyHorizonSite *ntab = PyMem_New(NyHorizonSite, nsize);
+	if (!ntab) {
+	    PyErr_NoMemory();
+	    return -1;
+	}
+	memset(ntab, 0, nsize * sizeof(NyHorizonSite));
+	for (i = 0; i < osize; i++) {
+	    if (hz->sitetab[i].obj)
+	      *horizon_site_lookup(ntab, nsize - 1, hz->sitetab[i].obj) =
+		hz->sitetab[i];
+	}
+	PyMem_Del(hz->sitetab);
+	hz->sitetab = ntab;
+	hz->sitemask = nsize - 1;
+    }
+    e = horizon_site_lookup(hz->sitetab, hz->sitemask, obj);
+    if (e->obj)
+      return 0;			/* Keep the first site */
+    t = horizon_base(obj);
+    if (t->tp_dealloc != horizon_patched_dealloc &&
+	horizon_patch_dealloc(t) == -1)
+      return -1;
+    e->obj = obj;
+    e->site = site;
+    hz->siteused++;
+    return 0;
+}
+
+static void
+horizon_site_remove(NyHorizonObject *hz, PyObject *obj)
+{
+    NyHorizonSite *tab = hz->sitetab;
+    int mask = hz->sitemask;
+    int i = HZ_SITE_HASH(obj) & mask;
+    int j;
+    while (tab[i].obj != obj) {
+	if (!tab[i].obj)
+	  return;
+	i = (i + 1) & mask;
+    }
+    /* Shift back the entries after it that would not be found otherwise */
+    for (j = (i + 1) & mask; tab[j].obj; j = (j + 1) & mask) {
+	int k = HZ_SITE_HASH(tab[j].obj) & mask;
+	if (i <= j ? (i < k && k <= j) : (i < k || k <= j))
+	  continue;
+	tab[i] = tab[j];
+	i = j;
+    }
+    tab[i].obj = 0;
+    hz->siteused--;
+}
+
+/* Return the index in sites of the line being executed in frame f,
+   or -1 on error. */
+
+static int
+horizon_site_index(NyHorizonObject *hz, PyFrameObject *f)
+{
+    PyCodeObject *code = f->f_code;
+    int line = PyFrame_GetLineNumber(f);
+    PyObject *key, *index;
+    int site;
+    if (code == hz->lastcode && line == hz->lastline)
+      return hz->lastsite;
+    key = Py_BuildValue("(Oi)", code, line);
+    if (!key)
+      return -1;
+    index = PyDict_GetItem(hz->siteindex, key);
+    if (index) {
+	site = PyInt_AS_LONG(index);
+    } else {
+	PyObject *s = Py_BuildValue("(Oi)", code->co_filename, line);
+	site = PyList_GET_SIZE(hz->sites);
+	if (!s || PyList_Append(hz->sites, s) == -1 ||
+	    !(index = PyInt_FromLong(site)) ||
+	    PyDict_SetItem(hz->siteindex, key, index) == -1) {
+	    Py_XDECREF(s);
+	    Py_XDECREF(index);
+	    Py_DECREF(key);
+	    return -1;
+	}
+	Py_DECREF(s);
+	Py_DECREF(index);
+    }
+    Py_DECREF(key);
+    hz->lastcode = code;	/* Kept by siteindex */
+    hz->lastline = line;
+    hz->lastsite = site;
+    return site;
+}
+
+static int
+horizon_site_is_head(PyGC_Head *g)
+{
+    int i;
+    for (i = 0; i < HZ_NGENERATIONS; i++) {
+	if (g == &HZ_GENERATIONS[i].head)
+	  return 1;
+    }
+    return 0;
+}
+
+/* Take the objects from g up to the end of its list to be new, keeping
+   every interval'th of them in news. Return the head ending the list,
+   or 0 on error. */
+
+static PyGC_Head *
+horizon_site_news(NyHorizonObject *hz, PyGC_Head *g)
+{
+    for (; !horizon_site_is_head(g); g = g->gc.gc_next) {
+	if (--hz->countdown > 0)
+	  continue;
+	hz->countdown = hz->interval;
+	if (hz->nnews >= hz->maxnews) {
+	    int n = hz->maxnews * 2;
+	    PyObject **news = PyMem_Resize(hz->news, PyObject *, n);
+	    if (!news) {
+		PyErr_NoMemory();
+		return 0;
+	    }
+	    hz->news = news;
+	    hz->maxnews = n;
+	}
+	/* Kept alive in case finding the site makes a collection */
+	hz->news[hz->nnews] = (PyObject *)(g + 1);
+	Py_INCREF(hz->news[hz->nnews]);
+	hz->nnews++;
+    }
+    return g;
+}
+
+static int
+horizon_site_profile(NyHorizonObject *hz, PyFrameObject *f, int what,
+		     PyObject *arg)
+{
+    PyGC_Head *sentinel = _Py_AS_GC(hz->sentinel);
+    PyGC_Head *g;
+    int i, site, r = 0;
+    int n = HZ_GEN0_COUNT - hz->lastcount;
+    if (hz->interval > 1 && 0 <= n && n < hz->countdown &&
+	HZ_GENERATIONS[1].count == hz->lastcount1) {
+	hz->countdown -= n;
+	goto done;
+    }
+    /* Collect the new objects to record, before anything is allocated.
+       If the sentinel is no longer in generation 0, it was moved by a
+       collection, and all of generation 0 is new as well. */
+    hz->nnews = 0;
+    g = horizon_site_news(hz, sentinel->gc.gc_next);
+    if (g && g != _PyGC_generation0)
+      g = horizon_site_news(hz, _PyGC_generation0->gc.gc_next);
+    if (!g)
+      r = -1;
+    if (hz->nnews && r == 0 && f) {
+	if (what == PyTrace_CALL && f->f_back)
+	  f = f->f_back;
+	site = horizon_site_index(hz, f);
+	for (i = 0; i < hz->nnews && site != -1; i++) {
+	    if (horizon_site_add(hz, hz->news[i], site) == -1)
+	      site = -1;
+	}
+	if (site == -1)
+	  r = -1;
+    }
+    for (i = 0; i < hz->nnews; i++)
+      Py_DECREF(hz->news[i]);
+    hz->nnews = 0;
+  done:
+    PyObject_GC_UnTrack(hz->sentinel);
+    PyObject_GC_Track(hz->sentinel);
+    hz->lastcount = HZ_GEN0_COUNT;
+    hz->lastcount1 = HZ_GENERATIONS[1].count;
+    return r;
+}
+
+static char start_sites_doc[] =
+"H.start_sites([interval:int])\n"
+"\n"
+"Start recording the allocation sites of new objects, in the current\n"
+"thread. The objects are those tracked by the garbage collector, and\n"
+"every interval'th of them is recorded, by default every one. The site\n"
+"of an object is taken to be the (filename, lineno) that was executed\n"
+"when the next call or return of a function was made. This uses the\n"
+"profile function of the thread, as sys.setprofile() does, so it can\n"
+"not be used together with a profiler.";
+
+static PyObject *
+horizon_start_sites(NyHorizonObject *hz, PyObject *args)
+{
+    PyThreadState *ts = PyThreadState_GET();
+    int interval = 1;
+    if (!PyArg_ParseTuple(args, "|i:start_sites", &interval))
+      return 0;
+    if (interval < 1) {
+	PyErr_SetString(PyExc_ValueError,
+			"start_sites: interval must be positive");
+	return 0;
+    }
+    if (ts->c_profilefunc &&
+	!(ts->c_profilefunc == (Py_tracefunc)horizon_site_profile &&
+	  ts->c_profileobj == (PyObject *)hz)) {
+	PyErr_SetString(PyExc_ValueError,
+			"start_sites: a profile function is already set");
+	return 0;
+    }
+    if (!hz->sitetab) {
+	hz->sitetab = PyMem_New(NyHorizonSite, HZ_SITE_INITIAL_SIZE);
+	hz->maxnews = 64;
+	hz->news = PyMem_New(PyObject *, hz->maxnews);
+	if (!hz->sitetab || !hz->news) {
+	    PyErr_NoMemory();
+	    return 0;
+	}
+	memset(hz->sitetab, 0, HZ_SITE_INITIAL_SIZE * sizeof(NyHorizonSite));
+	hz->sitemask = HZ_SITE_INITIAL_SIZE - 1;
+	if (!(hz->sites = PyList_New(0)) ||
+	    !(hz->siteindex = PyDict_New()) ||
+	    !(hz->sentinel = PyList_New(0)))
+	  return 0;
+    }
+    hz->interval = hz->countdown = interval;
+    PyObject_GC_UnTrack(hz->sentinel);
+    PyObject_GC_Track(hz->sentinel);
+    hz->lastcount = HZ_GEN0_COUNT;
+    hz->lastcount1 = HZ_GENERATIONS[1].count;
+    PyEval_SetProfile((Py_tracefunc)horizon_site_profile, (PyObject *)hz);
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static char stop_sites_doc[] =
+"H.stop_sites()\n"
+"\n"
+"Stop recording allocation sites in the current thread, if H was\n"
+"recording them there. The sites already recorded are kept.";
+
+static PyObject *
+horizon_stop_sites(NyHorizonObject *hz, PyObject *notused)
+{
+    PyThreadState *ts = PyThreadState_GET();
+    if (ts->c_profilefunc == (Py_tracefunc)horizon_site_profile &&
+	ts->c_profileobj == (PyObject *)hz)
+      PyEval_SetProfile(0, 0);
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+/* Return a new reference to the site of obj, or to None if not known */
+
+static PyObject *
+horizon_site_of(NyHorizonObject *hz, PyObject *obj)
+{
+    PyObject *r = Py_None;
+    if (hz->siteused) {
+	NyHorizonSite *e = horizon_site_lookup(hz->sitetab, hz->sitemask, obj);
+	if (e->obj)
+	  r = PyList_GET_ITEM(hz->sites, e->site);
+    }
+    Py_INCREF(r);
+    return r;
+}
+
+/* Used by the site classifier */
+
+static PyObject *
+horizon_site(PyObject *hz, PyObject *obj)
+{
+    return horizon_site_of((NyHorizonObject *)hz, obj);
+}
+
+static char site_doc[] =
+"H.site(x) -> tuple or None\n"
+"\n"
+"Return the allocation site (filename, lineno) recorded for object x,\n"
+"or None if no site was recorded for it.";
+
 static PyMethodDef horizon_methods[] = {
 	{"news", (PyCFunction)horizon_news, METH_O, news_doc},
+	{"site", (PyCFunction)horizon_site_of, METH_O, site_doc},
+	{"start_sites", (PyCFunction)horizon_start_sites, METH_VARARGS,
+	 start_sites_doc},
+	{"stop_sites", (PyCFunction)horizon_stop_sites, METH_NOARGS,
+	 stop_sites_doc},
 	{NULL,		NULL}		/* sentinel */
 };
 
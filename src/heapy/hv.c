@@ -129,6 +129,9 @@ xt_free_table(ExtraType **xt_table, int size)
     PyMem_Del(xt_table);
 }
 
+static void dt_free(struct NyDomTree *dt);
+static PyObject *sc_owner(struct NyDictOwners *ow, PyObject *dict);
+
 static int
 hv_gc_clear(NyHeapViewObject *hv)
 {
@@ -149,6 +152,9 @@ hv_gc_clear(NyHeapViewObject *hv)
 
     xt_free_table(xt, hv->xt_size);
 
+    dt_free(hv->domtree);
+    hv->domtree = 0;
+
 
     Py_XDECREF(ro);
     Py_XDECREF(lf);
@@ -519,6 +525,8 @@ xt_traverse(ExtraType *xt, PyObject *obj, visitproc visit, void *arg)
 NyNodeSetObject *
 hv_mutnodeset_new(NyHeapViewObject *hv)
 {
+    if (hv->is_using_hashed_nodesets)
+      return NyMutNodeSet_NewFlagsHiding(NS_HOLDOBJECTS | NS_HASHED, hv->_hiding_tag_);
     return NyMutNodeSet_NewHiding(hv->_hiding_tag_);
 }
 
@@ -672,6 +680,8 @@ NyHeapView_SubTypeNew(PyTypeObject *type, PyObject *root, PyTupleObject *heapdef
     hv->xt_mask = XT_MASK;
     hv->weak_type_callback = 0;
     hv->xt_table = 0;
+    hv->domtree = 0;
+    hv->sample_owners = 0;
 
     /* The HeapView object hv is now initialized to some well-defined state --
        but we have waited to try allocation till now when all
@@ -778,9 +788,12 @@ hv_delete_extra_type(NyHeapViewObject *hv, PyObject *wr)
 
 #include "hv_cli.c"
 
+#include "hv_travstack.c"
+
 typedef struct {
     NyHeapViewObject *hv;
     NyNodeSetObject *hs;
+    NyTravStack st;
     PyObject *arg;
     int (*visit)(PyObject *, void *);
 } IterTravArg;
@@ -799,29 +812,49 @@ iter_rec(PyObject *obj, IterTravArg *ta) {
     }
     r = ta->visit(obj, ta->arg);
     if (!r) {
-	r = hv_std_traverse(ta->hv, obj, (visitproc)iter_rec, ta);
+	r = travstack_push(&ta->st, obj);
     }
     return r;
 }
 
-int
-NyHeapView_iterate(NyHeapViewObject *hv, int (*visit)(PyObject *, void *),
-		void *arg)
+static int
+hv_iterate_flags(NyHeapViewObject *hv, int (*visit)(PyObject *, void *),
+		 void *arg, int holding)
 {
+    /* Visits each object in the heap once. If not holding, the set of
+       the visited objects does not keep them alive. */
     IterTravArg ta;
     int r;
     ta.hv = hv;
     ta.visit = visit;
     ta.arg = arg;
-    ta.hs = hv_mutnodeset_new(hv);
+    if (holding)
+      ta.hs = hv_mutnodeset_new(hv);
+    else
+      ta.hs = NyMutNodeSet_NewFlagsHiding(
+	  hv->is_using_hashed_nodesets ? NS_HASHED : 0, hv->_hiding_tag_);
     if (!ta.hs) {
 	return -1;
     }
+    if (travstack_init(&ta.st) == -1) {
+	Py_DECREF(ta.hs);
+	return -1;
+    }
     r = iter_rec(ta.hv->root, &ta);
+    if (!r)
+      r = hv_travstack_walk(ta.hv, &ta.st, (visitproc)iter_rec, &ta);
+    travstack_fini(&ta.st);
     Py_DECREF(ta.hs);
     return r;
 }
 
+int
+NyHeapView_iterate(NyHeapViewObject *hv, int (*visit)(PyObject *, void *),
+		void *arg)
+{
+    return hv_iterate_flags(hv, visit, arg, 1);
+}
+
 PyDoc_STRVAR(hv_heap_doc,
 "HV.heap() -> NodeSet\n\
 \n\
@@ -831,6 +864,7 @@ defined by HV. See also HeapView.__doc__.");
 typedef struct {
     NyHeapViewObject *hv;
     NyNodeSetObject *visited;
+    NyTravStack st;
 } HeapTravArg;
 
 static int
@@ -840,7 +874,7 @@ hv_heap_rec(PyObject *obj, HeapTravArg *ta) {
     if (r)
       return r < 0 ? r: 0;
     else {
-	return hv_std_traverse(ta->hv, obj, (visitproc)hv_heap_rec, ta);
+	return travstack_push(&ta->st, obj);
     }
 
 }
@@ -864,11 +898,18 @@ static PyObject *
 hv_heap(NyHeapViewObject *self, PyObject *args, PyObject *kwds)
 {
     HeapTravArg ta;
+    int r;
     ta.hv = self;
     ta.visited = hv_mutnodeset_new(self);
     if (!ta.visited)
       goto err;
-    if (hv_heap_rec(ta.hv->root, &ta) == -1)
+    if (travstack_init(&ta.st) == -1)
+      goto err;
+    r = hv_heap_rec(ta.hv->root, &ta);
+    if (r != -1)
+      r = hv_travstack_walk(ta.hv, &ta.st, (visitproc)hv_heap_rec, &ta);
+    travstack_fini(&ta.st);
+    if (r == -1)
       goto err;
     if (hv_cleanup_mutset(ta.hv, ta.visited) == -1)
       goto err;
@@ -913,6 +954,191 @@ hv_indisize_sum(NyHeapViewObject *self, PyObject *arg)
 }
 
 
+/* Census: count and individual size per kind, in a single pass.
+
+   The kinds are kept in an open addressing hash table keyed on the
+   address of the kind object, like the kinds are keyed in
+   cli_epartition, so no Python level objects need to be allocated
+   per classified object. */
+
+typedef struct {
+    PyObject *kind;
+    long count;
+    long size;
+    int end;			/* Used by domtree_retained */
+    NyNodeSetObject *set;	/* Used by cli_partition_stats */
+} CensusEntry;
+
+typedef struct {
+    NyHeapViewObject *hv;
+    NyObjectClassifierObject *cli;
+    CensusEntry *table;
+    int mask;
+    int used;
+} CensusTravArg;
+
+#define CENSUS_INITIAL_SIZE	64
+#define CENSUS_HASH(kind)	((int)(((Py_uintptr_t)(kind) >> 3) * 2654435761UL))
+
+static CensusEntry *
+census_lookup(CensusEntry *table, int mask, PyObject *kind)
+{
+    int i = CENSUS_HASH(kind) & mask;
+    while (table[i].kind && table[i].kind != kind)
+      i = (i + 1) & mask;
+    return &table[i];
+}
+
+static int
+census_grow(CensusTravArg *ta)
+{
+    int osize = ta->mask + 1;
+    int nsize = osize * 2;
+    CensusEntry *otable = ta->table;
+    CensusEntry *ntable = PyMem_New(CensusEntry, nsize);
+    int i;
+    if (!ntable) {
+	PyErr_NoMemory();
+	return -1;
+    }
+    memset(ntable, 0, nsize * sizeof(CensusEntry));
+    for (i = 0; i < osize; i++) {
+	if (otable[i].kind)
+	  *census_lookup(ntable, nsize - 1, otable[i].kind) = otable[i];
+    }
+    PyMem_Del(otable);
+    ta->table = ntable;
+    ta->mask = nsize - 1;
+    return 0;
+}
+
+static int
+hv_census_rec(PyObject *obj, CensusTravArg *ta)
+{
+    CensusEntry *e;
+    PyObject *kind = ta->cli->def->classify(ta->cli->self, obj);
+    if (!kind)
+      return -1;
+    e = census_lookup(ta->table, ta->mask, kind);
+    if (!e->kind) {
+	if ((ta->used + 1) * 3 >= (ta->mask + 1) * 2) {
+	    if (census_grow(ta) == -1) {
+		Py_DECREF(kind);
+		return -1;
+	    }
+	    e = census_lookup(ta->table, ta->mask, kind);
+	}
+	e->kind = kind;		/* Steals the reference */
+	ta->used++;
+    } else {
+	Py_DECREF(kind);
+    }
+    e->count++;
+    e->size += hv_std_size(ta->hv, obj);
+    return 0;
+}
+
+typedef struct {
+    CensusTravArg *ta;
+    int update_static_types;
+} CensusIterArg;
+
+static int
+hv_census_visit(PyObject *obj, CensusIterArg *arg)
+{
+    /* Classifies the objects as they are found by the traversal,
+       leaving out the hidden objects as hv_heap does. */
+    if (hv_is_obj_hidden(arg->ta->hv, obj))
+      return 0;
+    if (arg->update_static_types &&
+	hv_update_static_types_visitor(obj, arg->ta->hv) == -1)
+      return -1;
+    return hv_census_rec(obj, arg->ta);
+}
+
+static int hv_census_parallel(NyHeapViewObject *hv, NyObjectClassifierObject *cli,
+			      int nthreads, CensusTravArg *ta);
+
+PyDoc_STRVAR(hv_census_doc,
+"HV.census(C:ObjectClassifier [, nthreads:int]) -> list\n\
+\n\
+Return a list of tuples (kind, count, size), one for each kind of the\n\
+'visible objects' in the heap as classified by C. The count is the\n\
+number of objects of the kind and the size is the sum of their\n\
+individual size.\n\
+\n\
+The result is the same as would be got from partitioning HV.heap()\n\
+by C and summing the parts, but the objects are classified as they are\n\
+found by the traversal. Only a set of the addresses of the visited\n\
+objects with more than one reference is kept, which does not hold\n\
+the objects. See also HeapView.__doc__.\n\
+\n\
+If nthreads is greater than 1, the objects are classified and sized\n\
+by that many native threads, while the interpreter lock is held. This\n\
+is done for classifiers made by cli_type, cli_class, cli_indisize,\n\
+cli_dictof by type or class, and cli_and of at most two of these, such\n\
+as the one of Clodo. The threads divide the objects as found by the\n\
+traversal, whose addresses are then kept in an array, but no set of\n\
+them is made. Other classifiers are used by a single thread.");
+
+static PyObject *
+hv_census(NyHeapViewObject *self, PyObject *args)
+{
+    CensusTravArg ta;
+    PyObject *result = 0;
+    int i, nthreads = 1, r = 0;
+    ta.hv = self;
+    ta.table = 0;
+    ta.used = 0;
+    if (!PyArg_ParseTuple(args, "O!|i:census",
+			  &NyObjectClassifier_Type, &ta.cli, &nthreads))
+      return 0;
+    ta.mask = CENSUS_INITIAL_SIZE - 1;
+    ta.table = PyMem_New(CensusEntry, CENSUS_INITIAL_SIZE);
+    if (!ta.table) {
+	PyErr_NoMemory();
+	goto err;
+    }
+    memset(ta.table, 0, CENSUS_INITIAL_SIZE * sizeof(CensusEntry));
+    if (nthreads > 1) {
+	r = hv_census_parallel(self, ta.cli, nthreads, &ta);
+	if (r == -1)
+	  goto err;
+    }
+    if (!r) {
+	CensusIterArg ia;
+	ia.ta = &ta;
+	ia.update_static_types = PyObject_Length(self->static_types) == 0;
+	if (hv_iterate_flags(self, (int (*)(PyObject *, void *))hv_census_visit,
+			     &ia, 0) == -1)
+	  goto err;
+    }
+    result = PyList_New(0);
+    if (!result)
+      goto err;
+    for (i = 0; i <= ta.mask; i++) {
+	CensusEntry *e = &ta.table[i];
+	PyObject *cs;
+	if (!e->kind)
+	  continue;
+	cs = Py_BuildValue("(Oll)", e->kind, e->count, e->size);
+	if (!cs || PyList_Append(result, cs) == -1) {
+	    Py_XDECREF(cs);
+	    Py_CLEAR(result);
+	    goto err;
+	}
+	Py_DECREF(cs);
+    }
+  err:
+    if (ta.table) {
+	for (i = 0; i <= ta.mask; i++)
+	  Py_XDECREF(ta.table[i].kind);
+	PyMem_Del(ta.table);
+    }
+    return result;
+}
+
+
 
 typedef struct {
     NyHeapRelate hr;
@@ -1002,6 +1228,7 @@ typedef struct {
     NyHeapViewObject *hv;
     NyNodeSetObject *start, *avoid;
     NyNodeSetObject *visited;
+    NyTravStack st;
 } RATravArg;
 
 static int
@@ -1014,7 +1241,20 @@ hv_ra_rec(PyObject *obj, RATravArg *ta)
     if (r)
       return r < 0 ? r: 0;
     else
-      return hv_std_traverse(ta->hv, obj, (visitproc)hv_ra_rec, ta);
+      return travstack_push(&ta->st, obj);
+}
+
+static int
+hv_reachable_walk(RATravArg *ta, visitproc visit)
+{
+    int r;
+    if (travstack_init(&ta->st) == -1)
+      return -1;
+    r = NyNodeSet_iterate(ta->start, visit, ta);
+    if (r != -1)
+      r = hv_travstack_walk(ta->hv, &ta->st, visit, ta);
+    travstack_fini(&ta->st);
+    return r;
 }
 
 PyDoc_STRVAR(hv_reachable_doc,
@@ -1036,7 +1276,7 @@ hv_reachable(NyHeapViewObject *self, PyObject *args, PyObject *kwds)
     ta.visited = hv_mutnodeset_new(self);
     if (!ta.visited)
       goto err;
-    if (NyNodeSet_iterate(ta.start, (visitproc)hv_ra_rec, &ta) == -1)
+    if (hv_reachable_walk(&ta, (visitproc)hv_ra_rec) == -1)
       goto err;
     if (hv_cleanup_mutset(ta.hv, ta.visited) == -1)
       goto err;
@@ -1056,7 +1296,7 @@ hv_ra_rec_e(PyObject *obj, RATravArg *ta)
     else {
 	if (NyNodeSet_hasobj(ta->avoid, obj))
 	  return 0;
-	return hv_std_traverse(ta->hv, obj, (visitproc)hv_ra_rec_e, ta);
+	return travstack_push(&ta->st, obj);
     }
 }
 
@@ -1080,7 +1320,7 @@ hv_reachable_x(NyHeapViewObject *self, PyObject *args, PyObject *kwds)
     ta.visited = hv_mutnodeset_new(self);
     if (!ta.visited)
       goto err;
-    if (NyNodeSet_iterate(ta.start, (visitproc)hv_ra_rec_e, &ta) == -1)
+    if (hv_reachable_walk(&ta, (visitproc)hv_ra_rec_e) == -1)
       goto err;
     if (hv_cleanup_mutset(ta.hv, ta.visited) == -1)
       goto err;
@@ -1449,34 +1689,29 @@ hv_update_dictowners(NyHeapViewObject *self, PyObject *args)
     return Py_None;
 }
 
-#define RG_STACK_MARK 0x8000000
-
-static int
-rg_is_on_stack(PyObject *obj)
-{
-    return obj->ob_refcnt & RG_STACK_MARK;
-}
-
-static void
-rg_set_on_stack(PyObject *obj)
-{
-     obj->ob_refcnt |= RG_STACK_MARK;
-}     
-
-static void
-rg_clr_on_stack(PyObject *obj)
-{
-     obj->ob_refcnt &= ~RG_STACK_MARK;
-}     
+/* Code specific for update ... */
 
+/* The referrer graph is updated by a depth first walk from the root
+   where an object is known to be on a path to the target set only when
+   its referents have been walked. The objects being walked are kept as
+   frames in RetaTravArg, their referents waiting to be visited on the
+   traversal stack above the base of their frame. */
 
-/* Code specific for update ... */
+typedef struct {
+    PyObject *obj;
+    Py_ssize_t base;		/* Stack size when obj was entered */
+    int osize;			/* Graph size when obj was entered */
+    int marked;			/* Whether obj is in onstack */
+} RetaFrame;
 
 typedef struct {
     NyHeapViewObject *hv;
-    NyNodeSetObject *targetset, *markset, *outset;
+    NyNodeSetObject *targetset, *markset, *outset, *onstack;
     NyNodeGraphObject *rg;
     PyObject *retainer;
+    NyTravStack st;
+    RetaFrame *frames;
+    Py_ssize_t nframes, allo;
 } RetaTravArg;
 
 static int
@@ -1489,25 +1724,61 @@ rg_put_set_out(RetaTravArg *ta, PyObject *obj)
     return 0;
 }
 
-static int rg_retarec(PyObject *obj, RetaTravArg *ta);
+/* Record what was found about obj, retained by ta->retainer, when its
+   referents have been walked; r tells if it is on a path to the target. */
 
 static int
-rg_traverec(PyObject *obj, RetaTravArg *ta)
+rg_left(RetaTravArg *ta, PyObject *obj, int marked, int r)
 {
-    PyObject *oretainer = ta->retainer;
-    int osize = ta->rg->used_size;
-    int r;
+    if (!marked)
+      return r ? NyNodeGraph_AddEdge(ta->rg, obj, ta->retainer) : 0;
+    if (NyNodeSet_clrobj(ta->onstack, obj) == -1)
+      return -1;
+    if (r)
+      return rg_put_set_out(ta, obj);
+    return NyNodeSet_setobj(ta->markset, obj);
+}
+
+static int
+rg_enter(RetaTravArg *ta, PyObject *obj, int marked)
+{
+    RetaFrame *f;
     if (obj == (PyObject *)ta->rg)
+      return rg_left(ta, obj, marked, 0);
+    assert((Py_uintptr_t)obj->ob_type > 0x1000);
+    if (ta->nframes == ta->allo) {
+	Py_ssize_t allo = ta->allo ? ta->allo * 2 : NYTRAVSTACK_INITSIZE;
+	RetaFrame *frames = ta->frames;
+	PyMem_RESIZE(frames, RetaFrame, allo);
+	if (!frames) {
+	    PyErr_NoMemory();
+	    return -1;
+	}
+	ta->frames = frames;
+	ta->allo = allo;
+    }
+    if (marked && NyNodeSet_setobj(ta->onstack, obj) == -1)
+      return -1;
+    f = &ta->frames[ta->nframes++];
+    f->obj = obj;
+    f->base = ta->st.sp;
+    f->osize = ta->rg->used_size;
+    f->marked = marked;
+    return hv_std_traverse(ta->hv, obj, (visitproc)travstack_visit, &ta->st);
+}
+
+static int
+rg_leave(RetaTravArg *ta)
+{
+    RetaFrame *f = &ta->frames[--ta->nframes];
+    PyObject *obj = f->obj;
+    int r = (f->osize < ta->rg->used_size ||
+	     (!ta->targetset && obj != ta->hv->root) ||
+	     (ta->targetset && NyNodeSet_hasobj(ta->targetset, obj)));
+    if (!ta->nframes)
       return 0;
-    assert(obj->ob_refcnt < 0xa000000 && (Py_uintptr_t)obj->ob_type > 0x1000);
-    ta->retainer = obj;
-    r = hv_std_traverse(ta->hv, obj, (visitproc)rg_retarec, ta);
-    ta->retainer = oretainer;
-    if (r != -1)
-      r = (osize < ta->rg->used_size ||
-	   (!ta->targetset && obj != ta->hv->root) ||
-	   (ta->targetset && NyNodeSet_hasobj(ta->targetset, obj)));
-    return r;
+    ta->retainer = f[-1].obj;
+    return rg_left(ta, obj, f->marked, r);
 }
 
 static int
@@ -1515,28 +1786,70 @@ rg_retarec(PyObject *obj, RetaTravArg *ta) {
     int r;
     if (obj == ta->hv->root)
       r = 0;
-    else if (rg_is_on_stack(obj)) {
-	r = rg_put_set_out(ta, obj);
-    } else if (obj->ob_refcnt == 1) {
-	r = rg_traverec(obj, ta);
-	if (r > 0)
-	  r = NyNodeGraph_AddEdge(ta->rg, obj, ta->retainer);
+    else if (obj->ob_refcnt == 1) {
+	r = rg_enter(ta, obj, 0);
     } else if (NyNodeSet_hasobj(ta->markset, obj)) {
 	r = 0;
     } else if (NyNodeSet_hasobj(ta->outset, obj)) {
 	r = NyNodeGraph_AddEdge(ta->rg, obj, ta->retainer);
+    } else if (NyNodeSet_hasobj(ta->onstack, obj)) {
+	/* Not in outset, so not yet found to be on a path */
+	r = rg_put_set_out(ta, obj);
     } else {
-	rg_set_on_stack(obj);
-	r = rg_traverec(obj, ta);
-	rg_clr_on_stack(obj);
-	if (r > 0)
-	  r = rg_put_set_out(ta, obj);
-	else if (r == 0)
-	  r = NyNodeSet_setobj(ta->markset, obj);
+	r = rg_enter(ta, obj, 1);
     }
     return r;
 }
 
+static int
+rg_traverec(PyObject *root, RetaTravArg *ta)
+{
+    int r;
+    ta->frames = 0;
+    ta->nframes = ta->allo = 0;
+    if (travstack_init(&ta->st) == -1)
+      return -1;
+    ta->retainer = 0;
+    r = rg_enter(ta, root, 0);
+    while (r != -1 && ta->nframes) {
+	RetaFrame *f = &ta->frames[ta->nframes - 1];
+	ta->retainer = f->obj;
+	if (ta->st.sp > f->base)
+	  r = rg_retarec(ta->st.items[--ta->st.sp], ta);
+	else
+	  r = rg_leave(ta);
+    }
+    PyMem_FREE(ta->frames);
+    travstack_fini(&ta->st);
+    return r == -1 ? -1 : 0;
+}
+
+
+static int
+hv_update_referrers_to(NyHeapViewObject *self, NyNodeGraphObject *rg,
+		       NyNodeSetObject *targetset)
+{
+    RetaTravArg ta;
+    int r;
+    ta.hv = self;
+    ta.rg = rg;
+    ta.targetset = targetset;
+    ta.markset = hv_mutnodeset_new(self);
+    ta.outset = hv_mutnodeset_new(self);
+    ta.onstack = NyMutNodeSet_NewFlagsHiding(
+	self->is_using_hashed_nodesets ? NS_HASHED : 0, self->_hiding_tag_);
+    if (!(ta.markset && ta.outset && ta.onstack)) {
+	Py_XDECREF(ta.markset);
+	Py_XDECREF(ta.outset);
+	Py_XDECREF(ta.onstack);
+	return -1;
+    }
+    r = rg_traverec(ta.hv->root, &ta);
+    Py_DECREF(ta.markset);
+    Py_DECREF(ta.outset);
+    Py_DECREF(ta.onstack);
+    return r;
+}
 
 PyDoc_STRVAR(hv_update_referrers_doc,
 "HV.update_referrers(X:NodeGraph, Y:NodeSet)\n"
@@ -1550,31 +1863,16 @@ PyDoc_STRVAR(hv_update_referrers_doc,
 PyObject *
 hv_update_referrers(NyHeapViewObject *self, PyObject *args)
 {
-    RetaTravArg ta;
-    int r;
+    NyNodeGraphObject *rg;
+    NyNodeSetObject *targetset;
     if (!PyArg_ParseTuple(args, "O!O!:update_referrers",
-			  &NyNodeGraph_Type, &ta.rg,
-			  NyNodeSet_TYPE, &ta.targetset))
+			  &NyNodeGraph_Type, &rg,
+			  NyNodeSet_TYPE, &targetset))
       return NULL;
-
-    ta.hv = self;
-    ta.markset = hv_mutnodeset_new(self);
-    ta.outset = hv_mutnodeset_new(self);
-    if (!(ta.markset && ta.outset)) {
-	Py_XDECREF(ta.markset);
-	Py_XDECREF(ta.outset);
-	return 0;
-    }
-    ta.retainer = 0;
-    r = rg_traverec(ta.hv->root, &ta);
-    Py_DECREF(ta.markset);
-    Py_DECREF(ta.outset);
-    if (r != -1) {
-	Py_INCREF(Py_None);
-	return Py_None;
-    } else {
-	return 0;
-    }
+    if (hv_update_referrers_to(self, rg, targetset) == -1)
+      return 0;
+    Py_INCREF(Py_None);
+    return Py_None;
 }
 
 PyDoc_STRVAR(hv_update_referrers_completely_doc,
@@ -1649,7 +1947,15 @@ hv_update_referrers_completely(NyHeapViewObject *self, PyObject *args)
     return result;
 }
 
+#include "hv_domtree.c"
+#include "hv_export.c"
+#include "hv_shpath.c"
+#include "hv_pcensus.c"
+#include "hv_scensus.c"
+
 static PyMethodDef hv_methods[] = {
+    {"census", (PyCFunction)hv_census, METH_VARARGS, hv_census_doc},
+    {"census_sample", (PyCFunction)hv_census_sample, METH_VARARGS, hv_census_sample_doc},
     {"cli_and", (PyCFunction)hv_cli_and, METH_VARARGS, hv_cli_and_doc},
     {"cli_class", (PyCFunction)hv_cli_class, METH_NOARGS, hv_cli_class_doc},
     {"cli_dictof", (PyCFunction)hv_cli_dictof, METH_VARARGS, hv_cli_dictof_doc},
@@ -1660,9 +1966,16 @@ static PyMethodDef hv_methods[] = {
     {"cli_inrel", (PyCFunction)hv_cli_inrel, METH_VARARGS, hv_cli_inrel_doc},
     {"cli_none", (PyCFunction)hv_cli_none, METH_NOARGS, hv_cli_none_doc},
     {"cli_rcs", (PyCFunction)hv_cli_rcs, METH_VARARGS, hv_cli_rcs_doc},
+    {"cli_site", (PyCFunction)hv_cli_site, METH_VARARGS, hv_cli_site_doc},
     {"cli_type", (PyCFunction)hv_cli_type, METH_NOARGS, hv_cli_type_doc},
     {"cli_user_defined", (PyCFunction)hv_cli_user_defined, METH_KEYWORDS, hv_cli_user_defined_doc},
+    {"clear_domtree", (PyCFunction)hv_clear_domtree, METH_NOARGS, hv_clear_domtree_doc},
     {"delete_extra_type", (PyCFunction)hv_delete_extra_type, METH_O, hv_delete_extra_type_doc},
+    {"domtree_dominos", (PyCFunction)hv_domtree_dominos, METH_VARARGS, hv_domtree_dominos_doc},
+    {"domtree_domisize", (PyCFunction)hv_domtree_domisize, METH_VARARGS, hv_domtree_domisize_doc},
+    {"domtree_imdom", (PyCFunction)hv_domtree_imdom, METH_VARARGS, hv_domtree_imdom_doc},
+    {"domtree_retained", (PyCFunction)hv_domtree_retained, METH_VARARGS, hv_domtree_retained_doc},
+    {"export_graph", (PyCFunction)hv_export_graph, METH_VARARGS, hv_export_graph_doc},
     {"indisize_sum", (PyCFunction)hv_indisize_sum, METH_O, hv_indisize_sum_doc},
     {"heap", (PyCFunction)hv_heap, METH_NOARGS, hv_heap_doc},
     {"numedges", (PyCFunction)hv_numedges, METH_VARARGS, hv_numedges_doc},
@@ -1675,6 +1988,8 @@ static PyMethodDef hv_methods[] = {
     {"relate", (PyCFunction)hv_relate, METH_KEYWORDS, hv_relate_doc},
     {"relimg", (PyCFunction)hv_relimg, METH_O, hv_relimg_doc},
     {"shpathstep", (PyCFunction)hv_shpathstep, METH_KEYWORDS, hv_shpathstep_doc},
+    {"shpathsearch", (PyCFunction)hv_shpathsearch, METH_KEYWORDS, hv_shpathsearch_doc},
+    {"update_domtree", (PyCFunction)hv_update_domtree, METH_NOARGS, hv_update_domtree_doc},
     {"update_dictowners", (PyCFunction)hv_update_dictowners, METH_VARARGS,
        hv_update_dictowners_doc},
     {"update_referrers", (PyCFunction)hv_update_referrers, METH_VARARGS,
@@ -1723,6 +2038,15 @@ dicts found in the gc collection structure, by gc.get_objects(). This was\n\
 found to be much faster in usual cases, but the old version is available\n\
 by setting this flag. -- It may be removed in a later release! --"},
 
+    {"is_using_hashed_nodesets", T_UBYTE, OFF(is_using_hashed_nodesets), 0,
+"HV.is_using_hashed_nodesets : boolean kind\n\
+\n\
+If True, the mutable nodesets that HV makes to mark the objects seen in\n\
+a traversal, and to collect its results, keep their elements in an\n\
+address hash table instead of a bitset; see MutNodeSet. This may be\n\
+faster when the heap is spread out in many separate areas of memory.\n\
+The default is False."},
+
 
     {"root",	 T_OBJECT, OFF(root), 0, 
 "HV.root\n\
@@ -8,6 +8,7 @@
 #include "hv_cli_idset.c"
 #include "hv_cli_rcs.c"
 #include "hv_cli_indisize.c"
+#include "hv_cli_site.c"
 #include "hv_cli_findex.c"
 #include "hv_cli_rel.c"
 #include "hv_cli_user.c"
@@ -156,6 +156,16 @@ hv_cli_dictof_classify(DictofObject *self, PyObject *obj)
 	if (NyNodeGraph_Region(self->owners, obj, &lo, &hi) == -1) {
 	    return 0;
 	}
+	if (!(lo < hi) && self->hv->sample_owners) {
+	    /* In census_sample, the owners are those it has found from
+	       its list of objects, so that it does not walk the heap */
+	    PyObject *owner = sc_owner(self->hv->sample_owners, obj);
+	    if (owner)
+	      return self->ownerclassifier->def->classify
+		(self->ownerclassifier->self, owner);
+	    Py_INCREF(self->notownedkind);
+	    return self->notownedkind;
+	}
 	if (!(lo < hi)) {
 	    NyNodeGraph_Clear(self->owners);
 	    if (hv_cli_dictof_update(self->hv, self->owners) == -1)
@@ -0,0 +1,85 @@
+/* Implementation of the 'site' classifier */
+
+typedef struct {
+    PyObject_VAR_HEAD
+    PyObject *horizon;
+    PyObject *memo;
+} SiteObject;
+
+static PyObject *horizon_site(PyObject *hz, PyObject *obj);
+
+static PyObject *
+hv_cli_site_memoized_kind(SiteObject *self, PyObject *site)
+{
+    PyObject *memoedsite = PyDict_GetItem(self->memo, site);
+    if (!memoedsite) {
+	if (PyDict_SetItem(self->memo, site, site) == -1) {
+	    return 0;
+	}
+	memoedsite = site;
+    }
+    Py_INCREF(memoedsite);
+    return memoedsite;
+}
+
+static PyObject *
+hv_cli_site_classify(SiteObject *self, PyObject *obj)
+{
+    PyObject *site = horizon_site(self->horizon, obj);
+    PyObject *memoedsite;
+    if (!site)
+      return site;
+    memoedsite = hv_cli_site_memoized_kind(self, site);
+    Py_DECREF(site);
+    return memoedsite;
+}
+
+static int
+hv_cli_site_le(PyObject * self, PyObject *a, PyObject *b)
+{
+    return PyObject_RichCompareBool(a, b, Py_EQ);
+}
+
+
+static NyObjectClassifierDef hv_cli_site_def = {
+    0,
+    sizeof(NyObjectClassifierDef),
+    "cli_site",
+    "classifier returning object allocation site",
+    (binaryfunc)hv_cli_site_classify,
+    (binaryfunc)hv_cli_site_memoized_kind,
+    hv_cli_site_le,
+};
+
+static char hv_cli_site_doc[] =
+"HV.cli_site(H, memo) -> ObjectClassifier\n"
+"\n"
+"Return a classifier that classifies by allocation site.\n"
+"\n"
+"The classification of each object is the tuple (filename, lineno)\n"
+"that was recorded for it by the horizon H, or None if no site was\n"
+"recorded. The arguments are:\n"
+"\n"
+"    H           A Horizon object, recording sites; see H.start_sites().\n"
+"    memo        A dict used to memoize the classification objects.";
+
+static PyObject *
+hv_cli_site(NyHeapViewObject *self, PyObject *args)
+{
+    PyObject *r, *horizon, *memo;
+    SiteObject *s;
+    if (!PyArg_ParseTuple(args, "O!O!:cli_site", 
+			  &NyHorizon_Type, &horizon,
+			  &PyDict_Type, &memo))
+      return NULL;
+    s = NYTUPLELIKE_NEW(SiteObject);
+    if (!s)
+      return 0;
+    s->horizon = horizon;
+    Py_INCREF(horizon);
+    s->memo = memo;
+    Py_INCREF(memo);
+    r = NyObjectClassifier_New((PyObject *)s, &hv_cli_site_def);
+    Py_DECREF(s);
+    return r;
+}
@@ -0,0 +1,901 @@
+/* Dominator tree of the visible heap
+
+   HV.update_domtree() traverses the heap from the root of HV once,
+   numbering the objects in depth first order and recording the edges as
+   arrays of indexes, and then computes the immediate dominator of each
+   object with the algorithm of Lengauer and Tarjan. The tree is kept in
+   HV with references to the objects, so the queries that follow can be
+   answered from the arrays without traversing the heap again, until it
+   is cleared with HV.clear_domtree().
+
+   The objects dominated by an object are the ones in its subtree of the
+   dominator tree. The objects dominated by a set of objects D may be
+   more than those dominated by the individual objects in D; but they
+   are all dominated by the nearest common dominator L of D, and can only
+   be reached via L, so they are found by searching the subtree of L
+   only. The subtrees are kept contiguous in a preorder array.
+
+   The references from HV to the objects in the tree are not visited by
+   the traversal of HV, so the tree does not make HV look like it refers
+   to everything in the heap.
+
+*/
+
+typedef struct NyDomTree {
+    PyObject **objs;		/* References, indexed in depth first order */
+    int n;
+    int *table;			/* Open addressing of indexes, -1 if free */
+    int mask;
+    int *soff;			/* Successors of i are succ[soff[i]:soff[i+1]] */
+    int *succ;
+    int *idom;
+    int *tpre;			/* Position in preorder of dominator tree */
+    int *torder;		/* Index at position */
+    int *tsize;			/* Size of subtree */
+    long *size;			/* Individual size, 0 for hidden objects */
+    long *retained;		/* Sum of size in subtree */
+    char busy;
+    char clear_pending;
+} NyDomTree;
+
+typedef struct {
+    NyHeapViewObject *hv;
+    NyDomTree *dt;
+    PyObject **edges;
+    int nedges;
+    int alloedges;
+    int allonodes;
+    int *parent;
+} DTBuildArg;
+
+#define DT_HASH(obj)	((int)(((Py_uintptr_t)(obj) >> 4) * 2654435761UL))
+
+static void
+dt_free(NyDomTree *dt)
+{
+    int i;
+    if (!dt)
+      return;
+    for (i = 0; i < dt->n; i++)
+      Py_DECREF(dt->objs[i]);
+    PyMem_FREE(dt->objs);
+    PyMem_FREE(dt->table);
+    PyMem_FREE(dt->soff);
+    PyMem_FREE(dt->succ);
+    PyMem_FREE(dt->idom);
+    PyMem_FREE(dt->tpre);
+    PyMem_FREE(dt->torder);
+    PyMem_FREE(dt->tsize);
+    PyMem_FREE(dt->size);
+    PyMem_FREE(dt->retained);
+    PyMem_FREE(dt);
+}
+
+static int
+dt_index(NyDomTree *dt, PyObject *obj)
+{
+    int i = DT_HASH(obj) & dt->mask;
+    while (dt->table[i] != -1) {
+	if (dt->objs[dt->table[i]] == obj)
+	  return dt->table[i];
+	i = (i + 1) & dt->mask;
+    }
+    return -1;
+}
+
+static int
+dt_grow_table(NyDomTree *dt)
+{
+    int size = (dt->mask + 1) * 2;
+    int i, j;
+    PyMem_FREE(dt->table);
+    dt->table = PyMem_New(int, size);
+    if (!dt->table) {
+	PyErr_NoMemory();
+	return -1;
+    }
+    for (i = 0; i < size; i++)
+      dt->table[i] = -1;
+    dt->mask = size - 1;
+    for (j = 0; j < dt->n; j++) {
+	i = DT_HASH(dt->objs[j]) & dt->mask;
+	while (dt->table[i] != -1)
+	  i = (i + 1) & dt->mask;
+	dt->table[i] = j;
+    }
+    return 0;
+}
+
+static int
+dt_visit(PyObject *obj, DTBuildArg *ba)
+{
+    if (ba->nedges >= ba->alloedges) {
+	int allo = roundupsize(ba->nedges + 1);
+	PyMem_RESIZE(ba->edges, PyObject *, allo);
+	if (!ba->edges) {
+	    PyErr_NoMemory();
+	    return -1;
+	}
+	ba->alloedges = allo;
+    }
+    ba->edges[ba->nedges++] = obj;
+    return 0;
+}
+
+/* Give obj the next index and record its referents. */
+
+static int
+dt_discover(DTBuildArg *ba, PyObject *obj, int parent)
+{
+    NyDomTree *dt = ba->dt;
+    int i;
+    if (dt->n + 1 >= ba->allonodes) {
+	int allo = roundupsize(dt->n + 2);
+	PyMem_RESIZE(dt->objs, PyObject *, allo);
+	PyMem_RESIZE(dt->soff, int, allo);
+	PyMem_RESIZE(ba->parent, int, allo);
+	if (!(dt->objs && dt->soff && ba->parent)) {
+	    if (!dt->objs)
+	      dt->n = 0;	/* The references are lost */
+	    PyErr_NoMemory();
+	    return -1;
+	}
+	ba->allonodes = allo;
+    }
+    if ((dt->n + 1) * 2 > dt->mask + 1) {
+	if (dt_grow_table(dt) == -1)
+	  return -1;
+    }
+    i = DT_HASH(obj) & dt->mask;
+    while (dt->table[i] != -1)
+      i = (i + 1) & dt->mask;
+    dt->table[i] = dt->n;
+    Py_INCREF(obj);
+    dt->objs[dt->n] = obj;
+    ba->parent[dt->n] = parent;
+    dt->soff[dt->n] = ba->nedges;
+    dt->n++;
+    if (hv_std_traverse(ba->hv, obj, (visitproc)dt_visit, ba) == -1)
+      return -1;
+    dt->soff[dt->n] = ba->nedges;
+    return 0;
+}
+
+/* Number the objects reachable from the root in depth first order. */
+
+static int
+dt_number(DTBuildArg *ba)
+{
+    NyDomTree *dt = ba->dt;
+    int *stack = 0, *cursor = 0;
+    int allo = 0, sp = 0;
+    int ret = -1;
+    if (dt_discover(ba, ba->hv->root, -1) == -1)
+      goto err;
+    allo = roundupsize(1);
+    stack = PyMem_New(int, allo);
+    cursor = PyMem_New(int, allo);
+    if (!(stack && cursor))
+      goto nomem;
+    stack[0] = 0;
+    cursor[0] = dt->soff[0];
+    sp = 1;
+    while (sp) {
+	int v = stack[sp-1];
+	PyObject *w;
+	if (cursor[sp-1] >= dt->soff[v+1]) {
+	    sp--;
+	    continue;
+	}
+	w = ba->edges[cursor[sp-1]++];
+	if (dt_index(dt, w) != -1)
+	  continue;
+	if (dt_discover(ba, w, v) == -1)
+	  goto err;
+	if (sp >= allo) {
+	    allo = roundupsize(sp + 1);
+	    PyMem_RESIZE(stack, int, allo);
+	    PyMem_RESIZE(cursor, int, allo);
+	    if (!(stack && cursor))
+	      goto nomem;
+	}
+	stack[sp] = dt->n - 1;
+	cursor[sp] = dt->soff[dt->n - 1];
+	sp++;
+    }
+    ret = 0;
+    goto err;
+  nomem:
+    PyErr_NoMemory();
+  err:
+    PyMem_FREE(stack);
+    PyMem_FREE(cursor);
+    return ret;
+}
+
+/* Lengauer-Tarjan, simple version with path compression.
+   The indexes are the depth first numbers, so semi holds indexes. */
+
+static int
+dt_eval(int v, int *semi, int *ancestor, int *label, int *path)
+{
+    int sp = 0, x = v;
+    if (ancestor[v] == -1)
+      return v;
+    /* Compress the path from v, without recursion */
+    while (ancestor[ancestor[x]] != -1) {
+	path[sp++] = x;
+	x = ancestor[x];
+    }
+    while (sp) {
+	int a;
+	x = path[--sp];
+	a = ancestor[x];
+	if (semi[label[a]] < semi[label[x]])
+	  label[x] = label[a];
+	ancestor[x] = ancestor[a];
+    }
+    return label[v];
+}
+
+static int
+dt_compute_idom(NyDomTree *dt, int *parent)
+{
+    int n = dt->n, m = dt->soff[n];
+    int *poff = 0, *pred = 0, *semi = 0, *ancestor = 0, *label = 0;
+    int *bhead = 0, *bnext = 0, *path = 0;
+    int i, v, w, ret = -1;
+    poff = PyMem_New(int, n + 1);
+    pred = PyMem_New(int, m ? m : 1);
+    semi = PyMem_New(int, n);
+    ancestor = PyMem_New(int, n);
+    label = PyMem_New(int, n);
+    bhead = PyMem_New(int, n);
+    bnext = PyMem_New(int, n);
+    path = PyMem_New(int, n);
+    dt->idom = PyMem_New(int, n);
+    if (!(poff && pred && semi && ancestor && label && bhead && bnext && path &&
+	  dt->idom)) {
+	PyErr_NoMemory();
+	goto err;
+    }
+    for (i = 0; i <= n; i++)
+      poff[i] = 0;
+    for (i = 0; i < m; i++)
+      poff[dt->succ[i] + 1]++;
+    for (i = 0; i < n; i++)
+      poff[i+1] += poff[i];
+    for (v = 0; v < n; v++) {
+	for (i = dt->soff[v]; i < dt->soff[v+1]; i++)
+	  pred[poff[dt->succ[i]]++] = v;
+    }
+    for (i = n; i > 0; i--)
+      poff[i] = poff[i-1];
+    poff[0] = 0;
+    for (v = 0; v < n; v++) {
+	semi[v] = label[v] = v;
+	ancestor[v] = bhead[v] = -1;
+    }
+    for (w = n - 1; w > 0; w--) {
+	int p = parent[w];
+	for (i = poff[w]; i < poff[w+1]; i++) {
+	    int u = dt_eval(pred[i], semi, ancestor, label, path);
+	    if (semi[u] < semi[w])
+	      semi[w] = semi[u];
+	}
+	bnext[w] = bhead[semi[w]];
+	bhead[semi[w]] = w;
+	ancestor[w] = p;
+	for (v = bhead[p]; v != -1; v = bnext[v]) {
+	    int u = dt_eval(v, semi, ancestor, label, path);
+	    dt->idom[v] = semi[u] < semi[v] ? u : p;
+	}
+	bhead[p] = -1;
+    }
+    dt->idom[0] = 0;
+    for (w = 1; w < n; w++) {
+	if (dt->idom[w] != semi[w])
+	  dt->idom[w] = dt->idom[dt->idom[w]];
+    }
+    ret = 0;
+  err:
+    PyMem_FREE(poff);
+    PyMem_FREE(pred);
+    PyMem_FREE(semi);
+    PyMem_FREE(ancestor);
+    PyMem_FREE(label);
+    PyMem_FREE(bhead);
+    PyMem_FREE(bnext);
+    PyMem_FREE(path);
+    return ret;
+}
+
+/* Lay out the dominator tree in preorder and sum up the sizes. */
+
+static int
+dt_layout(NyHeapViewObject *hv, NyDomTree *dt)
+{
+    int n = dt->n;
+    int *coff = 0, *child = 0, *stack = 0;
+    int i, v, p, sp, ret = -1;
+    coff = PyMem_New(int, n + 1);
+    child = PyMem_New(int, n);
+    stack = PyMem_New(int, n);
+    dt->tpre = PyMem_New(int, n);
+    dt->torder = PyMem_New(int, n);
+    dt->tsize = PyMem_New(int, n);
+    dt->size = PyMem_New(long, n);
+    dt->retained = PyMem_New(long, n);
+    if (!(coff && child && stack && dt->tpre && dt->torder && dt->tsize &&
+	  dt->size && dt->retained)) {
+	PyErr_NoMemory();
+	goto err;
+    }
+    for (i = 0; i <= n; i++)
+      coff[i] = 0;
+    for (v = 1; v < n; v++)
+      coff[dt->idom[v] + 1]++;
+    for (i = 0; i < n; i++)
+      coff[i+1] += coff[i];
+    for (v = 1; v < n; v++)
+      child[coff[dt->idom[v]]++] = v;
+    for (i = n; i > 0; i--)
+      coff[i] = coff[i-1];
+    coff[0] = 0;
+    p = 0;
+    sp = 0;
+    stack[sp++] = 0;
+    while (sp) {
+	v = stack[--sp];
+	dt->tpre[v] = p;
+	dt->torder[p++] = v;
+	for (i = coff[v+1] - 1; i >= coff[v]; i--)
+	  stack[sp++] = child[i];
+    }
+    for (v = 0; v < n; v++) {
+	PyObject *obj = dt->objs[v];
+	dt->tsize[v] = 1;
+	dt->size[v] = hv_is_obj_hidden(hv, obj) ? 0 : hv_std_size(hv, obj);
+	if (dt->size[v] == -1)
+	  goto err;
+	dt->retained[v] = dt->size[v];
+    }
+    for (p = n - 1; p > 0; p--) {
+	v = dt->torder[p];
+	dt->tsize[dt->idom[v]] += dt->tsize[v];
+	dt->retained[dt->idom[v]] += dt->retained[v];
+    }
+    ret = 0;
+  err:
+    PyMem_FREE(coff);
+    PyMem_FREE(child);
+    PyMem_FREE(stack);
+    return ret;
+}
+
+static NyDomTree *
+dt_build(NyHeapViewObject *hv)
+{
+    DTBuildArg ba;
+    NyDomTree *dt;
+    int i;
+    ba.hv = hv;
+    ba.edges = 0;
+    ba.nedges = ba.alloedges = ba.allonodes = 0;
+    ba.parent = 0;
+    dt = PyMem_New(NyDomTree, 1);
+    if (!dt) {
+	PyErr_NoMemory();
+	return 0;
+    }
+    memset(dt, 0, sizeof(*dt));
+    ba.dt = dt;
+    dt->mask = 1023;
+    dt->table = PyMem_New(int, dt->mask + 1);
+    if (!dt->table) {
+	PyErr_NoMemory();
+	goto err;
+    }
+    for (i = 0; i <= dt->mask; i++)
+      dt->table[i] = -1;
+    if (dt_number(&ba) == -1)
+      goto err;
+    dt->succ = PyMem_New(int, ba.nedges ? ba.nedges : 1);
+    if (!dt->succ) {
+	PyErr_NoMemory();
+	goto err;
+    }
+    for (i = 0; i < ba.nedges; i++)
+      dt->succ[i] = dt_index(dt, ba.edges[i]);
+    PyMem_FREE(ba.edges);
+    ba.edges = 0;
+    if (dt_compute_idom(dt, ba.parent) == -1)
+      goto err;
+    if (dt_layout(hv, dt) == -1)
+      goto err;
+    PyMem_FREE(ba.parent);
+    return dt;
+  err:
+    PyMem_FREE(ba.edges);
+    PyMem_FREE(ba.parent);
+    dt_free(dt);
+    return 0;
+}
+
+static NyDomTree *
+dt_enter(NyHeapViewObject *hv, char *name)
+{
+    NyDomTree *dt = hv->domtree;
+    if (!dt) {
+	PyErr_Format(PyExc_ValueError,
+		     "%s: there is no dominator tree, see update_domtree", name);
+	return 0;
+    }
+    dt->busy = 1;
+    return dt;
+}
+
+static void
+dt_leave(NyHeapViewObject *hv, NyDomTree *dt)
+{
+    dt->busy = 0;
+    if (dt->clear_pending) {
+	hv->domtree = 0;
+	dt_free(dt);
+    }
+}
+
+#define DT_IS_ANCESTOR(dt, a, b) \
+	((dt)->tpre[a] <= (dt)->tpre[b] && \
+	 (dt)->tpre[b] < (dt)->tpre[a] + (dt)->tsize[a])
+
+/* Find the indexes of the objects in X and their nearest common dominator.
+   Returns the number found; *pnotfound is set if some object was not in
+   the tree. */
+
+typedef struct {
+    NyDomTree *dt;
+    int *ixs;
+    int n;
+    int notfound;
+} DTIndexArg;
+
+static int
+dt_index_visit(PyObject *obj, DTIndexArg *ia)
+{
+    int i = dt_index(ia->dt, obj);
+    if (i == -1)
+      ia->notfound = 1;
+    else
+      ia->ixs[ia->n++] = i;
+    return 0;
+}
+
+static int
+dt_lca(NyDomTree *dt, int *ixs, int n)
+{
+    int i, l = ixs[0];
+    for (i = 1; i < n; i++) {
+	while (!DT_IS_ANCESTOR(dt, l, ixs[i]))
+	  l = dt->idom[l];
+    }
+    return l;
+}
+
+static int *
+dt_indexes(NyDomTree *dt, NyNodeSetObject *X, int *pn, int *pnotfound)
+{
+    DTIndexArg ia;
+    int len = PyObject_Length((PyObject *)X);
+    if (len == -1)
+      return 0;
+    ia.dt = dt;
+    ia.n = 0;
+    ia.notfound = 0;
+    ia.ixs = PyMem_New(int, len ? len : 1);
+    if (!ia.ixs) {
+	PyErr_NoMemory();
+	return 0;
+    }
+    if (NyNodeSet_iterate(X, (visitproc)dt_index_visit, &ia) == -1) {
+	PyMem_FREE(ia.ixs);
+	return 0;
+    }
+    *pn = ia.n;
+    *pnotfound = ia.notfound;
+    return ia.ixs;
+}
+
+#define DT_MARKED	1
+#define DT_REACHED	2
+
+/* Mark, in the subtree of l, the objects reachable from l,
+   stopping at the marked objects. */
+
+static int
+dt_search(NyDomTree *dt, int l, char *mark)
+{
+    int base = dt->tpre[l], end = base + dt->tsize[l];
+    int *stack = PyMem_New(int, dt->tsize[l]);
+    int sp = 0, i;
+    if (!stack) {
+	PyErr_NoMemory();
+	return -1;
+    }
+    mark[0] |= DT_REACHED;
+    stack[sp++] = l;
+    while (sp) {
+	int v = stack[--sp];
+	if (mark[dt->tpre[v] - base] & DT_MARKED)
+	  continue;
+	for (i = dt->soff[v]; i < dt->soff[v+1]; i++) {
+	    int w = dt->succ[i];
+	    int p = dt->tpre[w];
+	    if (p < base || p >= end || (mark[p - base] & DT_REACHED))
+	      continue;
+	    mark[p - base] |= DT_REACHED;
+	    stack[sp++] = w;
+	}
+    }
+    PyMem_FREE(stack);
+    return 0;
+}
+
+/* Find the subtree holding the objects dominated by X and mark those
+   in it that are not. Returns the root of the subtree, or -1 if it is
+   empty, -2 if X can not be handled by the tree, -3 on error. */
+
+static int
+dt_dominated(NyDomTree *dt, NyNodeSetObject *X, char **pmark)
+{
+    int *ixs, n, notfound, l, i;
+    char *mark;
+    *pmark = 0;
+    ixs = dt_indexes(dt, X, &n, &notfound);
+    if (!ixs)
+      return -3;
+    if (notfound) {
+	PyMem_FREE(ixs);
+	return -2;
+    }
+    if (!n) {
+	PyMem_FREE(ixs);
+	return -1;
+    }
+    l = dt_lca(dt, ixs, n);
+    for (i = 0; i < n && ixs[i] != l; i++);
+    if (i == n) {
+	mark = PyMem_New(char, dt->tsize[l]);
+	if (!mark) {
+	    PyErr_NoMemory();
+	    PyMem_FREE(ixs);
+	    return -3;
+	}
+	memset(mark, 0, dt->tsize[l]);
+	for (i = 0; i < n; i++)
+	  mark[dt->tpre[ixs[i]] - dt->tpre[l]] = DT_MARKED;
+	if (dt_search(dt, l, mark) == -1) {
+	    PyMem_FREE(mark);
+	    PyMem_FREE(ixs);
+	    return -3;
+	}
+	*pmark = mark;
+    }
+    PyMem_FREE(ixs);
+    return l;
+}
+
+#define DT_IS_DOMINATED(mark, p) \
+	(!(mark) || ((mark)[p] & DT_MARKED) || !((mark)[p] & DT_REACHED))
+
+PyDoc_STRVAR(hv_update_domtree_doc,
+"HV.update_domtree() -> int\n\
+\n\
+Compute the dominator tree of the visible heap as defined by HV and\n\
+keep it in HV, replacing any previous one, to be used by the domtree_\n\
+methods. The objects in the tree are kept alive until it is cleared\n\
+with clear_domtree. Returns the number of objects in the tree.");
+
+static PyObject *
+hv_update_domtree(NyHeapViewObject *self, PyObject *args)
+{
+    NyDomTree *dt;
+    if (self->domtree && self->domtree->busy) {
+	PyErr_SetString(PyExc_RuntimeError,
+			"update_domtree: the dominator tree is in use");
+	return 0;
+    }
+    dt_free(self->domtree);
+    self->domtree = 0;
+    dt = dt_build(self);
+    if (!dt)
+      return 0;
+    self->domtree = dt;
+    return PyInt_FromLong(dt->n);
+}
+
+PyDoc_STRVAR(hv_clear_domtree_doc,
+"HV.clear_domtree()\n\
+\n\
+Clear the dominator tree kept in HV, releasing the objects in it.");
+
+static PyObject *
+hv_clear_domtree(NyHeapViewObject *self, PyObject *args)
+{
+    NyDomTree *dt = self->domtree;
+    if (dt) {
+	if (dt->busy)
+	  dt->clear_pending = 1;
+	else {
+	    self->domtree = 0;
+	    dt_free(dt);
+	}
+    }
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+PyDoc_STRVAR(hv_domtree_dominos_doc,
+"HV.domtree_dominos(X:NodeSet) -> NodeSet | None\n\
+\n\
+Return the set of objects dominated by X, as found from the dominator\n\
+tree, or None if some object in X is not in the tree.");
+
+static PyObject *
+hv_domtree_dominos(NyHeapViewObject *self, PyObject *args)
+{
+    NyNodeSetObject *X, *result = 0;
+    NyDomTree *dt;
+    char *mark = 0;
+    int l, p, base;
+    if (!PyArg_ParseTuple(args, "O!:domtree_dominos", NyNodeSet_TYPE, &X))
+      return 0;
+    if (!(dt = dt_enter(self, "domtree_dominos")))
+      return 0;
+    l = dt_dominated(dt, X, &mark);
+    if (l == -3)
+      goto err;
+    if (l == -2) {
+	dt_leave(self, dt);
+	Py_INCREF(Py_None);
+	return Py_None;
+    }
+    result = hv_mutnodeset_new(self);
+    if (!result)
+      goto err;
+    if (l >= 0) {
+	base = dt->tpre[l];
+	for (p = 0; p < dt->tsize[l]; p++) {
+	    PyObject *obj;
+	    if (!DT_IS_DOMINATED(mark, p))
+	      continue;
+	    obj = dt->objs[dt->torder[base + p]];
+	    if (hv_is_obj_hidden(self, obj))
+	      continue;
+	    if (NyNodeSet_setobj(result, obj) == -1)
+	      goto err;
+	}
+    }
+    PyMem_FREE(mark);
+    dt_leave(self, dt);
+    return (PyObject *)result;
+  err:
+    PyMem_FREE(mark);
+    Py_XDECREF(result);
+    dt_leave(self, dt);
+    return 0;
+}
+
+PyDoc_STRVAR(hv_domtree_domisize_doc,
+"HV.domtree_domisize(X:NodeSet) -> int | None\n\
+\n\
+Return the total size of the objects dominated by X, as found from the\n\
+dominator tree, or None if some object in X is not in the tree.");
+
+static PyObject *
+hv_domtree_domisize(NyHeapViewObject *self, PyObject *args)
+{
+    NyNodeSetObject *X;
+    NyDomTree *dt;
+    char *mark = 0;
+    long sum = 0;
+    int l, p, base;
+    if (!PyArg_ParseTuple(args, "O!:domtree_domisize", NyNodeSet_TYPE, &X))
+      return 0;
+    if (!(dt = dt_enter(self, "domtree_domisize")))
+      return 0;
+    l = dt_dominated(dt, X, &mark);
+    if (l == -3) {
+	dt_leave(self, dt);
+	return 0;
+    }
+    if (l == -2) {
+	dt_leave(self, dt);
+	Py_INCREF(Py_None);
+	return Py_None;
+    }
+    if (l >= 0 && !mark)
+      sum = dt->retained[l];
+    else if (l >= 0) {
+	base = dt->tpre[l];
+	for (p = 0; p < dt->tsize[l]; p++) {
+	    if (DT_IS_DOMINATED(mark, p))
+	      sum += dt->size[dt->torder[base + p]];
+	}
+    }
+    PyMem_FREE(mark);
+    dt_leave(self, dt);
+    return PyInt_FromLong(sum);
+}
+
+PyDoc_STRVAR(hv_domtree_imdom_doc,
+"HV.domtree_imdom(X:NodeSet) -> NodeSet\n\
+\n\
+Return the objects in X that are reachable from the root of HV via a\n\
+path avoiding the other objects in X, as found from the dominator tree.\n\
+This is the same as X & HV.reachable_x(root, X).");
+
+static PyObject *
+hv_domtree_imdom(NyHeapViewObject *self, PyObject *args)
+{
+    NyNodeSetObject *X, *result = 0;
+    NyDomTree *dt;
+    char *mark = 0;
+    int *ixs = 0, n, notfound, l, i;
+    if (!PyArg_ParseTuple(args, "O!:domtree_imdom", NyNodeSet_TYPE, &X))
+      return 0;
+    if (!(dt = dt_enter(self, "domtree_imdom")))
+      return 0;
+    result = hv_mutnodeset_new(self);
+    if (!result)
+      goto err;
+    ixs = dt_indexes(dt, X, &n, &notfound);
+    if (!ixs)
+      goto err;
+    if (n) {
+	/* Every path to the objects goes via their nearest common dominator.
+	   If it is one of them, it is the only one reached. */
+	l = dt_lca(dt, ixs, n);
+	for (i = 0; i < n && ixs[i] != l; i++);
+	if (i < n) {
+	    if (!hv_is_obj_hidden(self, dt->objs[l]) &&
+		NyNodeSet_setobj(result, dt->objs[l]) == -1)
+	      goto err;
+	} else {
+	    mark = PyMem_New(char, dt->tsize[l]);
+	    if (!mark) {
+		PyErr_NoMemory();
+		goto err;
+	    }
+	    memset(mark, 0, dt->tsize[l]);
+	    for (i = 0; i < n; i++)
+	      mark[dt->tpre[ixs[i]] - dt->tpre[l]] = DT_MARKED;
+	    if (dt_search(dt, l, mark) == -1)
+	      goto err;
+	    for (i = 0; i < n; i++) {
+		PyObject *obj = dt->objs[ixs[i]];
+		if ((mark[dt->tpre[ixs[i]] - dt->tpre[l]] & DT_REACHED) &&
+		    !hv_is_obj_hidden(self, obj) &&
+		    NyNodeSet_setobj(result, obj) == -1)
+		  goto err;
+	    }
+	}
+    }
+    PyMem_FREE(ixs);
+    PyMem_FREE(mark);
+    dt_leave(self, dt);
+    return (PyObject *)result;
+  err:
+    PyMem_FREE(ixs);
+    PyMem_FREE(mark);
+    Py_XDECREF(result);
+    dt_leave(self, dt);
+    return 0;
+}
+
+static int
+dt_pos_compare(const void *x, const void *y)
+{
+    return *(int *)x - *(int *)y;
+}
+
+PyDoc_STRVAR(hv_domtree_retained_doc,
+"HV.domtree_retained(C:ObjectClassifier [, X:NodeSet]) -> list\n\
+\n\
+Return a list of tuples (kind, count, size), one for each kind of the\n\
+visible objects in the dominator tree, or of the objects in X, as\n\
+classified by C. The size is the retained size of the kind: the total\n\
+size of the objects dominated by some object of that kind.");
+
+static PyObject *
+hv_domtree_retained(NyHeapViewObject *self, PyObject *args)
+{
+    CensusTravArg ta;
+    NyNodeSetObject *X = 0;
+    NyDomTree *dt;
+    PyObject *result = 0;
+    int *pos = 0, npos, notfound, i;
+    ta.hv = self;
+    ta.table = 0;
+    ta.used = 0;
+    if (!PyArg_ParseTuple(args, "O!|O!:domtree_retained",
+			  &NyObjectClassifier_Type, &ta.cli,
+			  NyNodeSet_TYPE, &X))
+      return 0;
+    if (!(dt = dt_enter(self, "domtree_retained")))
+      return 0;
+    ta.mask = CENSUS_INITIAL_SIZE - 1;
+    ta.table = PyMem_New(CensusEntry, CENSUS_INITIAL_SIZE);
+    if (!ta.table) {
+	PyErr_NoMemory();
+	goto err;
+    }
+    memset(ta.table, 0, CENSUS_INITIAL_SIZE * sizeof(CensusEntry));
+    if (X) {
+	pos = dt_indexes(dt, X, &npos, &notfound);
+	if (!pos)
+	  goto err;
+	for (i = 0; i < npos; i++)
+	  pos[i] = dt->tpre[pos[i]];
+	qsort(pos, npos, sizeof(int), dt_pos_compare);
+    } else
+      npos = dt->n;
+    /* In preorder, an object is in the subtree of an earlier object of
+       the same kind iff it is before the end of that subtree. */
+    for (i = 0; i < npos; i++) {
+	int p = pos ? pos[i] : i;
+	int v = dt->torder[p];
+	PyObject *obj = dt->objs[v];
+	PyObject *kind;
+	CensusEntry *e;
+	if (hv_is_obj_hidden(self, obj))
+	  continue;
+	kind = ta.cli->def->classify(ta.cli->self, obj);
+	if (!kind)
+	  goto err;
+	e = census_lookup(ta.table, ta.mask, kind);
+	if (!e->kind) {
+	    if ((ta.used + 1) * 3 >= (ta.mask + 1) * 2) {
+		if (census_grow(&ta) == -1) {
+		    Py_DECREF(kind);
+		    goto err;
+		}
+		e = census_lookup(ta.table, ta.mask, kind);
+	    }
+	    e->kind = kind;
+	    ta.used++;
+	} else {
+	    Py_DECREF(kind);
+	}
+	e->count++;
+	if (p >= e->end) {
+	    e->size += dt->retained[v];
+	    e->end = p + dt->tsize[v];
+	}
+    }
+    result = PyList_New(0);
+    if (!result)
+      goto err;
+    for (i = 0; i <= ta.mask; i++) {
+	CensusEntry *e = &ta.table[i];
+	PyObject *cs;
+	if (!e->kind)
+	  continue;
+	cs = Py_BuildValue("(Oll)", e->kind, e->count, e->size);
+	if (!cs || PyList_Append(result, cs) == -1) {
+	    Py_XDECREF(cs);
+	    Py_CLEAR(result);
+	    goto err;
+	}
+	Py_DECREF(cs);
+    }
+  err:
+    PyMem_FREE(pos);
+    if (ta.table) {
+	for (i = 0; i <= ta.mask; i++)
+	  Py_XDECREF(ta.table[i].kind);
+	PyMem_Del(ta.table);
+    }
+    dt_leave(self, dt);
+    return result;
+}
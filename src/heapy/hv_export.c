@@ -0,0 +1,521 @@
+/* Export of the graph of the visible heap to a file
+
+   HV.export_graph(path) traverses the visible heap from the root of HV
+   once, in breadth first order, and writes every object found and the
+   references between them to a binary file, with what is needed to
+   classify them as the classifiers of heapy do. The objects are numbered
+   in the order they are found, the root being object 0, so the objects
+   waiting to be traversed are those in the index after the one being
+   traversed, and the references from each object can be written as
+   soon as it has been traversed. Every column of the file is written
+   to a temporary file as the traversal proceeds and copied to the file
+   at the end, so apart from the index of objects and the owner of each
+   dict nothing proportional to the size of the heap is kept in memory.
+
+   The file begins with a header, with all integers in the byte order of
+   the machine that wrote it:
+
+	char[8]		"HPYGRAPH"
+	uint32		EXPORT_VERSION
+	uint32		number of sections
+	for each section:
+	    char[4]	tag
+	    uint32	size of an item
+	    uint64	offset of the data from the start of the file
+	    uint64	number of items
+
+   followed by the data of the sections, each aligned to 8 bytes so they
+   can be used directly from a memory mapped file. The sections are
+
+	ADDR	uint64[n]	Address of each object
+	SIZE	int64[n]	Individual size of each object
+	TYPE	uint32[n]	Index of the type of each object in TADR and TNAM
+	CLAS	uint32[n]	Index of the class of each object in TADR and TNAM,
+			the same as its type unless it is an old-style instance
+	FLAG	uint8[n]	EXPORT_HIDDEN if the object is not in HV.heap(),
+			EXPORT_DICT if it is of type dict exactly
+	OWNR	uint32[n]	For a dict, 1 + the index of the object it is the
+			__dict__ of, or 0 if none was found
+	EOFF	uint64[n+1]	References from object i are in EOFF[i]:EOFF[i+1]
+	EDST	uint32[m]	Index of the object referred to
+	EKND	uint8[m]	Relation kind, an NYHR_ value, or 0 if not found
+	TADR	uint64[t]	Address of each type and class
+	TNAM	char[]		Name of each type and class, each ended by a 0 byte
+
+   The names are those returned by the name function given to
+   export_graph, or else the module and name of the type or class, the
+   module being left out for the builtin types.
+
+   There is one reference for each time the traversal of an object
+   visits another. Finding the kind of a reference takes time
+   proportional to the number of references from its source, so it is
+   only looked for when that is at most EXPORT_RELATE_LIMIT.
+
+   The objects in the index are referenced until the export is done, so
+   the addresses written stay unique even if code run during it would
+   release some of them.
+
+*/
+
+#define EXPORT_VERSION		1
+#define EXPORT_HIDDEN		1
+#define EXPORT_DICT		2
+#define EXPORT_RELATE_LIMIT	256
+#define EXPORT_NSECTIONS	11
+
+#define EX_HASH(obj)	((Py_ssize_t)(((Py_uintptr_t)(obj) >> 4) * 2654435761UL))
+
+typedef struct {
+    PyObject **objs;		/* References, in order of index */
+    Py_ssize_t n;
+    Py_ssize_t allo;
+    Py_ssize_t *table;		/* Open addressing of indexes, -1 if free */
+    Py_ssize_t mask;
+} ExIndex;
+
+typedef struct {
+    char tag[4];
+    int itemsize;
+    FILE *fp;			/* Temporary file with the data */
+    unsigned PY_LONG_LONG count;
+} ExColumn;
+
+enum {EX_ADDR, EX_SIZE, EX_TYPE, EX_CLAS, EX_FLAG, EX_OWNR, EX_EOFF, EX_EDST, EX_EKND,
+      EX_TADR, EX_TNAM};
+
+typedef struct {
+    NyHeapRelate hr;
+    NyHeapViewObject *hv;
+    ExIndex nodes, types;
+    ExColumn cols[EXPORT_NSECTIONS];
+    PyObject *name;		/* Name function, or 0 */
+    unsigned int *owners;	/* 1 + index of the owner of each dict */
+    Py_ssize_t alloowners;
+    PyObject **refs;		/* Referents of the object being traversed */
+    Py_ssize_t nrefs;
+    Py_ssize_t allorefs;
+    int kind;
+} ExportArg;
+
+static void
+ex_index_free(ExIndex *x)
+{
+    Py_ssize_t i;
+    for (i = 0; i < x->n; i++)
+      Py_DECREF(x->objs[i]);
+    PyMem_FREE(x->objs);
+    PyMem_FREE(x->table);
+}
+
+static int
+ex_index_grow(ExIndex *x)
+{
+    Py_ssize_t size = x->mask ? (x->mask + 1) * 2 : 1024;
+    Py_ssize_t i, j;
+    PyMem_FREE(x->table);
+    x->table = PyMem_New(Py_ssize_t, size);
+    if (!x->table) {
+	PyErr_NoMemory();
+	return -1;
+    }
+    for (i = 0; i < size; i++)
+      x->table[i] = -1;
+    x->mask = size - 1;
+    for (j = 0; j < x->n; j++) {
+	i = EX_HASH(x->objs[j]) & x->mask;
+	while (x->table[i] != -1)
+	  i = (i + 1) & x->mask;
+	x->table[i] = j;
+    }
+    return 0;
+}
+
+/* Return the index of obj, or -1 if it has none. */
+
+static Py_ssize_t
+ex_find(ExIndex *x, PyObject *obj)
+{
+    Py_ssize_t i;
+    if (!x->table)
+      return -1;
+    i = EX_HASH(obj) & x->mask;
+    while (x->table[i] != -1) {
+	if (x->objs[x->table[i]] == obj)
+	  return x->table[i];
+	i = (i + 1) & x->mask;
+    }
+    return -1;
+}
+
+/* Return the index of obj, giving it the next index if it had none. */
+
+static Py_ssize_t
+ex_index(ExIndex *x, PyObject *obj)
+{
+    Py_ssize_t i;
+    if ((x->n + 1) * 2 > x->mask + 1) {
+	if (ex_index_grow(x) == -1)
+	  return -1;
+    }
+    i = EX_HASH(obj) & x->mask;
+    while (x->table[i] != -1) {
+	if (x->objs[x->table[i]] == obj)
+	  return x->table[i];
+	i = (i + 1) & x->mask;
+    }
+    if (x->n >= x->allo) {
+	Py_ssize_t allo = roundupsize(x->n + 1);
+	PyObject **objs = x->objs;
+	PyMem_RESIZE(objs, PyObject *, allo);
+	if (!objs) {
+	    PyErr_NoMemory();
+	    return -1;
+	}
+	x->objs = objs;
+	x->allo = allo;
+    }
+    if (x->n >= 0xffffffffL) {
+	PyErr_SetString(PyExc_OverflowError,
+			"export_graph: too many objects to index");
+	return -1;
+    }
+    Py_INCREF(obj);
+    x->table[i] = x->n;
+    x->objs[x->n] = obj;
+    return x->n++;
+}
+
+static int
+ex_put(ExColumn *c, void *item)
+{
+    if (fwrite(item, c->itemsize, 1, c->fp) != 1) {
+	PyErr_SetFromErrno(PyExc_IOError);
+	return -1;
+    }
+    c->count++;
+    return 0;
+}
+
+static int
+ex_visit(PyObject *obj, ExportArg *ea)
+{
+    if (ea->nrefs >= ea->allorefs) {
+	Py_ssize_t allo = roundupsize(ea->nrefs + 1);
+	PyObject **refs = ea->refs;
+	PyMem_RESIZE(refs, PyObject *, allo);
+	if (!refs) {
+	    PyErr_NoMemory();
+	    return -1;
+	}
+	ea->refs = refs;
+	ea->allorefs = allo;
+    }
+    ea->refs[ea->nrefs++] = obj;
+    return 0;
+}
+
+static int
+ex_relate_visit(unsigned int relatype, PyObject *relator, NyHeapRelate *arg)
+{
+    ExportArg *ea = (void *)arg;
+    if (!relator && PyErr_Occurred())
+      return -1;
+    Py_XDECREF(relator);
+    if (relatype < NYHR_LIMIT)
+      ea->kind = relatype;
+    return 1;
+}
+
+/* Note that obj is the owner of the dict with index i. */
+
+static int
+ex_owner(ExportArg *ea, Py_ssize_t i, PyObject *obj)
+{
+    Py_ssize_t o = ex_index(&ea->nodes, obj);
+    if (o == -1)
+      return -1;
+    if (i >= ea->alloowners) {
+	Py_ssize_t allo = roundupsize(i + 1);
+	unsigned int *owners = ea->owners;
+	PyMem_RESIZE(owners, unsigned int, allo);
+	if (!owners) {
+	    PyErr_NoMemory();
+	    return -1;
+	}
+	memset(owners + ea->alloowners, 0,
+	       (allo - ea->alloowners) * sizeof(unsigned int));
+	ea->owners = owners;
+	ea->alloowners = allo;
+    }
+    ea->owners[i] = o + 1;
+    return 0;
+}
+
+/* Write the owner of each dict, after all objects are written. */
+
+static int
+ex_owners(ExportArg *ea)
+{
+    Py_ssize_t i;
+    for (i = 0; i < ea->nodes.n; i++) {
+	unsigned int o = i < ea->alloowners ? ea->owners[i] : 0;
+	if (ex_put(&ea->cols[EX_OWNR], &o) == -1)
+	  return -1;
+    }
+    return 0;
+}
+
+/* Write an object and its references. */
+
+static int
+ex_node(ExportArg *ea, PyObject *obj)
+{
+    unsigned PY_LONG_LONG addr = (Py_uintptr_t)obj;
+    unsigned PY_LONG_LONG eoff = ea->cols[EX_EDST].count;
+    PY_LONG_LONG size;
+    unsigned int t, c;
+    unsigned char flags = 0;
+    PyObject **dp;
+    Py_ssize_t i;
+    if ((i = ex_index(&ea->types, (PyObject *)obj->ob_type)) == -1)
+      return -1;
+    t = i;
+    if (PyInstance_Check(obj) &&
+	(i = ex_index(&ea->types, (PyObject *)((PyInstanceObject *)obj)->in_class)) == -1)
+      return -1;
+    c = i;
+    if (PyDict_CheckExact(obj))
+      flags |= EXPORT_DICT;
+    if (hv_is_obj_hidden(ea->hv, obj)) {
+	flags |= EXPORT_HIDDEN;
+	size = 0;
+    } else {
+	size = hv_std_size(ea->hv, obj);
+	if (size == -1 && PyErr_Occurred())
+	  return -1;
+    }
+    if (ex_put(&ea->cols[EX_ADDR], &addr) == -1 ||
+	ex_put(&ea->cols[EX_SIZE], &size) == -1 ||
+	ex_put(&ea->cols[EX_TYPE], &t) == -1 ||
+	ex_put(&ea->cols[EX_CLAS], &c) == -1 ||
+	ex_put(&ea->cols[EX_FLAG], &flags) == -1 ||
+	ex_put(&ea->cols[EX_EOFF], &eoff) == -1)
+      return -1;
+    ea->nrefs = 0;
+    if (hv_std_traverse(ea->hv, obj, (visitproc)ex_visit, ea) == -1)
+      return -1;
+    for (i = 0; i < ea->nrefs; i++) {
+	PyObject *tgt = ea->refs[i];
+	Py_ssize_t d = ex_index(&ea->nodes, tgt);
+	unsigned int dst = d;
+	unsigned char kind;
+	if (d == -1)
+	  return -1;
+	ea->kind = 0;
+	if (ea->nrefs <= EXPORT_RELATE_LIMIT) {
+	    ea->hr.src = obj;
+	    ea->hr.tgt = tgt;
+	    if (hv_std_relate(&ea->hr) == -1 || PyErr_Occurred())
+	      return -1;
+	}
+	kind = ea->kind;
+	if (ex_put(&ea->cols[EX_EDST], &dst) == -1 ||
+	    ex_put(&ea->cols[EX_EKND], &kind) == -1)
+	  return -1;
+    }
+    /* The owner of a dict is noted only if the dict was found by a
+       traversal; a dict that was not is not in the graph. */
+    dp = hv_cli_dictof_dictptr(obj);
+    if (dp && *dp && PyDict_CheckExact(*dp) &&
+	(i = ex_find(&ea->nodes, *dp)) != -1 &&
+	ex_owner(ea, i, obj) == -1)
+      return -1;
+    return 0;
+}
+
+/* Return a new reference to the name of a type or class. */
+
+static PyObject *
+ex_name(ExportArg *ea, PyObject *obj)
+{
+    PyObject *mod = 0;
+    char *name;
+    if (ea->name) {
+	PyObject *r = PyObject_CallFunctionObjArgs(ea->name, obj, 0);
+	if (r && !PyString_Check(r)) {
+	    PyErr_SetString(PyExc_TypeError,
+			    "export_graph: name function should return a string");
+	    Py_DECREF(r);
+	    return 0;
+	}
+	return r;
+    }
+    if (PyClass_Check(obj)) {
+	PyClassObject *cl = (PyClassObject *)obj;
+	mod = PyDict_GetItemString(cl->cl_dict, "__module__");
+	name = PyString_AsString(cl->cl_name);
+	if (!name)
+	  return 0;
+    } else {
+	PyTypeObject *type = (PyTypeObject *)obj;
+	if ((type->tp_flags & Py_TPFLAGS_HEAPTYPE) && type->tp_dict)
+	  mod = PyDict_GetItemString(type->tp_dict, "__module__");
+	name = (char *)type->tp_name;
+    }
+    if (mod && PyString_Check(mod) &&
+	strcmp(PyString_AS_STRING(mod), "__builtin__") != 0)
+      return PyString_FromFormat("%s.%s", PyString_AS_STRING(mod), name);
+    return PyString_FromString(name);
+}
+
+/* Write the address and name of each type and class. */
+
+static int
+ex_types(ExportArg *ea)
+{
+    Py_ssize_t i;
+    for (i = 0; i < ea->types.n; i++) {
+	PyObject *type = ea->types.objs[i];
+	unsigned PY_LONG_LONG addr = (Py_uintptr_t)type;
+	PyObject *name;
+	char *s;
+	int r = 0;
+	if (ex_put(&ea->cols[EX_TADR], &addr) == -1 ||
+	    !(name = ex_name(ea, type)))
+	  return -1;
+	for (s = PyString_AS_STRING(name); ; s++) {
+	    if ((r = ex_put(&ea->cols[EX_TNAM], s)) == -1 || !*s)
+	      break;
+	}
+	Py_DECREF(name);
+	if (r == -1)
+	  return -1;
+    }
+    return 0;
+}
+
+/* Write the header and copy the columns to the file. */
+
+static int
+ex_write(ExportArg *ea, FILE *fp)
+{
+    char buf[8192];
+    unsigned int version = EXPORT_VERSION, nsections = EXPORT_NSECTIONS;
+    unsigned PY_LONG_LONG offset, offsets[EXPORT_NSECTIONS];
+    int i;
+    offset = 16 + EXPORT_NSECTIONS * 24;
+    for (i = 0; i < EXPORT_NSECTIONS; i++) {
+	offsets[i] = offset;
+	offset += (ea->cols[i].count * ea->cols[i].itemsize + 7) & ~7;
+    }
+    if (fwrite("HPYGRAPH", 8, 1, fp) != 1 ||
+	fwrite(&version, 4, 1, fp) != 1 ||
+	fwrite(&nsections, 4, 1, fp) != 1)
+      goto ioerr;
+    for (i = 0; i < EXPORT_NSECTIONS; i++) {
+	ExColumn *c = &ea->cols[i];
+	unsigned int itemsize = c->itemsize;
+	if (fwrite(c->tag, 4, 1, fp) != 1 ||
+	    fwrite(&itemsize, 4, 1, fp) != 1 ||
+	    fwrite(&offsets[i], 8, 1, fp) != 1 ||
+	    fwrite(&c->count, 8, 1, fp) != 1)
+	  goto ioerr;
+    }
+    for (i = 0; i < EXPORT_NSECTIONS; i++) {
+	ExColumn *c = &ea->cols[i];
+	size_t n;
+	long pad = (8 - (c->count * c->itemsize) % 8) % 8;
+	if (fflush(c->fp) != 0)
+	  goto ioerr;
+	rewind(c->fp);
+	while ((n = fread(buf, 1, sizeof(buf), c->fp)) > 0) {
+	    if (fwrite(buf, 1, n, fp) != n)
+	      goto ioerr;
+	}
+	if (ferror(c->fp))
+	  goto ioerr;
+	memset(buf, 0, 8);
+	if (pad && fwrite(buf, 1, pad, fp) != pad)
+	  goto ioerr;
+    }
+    if (fflush(fp) != 0)
+      goto ioerr;
+    return 0;
+  ioerr:
+    PyErr_SetFromErrno(PyExc_IOError);
+    return -1;
+}
+
+PyDoc_STRVAR(hv_export_graph_doc,
+"HV.export_graph(path:string [, name:callable]) -> tuple\n\
+\n\
+Write the objects in the visible heap as defined by HV, and the\n\
+references between them, to a binary file named path, in the format\n\
+read by guppy.heapy.HeapGraph. The types and classes of the objects\n\
+are written with the names returned by name, called with each of\n\
+them, if it is given. Returns a tuple of the number of objects and\n\
+the number of references written.");
+
+static PyObject *
+hv_export_graph(NyHeapViewObject *self, PyObject *args)
+{
+    static char *tags[EXPORT_NSECTIONS] = {
+	"ADDR", "SIZE", "TYPE", "CLAS", "FLAG", "OWNR", "EOFF", "EDST", "EKND",
+	"TADR", "TNAM"};
+    static int itemsizes[EXPORT_NSECTIONS] = {8, 8, 4, 4, 1, 4, 8, 4, 1, 8, 1};
+    char *path;
+    PyObject *name = Py_None;
+    ExportArg ea;
+    FILE *fp = 0;
+    PyObject *result = 0;
+    Py_ssize_t i;
+    unsigned PY_LONG_LONG eoff;
+    if (!PyArg_ParseTuple(args, "s|O:export_graph", &path, &name))
+      return 0;
+    memset(&ea, 0, sizeof(ea));
+    ea.hv = self;
+    if (name != Py_None)
+      ea.name = name;
+    ea.hr.hv = (PyObject *)self;
+    ea.hr.visit = ex_relate_visit;
+    for (i = 0; i < EXPORT_NSECTIONS; i++) {
+	memcpy(ea.cols[i].tag, tags[i], 4);
+	ea.cols[i].itemsize = itemsizes[i];
+	if (!(ea.cols[i].fp = tmpfile())) {
+	    PyErr_SetFromErrno(PyExc_IOError);
+	    goto err;
+	}
+    }
+    if (ex_index(&ea.nodes, self->root) == -1)
+      goto err;
+    for (i = 0; i < ea.nodes.n; i++) {
+	if (ex_node(&ea, ea.nodes.objs[i]) == -1)
+	  goto err;
+    }
+    eoff = ea.cols[EX_EDST].count;
+    if (ex_put(&ea.cols[EX_EOFF], &eoff) == -1 ||
+	ex_owners(&ea) == -1 ||
+	ex_types(&ea) == -1)
+      goto err;
+    if (!(fp = fopen(path, "wb"))) {
+	PyErr_SetFromErrnoWithFilename(PyExc_IOError, path);
+	goto err;
+    }
+    if (ex_write(&ea, fp) == -1)
+      goto err;
+    result = Py_BuildValue("(nK)", ea.nodes.n, eoff);
+  err:
+    if (fp && fclose(fp) != 0 && result) {
+	Py_DECREF(result);
+	result = PyErr_SetFromErrnoWithFilename(PyExc_IOError, path);
+    }
+    for (i = 0; i < EXPORT_NSECTIONS; i++) {
+	if (ea.cols[i].fp)
+	  fclose(ea.cols[i].fp);
+    }
+    ex_index_free(&ea.nodes);
+    ex_index_free(&ea.types);
+    PyMem_FREE(ea.refs);
+    PyMem_FREE(ea.owners);
+    return result;
+}
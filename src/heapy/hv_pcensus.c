@@ -0,0 +1,474 @@
+/* Parallel census
+
+   HV.census(C, nthreads) with nthreads > 1 collects the objects of the
+   heap into an array in one traversal, splits it into chunks, and lets
+   native threads count and size them per kind while the calling thread
+   holds on to the interpreter lock, so the objects do not change
+   meanwhile. The worker threads must not
+   use the Python API, in particular not reference counts, so they can
+   not call the classifier. Instead each object gets a key, of one or
+   two words, that a classifier of a supported form would give the same
+   kind for, and one object of each key is kept as its representative.
+   The calling thread then classifies the representatives to get the
+   kinds and merges the partial tables of the threads.
+
+   The supported classifiers are those made by cli_type, cli_class,
+   cli_indisize (of the same heap view), cli_dictof with an owner
+   classifier by type or class, and cli_and of one or two of these,
+   such as the one used for Clodo. For other classifiers, the census is
+   made by a single thread as usual.
+
+   An object whose key or size can not be found without the Python API
+   is left to the calling thread, to be classified after the threads
+   are done. This is the case for an object of a type that has no extra
+   type yet, and for a dict that is not yet in the owner graph of a
+   dictof classifier. The size functions of the heap definitions are
+   assumed not to use the Python API, as is the case for the standard
+   ones. */
+
+#ifdef WITH_THREAD
+#include "pythread.h"
+#endif
+
+#define PC_TYPE		1
+#define PC_CLASS	2
+#define PC_INDISIZE	3
+#define PC_DICTOF	4
+
+#define PC_MAXSPEC	2
+#define PC_MAXTHREADS	64
+
+typedef struct {
+    int code;
+    NyNodeGraphObject *owners;	/* For PC_DICTOF */
+    int ownercode;		/* For PC_DICTOF, PC_TYPE or PC_CLASS */
+} PCSpec;
+
+typedef struct {
+    void *key[PC_MAXSPEC];
+    PyObject *rep;		/* 0 if the entry is not used */
+    long count;
+    long size;
+} PCEntry;
+
+typedef struct {
+    NyHeapViewObject *hv;
+    PCSpec *spec;
+    int nspec;
+    PyObject **objs;
+    int lo, hi;
+    PCEntry *table;
+    int mask;
+    int used;
+    PyObject **deferred;
+    int ndeferred, maxdeferred;
+    int err;
+#ifdef WITH_THREAD
+    PyThread_type_lock done;
+#endif
+} PCWorker;
+
+#define PC_INITIAL_SIZE		64
+
+static int
+pc_spec_leaf(NyHeapViewObject *hv, NyObjectClassifierObject *cli, PCSpec *sp)
+{
+    if (cli->def == &hv_cli_type_def)
+      sp->code = PC_TYPE;
+    else if (cli->def == &hv_cli_class_def)
+      sp->code = PC_CLASS;
+    else if (cli->def == &hv_cli_indisize_def &&
+	     ((IndisizeObject *)cli->self)->hv == hv)
+      sp->code = PC_INDISIZE;
+    else if (cli->def == &hv_cli_dictof_def) {
+	DictofObject *d = (DictofObject *)cli->self;
+	if (d->ownerclassifier->def == &hv_cli_type_def)
+	  sp->ownercode = PC_TYPE;
+	else if (d->ownerclassifier->def == &hv_cli_class_def)
+	  sp->ownercode = PC_CLASS;
+	else
+	  return 0;
+	sp->code = PC_DICTOF;
+	sp->owners = d->owners;
+    } else
+      return 0;
+    return 1;
+}
+
+/* Find out if cli is supported, and if so set up spec.
+   Return the number of specs, or 0 if cli is not supported. */
+
+static int
+pc_spec_init(NyHeapViewObject *hv, NyObjectClassifierObject *cli, PCSpec *spec)
+{
+    memset(spec, 0, PC_MAXSPEC * sizeof(PCSpec));
+    if (cli->def == &hv_cli_and_def) {
+	PyObject *clis = ((CliAndObject *)cli->self)->classifiers;
+	int i, n = PyTuple_GET_SIZE(clis);
+	if (!(0 < n && n <= PC_MAXSPEC))
+	  return 0;
+	for (i = 0; i < n; i++) {
+	    PyObject *c = PyTuple_GET_ITEM(clis, i);
+	    if (!NyObjectClassifier_Check(c) ||
+		!pc_spec_leaf(hv, (NyObjectClassifierObject *)c, &spec[i]))
+	      return 0;
+	}
+	return n;
+    }
+    return pc_spec_leaf(hv, cli, spec);
+}
+
+/* Look up the extra type of a type without changing anything */
+
+static ExtraType *
+pc_extra_type(NyHeapViewObject *hv, PyTypeObject *type)
+{
+    ExtraType *xt;
+    for (xt = hv->xt_table[XT_HASH(hv, type)]; xt; xt = xt->xt_next) {
+	if (xt->xt_type == type)
+	  return xt;
+    }
+    return 0;
+}
+
+#define PC_CLASS_OF(obj) \
+    (PyInstance_Check(obj) ? (void *)((PyInstanceObject *)(obj))->in_class \
+     : (void *)(obj)->ob_type)
+
+/* Get the key of obj by one spec. Return 0 if done, 1 if it is to be
+   deferred. */
+
+static int
+pc_key(PCSpec *sp, PyObject *obj, long size, void **key)
+{
+    switch (sp->code) {
+      case PC_TYPE:
+	*key = obj->ob_type;
+	return 0;
+      case PC_CLASS:
+	*key = PC_CLASS_OF(obj);
+	return 0;
+      case PC_INDISIZE:
+	*key = (void *)size;
+	return 0;
+      case PC_DICTOF: {
+	  NyNodeGraphEdge *lo, *hi;
+	  PyObject *owner;
+	  if (!DictofDict_Check(obj)) {
+	      *key = (void *)0;
+	      return 0;
+	  }
+	  NyNodeGraph_Region(sp->owners, obj, &lo, &hi);
+	  if (!(lo < hi))
+	    return 1;
+	  owner = lo->tgt;
+	  if (owner == Py_None)
+	    *key = (void *)1;
+	  else if (sp->ownercode == PC_TYPE)
+	    *key = owner->ob_type;
+	  else
+	    *key = PC_CLASS_OF(owner);
+	  return 0;
+      }
+      default:
+	return 1;
+    }
+}
+
+static Py_uintptr_t
+pc_hash(void **key, int nspec)
+{
+    Py_uintptr_t h = 0;
+    int i;
+    for (i = 0; i < nspec; i++)
+      h = (h ^ ((Py_uintptr_t)key[i] >> 3)) * 2654435761UL;
+    return h;
+}
+
+static PCEntry *
+pc_lookup(PCEntry *table, int mask, int nspec, void **key)
+{
+    int i = pc_hash(key, nspec) & mask;
+    for (;;) {
+	PCEntry *e = &table[i];
+	if (!e->rep || memcmp(e->key, key, nspec * sizeof(void *)) == 0)
+	  return e;
+	i = (i + 1) & mask;
+    }
+}
+
+/* The worker allocates with malloc since it does not hold the
+   interpreter lock. */
+
+static int
+pc_grow(PCWorker *w)
+{
+    int osize = w->mask + 1;
+    int nsize = osize * 2;
+    PCEntry *ntable = calloc(nsize, sizeof(PCEntry));
+    int i;
+    if (!ntable)
+      return -1;
+    for (i = 0; i < osize; i++) {
+	PCEntry *e = &w->table[i];
+	if (e->rep)
+	  *pc_lookup(ntable, nsize - 1, w->nspec, e->key) = *e;
+    }
+    free(w->table);
+    w->table = ntable;
+    w->mask = nsize - 1;
+    return 0;
+}
+
+static int
+pc_defer(PCWorker *w, PyObject *obj)
+{
+    if (w->ndeferred == w->maxdeferred) {
+	int n = w->maxdeferred ? w->maxdeferred * 2 : 64;
+	PyObject **d = realloc(w->deferred, n * sizeof(PyObject *));
+	if (!d)
+	  return -1;
+	w->deferred = d;
+	w->maxdeferred = n;
+    }
+    w->deferred[w->ndeferred++] = obj;
+    return 0;
+}
+
+static void
+pc_work(PCWorker *w)
+{
+    void *key[PC_MAXSPEC];
+    PyTypeObject *type = 0;
+    ExtraType *xt = 0;
+    int i, j;
+    w->table = calloc(PC_INITIAL_SIZE, sizeof(PCEntry));
+    if (!w->table) {
+	w->err = 1;
+	return;
+    }
+    w->mask = PC_INITIAL_SIZE - 1;
+    for (i = w->lo; i < w->hi; i++) {
+	PyObject *obj = w->objs[i];
+	PCEntry *e;
+	long size;
+	if (obj->ob_type != type) {
+	    type = obj->ob_type;
+	    xt = pc_extra_type(w->hv, type);
+	}
+	if (!xt)
+	  goto Defer;
+	size = xt_size(xt, obj);
+	for (j = 0; j < w->nspec; j++) {
+	    if (pc_key(&w->spec[j], obj, size, &key[j]))
+	      goto Defer;
+	}
+	e = pc_lookup(w->table, w->mask, w->nspec, key);
+	if (!e->rep) {
+	    if ((w->used + 1) * 3 >= (w->mask + 1) * 2) {
+		if (pc_grow(w) == -1) {
+		    w->err = 1;
+		    return;
+		}
+		e = pc_lookup(w->table, w->mask, w->nspec, key);
+	    }
+	    memcpy(e->key, key, w->nspec * sizeof(void *));
+	    e->rep = obj;
+	    w->used++;
+	}
+	e->count++;
+	e->size += size;
+	continue;
+      Defer:
+	if (pc_defer(w, obj) == -1) {
+	    w->err = 1;
+	    return;
+	}
+    }
+}
+
+#ifdef WITH_THREAD
+static void
+pc_thread(void *arg)
+{
+    PCWorker *w = arg;
+    pc_work(w);
+    PyThread_release_lock(w->done);
+}
+#endif
+
+typedef struct {
+    NyHeapViewObject *hv;
+    PyObject **objs;
+    int n, max;
+    int update_static_types;
+} PCFillArg;
+
+/* Collect the objects into a plain array as the traversal finds them,
+   leaving out the hidden objects as hv_census_visit does. */
+
+static int
+pc_fill(PyObject *obj, PCFillArg *fa)
+{
+    if (hv_is_obj_hidden(fa->hv, obj))
+      return 0;
+    if (fa->update_static_types &&
+	hv_update_static_types_visitor(obj, fa->hv) == -1)
+      return -1;
+    if (fa->n == fa->max) {
+	int n = fa->max ? fa->max * 2 : 1024;
+	PyObject **objs = fa->objs;
+	PyMem_Resize(objs, PyObject *, n);
+	if (!objs) {
+	    PyErr_NoMemory();
+	    return -1;
+	}
+	fa->objs = objs;
+	fa->max = n;
+    }
+    fa->objs[fa->n++] = obj;
+    return 0;
+}
+
+/* Make the census of the objects in the heap by cli into ta->table,
+   using nthreads threads. Return 1 if done, 0 if cli is not supported,
+   and -1 on error. */
+
+static int
+hv_census_parallel(NyHeapViewObject *hv, NyObjectClassifierObject *cli,
+		   int nthreads, CensusTravArg *ta)
+{
+    PCSpec spec[PC_MAXSPEC];
+    PCWorker *workers = 0;
+    PCFillArg fa;
+    int nspec, i, k, started = 0, result = -1;
+    nspec = pc_spec_init(hv, cli, spec);
+    if (!nspec)
+      return 0;
+#ifndef WITH_THREAD
+    nthreads = 1;
+#endif
+    if (nthreads > PC_MAXTHREADS)
+      nthreads = PC_MAXTHREADS;
+
+    /* Make the owner graphs complete and sorted, so the threads can only
+       read them */
+    for (k = 0; k < nspec; k++) {
+	if (spec[k].code == PC_DICTOF) {
+	    NyNodeGraphEdge *lo, *hi;
+	    if (spec[k].owners->used_size == 0 &&
+		hv_cli_dictof_update(hv, spec[k].owners) == -1)
+	      return -1;
+	    NyNodeGraph_Region(spec[k].owners, Py_None, &lo, &hi);
+	}
+    }
+    /* The chunks of the threads are taken from the objects as found by
+       the one traversal, so no set of them is made as by HV.heap().
+       Like the traversal, the array does not hold the objects. */
+    fa.hv = hv;
+    fa.objs = 0;
+    fa.n = fa.max = 0;
+    fa.update_static_types = PyObject_Length(hv->static_types) == 0;
+    if (hv_iterate_flags(hv, (int (*)(PyObject *, void *))pc_fill, &fa, 0) == -1)
+      goto err;
+    workers = PyMem_New(PCWorker, nthreads);
+    if (!workers) {
+	PyErr_NoMemory();
+	goto err;
+    }
+    memset(workers, 0, nthreads * sizeof(PCWorker));
+    for (i = 0; i < nthreads; i++) {
+	PCWorker *w = &workers[i];
+	w->hv = hv;
+	w->spec = spec;
+	w->nspec = nspec;
+	w->objs = fa.objs;
+	w->lo = (int)(((long long)fa.n * i) / nthreads);
+	w->hi = (int)(((long long)fa.n * (i + 1)) / nthreads);
+    }
+#ifdef WITH_THREAD
+    /* Worker 0 is run by this thread */
+    for (i = 1; i < nthreads; i++) {
+	PCWorker *w = &workers[i];
+	w->done = PyThread_allocate_lock();
+	if (!w->done) {
+	    PyErr_NoMemory();
+	    goto join;
+	}
+	PyThread_acquire_lock(w->done, WAIT_LOCK);
+	if (PyThread_start_new_thread(pc_thread, w) == -1) {
+	    PyErr_SetString(PyExc_RuntimeError, "census: can't start new thread");
+	    goto join;
+	}
+	started = i;
+    }
+#endif
+    pc_work(&workers[0]);
+    result = 0;
+#ifdef WITH_THREAD
+  join:
+    for (i = 1; i <= started; i++)
+      PyThread_acquire_lock(workers[i].done, WAIT_LOCK);
+#endif
+    if (result == -1)
+      goto err;
+    result = -1;
+    for (i = 0; i < nthreads; i++) {
+	if (workers[i].err) {
+	    PyErr_NoMemory();
+	    goto err;
+	}
+    }
+
+    /* Merge the tables by the kinds of the representatives,
+       and take care of the deferred objects */
+
+    for (i = 0; i < nthreads; i++) {
+	PCWorker *w = &workers[i];
+	for (k = 0; k <= w->mask; k++) {
+	    PCEntry *pe = &w->table[k];
+	    CensusEntry *e;
+	    PyObject *kind;
+	    if (!pe->rep)
+	      continue;
+	    kind = cli->def->classify(cli->self, pe->rep);
+	    if (!kind)
+	      goto err;
+	    e = census_lookup(ta->table, ta->mask, kind);
+	    if (!e->kind) {
+		if ((ta->used + 1) * 3 >= (ta->mask + 1) * 2) {
+		    if (census_grow(ta) == -1) {
+			Py_DECREF(kind);
+			goto err;
+		    }
+		    e = census_lookup(ta->table, ta->mask, kind);
+		}
+		e->kind = kind;		/* Steals the reference */
+		ta->used++;
+	    } else {
+		Py_DECREF(kind);
+	    }
+	    e->count += pe->count;
+	    e->size += pe->size;
+	}
+	for (k = 0; k < w->ndeferred; k++) {
+	    if (hv_census_rec(w->deferred[k], ta) == -1)
+	      goto err;
+	}
+    }
+    result = 1;
+  err:
+    if (workers) {
+	for (i = 0; i < nthreads; i++) {
+	    free(workers[i].table);
+	    free(workers[i].deferred);
+#ifdef WITH_THREAD
+	    if (workers[i].done)
+	      PyThread_free_lock(workers[i].done);
+#endif
+	}
+	PyMem_Del(workers);
+    }
+    PyMem_Del(fa.objs);
+    return result;
+}
@@ -0,0 +1,623 @@
+/* Sampling census
+
+   HV.census_sample(C, objects, fraction [, seed]) estimates the count
+   and size per kind of the objects in the heap from a random sample of
+   the objects tracked by the garbage collector, as listed by
+   gc.get_objects(). Each tracked object is taken into the sample
+   independently, with the probability given by fraction, except that
+   objects of at least SC_BIGSIZE bytes, such as big lists and dicts,
+   are always taken. Such an object may refer to many others, and
+   leaving it to chance would make the estimates swing widely.
+
+   Objects that are not tracked, such as strings, ints and untracked
+   tuples, are not in the list. They are accounted for by the tracked
+   objects that refer to them: each reference from a sampled object to
+   an untracked object adds 1/refcount of it, so an object referred to
+   only from tracked objects is counted once on average. The untracked
+   objects are traversed in turn, to some depth, with the weight of their
+   referents divided by their own, so that for example the constants of
+   code objects are reached.
+
+   The owners of dicts are first found from the __dict__ slots of the
+   objects in the list, and the tp_dict of the static types of them.
+   An owned dict is counted only from its owner, with the weight of the
+   owner, so that it is not traversed again from each of the many
+   objects that may refer to it, as functions do to the dict of their
+   module. A dictof classifier finds the owner from the same table, in
+   HV.sample_owners, instead of walking the heap to update its graph of
+   the owners of all dicts. Dicts not owned are taken as other objects.
+   An object is also always taken if it and its dict together are big.
+
+   Static types are not tracked, but they are not counted by reference
+   either, since they refer to each other by their bases and mro, and
+   are referred to from many objects, so that they would be traversed
+   over and over. A static type is instead taken, as if it were big,
+   when it is first found from a sampled object. A static type that no
+   object of the list is of, or derives from, is not known as the owner
+   of its dict, which is then taken as a dict that is not owned.
+
+   The reference counts must not include references from hidden
+   objects, such as the owner graph of dicts that heapy keeps. That
+   graph may be made anew when a dict is classified, so the sampled
+   objects are first all found and classified, and recorded each with
+   the record it was found from. The hidden objects of the list are then
+   traversed to count the references from them, and the weights are
+   found last, from the reference counts less these references. Node
+   graphs and node sets hide themselves by their heap definitions,
+   which give no referents, rather than by hv_is_obj_hidden, so they
+   are checked for separately.
+
+   The contributions of each sampled object are summed per kind, to a
+   value y for the object. The estimate of a kind is the sum of y/p over
+   the sample, where p is the probability the object was sampled with,
+   and its variance is estimated as the sum of (1-p)/p**2 times y**2, as
+   for the Horvitz-Thompson estimator with independent sampling. The
+   totals of all kinds are estimated in the same way from the sum of y
+   over the kinds. */
+
+#define SC_MAXDEPTH	8
+#define SC_BIGSIZE	4096
+
+typedef struct {
+    PyObject *obj;
+    PyObject *kind;
+    int parent;			/* Index of the record found from, or -1 */
+    double p;			/* The probability, if parent is -1 */
+    double size;
+    double w;			/* The weight, when found */
+} SCRecord;
+
+typedef struct {
+    PyObject *obj;
+    long n;
+} SCUncounted;
+
+typedef struct {
+    PyObject *dict, *owner;
+} SCOwner;
+
+typedef struct NyDictOwners {
+    SCOwner *table;		/* The owners of dicts, from the list */
+    int mask, used;
+} NyDictOwners;
+
+typedef struct {
+    PyObject *kind;
+    double count, size;		/* Sums of y/p over the sample */
+    double countsq, sizesq;	/* Sums of (1-p)/p**2 * y**2 */
+    double ucount, usize;	/* y of the current sampled object */
+    int touched;
+} SCEntry;
+
+typedef struct {
+    NyHeapViewObject *hv;
+    NyObjectClassifierObject *cli;
+    SCRecord *recs;
+    int nrecs, maxrecs;
+    int cur, depth;
+    SCUncounted *uncounted;	/* References not to count, per object */
+    int umask, uused;
+    NyDictOwners owners;
+    NyNodeSetObject *typeset;	/* The static types found */
+    PyObject *types;		/* The same, in the order found */
+    SCEntry *table;
+    int mask, used;
+    PyObject **touched;		/* Kinds touched by the current object */
+    int ntouched, maxtouched;
+    double ucount, usize;	/* Total y of the current object */
+} SCTravArg;
+
+static int
+sc_is_hidden(NyHeapViewObject *hv, PyObject *obj)
+{
+    if (NyNodeGraph_Check(obj))
+      return ((NyNodeGraphObject *)obj)->_hiding_tag_ == hv->_hiding_tag_;
+    if (NyNodeSet_Check(obj))
+      return ((NyNodeSetObject *)obj)->_hiding_tag_ == hv->_hiding_tag_;
+    return hv_is_obj_hidden(hv, obj);
+}
+
+static SCOwner *
+sc_owner_lookup(SCOwner *table, int mask, PyObject *dict)
+{
+    int i = CENSUS_HASH(dict) & mask;
+    while (table[i].dict && table[i].dict != dict)
+      i = (i + 1) & mask;
+    return &table[i];
+}
+
+/* The owner of dict, or NULL; also for hv_cli_dictof_classify */
+
+static PyObject *
+sc_owner(NyDictOwners *ow, PyObject *dict)
+{
+    return sc_owner_lookup(ow->table, ow->mask, dict)->owner;
+}
+
+/* Note owner as the owner of dict, unless it has one already */
+
+static int
+sc_add_owner(NyDictOwners *ow, PyObject *dict, PyObject *owner)
+{
+    SCOwner *o;
+    if (!DictofDict_Check(dict))
+      return 0;
+    o = sc_owner_lookup(ow->table, ow->mask, dict);
+    if (!o->dict) {
+	if ((ow->used + 1) * 3 >= (ow->mask + 1) * 2) {
+	    int i, osize = ow->mask + 1, nsize = osize * 2;
+	    SCOwner *ntable = PyMem_New(SCOwner, nsize);
+	    if (!ntable) {
+		PyErr_NoMemory();
+		return -1;
+	    }
+	    memset(ntable, 0, nsize * sizeof(SCOwner));
+	    for (i = 0; i < osize; i++) {
+		if (ow->table[i].dict)
+		  *sc_owner_lookup(ntable, nsize - 1, ow->table[i].dict) =
+		    ow->table[i];
+	    }
+	    PyMem_Del(ow->table);
+	    ow->table = ntable;
+	    ow->mask = nsize - 1;
+	    o = sc_owner_lookup(ow->table, ow->mask, dict);
+	}
+	o->dict = dict;
+	o->owner = owner;
+	ow->used++;
+    }
+    return 0;
+}
+
+#define SC_IS_STATIC_TYPE(obj) \
+    (PyType_Check(obj) && \
+     !(((PyTypeObject *)(obj))->tp_flags & Py_TPFLAGS_HEAPTYPE))
+
+/* Whether obj is weighed by its reference count when found, as it is
+   neither sampled from the list, a static type nor an owned dict */
+
+#define SC_BY_REFCNT(ta, obj) \
+    (!(PyObject_IS_GC(obj) && _PyObject_GC_IS_TRACKED(obj)) && \
+     !SC_IS_STATIC_TYPE(obj) && \
+     !(DictofDict_Check(obj) && sc_owner(&(ta)->owners, obj)))
+
+static SCUncounted *
+sc_uncounted_lookup(SCUncounted *table, int mask, PyObject *obj)
+{
+    int i = CENSUS_HASH(obj) & mask;
+    while (table[i].obj && table[i].obj != obj)
+      i = (i + 1) & mask;
+    return &table[i];
+}
+
+/* Note a reference to obj that is not to be counted */
+
+static int
+sc_uncount(PyObject *obj, SCTravArg *ta)
+{
+    SCUncounted *u;
+    if (!SC_BY_REFCNT(ta, obj))
+      return 0;
+    u = sc_uncounted_lookup(ta->uncounted, ta->umask, obj);
+    if (!u->obj) {
+	if ((ta->uused + 1) * 3 >= (ta->umask + 1) * 2) {
+	    int i, osize = ta->umask + 1, nsize = osize * 2;
+	    SCUncounted *ntable = PyMem_New(SCUncounted, nsize);
+	    if (!ntable) {
+		PyErr_NoMemory();
+		return -1;
+	    }
+	    memset(ntable, 0, nsize * sizeof(SCUncounted));
+	    for (i = 0; i < osize; i++) {
+		if (ta->uncounted[i].obj)
+		  *sc_uncounted_lookup(ntable, nsize - 1, ta->uncounted[i].obj) =
+		    ta->uncounted[i];
+	    }
+	    PyMem_Del(ta->uncounted);
+	    ta->uncounted = ntable;
+	    ta->umask = nsize - 1;
+	    u = sc_uncounted_lookup(ta->uncounted, ta->umask, obj);
+	}
+	u->obj = obj;
+	ta->uused++;
+    }
+    u->n++;
+    return 0;
+}
+
+/* Record and classify obj, found from record parent.
+   Return the index of the record, or -1 on error. */
+
+static int
+sc_record(SCTravArg *ta, PyObject *obj, int parent, double p)
+{
+    SCRecord *r;
+    PyObject *kind;
+    if (ta->nrecs >= ta->maxrecs) {
+	int n = ta->maxrecs * 2;
+	SCRecord *recs = PyMem_Resize(ta->recs, SCRecord, n);
+	if (!recs) {
+	    PyErr_NoMemory();
+	    return -1;
+	}
+	ta->recs = recs;
+	ta->maxrecs = n;
+    }
+    kind = ta->cli->def->classify(ta->cli->self, obj);
+    if (!kind)
+      return -1;
+    if (sc_uncount(obj, ta) == -1) {	/* The reference of the record */
+	Py_DECREF(kind);
+	return -1;
+    }
+    r = &ta->recs[ta->nrecs];
+    Py_INCREF(obj);
+    r->obj = obj;
+    r->kind = kind;
+    r->parent = parent;
+    r->p = p;
+    r->size = hv_std_size(ta->hv, obj);
+    r->w = 0.0;
+    return ta->nrecs++;
+}
+
+static int
+sc_visit(PyObject *obj, SCTravArg *ta)
+{
+    PyObject *owner;
+    int idx, ocur, r;
+    if (DictofDict_Check(obj) && (owner = sc_owner(&ta->owners, obj))) {
+	if (owner != ta->recs[ta->cur].obj)
+	  return 0;		/* It is counted from its owner */
+    } else if (PyObject_IS_GC(obj) && _PyObject_GC_IS_TRACKED(obj))
+      return 0;			/* It is counted when it is sampled */
+    if (SC_IS_STATIC_TYPE(obj)) {
+	r = NyNodeSet_setobj(ta->typeset, obj);
+	if (r == 0)		/* It is taken after the sampled objects */
+	  r = PyList_Append(ta->types, obj);
+	return r == -1 ? -1 : 0;
+    }
+    if (sc_is_hidden(ta->hv, obj))
+      return 0;
+    idx = sc_record(ta, obj, ta->cur, 0.0);
+    if (idx == -1)
+      return -1;
+    if (ta->depth >= SC_MAXDEPTH)
+      return 0;
+    ocur = ta->cur;
+    ta->cur = idx;
+    ta->depth++;
+    r = hv_std_traverse(ta->hv, obj, (visitproc)sc_visit, ta);
+    ta->depth--;
+    ta->cur = ocur;
+    return r;
+}
+
+static SCEntry *
+sc_lookup(SCEntry *table, int mask, PyObject *kind)
+{
+    int i = CENSUS_HASH(kind) & mask;
+    while (table[i].kind && table[i].kind != kind)
+      i = (i + 1) & mask;
+    return &table[i];
+}
+
+static int
+sc_grow(SCTravArg *ta)
+{
+    int osize = ta->mask + 1;
+    int nsize = osize * 2;
+    SCEntry *otable = ta->table;
+    SCEntry *ntable = PyMem_New(SCEntry, nsize);
+    int i;
+    if (!ntable) {
+	PyErr_NoMemory();
+	return -1;
+    }
+    memset(ntable, 0, nsize * sizeof(SCEntry));
+    for (i = 0; i < osize; i++) {
+	if (otable[i].kind)
+	  *sc_lookup(ntable, nsize - 1, otable[i].kind) = otable[i];
+    }
+    PyMem_Del(otable);
+    ta->table = ntable;
+    ta->mask = nsize - 1;
+    return 0;
+}
+
+/* Add the weight of record r to its kind, for the current sampled object */
+
+static int
+sc_add(SCTravArg *ta, SCRecord *r)
+{
+    SCEntry *e = sc_lookup(ta->table, ta->mask, r->kind);
+    if (!e->kind) {
+	if ((ta->used + 1) * 3 >= (ta->mask + 1) * 2) {
+	    if (sc_grow(ta) == -1)
+	      return -1;
+	    e = sc_lookup(ta->table, ta->mask, r->kind);
+	}
+	Py_INCREF(r->kind);
+	e->kind = r->kind;
+	ta->used++;
+    }
+    if (!e->touched) {
+	if (ta->ntouched >= ta->maxtouched) {
+	    int n = ta->maxtouched * 2;
+	    PyObject **t = PyMem_Resize(ta->touched, PyObject *, n);
+	    if (!t) {
+		PyErr_NoMemory();
+		return -1;
+	    }
+	    ta->touched = t;
+	    ta->maxtouched = n;
+	}
+	ta->touched[ta->ntouched++] = e->kind;
+	e->touched = 1;
+    }
+    e->ucount += r->w;
+    e->usize += r->w * r->size;
+    ta->ucount += r->w;
+    ta->usize += r->w * r->size;
+    return 0;
+}
+
+/* Fold the y of the current object, sampled with probability p,
+   into the sums */
+
+static void
+sc_flush(SCTravArg *ta, double p, double *tot)
+{
+    double scale = 1.0 / p, vscale = (1.0 - p) / (p * p);
+    int i;
+    for (i = 0; i < ta->ntouched; i++) {
+	SCEntry *e = sc_lookup(ta->table, ta->mask, ta->touched[i]);
+	e->count += e->ucount * scale;
+	e->size += e->usize * scale;
+	e->countsq += e->ucount * e->ucount * vscale;
+	e->sizesq += e->usize * e->usize * vscale;
+	e->ucount = e->usize = 0.0;
+	e->touched = 0;
+    }
+    ta->ntouched = 0;
+    tot[0] += ta->ucount * scale;
+    tot[1] += ta->usize * scale;
+    tot[2] += ta->ucount * ta->ucount * vscale;
+    tot[3] += ta->usize * ta->usize * vscale;
+    ta->ucount = ta->usize = 0.0;
+}
+
+/* xorshift64* generator, giving doubles in [0, 1) */
+
+static double
+sc_random(unsigned PY_LONG_LONG *state)
+{
+    unsigned PY_LONG_LONG x = *state;
+    x ^= x >> 12;
+    x ^= x << 25;
+    x ^= x >> 27;
+    *state = x;
+    x *= 2685821657736338717ULL;
+    return (double)(x >> 11) * (1.0 / 9007199254740992.0);
+}
+
+/* Take obj into the sample with probability p, with what it refers to */
+
+static int
+sc_take(SCTravArg *ta, PyObject *obj, double p)
+{
+    ta->cur = sc_record(ta, obj, -1, p);
+    if (ta->cur == -1)
+      return -1;
+    return hv_std_traverse(ta->hv, obj, (visitproc)sc_visit, ta);
+}
+
+PyDoc_STRVAR(hv_census_sample_doc,
+"HV.census_sample(C:ObjectClassifier, objects:list, fraction:float\n\
+                 [, seed:int]) -> tuple\n\
+\n\
+Estimate the count and size per kind of the objects in the heap, as\n\
+classified by C, from a random sample of objects, which should be the\n\
+list of objects tracked by the garbage collector as returned by\n\
+gc.get_objects(). Each object of the list is sampled with probability\n\
+fraction, or always if it is big, as a list of many items may be,\n\
+except that a dict owned by an object of the list, or by its type, is\n\
+counted with its owner. Objects not tracked by the garbage collector\n\
+are counted by the sampled objects referring to them, in proportion to\n\
+their reference count. The owner of a dict, for a classifier by dict\n\
+owner, is found from the __dict__ slots of the objects of the list,\n\
+without updating the owner graph of the classifier. The random\n\
+generator is seeded with seed, if given. The garbage collector should be disabled while the\n\
+list is made and used.\n\
+\n\
+Return a tuple (rows, totals). The rows is a list of tuples (kind,\n\
+count, size, countvar, sizevar), where count and size are estimates of\n\
+the number and individual size of the objects of kind, and countvar\n\
+and sizevar are estimates of the variance of these. The totals is a\n\
+tuple (n, count, size, countvar, sizevar) for all kinds, where n is the\n\
+number of objects sampled.");
+
+static PyObject *
+hv_census_sample(NyHeapViewObject *self, PyObject *args)
+{
+    SCTravArg ta;
+    NyObjectClassifierObject *cli;
+    PyObject *objects, *result = 0, *rows = 0;
+    double fraction, p = 1.0, tot[4] = {0.0, 0.0, 0.0, 0.0};
+    unsigned PY_LONG_LONG state;
+    long seed = 0;
+    int i, n, nsampled = 0;
+    if (!PyArg_ParseTuple(args, "O!O!d|l:census_sample",
+			  &NyObjectClassifier_Type, &cli,
+			  &PyList_Type, &objects, &fraction, &seed))
+      return 0;
+    if (!(0.0 < fraction && fraction <= 1.0)) {
+	PyErr_SetString(PyExc_ValueError,
+			"census_sample: fraction must be > 0 and <= 1");
+	return 0;
+    }
+    memset(&ta, 0, sizeof(ta));
+    ta.hv = self;
+    ta.cli = cli;
+    ta.maxrecs = 1024;
+    ta.recs = PyMem_New(SCRecord, ta.maxrecs);
+    ta.umask = CENSUS_INITIAL_SIZE - 1;
+    ta.uncounted = PyMem_New(SCUncounted, CENSUS_INITIAL_SIZE);
+    ta.owners.mask = CENSUS_INITIAL_SIZE - 1;
+    ta.owners.table = PyMem_New(SCOwner, CENSUS_INITIAL_SIZE);
+    ta.mask = CENSUS_INITIAL_SIZE - 1;
+    ta.table = PyMem_New(SCEntry, CENSUS_INITIAL_SIZE);
+    ta.maxtouched = 16;
+    ta.touched = PyMem_New(PyObject *, ta.maxtouched);
+    ta.typeset = NyMutNodeSet_New();
+    ta.types = PyList_New(0);
+    if (!ta.recs || !ta.uncounted || !ta.owners.table || !ta.table ||
+	!ta.touched || !ta.typeset || !ta.types) {
+	PyErr_NoMemory();
+	goto err;
+    }
+    memset(ta.uncounted, 0, CENSUS_INITIAL_SIZE * sizeof(SCUncounted));
+    memset(ta.owners.table, 0, CENSUS_INITIAL_SIZE * sizeof(SCOwner));
+    memset(ta.table, 0, CENSUS_INITIAL_SIZE * sizeof(SCEntry));
+    if (self->sample_owners) {
+	PyErr_SetString(PyExc_RuntimeError,
+			"census_sample: recursive call");
+	goto err;
+    }
+    self->sample_owners = &ta.owners;
+    state = (unsigned PY_LONG_LONG)seed * 6364136223846793005ULL +
+      1442695040888963407ULL;
+    if (!state)
+      state = 1;
+
+    /* Find the owners of dicts, from the objects and their static types */
+    Py_INCREF(objects);
+    n = PyList_GET_SIZE(objects);
+    for (i = 0; i < n; i++) {
+	PyObject *obj = PyList_GET_ITEM(objects, i);
+	PyObject **dp = hv_cli_dictof_dictptr(obj);
+	PyTypeObject *type;
+	if (dp && *dp && sc_add_owner(&ta.owners, *dp, obj) == -1) {
+	    Py_DECREF(objects);
+	    goto err;
+	}
+	for (type = obj->ob_type; type; type = type->tp_base) {
+	    if ((type->tp_flags & Py_TPFLAGS_HEAPTYPE) || !type->tp_dict)
+	      continue;
+	    if (sc_owner(&ta.owners, type->tp_dict))
+	      break;
+	    if (sc_add_owner(&ta.owners, type->tp_dict,
+			     (PyObject *)type) == -1) {
+		Py_DECREF(objects);
+		goto err;
+	    }
+	}
+    }
+
+    /* Find and classify the sampled objects and what they refer to */
+    for (i = 0; i < n; i++) {
+	PyObject *obj = PyList_GET_ITEM(objects, i);
+	p = fraction;
+	if (obj == objects ||
+	    (DictofDict_Check(obj) && sc_owner(&ta.owners, obj)))
+	  continue;
+	if (fraction < 1.0) {
+	    PyObject **dp = hv_cli_dictof_dictptr(obj);
+	    int size = hv_std_size(self, obj);
+	    if (dp && *dp && sc_owner(&ta.owners, *dp) == obj)
+	      size += hv_std_size(self, *dp);
+	    if (size >= SC_BIGSIZE)
+	      p = 1.0;
+	    else if (sc_random(&state) >= fraction)
+	      continue;
+	}
+	if (sc_is_hidden(self, obj))
+	  continue;
+	nsampled++;
+	if (sc_take(&ta, obj, p) == -1) {
+	    Py_DECREF(objects);
+	    goto err;
+	}
+    }
+    for (i = 0; i < PyList_GET_SIZE(ta.types); i++) {
+	nsampled++;
+	if (sc_take(&ta, PyList_GET_ITEM(ta.types, i), 1.0) == -1) {
+	    Py_DECREF(objects);
+	    goto err;
+	}
+    }
+
+    /* Find the references from hidden objects */
+    for (i = 0; i < n; i++) {
+	PyObject *obj = PyList_GET_ITEM(objects, i);
+	traverseproc trav = obj->ob_type->tp_traverse;
+	if (trav && sc_is_hidden(self, obj) &&
+	    trav(obj, (visitproc)sc_uncount, &ta) == -1) {
+	    Py_DECREF(objects);
+	    goto err;
+	}
+    }
+    Py_DECREF(objects);
+
+    /* Weigh the records and sum them per sampled object */
+    for (i = 0; i < ta.nrecs; i++) {
+	SCRecord *r = &ta.recs[i];
+	if (r->parent == -1) {
+	    if (i)
+	      sc_flush(&ta, p, tot);
+	    p = r->p;
+	    r->w = 1.0;
+	} else if (!SC_BY_REFCNT(&ta, r->obj)) {
+	    r->w = ta.recs[r->parent].w;	/* An owned dict */
+	} else {
+	    long refcnt = r->obj->ob_refcnt -
+	      sc_uncounted_lookup(ta.uncounted, ta.umask, r->obj)->n;
+	    r->w = refcnt > 0 ? ta.recs[r->parent].w / refcnt : 0.0;
+	}
+	if (sc_add(&ta, r) == -1)
+	  goto err;
+    }
+    if (ta.nrecs)
+      sc_flush(&ta, p, tot);
+
+    rows = PyList_New(0);
+    if (!rows)
+      goto err;
+    for (i = 0; i <= ta.mask; i++) {
+	SCEntry *e = &ta.table[i];
+	PyObject *cs;
+	if (!e->kind)
+	  continue;
+	cs = Py_BuildValue("(Odddd)", e->kind, e->count, e->size,
+			   e->countsq, e->sizesq);
+	if (!cs || PyList_Append(rows, cs) == -1) {
+	    Py_XDECREF(cs);
+	    goto err;
+	}
+	Py_DECREF(cs);
+    }
+    result = Py_BuildValue("(O(idddd))", rows, nsampled,
+			   tot[0], tot[1], tot[2], tot[3]);
+  err:
+    if (self->sample_owners == &ta.owners)
+      self->sample_owners = 0;
+    Py_XDECREF(rows);
+    if (ta.recs) {
+	for (i = 0; i < ta.nrecs; i++) {
+	    Py_DECREF(ta.recs[i].obj);
+	    Py_DECREF(ta.recs[i].kind);
+	}
+	PyMem_Del(ta.recs);
+    }
+    if (ta.table) {
+	for (i = 0; i <= ta.mask; i++)
+	  Py_XDECREF(ta.table[i].kind);
+	PyMem_Del(ta.table);
+    }
+    PyMem_Del(ta.uncounted);
+    PyMem_Del(ta.owners.table);
+    PyMem_Del(ta.touched);
+    Py_XDECREF(ta.typeset);
+    Py_XDECREF(ta.types);
+    return result;
+}
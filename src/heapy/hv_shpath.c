@@ -0,0 +1,610 @@
+/* Bidirectional shortest path search
+
+   HV.shpathsearch() finds the shortest paths from a source set to a
+   destination set by searching forward from the source, traversing the
+   objects as shpathstep does. A destination near the source is so
+   found without looking at the rest of the heap. When the forward
+   frontier has grown past a threshold, the search is made at the same
+   time backward from the destination, looking up the referrers in a
+   referrer graph. The side with the smaller frontier is then extended
+   one level at a time. When a new level of one side meets the nodes
+   visited from the other side, the nodes where they meet are all in
+   the last level of the other side, so the distance is then known and
+   the search ends. Only the objects near the paths are visited, rather
+   than every object nearer to the source than the destination, as in a
+   forward search.
+
+   The edges found are recorded in two graphs, from each node to the
+   node it was found from. The paths are then followed from the meeting
+   nodes back to the source and on to the destination, and their edges
+   are added to G in the same form as shpathstep adds them, from each
+   node to its predecessor on a shortest path.
+
+   The referrer graph is got from a function given by the caller, the
+   first time the threshold is passed, and is then used for all the
+   destination sets. Path.py gives View.rg, updated as with
+   update_referrers, so it is only made by a walk of the heap if it does
+   not already cover the destinations. It contains every edge of every
+   path from the root to the destination, and so of those from the
+   source, if the source is on such a path; else the search goes on
+   forward only. The graph may have been made before the heap changed,
+   so each edge taken from it is checked by traversing the referrer, and
+   if the backward search comes to an end before meeting the forward
+   search, the forward search goes on alone. A referrer added since the
+   graph was made is not found backward, so the paths found may then not
+   be the shortest ones, if such a referrer is on them and not reached
+   first by the forward search.
+
+*/
+
+typedef struct {
+    PyObject *referrers;		/* Function returning the referrer graph */
+    NyNodeGraphObject *rg;
+    int threshold;			/* Forward frontier size to search back */
+    int state;				/* 0 not got yet, 1 usable, -1 not */
+} ShRgArg;
+
+typedef struct {
+    NyHeapViewObject *hv;
+    NyNodeSetObject *S, *V;		/* Visited nodes, new level */
+    NyNodeGraphObject *P;		/* From each new node to where found */
+    NyNodeGraphObject *rg;
+    NyNodeGraphObject *edgestoavoid;
+} ShBackTravArg;
+
+typedef struct {
+    NyNodeGraphObject *G, *P;
+    NyNodeSetObject *found;		/* Nodes having an edge in G */
+    NyNodeSetObject *dst;		/* If not NULL, collect nodes in dst */
+    NyNodeSetObject *next;
+    NyNodeSetObject *result;
+    int invert, find_one;
+} ShJoinArg;
+
+static int
+hv_shpath_refers(PyObject *obj, PyObject *u)
+{
+    return obj == u;
+}
+
+static int
+hv_shback_outer(PyObject *u, ShBackTravArg *ta)
+{
+    NyNodeGraphEdge *lo, *hi;
+    if (NyNodeGraph_Region(ta->rg, u, &lo, &hi) == -1)
+      return -1;
+    for (; lo < hi; lo++) {
+	PyObject *v = lo->tgt;
+	int r;
+	if (v == Py_None)
+	  continue;
+	if (ta->edgestoavoid) {
+	    NyNodeGraphEdge *alo, *ahi;
+	    if (NyNodeGraph_Region(ta->edgestoavoid, v, &alo, &ahi) == -1)
+	      return -1;
+	    for (; alo < ahi; alo++) {
+		if (alo->tgt == u)
+		  break;
+	    }
+	    if (alo < ahi)
+	      continue;
+	}
+	r = NyNodeSet_hasobj(ta->S, v);
+	if (r == -1)
+	  return -1;
+	if (r)
+	  continue;
+	r = hv_std_traverse(ta->hv, v, (visitproc)hv_shpath_refers, u);
+	if (r == -1)
+	  return -1;
+	if (!r)
+	  continue;
+	if (NyNodeSet_setobj(ta->V, v) == -1)
+	  return -1;
+	if (NyNodeGraph_AddEdge(ta->P, v, u) == -1)
+	  return -1;
+    }
+    return 0;
+}
+
+static int
+hv_shpath_union(PyObject *obj, NyNodeSetObject *ns)
+{
+    return NyNodeSet_setobj(ns, obj) == -1 ? -1 : 0;
+}
+
+typedef struct {
+    NyNodeSetObject *S, *M;
+} ShMeetArg;
+
+static int
+hv_shpath_meet(PyObject *obj, ShMeetArg *ma)
+{
+    int r = NyNodeSet_hasobj(ma->S, obj);
+    if (r == -1)
+      return -1;
+    if (r && NyNodeSet_setobj(ma->M, obj) == -1)
+      return -1;
+    return 0;
+}
+
+static int
+hv_shpath_diff(PyObject *obj, ShMeetArg *ma)
+{
+    int r = NyNodeSet_hasobj(ma->S, obj);
+    if (r == -1)
+      return -1;
+    if (!r && NyNodeSet_setobj(ma->M, obj) == -1)
+      return -1;
+    return 0;
+}
+
+/* Add the edges of P from obj to G, as they are (forward part) or
+   inverted (backward part), and collect the nodes they lead to.
+   With find_one, a node that already has an edge in G is not given
+   another, so each node gets a single predecessor, and in the forward
+   part only the first edge is followed. */
+
+static int
+hv_shpath_join(PyObject *obj, ShJoinArg *ja)
+{
+    NyNodeGraphEdge *lo, *hi;
+    int r;
+    if (ja->dst) {
+	r = NyNodeSet_hasobj(ja->dst, obj);
+	if (r == -1)
+	  return -1;
+	if (r) {
+	    if (NyNodeSet_setobj(ja->result, obj) == -1)
+	      return -1;
+	    return 0;
+	}
+    }
+    if (NyNodeGraph_Region(ja->P, obj, &lo, &hi) == -1)
+      return -1;
+    for (; lo < hi; lo++) {
+	PyObject *v = lo->tgt;
+	if (ja->find_one) {
+	    r = NyNodeSet_setobj(ja->found, ja->invert ? v : obj);
+	    if (r == -1)
+	      return -1;
+	    if (r) {
+		if (ja->invert)
+		  continue;
+		return 0;
+	    }
+	}
+	if (ja->invert)
+	  r = NyNodeGraph_AddEdge(ja->G, v, obj);
+	else
+	  r = NyNodeGraph_AddEdge(ja->G, obj, v);
+	if (r == -1)
+	  return -1;
+	if (NyNodeSet_setobj(ja->next, v) == -1)
+	  return -1;
+	if (ja->find_one && !ja->invert)
+	  break;
+    }
+    return 0;
+}
+
+/* Follow the edges of P level by level from the nodes in M. */
+
+static int
+hv_shpath_follow(NyHeapViewObject *hv, ShJoinArg *ja, NyNodeSetObject *M)
+{
+    Py_INCREF(M);
+    ja->next = 0;
+    while (Py_SIZE(M)) {
+	ja->next = hv_mutnodeset_new(hv);
+	if (!ja->next)
+	  goto err;
+	if (NyNodeSet_iterate(M, (visitproc)hv_shpath_join, ja) == -1)
+	  goto err;
+	Py_DECREF(M);
+	M = ja->next;
+	ja->next = 0;
+    }
+    Py_DECREF(M);
+    return 0;
+  err:
+    Py_DECREF(M);
+    Py_XDECREF(ja->next);
+    ja->next = 0;
+    return -1;
+}
+
+static NyNodeGraphObject *
+hv_shpath_graph(NyHeapViewObject *hv)
+{
+    NyNodeGraphObject *ng = NyNodeGraph_New();
+    if (ng) {
+	ng->_hiding_tag_ = hv->_hiding_tag_;
+	Py_XINCREF(ng->_hiding_tag_);
+    }
+    return ng;
+}
+
+typedef struct {
+    NyHeapViewObject *hv;
+    ShJoinArg *fw;
+    NyNodeGraphObject *T;		/* Single predecessors toward Dst */
+    NyNodeSetObject *done;		/* Nodes having an edge in G from T */
+    NyNodeSetObject *one;
+    NyNodeSetObject *result;
+    int maxpaths;
+} ShFirstArg;
+
+/* Add the path to the destination node obj, found in T, and one path on
+   from the meeting node it leads to back to the source, unless maxpaths
+   destination nodes have been taken already. */
+
+static int
+hv_shpath_first(PyObject *obj, ShFirstArg *fa)
+{
+    PyObject *x = obj;
+    int r;
+    if (Py_SIZE(fa->result) >= fa->maxpaths)
+      return 0;
+    if (NyNodeSet_setobj(fa->result, obj) == -1)
+      return -1;
+    for (;;) {
+	NyNodeGraphEdge *lo, *hi;
+	if (NyNodeGraph_Region(fa->T, x, &lo, &hi) == -1)
+	  return -1;
+	if (lo == hi)
+	  break;
+	r = NyNodeSet_setobj(fa->done, x);
+	if (r == -1)
+	  return -1;
+	if (r)
+	  return 0;
+	if (NyNodeGraph_AddEdge(fa->fw->G, x, lo->tgt) == -1)
+	  return -1;
+	x = lo->tgt;
+    }
+    if (NyNodeSet_setobj(fa->one, x) == -1)
+      return -1;
+    if (hv_shpath_follow(fa->hv, fa->fw, fa->one) == -1)
+      return -1;
+    return NyNodeSet_clrobj(fa->one, x) == -1 ? -1 : 0;
+}
+
+typedef struct {
+    NyHeapViewObject *hv;
+    NyNodeGraphObject *rg;
+    int covered;
+} ShCoverArg;
+
+static int
+hv_shpath_covered(PyObject *obj, ShCoverArg *ca)
+{
+    NyNodeGraphEdge *lo, *hi;
+    if (obj == ca->hv->root)
+      return 0;
+    if (NyNodeGraph_Region(ca->rg, obj, &lo, &hi) == -1)
+      return -1;
+    if (lo == hi)
+      ca->covered = 0;
+    return 0;
+}
+
+/* Get the referrer graph, the first time it is needed. Return 1 if
+   the search can be made backward with it, 0 if not, -1 on error. It
+   can not if the source has nodes not on a path from the root to a
+   destination set, since the paths from them may not be in the graph. */
+
+static int
+hv_shpath_getrg(NyHeapViewObject *hv, ShRgArg *ra, NyNodeSetObject *Src)
+{
+    ShCoverArg ca;
+    PyObject *rg;
+    if (ra->state)
+      return ra->state > 0;
+    ra->state = -1;
+    if (!ra->referrers)
+      return 0;
+    rg = PyObject_CallObject(ra->referrers, 0);
+    if (!rg)
+      return -1;
+    if (rg == Py_None) {
+	Py_DECREF(rg);
+	return 0;
+    }
+    if (!NyNodeGraph_Check(rg)) {
+	PyErr_SetString(PyExc_TypeError,
+			"shpathsearch: referrers must return a NodeGraph or None");
+	Py_DECREF(rg);
+	return -1;
+    }
+    ra->rg = (NyNodeGraphObject *)rg;
+    ca.hv = hv;
+    ca.rg = ra->rg;
+    ca.covered = 1;
+    if (NyNodeSet_iterate(Src, (visitproc)hv_shpath_covered, &ca) == -1)
+      return -1;
+    if (!ca.covered)
+      return 0;
+    ra->state = 1;
+    return 1;
+}
+
+/* Search for the shortest paths from Src to Dst, returning the nodes
+   in Dst found. */
+
+static NyNodeSetObject *
+hv_shpath_search(NyHeapViewObject *self, NyNodeGraphObject *G,
+		 ShRgArg *ra, NyNodeSetObject *Src,
+		 NyNodeSetObject *Dst, NyNodeSetObject *S,
+		 NyNodeGraphObject *edgestoavoid, int maxpaths)
+{
+    NyNodeGraphObject *PF = 0, *PB = 0, *T = 0;
+    NyNodeSetObject *FS = 0, *BS = 0, *FU = 0, *BU = 0, *D = 0, *M = 0;
+    NyNodeSetObject *result = 0, *found = 0, *done = 0, *one = 0;
+    int meet_forward = 0, backward = 0;	/* 1 if searching back, -1 not */
+    ShPathTravArg fa;
+    ShBackTravArg ba;
+    ShMeetArg ma;
+    ShJoinArg fj, bj;
+    if (edgestoavoid && edgestoavoid->used_size == 0)
+      edgestoavoid = 0;
+    if (!((FS = hv_mutnodeset_new(self)) &&
+	  (BS = hv_mutnodeset_new(self)) &&
+	  (FU = hv_mutnodeset_new(self)) &&
+	  (BU = hv_mutnodeset_new(self)) &&
+	  (D = hv_mutnodeset_new(self)) &&
+	  (result = hv_mutnodeset_new(self)) &&
+	  (PF = hv_shpath_graph(self)) &&
+	  (PB = hv_shpath_graph(self))))
+      goto err;
+
+    /* The visited sets start with the nodes to avoid, so they are not
+       visited again. The destination nodes searched for are those not
+       avoided and not in the source. */
+
+    if (NyNodeSet_iterate(S, (visitproc)hv_shpath_union, FS) == -1 ||
+	NyNodeSet_iterate(S, (visitproc)hv_shpath_union, BS) == -1)
+      goto err;
+    ma.S = S;
+    ma.M = FU;
+    if (NyNodeSet_iterate(Src, (visitproc)hv_shpath_diff, &ma) == -1 ||
+	NyNodeSet_iterate(Src, (visitproc)hv_shpath_union, FS) == -1)
+      goto err;
+    ma.S = FS;
+    ma.M = D;
+    if (NyNodeSet_iterate(Dst, (visitproc)hv_shpath_diff, &ma) == -1 ||
+	NyNodeSet_iterate(D, (visitproc)hv_shpath_union, BS) == -1 ||
+	NyNodeSet_iterate(D, (visitproc)hv_shpath_union, BU) == -1)
+      goto err;
+
+    fa.hv = self;
+    fa.U = fa.V = 0;
+    fa.S = FS;
+    fa.P = PF;
+    fa.edgestoavoid = edgestoavoid;
+    fa.find_one_flag = 0;
+
+    ba.hv = self;
+    ba.S = BS;
+    ba.V = 0;
+    ba.P = PB;
+    ba.rg = 0;
+    ba.edgestoavoid = edgestoavoid;
+
+    for (;;) {
+	NyNodeSetObject *V;
+	if (!Py_SIZE(FU))
+	  goto done;
+	if (!backward && Py_SIZE(FU) > ra->threshold) {
+	    int r = hv_shpath_getrg(self, ra, Src);
+	    if (r == -1)
+	      goto err;
+	    backward = r ? 1 : -1;
+	    ba.rg = ra->rg;
+	}
+	if (backward == 1 && !Py_SIZE(BU))
+	  backward = -1;
+	V = hv_mutnodeset_new(self);
+	if (!V)
+	  goto err;
+	meet_forward = backward != 1 || Py_SIZE(FU) <= Py_SIZE(BU);
+	if (meet_forward) {
+	    fa.U = FU;
+	    fa.V = V;
+	    if (NyNodeSet_iterate(FU, (visitproc)hv_shpath_outer, &fa) == -1) {
+		Py_DECREF(V);
+		goto err;
+	    }
+	    Py_DECREF(FU);
+	    FU = V;
+	    ma.S = BS;
+	} else {
+	    ba.V = V;
+	    if (NyNodeSet_iterate(BU, (visitproc)hv_shback_outer, &ba) == -1) {
+		Py_DECREF(V);
+		goto err;
+	    }
+	    Py_DECREF(BU);
+	    BU = V;
+	    ma.S = FS;
+	}
+	M = hv_mutnodeset_new(self);
+	if (!M)
+	  goto err;
+	ma.M = M;
+	if (NyNodeSet_iterate(V, (visitproc)hv_shpath_meet, &ma) == -1)
+	  goto err;
+	if (Py_SIZE(M))
+	  break;
+	Py_DECREF(M);
+	M = 0;
+	if (NyNodeSet_iterate(V, (visitproc)hv_shpath_union,
+			      meet_forward ? FS : BS) == -1)
+	  goto err;
+    }
+
+    /* Follow the paths from the meeting nodes. To find only the first
+       paths, the paths toward Dst are first followed to a tree T, in
+       which a path to each node in Dst reached can be taken alone. */
+
+    if (!(found = hv_mutnodeset_new(self)))
+      goto err;
+    fj.G = bj.G = G;
+    fj.P = PF;
+    bj.P = PB;
+    fj.found = bj.found = found;
+    fj.dst = 0;
+    bj.dst = D;
+    fj.result = bj.result = result;
+    fj.invert = 0;
+    bj.invert = 1;
+    fj.find_one = bj.find_one = maxpaths >= 0;
+    if (maxpaths < 0) {
+	if (hv_shpath_follow(self, &bj, M) == -1 ||
+	    hv_shpath_follow(self, &fj, M) == -1)
+	  goto err;
+    } else {
+	ShFirstArg fi;
+	NyNodeSetObject *reached = 0;
+	if (!((T = hv_shpath_graph(self)) &&
+	      (reached = hv_mutnodeset_new(self)) &&
+	      (done = hv_mutnodeset_new(self)) &&
+	      (one = hv_mutnodeset_new(self)))) {
+	    Py_XDECREF(reached);
+	    goto err;
+	}
+	bj.G = T;
+	bj.result = reached;
+	if (hv_shpath_follow(self, &bj, M) == -1) {
+	    Py_DECREF(reached);
+	    goto err;
+	}
+	fi.hv = self;
+	fi.fw = &fj;
+	fi.T = T;
+	fi.done = done;
+	fi.one = one;
+	fi.result = result;
+	fi.maxpaths = maxpaths;
+	if (NyNodeSet_iterate(reached, (visitproc)hv_shpath_first, &fi) == -1) {
+	    Py_DECREF(reached);
+	    goto err;
+	}
+	Py_DECREF(reached);
+    }
+
+  done:
+    Py_XDECREF(FS);
+    Py_XDECREF(BS);
+    Py_XDECREF(FU);
+    Py_XDECREF(BU);
+    Py_XDECREF(D);
+    Py_XDECREF(M);
+    Py_XDECREF(found);
+    Py_XDECREF(done);
+    Py_XDECREF(one);
+    Py_XDECREF(T);
+    Py_XDECREF(PF);
+    Py_XDECREF(PB);
+    return result;
+
+  err:
+    Py_XDECREF(result);
+    result = 0;
+    goto done;
+}
+
+PyDoc_STRVAR(hv_shpathsearch_doc,
+"HV.shpathsearch(G:NodeGraph, Src:NodeSet, DstSets:list, S:NodeSet\n"
+"                [,AvoidEdges:NodeGraph [,maxpaths:int\n"
+"                [,referrers:callable [,threshold:int]]]]) -> list\n"
+"\n"
+"Search for the shortest paths from Src to each of the NodeSets in\n"
+"DstSets, forward from Src and, when the forward frontier has grown\n"
+"past threshold nodes, also backward from the destination set until\n"
+"the two searches meet. The arguments are:\n"
+"\n"
+"    G           Updated by the method, with the edges from each node\n"
+"                on a shortest path to its predecessors on the path,\n"
+"                as shpathstep adds them.\n"
+"    Src         The source set.\n"
+"    DstSets     The destination sets.\n"
+"    S           Nodes to avoid.\n"
+"    AvoidEdges  Edges to avoid.\n"
+"    maxpaths    If given and not negative, at most one path to each of\n"
+"                at most this many nodes in each destination set is\n"
+"                added to G.\n"
+"    referrers   Called without arguments, the first time the threshold\n"
+"                is passed, to get a referrer graph, as made by\n"
+"                update_referrers, covering all the destination sets;\n"
+"                or None. If not given or None, or if Src has nodes\n"
+"                other than the root that are not on a path from the\n"
+"                root to a destination set, the search is forward only.\n"
+"    threshold   The forward frontier size to search backward from.\n"
+"                The default is 1000.\n"
+"\n"
+"Return value:   A list with, for each destination set, its nodes that\n"
+"                are nearest to Src, or those of them that paths were\n"
+"                added to when maxpaths is given. Nodes in Src are not\n"
+"                themselves searched for.\n"
+"\n"
+"See also: shpathstep, and shpgraph_algorithm in Path.py.");
+
+static PyObject *
+hv_shpathsearch(NyHeapViewObject *self, PyObject *args, PyObject *kwds)
+{
+    static char *kwlist[] = {"G", "Src", "DstSets", "S", "AvoidEdges",
+			     "maxpaths", "referrers", "threshold", 0};
+    NyNodeGraphObject *G, *edgestoavoid = 0;
+    NyNodeSetObject *Src, *S;
+    PyObject *DstSets, *result = 0;
+    ShRgArg ra;
+    Py_ssize_t i, n;
+    int maxpaths = -1;
+    ra.referrers = 0;
+    ra.rg = 0;
+    ra.threshold = 1000;
+    ra.state = 0;
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O!O!O!O!|O!iOi:shpathsearch",
+				     kwlist,
+				     &NyNodeGraph_Type, &G,
+				     NyNodeSet_TYPE, &Src,
+				     &PyList_Type, &DstSets,
+				     NyNodeSet_TYPE, &S,
+				     &NyNodeGraph_Type, &edgestoavoid,
+				     &maxpaths,
+				     &ra.referrers,
+				     &ra.threshold))
+      return 0;
+    if (ra.referrers == Py_None)
+      ra.referrers = 0;
+    n = PyList_GET_SIZE(DstSets);
+    for (i = 0; i < n; i++) {
+	if (!NyNodeSet_Check(PyList_GET_ITEM(DstSets, i))) {
+	    PyErr_SetString(PyExc_TypeError,
+			    "shpathsearch: DstSets must be a list of NodeSet");
+	    return 0;
+	}
+    }
+    if (edgestoavoid && edgestoavoid->used_size == 0)
+      edgestoavoid = 0;
+    if (!(result = PyList_New(n)))
+      goto err;
+    for (i = 0; i < n; i++) {
+	NyNodeSetObject *D = hv_shpath_search(
+	    self, G, &ra, Src, (NyNodeSetObject *)PyList_GET_ITEM(DstSets, i),
+	    S, edgestoavoid, maxpaths);
+	if (!D)
+	  goto err;
+	PyList_SET_ITEM(result, i, (PyObject *)D);
+    }
+
+  done:
+    Py_XDECREF(ra.rg);
+    return result;
+
+  err:
+    Py_XDECREF(result);
+    result = 0;
+    goto done;
+}
@@ -0,0 +1,103 @@
+/* Explicit stack for the walks of the visible heap
+
+   The walks from the root of a heap view, or from a set of objects,
+   keep the objects that remain to be traversed in a NyTravStack, an
+   array of object pointers that grows as needed, instead of recursing
+   through the C stack once for each level of depth. A long linked list
+   or a deep tree is then limited only by the available memory, and the
+   pending objects are kept together in one block.
+
+   A walk pushes its start objects with the visit function it gives to
+   hv_travstack_walk(), which then traverses the object on top of the
+   stack with that visit function until the stack is empty. The visit
+   function decides whether an object is to be traversed, typically by
+   marking it in a nodeset, and if so pushes it. Since the objects are
+   marked when they are found rather than when they are traversed, each
+   object is pushed at most once, and a walk that only follows a chain
+   needs a stack of a single object.
+
+   The objects on the stack are borrowed references; they are kept
+   alive by the objects that refer to them, as they were by the
+   recursive walks.
+
+*/
+
+#define NYTRAVSTACK_INITSIZE	1024
+
+typedef struct {
+    PyObject **items;
+    Py_ssize_t sp;		/* Number of objects on the stack */
+    Py_ssize_t size;		/* Number of objects allocated */
+} NyTravStack;
+
+static int
+travstack_init(NyTravStack *st)
+{
+    st->sp = 0;
+    st->size = NYTRAVSTACK_INITSIZE;
+    st->items = PyMem_New(PyObject *, st->size);
+    if (!st->items) {
+	PyErr_NoMemory();
+	return -1;
+    }
+    return 0;
+}
+
+static void
+travstack_fini(NyTravStack *st)
+{
+    PyMem_FREE(st->items);
+    st->items = 0;
+    st->sp = st->size = 0;
+}
+
+static int
+travstack_grow(NyTravStack *st)
+{
+    Py_ssize_t size = st->size * 2;
+    PyObject **items = st->items;
+    if (size <= st->size || (size_t)size > PY_SSIZE_T_MAX / sizeof(PyObject *)) {
+	PyErr_NoMemory();
+	return -1;
+    }
+    PyMem_RESIZE(items, PyObject *, size);
+    if (!items) {
+	PyErr_NoMemory();
+	return -1;
+    }
+    st->items = items;
+    st->size = size;
+    return 0;
+}
+
+static int
+travstack_push(NyTravStack *st, PyObject *obj)
+{
+    if (st->sp == st->size && travstack_grow(st) == -1)
+      return -1;
+    st->items[st->sp++] = obj;
+    return 0;
+}
+
+/* Visit function pushing every object */
+
+static int
+travstack_visit(PyObject *obj, NyTravStack *st)
+{
+    return travstack_push(st, obj);
+}
+
+/* Traverse the objects on the stack with visit, which may push more,
+   until the stack is empty or visit returns nonzero. */
+
+static int
+hv_travstack_walk(NyHeapViewObject *hv, NyTravStack *st, visitproc visit, void *arg)
+{
+    while (st->sp > 0) {
+	PyObject *obj = st->items[--st->sp];
+	int r = hv_std_traverse(hv, obj, visit, arg);
+	if (r)
+	  return r;
+    }
+    return 0;
+}
@@ -22,6 +22,11 @@ NyMutNodeSet_NewFlags(int flags) {
     return NODESET_EXPORTS->newMutFlags(flags);
 }
 
+NyNodeSetObject *
+NyMutNodeSet_NewFlagsHiding(int flags, PyObject *tag) {
+    return NODESET_EXPORTS->newMutFlagsHiding(flags, tag);
+}
+
 int
 NyNodeSet_setobj(NyNodeSetObject *v, PyObject *obj) {
     return NODESET_EXPORTS->setobj(v, obj);
@@ -114,6 +114,18 @@ NyNodeGraph_Clear(NyNodeGraphObject *ng)
     int N = ng->used_size;
     NyNodeGraphEdge *edges = ng->edges;
     int i;
+    ng->sorted_size = 0;
+    if (ng->exports) {
+	/* Keep the memory of the exported buffers, with no addresses */
+	ng->used_size = 0;
+	for (i = 0; i < N; i++) {
+	    PyObject *src = edges[i].src, *tgt = edges[i].tgt;
+	    edges[i].src = edges[i].tgt = 0;
+	    Py_DECREF(src);
+	    Py_DECREF(tgt);
+	}
+	return;
+    }
     ng->edges = 0;
     ng->used_size = ng->allo_size = 0;
     for (i = 0; i < N; i++) {
@@ -182,6 +194,11 @@ NyNodeGraph_AddEdge(NyNodeGraphObject *ng, PyObject *src, PyObject *tgt)
 
     if (ng->used_size >= ng->allo_size) {
 	int allo = roundupsize(ng->used_size + 1);
+	if (ng->exports) {
+	    PyErr_SetString(PyExc_BufferError,
+			    "NodeGraph can not grow while its edges are exported");
+	    return -1;
+	}
 	PyMem_RESIZE(ng->edges, NyNodeGraphEdge, allo);
 	if (!ng->edges) {
 	    ng->used_size = ng->allo_size = 0;
@@ -215,11 +232,119 @@ ng_compare_src_only(const void *x, const void *y)
     return c;
 }
 
+/* Sorting
+
+   The edges are sorted by source and target, or by source only if
+   duplicates are preserved, by an LSD radix sort on the bytes of the
+   addresses. The bytes that are the same in all edges, such as the high
+   bytes of addresses in the same region, are skipped. The sort is
+   stable, so edges with the same source keep their order when only the
+   source is sorted on.
+
+   The edges before sorted_size are those that were sorted the last
+   time. Only the edges added after them are sorted, and then merged with
+   them, so updating a big sorted graph with a few edges takes linear
+   time. If the memory needed can not be allocated, qsort is used. */
+
+#define NG_RADIX_MIN	256	/* Fewer edges are sorted by qsort */
+
+static int
+ng_radix_sort(NyNodeGraphEdge *edges, int n, int src_only)
+{
+    size_t (*counts)[256];
+    NyNodeGraphEdge *tmp, *from, *to;
+    int npasses = (src_only ? 1 : 2) * sizeof(PyObject *);
+    int pass, i;
+    if (n < NG_RADIX_MIN) {
+	qsort(edges, n, sizeof(NyNodeGraphEdge),
+	      src_only ? ng_compare_src_only : ng_compare);
+	return 0;
+    }
+    counts = PyMem_Malloc(npasses * sizeof(*counts));
+    tmp = PyMem_New(NyNodeGraphEdge, n);
+    if (!counts || !tmp) {
+	PyMem_Free(counts);
+	PyMem_Free(tmp);
+	return -1;
+    }
+    /* The counts of the bytes of all passes, in one pass over the edges.
+       The first passes are over the target, least significant byte first. */
+    memset(counts, 0, npasses * sizeof(*counts));
+    for (i = 0; i < n; i++) {
+	Py_uintptr_t s = (Py_uintptr_t)edges[i].src;
+	Py_uintptr_t t = (Py_uintptr_t)edges[i].tgt;
+	int b;
+	for (b = 0; b < (int)sizeof(PyObject *); b++) {
+	    if (src_only) {
+		counts[b][(s >> (b * 8)) & 0xff]++;
+	    } else {
+		counts[b][(t >> (b * 8)) & 0xff]++;
+		counts[b + sizeof(PyObject *)][(s >> (b * 8)) & 0xff]++;
+	    }
+	}
+    }
+    from = edges;
+    to = tmp;
+    for (pass = 0; pass < npasses; pass++) {
+	int shift = (pass % sizeof(PyObject *)) * 8;
+	int onsrc = src_only || pass >= (int)sizeof(PyObject *);
+	size_t *count = counts[pass];
+	size_t pos, c;
+	Py_uintptr_t first = (Py_uintptr_t)(onsrc ? from[0].src : from[0].tgt);
+	if (count[(first >> shift) & 0xff] == (size_t)n)
+	  continue;		/* All edges have the same byte */
+	for (pos = 0, i = 0; i < 256; i++) {
+	    c = count[i];
+	    count[i] = pos;
+	    pos += c;
+	}
+	for (i = 0; i < n; i++) {
+	    Py_uintptr_t key = (Py_uintptr_t)(onsrc ? from[i].src : from[i].tgt);
+	    to[count[(key >> shift) & 0xff]++] = from[i];
+	}
+	to = from;
+	from = from == edges ? tmp : edges;
+    }
+    if (from != edges)
+      memcpy(edges, from, n * sizeof(NyNodeGraphEdge));
+    PyMem_Free(counts);
+    PyMem_Free(tmp);
+    return 0;
+}
+
 static void
 ng_sort(NyNodeGraphObject *ng)
 {
-    qsort(ng->edges, ng->used_size, sizeof(NyNodeGraphEdge),
-	  ng->is_preserving_duplicates ? ng_compare_src_only : ng_compare);
+    NyNodeGraphEdge *edges = ng->edges, *tail, *tmp;
+    int (*compare)(const void *, const void *) =
+      ng->is_preserving_duplicates ? ng_compare_src_only : ng_compare;
+    int m = ng->sorted_size, n = ng->used_size, i, j, k;
+    if (n <= m)
+      return;
+    tail = edges + m;
+    if (ng_radix_sort(tail, n - m, ng->is_preserving_duplicates) == -1)
+      goto Qsort;
+    if (!m || compare(&tail[-1], &tail[0]) <= 0)
+      return;			/* The new edges come after the old */
+    /* Merge from the end, with the new edges copied out of the way.
+       The old ones come first when equal, so it is stable. */
+    tmp = PyMem_New(NyNodeGraphEdge, n - m);
+    if (!tmp)
+      goto Qsort;
+    memcpy(tmp, tail, (n - m) * sizeof(NyNodeGraphEdge));
+    i = m - 1;
+    j = n - m - 1;
+    k = n - 1;
+    while (j >= 0) {
+	if (i >= 0 && compare(&edges[i], &tmp[j]) > 0)
+	  edges[k--] = edges[i--];
+	else
+	  edges[k--] = tmp[j--];
+    }
+    PyMem_Free(tmp);
+    return;
+  Qsort:
+    qsort(edges, n, sizeof(NyNodeGraphEdge), compare);
 }
 
 static void
@@ -249,6 +374,8 @@ ng_remove_dups(NyNodeGraphObject *ng)
 static void
 ng_trim(NyNodeGraphObject *ng)
 {
+    if (ng->exports)
+      return;
     PyMem_RESIZE(ng->edges, NyNodeGraphEdge, ng->used_size);
     ng->allo_size = ng->used_size;
 }
@@ -260,6 +387,7 @@ ng_sortetc(NyNodeGraphObject *ng)
     if (!ng->is_preserving_duplicates)
       ng_remove_dups(ng);
     ng_trim(ng);
+    ng->sorted_size = ng->used_size;
     ng->is_sorted = 1;
 }
 
@@ -364,7 +492,7 @@ NyNodeGraph_SubtypeNew(PyTypeObject *type)
     if (!ng)
       return NULL;
     ng->_hiding_tag_ = 0;
-    ng->allo_size = ng->used_size = 0;
+    ng->allo_size = ng->used_size = ng->sorted_size = 0;
     ng->is_sorted = 0;
     ng->is_mapping = 0;
     ng->is_preserving_duplicates = 0;
@@ -546,6 +674,7 @@ NyNodeGraph_Invert(NyNodeGraphObject *ng) {
 	edge->tgt = t;
     }
     ng->is_sorted = 0;
+    ng->sorted_size = 0;
     return 0;
 }
 
@@ -826,9 +955,72 @@ o The mapping is based on object identity - no equality or hashing is\n\
 o There may be any number of targets associated with each source.\n\
 \n\
 o Performance characteristics differ from dicts, in somewhat subtle ways.\n\
+\n\
+The edges can be read without making any objects via the buffer\n\
+interface, as memoryview(NG) or numpy.asarray(NG) would: a read-only\n\
+array of shape (len(NG), 2) with the addresses of the source and\n\
+target of each edge, sorted by source.\n\
 ";
 
 
+/* Buffer interface
+
+   The edges are exported as a read-only array of shape (len(NG), 2),
+   of the addresses of the source and target of each edge, after the
+   edges are sorted. The array can not grow while exported, so adding
+   edges beyond its allocated size raises BufferError. The shape is that
+   of the first of the buffers exported at the same time; it is kept in
+   the nodegraph since a memoryview copies the view, and the edges
+   beyond the current length are zero after a clear. A buffer requested
+   without format is the same memory as plain bytes. */
+
+static Py_ssize_t ng_buffer_strides[2] = {
+    sizeof(NyNodeGraphEdge), sizeof(PyObject *)
+};
+
+static int
+ng_getbuffer(NyNodeGraphObject *ng, Py_buffer *view, int flags)
+{
+    if (flags & PyBUF_WRITABLE) {
+	PyErr_SetString(PyExc_BufferError, "NodeGraph buffer is read-only");
+	return -1;
+    }
+    ng_maybesortetc(ng);
+    if (!ng->exports) {
+	ng->bufshape[0] = ng->used_size;
+	ng->bufshape[1] = 2;
+    }
+    if (PyBuffer_FillInfo(view, (PyObject *)ng, ng->edges,
+			  ng->bufshape[0] * sizeof(NyNodeGraphEdge),
+			  1, flags) == -1)
+      return -1;
+    if ((flags & PyBUF_FORMAT) && (flags & PyBUF_ND)) {
+	view->itemsize = sizeof(PyObject *);
+	view->ndim = 2;
+	view->format = NY_ADDRESS_FORMAT;
+	view->shape = ng->bufshape;
+	if ((flags & PyBUF_STRIDES) == PyBUF_STRIDES)
+	  view->strides = ng_buffer_strides;
+    }
+    ng->exports++;
+    return 0;
+}
+
+static void
+ng_releasebuffer(NyNodeGraphObject *ng, Py_buffer *view)
+{
+    ng->exports--;
+}
+
+static PyBufferProcs ng_as_buffer = {
+    0,					/* bf_getreadbuffer */
+    0,					/* bf_getwritebuffer */
+    0,					/* bf_getsegcount */
+    0,					/* bf_getcharbuffer */
+    (getbufferproc)ng_getbuffer,	/* bf_getbuffer */
+    (releasebufferproc)ng_releasebuffer,/* bf_releasebuffer */
+};
+
 static PyGetSetDef ng_getset[] = {
     {0}
 };
@@ -952,6 +1144,8 @@ ng_ass_sub(NyNodeGraphObject *ng, PyObject *v, PyObject *w)
 	    Py_INCREF(lo->tgt);
 	    Py_XDECREF(old);
 	}
+	/* The targets may be out of order now; sort it all next time */
+	ng->sorted_size = 0;
     }
     return 0;
 }
@@ -1012,9 +1206,9 @@ PyTypeObject NyNodeGraph_Type = {
 	0,					/* tp_str */
 	PyObject_GenericGetAttr,		/* tp_getattro */
 	0,					/* tp_setattro */
-	0,					/* tp_as_buffer */
+	&ng_as_buffer,				/* tp_as_buffer */
 	Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC |
-	  	Py_TPFLAGS_BASETYPE,		/* tp_flags */
+	  	Py_TPFLAGS_BASETYPE | Py_TPFLAGS_HAVE_NEWBUFFER, /* tp_flags */
  	ng_doc,					/* tp_doc */
  	(traverseproc)ng_gc_traverse,		/* tp_traverse */
  	(inquiry)ng_gc_clear,			/* tp_clear */
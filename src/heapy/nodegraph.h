@@ -11,9 +11,12 @@ typedef struct {
     NyNodeGraphEdge *edges;
     int used_size;
     int allo_size;
+    int sorted_size;	/* The edges before it are sorted, see ng_sort */
     char is_mapping;
     char is_sorted;
     char is_preserving_duplicates;
+    int exports;	/* Number of buffers exporting edges */
+    Py_ssize_t bufshape[2];	/* Their shape, see ng_getbuffer */
 } NyNodeGraphObject;
 
 extern PyTypeObject NyNodeGraph_Type;
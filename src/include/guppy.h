@@ -7,4 +7,12 @@
     if (PyType_Ready(&t) < 0) return -1;                    \
 }
 
+/* The struct module format of an object address exported in a buffer */
+
+#if SIZEOF_VOID_P == SIZEOF_LONG
+#define NY_ADDRESS_FORMAT "L"
+#else
+#define NY_ADDRESS_FORMAT "Q"
+#endif
+
 #endif /* GUPPY_H_INCLUDED */
@@ -259,6 +259,10 @@ static char ImmBitSet_doc[] =
 "hash(x)    -> int\n"
 "\n"
 "Return a hash value based on the bit numbers of the elements.\n"
+"\n"
+"A bitset that consists of few long runs of bits, such as a range, is\n"
+"kept as its runs when that takes at most half the memory. Instances of\n"
+"subtypes of ImmBitSet are always kept as bit fields.\n"
 ;
 
 static char cplbitset_doc[] =
@@ -333,6 +337,14 @@ static char tacbit_doc[] =
 "If e is in S, remove e from S and return True,\n"
 "else return False.";
 
+static char tobytes_doc[] =
+"S.tobytes() -> string\n"
+"\n"
+"Return a compact encoding of S, that does not depend on the word size\n"
+"or byte order. Runs of bits are stored by their length and single bits\n"
+"by their position. The bitset is recreated by immbitset_frombytes().\n"
+;
+
 static char mutable_copy_doc[] =
 "S.mutcopy() -> mutable bitset\n"
 "\n"
@@ -353,6 +365,15 @@ static char bitrange_doc[] =
 "Start defaults to 0. If step is given, it specifies a positive increment.\n"
 "For example, immbitrange(3) equals immbitset([0, 1, 2]).";
 
+static char immbitset_frombytes_doc[] =
+"immbitset_frombytes(data) -> ImmBitSet or CplBitSet\n"
+"\n"
+"Return the bitset encoded in the string data by S.tobytes() or\n"
+"NS.tobytes(). A ValueError is raised if data is not such a string\n"
+"or is of a later version of the encoding. Long runs of bits are kept\n"
+"as runs, except that a run up to the highest bit number is refused if\n"
+"it would take more than 2**20 fields.";
+
 static char bitform_doc[] =
 "_bs(flags, data) -> some kind of bitset\n"
 "\n"
@@ -381,6 +402,7 @@ static int mutbitset_reset(NyMutBitSetObject *v, NyImmBitSetObject *set);
 
 static NySetField *root_ins1(NyMutBitSetObject *v, NySetField *sf, NyBit pos);
 static NyImmBitSetObject *immbitset_realloc(NyImmBitSetObject *self, NyBit size);
+static int immbitset_fields(NyImmBitSetObject *v);
 
 
 static int mutbitset_ior_field(NyMutBitSetObject *v, NyBitField *w);
@@ -437,7 +459,9 @@ PyTypeObject NyBitSet_Type = {
 
 NyImmBitSetObject _NyImmBitSet_EmptyStruct = {
     PyObject_HEAD_INIT(NULL)
-    0	/* ob_size */
+    0,	/* ob_size */
+    0,	/* ob_length */
+    _NyImmBitSet_EmptyStruct.ob_inline	/* ob_field */
 };
 
 NyCplBitSetObject _NyImmBitSet_OmegaStruct = {
@@ -445,19 +469,6 @@ NyCplBitSetObject _NyImmBitSet_OmegaStruct = {
     &_NyImmBitSet_EmptyStruct	/* ob_val */
 };
 
-/* Counting bits for len() is optimized by looking up lengths of
-   bit segments. The segment size is defined by this shift.  Larger
-   values than 8, eg 16, can make len() some 30% faster at some tests,
-   but use exponentially more table space. 11 can be a compromise.
-   Experimental data can be found in notes per 5/6 -03.
-*/
-
-#define LEN_TAB_SHIFT	8	/*  8 is a memory/cache conservation setting. */
-
-#define LEN_TAB_SIZE	(1<<LEN_TAB_SHIFT)
-
-static int len_tab[LEN_TAB_SIZE];	/* helper for len() */
-
 static int n_immbitset, n_cplbitset, n_mutbitset;
 
 /* Check if an object looks like it can return an iterator
@@ -505,13 +516,17 @@ bitno_to_field(NyBit bitno, NyBitField *f) {
 
  Only to be used when some bit is set.
 
- Hardcoded for 64 or 32 bit fields
+ Hardcoded for 64 or 32 bit fields, where there are no builtins
 
 */
 
 static int
 bits_first(NyBits bits)
 {
+#ifdef NyBits_CTZ
+    assert(bits);
+    return NyBits_CTZ(bits);
+#else
     int i = 0;
     assert(bits);
 
@@ -547,11 +562,16 @@ bits_first(NyBits bits)
     }
     assert(bits & 0x1);
     return i;
+#endif
 }
 
 static int
 bits_last(NyBits bits)
 {
+#ifdef NyBits_CLZ
+    assert(bits);
+    return NyBits_N - 1 - NyBits_CLZ(bits);
+#else
     int i = NyBits_N-1;
     assert(bits);
 #if (NyBits_N==64)
@@ -602,17 +622,29 @@ bits_last(NyBits bits)
 #error "Unsupported NyBits_N"
 #endif
     return i;
+#endif
 }
 
 static int
 bits_length(NyBits bits) {
-    int n = 0;
-    while (bits) {
-	n += len_tab[bits & (LEN_TAB_SIZE-1)];
-	bits >>= LEN_TAB_SHIFT;
-    }
-    return n;
-    
+#ifdef NyBits_POPCOUNT
+    return NyBits_POPCOUNT(bits);
+#else
+    /* Count the bits in parallel, in pairs, nibbles and bytes */
+#if (NyBits_N==64)
+    bits = bits - ((bits >> 1) & 0x5555555555555555UL);
+    bits = (bits & 0x3333333333333333UL) + ((bits >> 2) & 0x3333333333333333UL);
+    bits = (bits + (bits >> 4)) & 0x0f0f0f0f0f0f0f0fUL;
+    return (bits * 0x0101010101010101UL) >> 56;
+#elif (NyBits_N==32)
+    bits = bits - ((bits >> 1) & 0x55555555UL);
+    bits = (bits & 0x33333333UL) + ((bits >> 2) & 0x33333333UL);
+    bits = (bits + (bits >> 4)) & 0x0f0f0f0fUL;
+    return (bits * 0x01010101UL) >> 24;
+#else
+#error "Unsupported NyBits_N"
+#endif
+#endif
 }
 
 static NyBit
@@ -691,6 +723,7 @@ NyImmBitSet_SubtypeNew(PyTypeObject *type, NyBit size)
 	if (r) {
 	    /* Mark length as not-calculated */
 	    r->ob_length = -1;
+	    r->ob_field = r->ob_inline;
 	    /* Note: the other fields are cleared by tp_alloc. */
 	    n_immbitset++;
 	}
@@ -706,6 +739,332 @@ NyImmBitSet_New(NyBit size)
 }
 
 
+/* Run sets
+
+   An immutable bitset that consists of few long runs of bits, such as
+   a range, is stored as its runs when that takes at most half the
+   memory of the fields. Length, membership, iteration, hashing,
+   shifting and the binary operations where a run set takes part are
+   done on the runs. Other operations make the fields from the runs
+   the first time they need them, and keep them with the set.
+
+   The runs are sorted and separated by at least one bit not in the
+   set, so equal sets have equal runs. */
+
+#define NyBits_ONES		(~(NyBits)0)
+
+#define NyBitRuns_PREFERRED(nruns, nfields) (2 * ((nruns) + 1) <= (nfields))
+
+static NyBit
+runs_nfields(NyBitRun *r, NyBit n)
+{
+    NyBit i, lopos, hipos, lastpos = 0, nf = 0;
+    for (i = 0; i < n; i++) {
+	bitno_modiv(r[i].lo, &lopos);
+	bitno_modiv(r[i].hi - 1, &hipos);
+	nf += hipos - lopos + 1;
+	if (i && lopos == lastpos)
+	  nf--;
+	lastpos = hipos;
+    }
+    return nf;
+}
+
+static int
+runs_iterate_fields(NyBitRun *r, NyBit n,
+		    int (*visit)(NyBitField *, void *),
+		    void *arg)
+{
+    /* Visits the fields of the runs r[0..n) in position order. */
+    NyBitField f;
+    NyBit i, pos, lopos, hipos;
+    NyBits lobits, hibits;
+    int pending = 0;
+    for (i = 0; i < n; i++) {
+	lobits = NyBits_ONES << bitno_modiv(r[i].lo, &lopos);
+	hibits = NyBits_ONES >> (NyBits_N - 1 - bitno_modiv(r[i].hi - 1, &hipos));
+	if (lopos == hipos)
+	  lobits &= hibits;
+	if (pending && f.pos == lopos) {
+	    f.bits |= lobits;
+	} else {
+	    if (pending && visit(&f, arg) == -1)
+	      return -1;
+	    f.pos = lopos;
+	    f.bits = lobits;
+	    pending = 1;
+	}
+	if (lopos < hipos) {
+	    if (visit(&f, arg) == -1)
+	      return -1;
+	    f.bits = NyBits_ONES;
+	    for (pos = lopos + 1; pos < hipos; pos++) {
+		f.pos = pos;
+		if (visit(&f, arg) == -1)
+		  return -1;
+	    }
+	    f.pos = hipos;
+	    f.bits = hibits;
+	}
+    }
+    if (pending)
+      return visit(&f, arg);
+    return 0;
+}
+
+static int
+runs_store_field(NyBitField *f, void *arg)
+{
+    NyBitField **g = arg;
+    *(*g)++ = *f;
+    return 0;
+}
+
+static NyBit
+fields_runs(NyBitField *f, NyBitField *end_f, NyBitRun *r)
+{
+    /* Stores the runs of the fields f..end_f at r, or only counts
+       them if r is 0. Returns the number of runs, or -1 if the last
+       run would end outside of the range of NyBit. */
+    NyBit n = 0, lastpos = 0;
+    NyBits open = 0;
+    for (; f < end_f; f++) {
+	NyBits b = f->bits, starts, ends, x;
+	NyBit base;
+	if (!b)
+	  continue;
+	if (open && f->pos != lastpos + 1) {
+	    if (r)
+	      r[n-1].hi = (lastpos + 1) * NyBits_N;
+	    open = 0;
+	}
+	starts = b & ~((b << 1) | open);
+	ends = ~b & ((b << 1) | open);
+	if (!r) {
+	    n += bits_length(starts);
+	} else {
+	    base = f->pos * NyBits_N;
+	    for (x = starts | ends; x; x &= x - 1) {
+		int i = bits_first(x);
+		if (starts & ((NyBits)1 << i))
+		  r[n++].lo = base + i;
+		else
+		  r[n-1].hi = base + i;
+	    }
+	}
+	open = b >> (NyBits_N - 1);
+	lastpos = f->pos;
+    }
+    if (open) {
+	if (lastpos == NyPos_MAX)
+	  return -1;
+	if (r)
+	  r[n-1].hi = (lastpos + 1) * NyBits_N;
+    }
+    return n;
+}
+
+static NyBit
+runs_find(NyBitRun *r, NyBit n, NyBit bit)
+{
+    /* Returns the index of the first run that ends after bit. */
+    NyBit lo = 0, hi = n;
+    while (lo < hi) {
+	NyBit mid = lo + (hi - lo) / 2;
+	if (r[mid].hi <= bit)
+	  lo = mid + 1;
+	else
+	  hi = mid;
+    }
+    return lo;
+}
+
+static NyImmBitSetObject *
+immbitset_from_runs(NyBitRun *r, NyBit n)
+{
+    /* Makes an immbitset of the runs r[0..n), keeping the runs if they
+       are preferred to the fields. */
+    NyImmBitSetObject *v;
+    NyBit nf = runs_nfields(r, n);
+    if (NyBitRuns_PREFERRED(n, nf)) {
+	v = NyImmBitSet_New(n + 1);
+	if (!v)
+	  return 0;
+	v->ob_size = nf;
+	v->ob_field = 0;
+	NyImmBitSet_NRUNS(v) = n;
+	memcpy(NyImmBitSet_RUNS(v), r, n * sizeof(NyBitRun));
+    } else {
+	NyBitField *g;
+	v = NyImmBitSet_New(nf);
+	if (!v)
+	  return 0;
+	g = v->ob_field;
+	runs_iterate_fields(r, n, runs_store_field, &g);
+	assert(g == v->ob_field + nf);
+    }
+    return v;
+}
+
+static NyImmBitSetObject *
+immbitset_runs_if_preferred(NyImmBitSetObject *v)
+{
+    /* Returns v as a run set, if that is preferred, otherwise v.
+       Steals the reference to v. */
+    NyBitRun *r;
+    NyImmBitSetObject *w;
+    NyBit n, i, full = 0;
+    if (!v || v->ob_type != &NyImmBitSet_Type || NyImmBitSet_HasRuns(v) ||
+	v->ob_size < 8)
+      return v;
+    /* Only look for the runs when they are likely to be preferred */
+    for (i = 0; i < v->ob_size; i++) {
+	if (v->ob_field[i].bits == NyBits_ONES)
+	  full++;
+    }
+    if (2 * full < v->ob_size)
+      return v;
+    n = fields_runs(v->ob_field, v->ob_field + v->ob_size, 0);
+    if (n < 0 || !NyBitRuns_PREFERRED(n, v->ob_size))
+      return v;
+    r = PyMem_New(NyBitRun, n);
+    if (!r) {
+	/* Not an error, we have the fields. */
+	return v;
+    }
+    fields_runs(v->ob_field, v->ob_field + v->ob_size, r);
+    w = immbitset_from_runs(r, n);
+    PyMem_Del(r);
+    if (!w) {
+	PyErr_Clear();
+	return v;
+    }
+    Py_DECREF(v);
+    return w;
+}
+
+static int
+immbitset_fields(NyImmBitSetObject *v)
+{
+    /* Makes sure the fields of v are available in v->ob_field. */
+    NyBitField *f, *g;
+    if (v->ob_field)
+      return 0;
+    f = g = PyMem_New(NyBitField, v->ob_size);
+    if (!f) {
+	PyErr_NoMemory();
+	return -1;
+    }
+    runs_iterate_fields(NyImmBitSet_RUNS(v), NyImmBitSet_NRUNS(v),
+			runs_store_field, &g);
+    assert(g == f + v->ob_size);
+    v->ob_field = f;
+    return 0;
+}
+
+static NyBitRun *
+immbitset_runs(NyImmBitSetObject *v, NyBit *n, NyBitRun **tmp)
+{
+    /* Gets the runs of v. If v is not a run set, they are made in
+       a new buffer, returned in *tmp for the caller to free. */
+    NyBit m;
+    *tmp = 0;
+    if (NyImmBitSet_HasRuns(v)) {
+	*n = NyImmBitSet_NRUNS(v);
+	return NyImmBitSet_RUNS(v);
+    }
+    m = fields_runs(v->ob_field, v->ob_field + v->ob_size, 0);
+    if (m < 0) {
+	PyErr_SetString(PyExc_OverflowError, "immbitset_runs(): the set is too large");
+	return 0;
+    }
+    *tmp = PyMem_New(NyBitRun, m ? m : 1);
+    if (!*tmp) {
+	PyErr_NoMemory();
+	return 0;
+    }
+    *n = fields_runs(v->ob_field, v->ob_field + v->ob_size, *tmp);
+    return *tmp;
+}
+
+static NyBit
+runs_op(NyBitRun *a, NyBit na, int op, NyBitRun *b, NyBit nb, NyBitRun *z)
+{
+    /* Stores the runs of a op b at z, which must have room for na+nb
+       runs, and returns their number. */
+    NyBit ia = 0, ib = 0, nz = 0, p;
+    int ina = 0, inb = 0, inz = 0, in;
+    while (ia < na || ib < nb) {
+	NyBit pa = ia < na ? (ina ? a[ia].hi : a[ia].lo) : 0;
+	NyBit pb = ib < nb ? (inb ? b[ib].hi : b[ib].lo) : 0;
+	if (ib >= nb || (ia < na && pa <= pb))
+	  p = pa;
+	else
+	  p = pb;
+	if (ia < na && pa == p) {
+	    ina = !ina;
+	    if (!ina)
+	      ia++;
+	}
+	if (ib < nb && pb == p) {
+	    inb = !inb;
+	    if (!inb)
+	      ib++;
+	}
+	switch(op) {
+	  case NyBits_AND:	in = ina && inb;	break;
+	  case NyBits_OR:	in = ina || inb;	break;
+	  case NyBits_XOR:	in = ina != inb;	break;
+	  case NyBits_SUB:	in = ina && !inb;	break;
+	  default:		in = 0;	/* silence undefined-warning */
+				assert(0);
+	}
+	if (in != inz) {
+	    if (in)
+	      z[nz].lo = p;
+	    else
+	      z[nz++].hi = p;
+	    inz = in;
+	}
+    }
+    assert(!inz);
+    return nz;
+}
+
+static NyImmBitSetObject *
+immbitset_runs_op(NyImmBitSetObject *v, int op, NyImmBitSetObject *w)
+{
+    NyBitRun *a, *b, *ta, *tb, *z;
+    NyBit na, nb;
+    NyImmBitSetObject *ret = 0;
+    a = immbitset_runs(v, &na, &ta);
+    if (!a)
+      return 0;
+    b = immbitset_runs(w, &nb, &tb);
+    if (!b)
+      goto Err;
+    z = PyMem_New(NyBitRun, na + nb + 1);
+    if (!z) {
+	PyErr_NoMemory();
+	goto Err;
+    }
+    ret = immbitset_from_runs(z, runs_op(a, na, op, b, nb, z));
+    PyMem_Del(z);
+  Err:
+    PyMem_Del(ta);
+    PyMem_Del(tb);
+    return ret;
+}
+
+static int
+immbitset_runs_eq(NyImmBitSetObject *v, NyImmBitSetObject *w)
+{
+    NyBit n = NyImmBitSet_NRUNS(v);
+    return (v->ob_size == w->ob_size && n == NyImmBitSet_NRUNS(w) &&
+	    !memcmp(NyImmBitSet_RUNS(v), NyImmBitSet_RUNS(w), n * sizeof(NyBitRun)));
+}
+
+
 static NyImmBitSetObject *
 NyImmBitSet_SubtypeFromIterable(PyTypeObject *type, PyObject *v)
 {
@@ -741,9 +1100,16 @@ NyImmBitSet_SubtypeNewArg(PyTypeObject *type, PyObject *v)
     anybitset_classify(v, &vt);
     if (vt == BITSET) {
 	NyImmBitSetObject *bs = (NyImmBitSetObject *)v;
-	NyImmBitSetObject *ret = NyImmBitSet_SubtypeNew(type, bs->ob_size);
+	NyImmBitSetObject *ret;
+	if (NyImmBitSet_HasRuns(bs) && type == &NyImmBitSet_Type)
+	  return immbitset_from_runs(NyImmBitSet_RUNS(bs), NyImmBitSet_NRUNS(bs));
+	if (immbitset_fields(bs) == -1)
+	  return 0;
+	ret = NyImmBitSet_SubtypeNew(type, bs->ob_size);
+	if (!ret)
+	  return 0;
 	memcpy(ret->ob_field, bs->ob_field, sizeof(NyBitField) * bs->ob_size);
-	return ret;
+	return immbitset_runs_if_preferred(ret);
     }
     if (vt == MUTSET) {
 	ms = (NyMutBitSetObject *)v;
@@ -836,7 +1202,18 @@ mutbitset_initset(NyMutBitSetObject *v, NyImmBitSetObject *set)
     NySetField *sf = root_ins1(v, &v->fst_root.ob_field[0], NyPos_MIN);
     if (!sf)
       return -1;
-    if (set) {
+    if (set && NyImmBitSet_HasRuns(set)) {
+	/* The fields will be changed in place, so they are not shared
+	   with a run set. */
+	NyBitField *g;
+	sf->set = NyImmBitSet_New(set->ob_size);
+	if (!sf->set)
+	  return -1;
+	g = sf->lo = sf->set->ob_field;
+	runs_iterate_fields(NyImmBitSet_RUNS(set), NyImmBitSet_NRUNS(set),
+			    runs_store_field, &g);
+	sf->hi = g;
+    } else if (set) {
 	sf->set = set;
 	Py_INCREF(set);
 	sf->lo = set->ob_field;
@@ -1010,10 +1387,46 @@ immbitset_realloc(NyImmBitSetObject *self, NyBit size)
 	ret = PyObject_Realloc(self,
           self->ob_type->tp_basicsize + self->ob_type->tp_itemsize * upsize);
 	ret = (void *) PyObject_InitVar((void *)ret, ret->ob_type, upsize);
+	if (ret)
+	  ret->ob_field = ret->ob_inline;
 	return ret;
     }
 }
 
+static NyImmBitSetObject *
+immbitset_new_uncleared(NyBit size)
+{
+    /* Like NyImmBitSet_New(size) with size > 0, but the fields are not
+       cleared, since they are to be written over anyway */
+    NyImmBitSetObject *r = PyObject_MALLOC(NyImmBitSet_Type.tp_basicsize +
+					   NyImmBitSet_Type.tp_itemsize * size);
+    if (!r)
+      return (NyImmBitSetObject *)PyErr_NoMemory();
+    PyObject_INIT_VAR(r, &NyImmBitSet_Type, size);
+    r->ob_length = -1;
+    r->ob_field = r->ob_inline;
+    n_immbitset++;
+    return r;
+}
+
+static NyImmBitSetObject *
+immbitset_shrink(NyImmBitSetObject *self, NyBit size)
+{
+    /* Shrinks a new immbitset to size fields, keeping the first ones. */
+    NyImmBitSetObject *ret;
+    assert(self->ob_refcnt == 1 && !NyImmBitSet_HasRuns(self));
+    assert(0 < size && size <= self->ob_size);
+    _Py_ForgetReference((PyObject *)self);
+    _Py_DEC_REFTOTAL;
+    ret = PyObject_Realloc(self,
+	self->ob_type->tp_basicsize + self->ob_type->tp_itemsize * size);
+    if (!ret)
+      ret = self;	/* Can't shrink, keep the room */
+    ret = (void *) PyObject_InitVar((void *)ret, ret->ob_type, size);
+    ret->ob_field = ret->ob_inline;
+    return ret;
+}
+
 static NyBitField *
 sf_getrange(NySetField *v, NyBitField **shi)
 {
@@ -1330,6 +1743,7 @@ mutbitset_as_noncomplemented_immbitset_subtype(NyMutBitSetObject *v, PyTypeObjec
 	    }
 	}
 	assert (j == size);
+	bs = immbitset_runs_if_preferred(bs);
     }
     return bs;
 }
@@ -1719,6 +2133,8 @@ mutbitset_iop_bits(NyMutBitSetObject *v, int op, NyBit pos, NyBits *bits, NyBit
 static int
 mutbitset_iop_immbitset(NyMutBitSetObject *v, int op, NyImmBitSetObject *w)
 {
+    if (immbitset_fields(w) == -1)
+      return -1;
     return mutbitset_iop_fields(v, op, w->ob_field, w->ob_size);
 }
 
@@ -2367,16 +2783,10 @@ bitfields_iterate(NyBitField *f, NyBitField *end_f,
 {
     for (;f < end_f; f++) {
 	NyBits bits = f->bits;
-	int bitpos = 0;
-	while (bits) {
-	    while (!(bits & 1)) {
-		bits >>= 1;
-		bitpos += 1;
-	    }
-	    if (visit(f->pos * NyBits_N + bitpos, arg) == -1)
+	NyBit base = f->pos * NyBits_N;
+	for (; bits; bits &= bits - 1) {
+	    if (visit(base + bits_first(bits), arg) == -1)
 	      return -1;
-	    bits >>= 1;
-	    bitpos += 1;
 	}
     }
     return 0;
@@ -2403,6 +2813,17 @@ immbitset_iterate(NyImmBitSetObject *v,
 		   int (*visit)(NyBit, void *),
 		   void *arg)
 {
+    if (NyImmBitSet_HasRuns(v)) {
+	NyBitRun *r = NyImmBitSet_RUNS(v);
+	NyBit i, bit;
+	for (i = 0; i < NyImmBitSet_NRUNS(v); i++) {
+	    for (bit = r[i].lo; bit < r[i].hi; bit++) {
+		if (visit(bit, arg) == -1)
+		  return -1;
+	    }
+	}
+	return 0;
+    }
     return bitfields_iterate(&v->ob_field[0], &v->ob_field[v->ob_size],
 			     visit, arg);
 }
@@ -2712,75 +3133,106 @@ immbitset_findpos(NyImmBitSetObject *v, NyBit pos)
 }
 
 
+/* The field loops of the binary operations, one for each operation so
+   that it is not dispatched per field. Runs of fields at the same
+   positions are combined in an inner loop that stores every result and
+   only advances past the nonzero ones, so it has no unpredictable
+   branch. The result must have room for all the fields it could get. */
+
+#define FIELDS_OP(name, OP, KEEP_V, KEEP_W)				\
+static NyBitField *							\
+name(NyBitField *vf, NyBitField *ve, NyBitField *wf, NyBitField *we,	\
+     NyBitField *zf)							\
+{									\
+    while (vf < ve && wf < we) {					\
+	if (vf->pos == wf->pos) {					\
+	    do {							\
+		NyBits bits = OP(vf->bits, wf->bits);			\
+		zf->pos = vf->pos;					\
+		zf->bits = bits;					\
+		zf += bits != 0;					\
+		vf++;							\
+		wf++;							\
+	    } while (vf < ve && wf < we && vf->pos == wf->pos);	\
+	} else if (vf->pos < wf->pos) {					\
+	    if (KEEP_V)							\
+	      *zf++ = *vf;						\
+	    vf++;							\
+	} else {							\
+	    if (KEEP_W)							\
+	      *zf++ = *wf;						\
+	    wf++;							\
+	}								\
+    }									\
+    if (KEEP_V) {							\
+	fp_move(zf, vf, ve - vf);					\
+	zf += ve - vf;							\
+    }									\
+    if (KEEP_W) {							\
+	fp_move(zf, wf, we - wf);					\
+	zf += we - wf;							\
+    }									\
+    return zf;								\
+}
+
+#define BITS_AND(a, b)	((a) & (b))
+#define BITS_OR(a, b)	((a) | (b))
+#define BITS_XOR(a, b)	((a) ^ (b))
+#define BITS_SUB(a, b)	((a) & ~(b))
+
+FIELDS_OP(fields_and, BITS_AND, 0, 0)
+FIELDS_OP(fields_or, BITS_OR, 1, 1)
+FIELDS_OP(fields_xor, BITS_XOR, 1, 1)
+FIELDS_OP(fields_sub, BITS_SUB, 1, 0)
+
 static NyImmBitSetObject *
 immbitset_op(NyImmBitSetObject *v, int op, NyImmBitSetObject *w)
 {
-    long z, pos;
-    NyBits bits, a, b;
-    NyImmBitSetObject *dst = 0;
-    NyBitField *zf, *vf, *wf, *ve, *we;
+    NyBit size, z;
+    NyImmBitSetObject *dst;
+    NyBitField *vf, *wf, *ve, *we, *ze;
+    /* Where a run set takes part, and the other set has no more fields,
+       the runs are combined, and the result may be a run set. */
+    if ((NyImmBitSet_HasRuns(v) && w->ob_size <= v->ob_size) ||
+	(NyImmBitSet_HasRuns(w) && v->ob_size <= w->ob_size))
+      return immbitset_runs_op(v, op, w);
+    if (immbitset_fields(v) == -1 || immbitset_fields(w) == -1)
+      return 0;
+    vf = &v->ob_field[0];
+    wf = &w->ob_field[0];
     ve = &v->ob_field[v->ob_size];
     we = &w->ob_field[w->ob_size];
-    for (z = 0, zf = 0; ;) {
-	for (vf = &v->ob_field[0], wf = &w->ob_field[0];;) {
-	    if (vf < ve) {
-		if (wf < we) {
-		    if (vf->pos <= wf->pos) {
-			pos = vf->pos;
-			a = vf->bits;
-			if (vf->pos == wf->pos) {
-			    b = wf->bits;
-			    wf++;
-			} else {
-			    b = NyBits_EMPTY;
-			}
-			vf++;
-		    } else {		/* (vf->pos > wf->pos) { */
-			pos = wf->pos;
-			a = NyBits_EMPTY;
-			b = wf->bits;
-			wf++;
-		    }
-		} else {
-		    pos = vf->pos;
-		    a = vf->bits;
-		    vf++;
-		    b = NyBits_EMPTY;
-		}
-	    } else if (wf < we) { 
-		pos = wf->pos;
-		a = NyBits_EMPTY;
-		b = wf->bits;
-		wf++;
-	    } else
-	      break;
-	    switch(op) {
-	      case NyBits_AND:		bits = a & b;		break;
-	      case NyBits_OR:		bits = a | b;		break;
-	      case NyBits_XOR:		bits = a ^ b;		break;
-	      case NyBits_SUB:		bits = a & ~b;		break;
-	      default:			bits = 0;	/* slicence undefined-warning */
-					assert(0);
-	    }
-	    if (bits) {
-		if (zf) {
-		    zf->pos = pos;
-		    zf->bits = bits;
-		    zf++;
-		} else {
-		    z++;
-		}
-	    }
-	}
-	if (zf) {
-	    return dst;
-	} else {
-	    dst = NyImmBitSet_New(z);
-	    if (!dst)
-	      return dst;
-	    zf = & dst->ob_field[0];
-	}
+    /* The result is made in one pass, with room for all fields it could
+       get, and shrunk afterwards */
+    switch(op) {
+      case NyBits_AND:	size = v->ob_size < w->ob_size ? v->ob_size : w->ob_size; break;
+      case NyBits_SUB:	size = v->ob_size; break;
+      default:		size = v->ob_size + w->ob_size; break;
+    }
+    if (!size) {
+	Py_INCREF(NyImmBitSet_Empty);
+	return NyImmBitSet_Empty;
+    }
+    dst = immbitset_new_uncleared(size);
+    if (!dst)
+      return 0;
+    switch(op) {
+      case NyBits_AND:	ze = fields_and(vf, ve, wf, we, dst->ob_field);	break;
+      case NyBits_OR:	ze = fields_or(vf, ve, wf, we, dst->ob_field);	break;
+      case NyBits_XOR:	ze = fields_xor(vf, ve, wf, we, dst->ob_field);	break;
+      case NyBits_SUB:	ze = fields_sub(vf, ve, wf, we, dst->ob_field);	break;
+      default:		ze = dst->ob_field;	/* silence undefined-warning */
+			assert(0);
+    }
+    z = ze - dst->ob_field;
+    if (z == 0) {
+	Py_DECREF(dst);
+	Py_INCREF(NyImmBitSet_Empty);
+	return NyImmBitSet_Empty;
     }
+    if (z < size)
+      dst = immbitset_shrink(dst, z);
+    return dst;
 }
 
 static PyObject *
@@ -2808,6 +3260,11 @@ int
 NyImmBitSet_hasbit(NyImmBitSetObject *v, NyBit bit)
 {
     NyBitField f, *fp;
+    if (NyImmBitSet_HasRuns(v)) {
+	NyBitRun *r = NyImmBitSet_RUNS(v);
+	NyBit i = runs_find(r, NyImmBitSet_NRUNS(v), bit);
+	return i < NyImmBitSet_NRUNS(v) && r[i].lo <= bit;
+    }
     bitno_to_field(bit, &f);
     fp = immbitset_findpos(v, f.pos);
     if (!fp)
@@ -2826,21 +3283,35 @@ immbitset_contains(NyImmBitSetObject *v, PyObject *w)
 }
 
 static void
-immbitset_dealloc(PyObject *v)
+immbitset_dealloc(NyImmBitSetObject *v)
 {
+    if (NyImmBitSet_HasRuns(v))
+      PyMem_Del(v->ob_field);
     v->ob_type->tp_free((PyObject *)v);
     n_immbitset--;
 }
 
+static int
+immbitset_hash_field(NyBitField *f, void *arg)
+{
+    *(long *)arg ^= f->bits ^ f->pos;
+    return 0;
+}
+
 static int
 immbitset_hash(NyImmBitSetObject *v)
 {
     NyBitField *f = &v->ob_field[0];
     NyBitField *f_stop = &v->ob_field[v->ob_size];
     long h = 0x1d567f9f;
-    while (f < f_stop) {
-	h ^= f->bits ^ f->pos;
-	f++;
+    if (NyImmBitSet_HasRuns(v)) {
+	runs_iterate_fields(NyImmBitSet_RUNS(v), NyImmBitSet_NRUNS(v),
+			    immbitset_hash_field, &h);
+    } else {
+	while (f < f_stop) {
+	    h ^= f->bits ^ f->pos;
+	    f++;
+	}
     }
     h += (h >> 16);
     h += (h >> 8);
@@ -2855,8 +3326,11 @@ immbitset_hash(NyImmBitSetObject *v)
 PyObject *
 immbitset_int(NyImmBitSetObject *v)
 {
-    NyBitField *f = &v->ob_field[0];
-    NyBitField *f_stop = &v->ob_field[v->ob_size];
+    NyBitField *f, *f_stop;
+    if (immbitset_fields(v) == -1)
+      return 0;
+    f = &v->ob_field[0];
+    f_stop = &v->ob_field[v->ob_size];
     if (f >= f_stop)
       return PyInt_FromLong(0L);
     if (f->pos < 0) {
@@ -2886,7 +3360,18 @@ immbitset_length(PyObject *_v)
     NyImmBitSetObject *v=(void*)_v;
 
     Py_ssize_t n = v->ob_length;
-    if (n == -1) {
+    if (n == -1 && NyImmBitSet_HasRuns(v)) {
+	NyBitRun *r = NyImmBitSet_RUNS(v);
+	NyBit i;
+	for (i = 0, n = 0; i < NyImmBitSet_NRUNS(v); i++) {
+	    if (r[i].hi - r[i].lo > PY_SSIZE_T_MAX - n) {
+		PyErr_SetString(PyExc_OverflowError, "len() of this immbitset is too large to tell");
+		return -1;
+	    }
+	    n += r[i].hi - r[i].lo;
+	}
+	v->ob_length = n;
+    } else if (n == -1) {
 	Py_ssize_t i;
 	for (i = 0, n = 0; i < v->ob_size; i++) {
 	    n += bits_length(v->ob_field[i].bits);
@@ -2936,6 +3421,28 @@ immbitset_lshift(NyImmBitSetObject *v, NyBit w)
 	Py_INCREF(NyImmBitSet_Empty);
 	return NyImmBitSet_Empty;
     }
+    if (NyImmBitSet_HasRuns(v)) {
+	NyBitRun *r = NyImmBitSet_RUNS(v), *z;
+	NyImmBitSetObject *ret;
+	n = NyImmBitSet_NRUNS(v);
+	if ((w > 0 && r[n-1].hi > NyBit_MAX - w) ||
+	    (w < 0 && r[0].lo < NyBit_MIN - w)) {
+	    PyErr_SetString(PyExc_OverflowError, "immbitset_lshift(): too large shift count");
+	    return 0;
+	}
+	z = PyMem_New(NyBitRun, n);
+	if (!z) {
+	    PyErr_NoMemory();
+	    return 0;
+	}
+	for (i = 0; i < n; i++) {
+	    z[i].lo = r[i].lo + w;
+	    z[i].hi = r[i].hi + w;
+	}
+	ret = immbitset_from_runs(z, n);
+	PyMem_Del(z);
+	return ret;
+    }
     n = v->ob_size;
     lopos = v->ob_field[0].pos;
     hipos = v->ob_field[n-1].pos;
@@ -3087,6 +3594,8 @@ immbitset_slice(NyImmBitSetObject *a, NyBit ilow, NyBit ihigh)
 	Py_INCREF(a);
 	return a;
     }
+    if (immbitset_fields(a) == -1)
+      return 0;
     s.lo = a->ob_field;
     s.hi = a->ob_field + a->ob_size;
     return sf_slice(&s, (&s)+1, ilow, ihigh);
@@ -3110,6 +3619,10 @@ immbitset_subscript(NyImmBitSetObject *v, PyObject *w)
 	PyErr_SetString(PyExc_IndexError, "empty immbitset - index out of range");
 	return 0;
     }
+    if (NyImmBitSet_HasRuns(v) && (i == 0 || i == -1)) {
+	NyBitRun *r = NyImmBitSet_RUNS(v);
+	return PyInt_FromLong(i == 0 ? r[0].lo : r[NyImmBitSet_NRUNS(v)-1].hi - 1);
+    }
     if (i == 0) {
 	return PyInt_FromLong(field_first(v->ob_field));
     } else if (i == -1) {
@@ -3125,9 +3638,12 @@ immbitset_long(NyImmBitSetObject *v)
 {
     NyBit num_poses, pos;
     NyBits bits, *buf;
-    NyBitField *f = &v->ob_field[0];
-    NyBitField *f_stop = &v->ob_field[v->ob_size];
+    NyBitField *f, *f_stop;
     PyObject *r;
+    if (immbitset_fields(v) == -1)
+      return 0;
+    f = &v->ob_field[0];
+    f_stop = &v->ob_field[v->ob_size];
     if (f >= f_stop)
       return PyLong_FromLong(0L);
 
@@ -3332,6 +3848,34 @@ claset_load(PyObject *v, int vt, int *cpl, NySetField *vst, NySetField **vs, NyS
     }
 }
 
+static NyImmBitSetObject *
+claset_immbitset(PyObject *v, int vt)
+{
+    switch (vt) {
+      case BITSET:	return (NyImmBitSetObject *)v;
+      case CPLSET:	return cplbitset_cpl((NyCplBitSetObject *)v);
+      default:		return 0;
+    }
+}
+
+static int
+claset_fields(PyObject *v, int vt, PyObject *w, int wt, int op, int *res)
+{
+    /* Makes sure the fields of v and w are available for claset_load(),
+       except when they are run sets compared for equality; then *res
+       is set to the result, otherwise to -1. */
+    NyImmBitSetObject *a = claset_immbitset(v, vt);
+    NyImmBitSetObject *b = claset_immbitset(w, wt);
+    *res = -1;
+    if (op == Py_EQ && a && b && NyImmBitSet_HasRuns(a) && NyImmBitSet_HasRuns(b)) {
+	*res = vt == wt && immbitset_runs_eq(a, b);
+	return 0;
+    }
+    if ((a && immbitset_fields(a) == -1) || (b && immbitset_fields(b) == -1))
+      return -1;
+    return 0;
+}
+
 static PyObject *
 claset_richcompare(PyObject *v, int vt, PyObject *w, int op)
 {
@@ -3374,6 +3918,10 @@ claset_richcompare(PyObject *v, int vt, PyObject *w, int op)
 	w = nw;
 	wt = nwt;
     }
+    if (claset_fields(v, vt, w, wt, op, &res) == -1)
+      return 0;
+    if (res != -1)
+      goto Done;
     claset_load(v, vt, &vcpl, &vst, &vs, &vse);
     claset_load(w, wt, &wcpl, &wst, &ws, &wse);
     switch (op) {
@@ -3402,6 +3950,7 @@ claset_richcompare(PyObject *v, int vt, PyObject *w, int op)
 	res = 0; /* silence undefined-warning */
 	assert(0);
     }
+  Done:
     if (cpl)
       res = !res;
     ret = res ? Py_True:Py_False;
@@ -3536,6 +4085,8 @@ immbitset_iter(NyImmBitSetObject *v)
 	 Py_INCREF(v);
 	 iter->fldpos = 0;
 	 iter->bitpos = 0;
+	 if (NyImmBitSet_HasRuns(v))
+	   iter->bitpos = NyImmBitSet_RUNS(v)[0].lo;
      }
      return (PyObject *)iter;
 }
@@ -3559,19 +4110,24 @@ bsiter_iternext(NyImmBitSetIterObject *bi)
 {
     NyImmBitSetObject *bs = bi->immbitset;
     NyBit fldpos = bi->fldpos;
+    if (NyImmBitSet_HasRuns(bs)) {
+	/* fldpos is the index of the run and bitpos the next bit */
+	NyBitRun *r = NyImmBitSet_RUNS(bs);
+	NyBit bit = bi->bitpos;
+	if (fldpos >= NyImmBitSet_NRUNS(bs))
+	  return NULL;
+	if (++bi->bitpos == r[fldpos].hi && ++bi->fldpos < NyImmBitSet_NRUNS(bs))
+	  bi->bitpos = r[bi->fldpos].lo;
+	return PyInt_FromLong(bit);
+    }
     if (fldpos < bs->ob_size) {
 	NyBit bitpos = bi->bitpos;
 	NyBitField *f = &bs->ob_field[fldpos];
-	NyBits bits = f->bits >> bitpos;
 	long rebit;
-	while (!(bits & 1)) {
-	    bits >>= 1;
-	    bitpos += 1;
-	}
+	bitpos += bits_first(f->bits >> bitpos);
 	rebit = f->pos * NyBits_N + bitpos;
-	bits >>= 1;
 	bitpos += 1;
-	if (!bits) {
+	if (bitpos == NyBits_N || !(f->bits >> bitpos)) {
 	    fldpos += 1;
 	    bi->fldpos = fldpos;
 	    bitpos = 0;
@@ -3943,11 +4499,14 @@ immbitset_mutable_copy(PyObject *self, PyObject *args)
 static PyObject *
 immbitset_reduce_flags(NyImmBitSetObject *self, int flags)
 {
-    PyObject *a = PyTuple_New(2);
-    PyObject *b = PyTuple_New(2);
-    PyObject *c = PyInt_FromLong(flags);
-    PyObject *d = PyString_FromStringAndSize((char *)self->ob_field,
-					     self->ob_size * sizeof(self->ob_field[0]));
+    PyObject *a, *b, *c, *d;
+    if (immbitset_fields(self) == -1)
+      return 0;
+    a = PyTuple_New(2);
+    b = PyTuple_New(2);
+    c = PyInt_FromLong(flags);
+    d = PyString_FromStringAndSize((char *)self->ob_field,
+				   self->ob_size * sizeof(self->ob_field[0]));
     if (!(a && b && c && d)) {
 	Py_XDECREF(a);
 	Py_XDECREF(b);
@@ -3969,35 +4528,527 @@ immbitset_reduce(NyImmBitSetObject *self, PyObject *args)
     return immbitset_reduce_flags(self, 0);
 }
 
-static PyMethodDef immbitset_methods[] = {
-	{"mutcopy", (PyCFunction)immbitset_mutable_copy, METH_NOARGS, mutable_copy_doc},
-	{"__reduce__", (PyCFunction)immbitset_reduce, METH_NOARGS, "helper for pickle"},
-	{NULL,		NULL}		/* sentinel */
-};
+/* Compact serialization
 
+   S.tobytes() encodes the bits as a string that does not depend on
+   the word size or byte order of the machine. The string starts with
+   a version byte and a flags byte. The bits follow as a sequence of
+   records, each covering some bytes of the bit array, byte b holding
+   the bits 8*b .. 8*b+7. A record is
 
-static PySequenceMethods immbitset_as_sequence = {
-	0,/* NOT USED - can be automatically called would be slow *//* sq_length */
-	0,					/* sq_concat */
-	0,					/* sq_repeat */
-	0,					/* sq_item */
-	0,					/* sq_slice */
-	0,					/* sq_ass_item */
-	0,					/* sq_ass_slice */
-	(objobjproc)immbitset_contains,		/* sq_contains */
-	0,					/* sq_inplace_concat */
-	0,					/* sq_inplace_repeat */
-};
+	gap	varint, the number of zero bytes since the previous
+		record, or the zigzag-encoded first byte number
+	head	varint, (n << 2) | kind
+	data	n+1 bytes as they are, for kind 0
+		n+1 bytes with all bits set, for kind 1, and no data
+		a single byte with only bit n set, for kind 2, and no data
 
+   where a varint is 7 bits in each byte, least significant first, with
+   the high bit set in all but the last byte. */
 
-static PyMappingMethods immbitset_as_mapping = {
-	immbitset_length,	       /*mp_length*/
-	(binaryfunc)immbitset_subscript, /*mp_subscript*/
-	(objobjargproc)0,	      /*mp_ass_subscript*/
-};
+#define NyBytes_VERSION		1
+#define NyBytes_RAW		0
+#define NyBytes_ONES		1
+#define NyBytes_BIT		2
 
+#define NyBytes_PER_FIELD	(NyBits_N / 8)
+#define NyBytePos_MAX		(NyBit_MAX / 8)
+#define NyBytePos_MIN		(NyBit_MIN / 8)
 
-static PyObject *
+typedef struct {
+    PyObject *str;		/* The result string */
+    Py_ssize_t used;		/* Number of bytes used in str */
+    NyBit cursor;		/* Byte number after the last record */
+    int first;			/* No record written yet */
+    int kind;			/* Kind of pending record, -1 if none */
+    NyBit start, end;		/* Bytes of the pending record */
+    unsigned char *raw;		/* Data of a pending raw record */
+    Py_ssize_t rawsize;		/* Allocated size of raw */
+} NyBytesWriter;
+
+static int
+bw_put(NyBytesWriter *w, unsigned char *p, Py_ssize_t n)
+{
+    Py_ssize_t size = PyString_GET_SIZE(w->str);
+    if (w->used + n > size) {
+	while (w->used + n > size)
+	  size *= 2;
+	if (_PyString_Resize(&w->str, size) == -1)
+	  return -1;
+    }
+    memcpy(PyString_AS_STRING(w->str) + w->used, p, n);
+    w->used += n;
+    return 0;
+}
+
+static int
+bw_varint(NyBytesWriter *w, Py_uintptr_t x)
+{
+    unsigned char buf[sizeof(x) * 8 / 7 + 1];
+    int n = 0;
+    while (x >= 0x80) {
+	buf[n++] = (unsigned char)(x | 0x80);
+	x >>= 7;
+    }
+    buf[n++] = (unsigned char)x;
+    return bw_put(w, buf, n);
+}
+
+static int
+bw_flush(NyBytesWriter *w)
+{
+    /* Writes the pending record, if any. */
+    Py_uintptr_t gap, n = w->end - w->start - 1;
+    int kind = w->kind, bit = 0;
+    if (kind == -1)
+      return 0;
+    if (w->first)
+      gap = ((Py_uintptr_t)w->start << 1) ^ (w->start < 0 ? (Py_uintptr_t)-1 : 0);
+    else
+      gap = w->start - w->cursor;
+    if (kind == NyBytes_RAW && n == 0 && !(w->raw[0] & (w->raw[0] - 1))) {
+	kind = NyBytes_BIT;
+	while (!(w->raw[0] & (1 << bit)))
+	  bit++;
+	n = bit;
+    }
+    if (bw_varint(w, gap) == -1 ||
+	bw_varint(w, (n << 2) | kind) == -1 ||
+	(kind == NyBytes_RAW && bw_put(w, w->raw, n + 1) == -1))
+      return -1;
+    w->cursor = w->end;
+    w->first = 0;
+    w->kind = -1;
+    return 0;
+}
+
+static int
+bw_byte(NyBytesWriter *w, NyBit b, unsigned char x)
+{
+    /* Adds the nonzero byte x at byte number b. A raw record is
+       continued over a gap of up to 2 zero bytes, since a new record
+       would take at least as much room. */
+    NyBit n;
+    if (w->kind == NyBytes_RAW && b - w->end <= 2) {
+	n = b + 1 - w->start;
+	if (n > w->rawsize) {
+	    w->rawsize *= 2;
+	    if (!PyMem_Resize(w->raw, unsigned char, w->rawsize)) {
+		PyErr_NoMemory();
+		return -1;
+	    }
+	}
+	while (w->end < b)
+	  w->raw[w->end++ - w->start] = 0;
+    } else {
+	if (bw_flush(w) == -1)
+	  return -1;
+	w->kind = NyBytes_RAW;
+	w->start = b;
+    }
+    w->raw[b - w->start] = x;
+    w->end = b + 1;
+    return 0;
+}
+
+static int
+bw_field(NyBitField *f, void *arg)
+{
+    NyBytesWriter *w = arg;
+    NyBit b = f->pos * NyBytes_PER_FIELD;
+    NyBits bits = f->bits;
+    int i;
+    if (bits == NyBits_ONES) {
+	if (w->kind == NyBytes_ONES && w->end == b) {
+	    w->end += NyBytes_PER_FIELD;
+	    return 0;
+	}
+	if (bw_flush(w) == -1)
+	  return -1;
+	w->kind = NyBytes_ONES;
+	w->start = b;
+	w->end = b + NyBytes_PER_FIELD;
+	return 0;
+    }
+    for (i = 0; bits; i++, bits >>= 8) {
+	if ((bits & 0xff) && bw_byte(w, b + i, (unsigned char)bits) == -1)
+	  return -1;
+    }
+    return 0;
+}
+
+PyObject *
+NyImmBitSet_AsBytes(NyImmBitSetObject *v, int flags, NyBit align)
+{
+    /* Encodes v as by S.tobytes(); align is written after the flags
+       if they include NyBytes_NODES. */
+    NyBytesWriter w;
+    unsigned char head[2];
+    NyBit i;
+    int r = -1;
+    w.str = PyString_FromStringAndSize(0, 64);
+    w.raw = PyMem_New(unsigned char, 64);
+    if (!(w.str && w.raw)) {
+	if (w.str)
+	  PyErr_NoMemory();
+	goto Err;
+    }
+    w.rawsize = 64;
+    w.used = 0;
+    w.cursor = 0;
+    w.first = 1;
+    w.kind = -1;
+    head[0] = NyBytes_VERSION;
+    head[1] = flags;
+    if (bw_put(&w, head, 2) == -1 ||
+	((flags & NyBytes_NODES) && bw_varint(&w, align) == -1))
+      goto Err;
+    if (NyImmBitSet_HasRuns(v)) {
+	if (runs_iterate_fields(NyImmBitSet_RUNS(v), NyImmBitSet_NRUNS(v),
+				bw_field, &w) == -1)
+	  goto Err;
+    } else {
+	for (i = 0; i < v->ob_size; i++) {
+	    if (bw_field(&v->ob_field[i], &w) == -1)
+	      goto Err;
+	}
+    }
+    if (bw_flush(&w) == -1 || _PyString_Resize(&w.str, w.used) == -1)
+      goto Err;
+    r = 0;
+  Err:
+    PyMem_Del(w.raw);
+    if (r == -1)
+      Py_CLEAR(w.str);
+    return w.str;
+}
+
+static PyObject *
+immbitset_tobytes(NyImmBitSetObject *self, PyObject *args)
+{
+    return NyImmBitSet_AsBytes(self, 0, 0);
+}
+
+static int
+br_varint(unsigned char **p, unsigned char *end, Py_uintptr_t *x)
+{
+    Py_uintptr_t r = 0;
+    int shift = 0;
+    for (;;) {
+	if (*p == end) {
+	    PyErr_SetString(PyExc_ValueError, "immbitset_frombytes: truncated data");
+	    return -1;
+	}
+	if (shift >= sizeof(r) * 8 ||
+	    (shift && (Py_uintptr_t)(**p & 0x7f) >> (sizeof(r) * 8 - shift))) {
+	    PyErr_SetString(PyExc_ValueError, "immbitset_frombytes: number out of range");
+	    return -1;
+	}
+	r |= (Py_uintptr_t)(**p & 0x7f) << shift;
+	shift += 7;
+	if (!(*(*p)++ & 0x80))
+	  break;
+    }
+    *x = r;
+    return 0;
+}
+
+/* The reader makes the runs of the bits directly from the records, so
+   a run of any length takes no more room than its record. A run can
+   not end after the highest bit number, so if the bits reach it, the
+   fields are made instead, but only if there are at most
+   NyBytes_MAXTOPFIELDS of them, since a few bytes could else ask for
+   any number. */
+
+#define NyBytes_MAXTOPFIELDS	(1 << 20)
+
+typedef struct {
+    NyBitRun *runs;
+    NyBit n, maxn;
+    int top;			/* The bit NyBit_MAX is set */
+} NyBytesReader;
+
+static int
+br_run(NyBytesReader *rd, NyBit lo, NyBit last)
+{
+    /* Adds the run of the bits lo..last, which are after those added
+       before, joining it with the last run if it follows that. */
+    NyBit hi = last + 1;
+    if (last == NyBit_MAX) {
+	rd->top = 1;
+	if (lo == last)
+	  return 0;
+	hi = last;
+    }
+    if (rd->n && rd->runs[rd->n - 1].hi == lo) {
+	rd->runs[rd->n - 1].hi = hi;
+	return 0;
+    }
+    if (rd->n >= rd->maxn) {
+	NyBit n = rd->maxn * 2;
+	NyBitRun *r = PyMem_Resize(rd->runs, NyBitRun, n);
+	if (!r) {
+	    PyErr_NoMemory();
+	    return -1;
+	}
+	rd->runs = r;
+	rd->maxn = n;
+    }
+    rd->runs[rd->n].lo = lo;
+    rd->runs[rd->n].hi = hi;
+    rd->n++;
+    return 0;
+}
+
+static int
+br_byte(NyBytesReader *rd, NyBit b, unsigned int x)
+{
+    /* Adds the runs of the bits of byte x at byte number b. */
+    int i, j;
+    for (i = 0; i < 8; i = j) {
+	if (!(x & (1 << i))) {
+	    j = i + 1;
+	    continue;
+	}
+	for (j = i + 1; j < 8 && (x & (1 << j)); j++)
+	  ;
+	if (br_run(rd, b * 8 + i, b * 8 + j - 1) == -1)
+	  return -1;
+    }
+    return 0;
+}
+
+static int
+br_records(unsigned char *p, unsigned char *end, NyBytesReader *rd)
+{
+    /* Reads the records p..end into the runs of rd. */
+    NyBit cursor = 0, start, len, i;
+    Py_uintptr_t gap, head, n;
+    int first = 1, kind;
+    while (p < end) {
+	if (br_varint(&p, end, &gap) == -1 ||
+	    br_varint(&p, end, &head) == -1)
+	  return -1;
+	if (first) {
+	    start = (NyBit)(gap >> 1) ^ -(NyBit)(gap & 1);
+	    if (start < NyBytePos_MIN || start > NyBytePos_MAX)
+	      goto Range;
+	} else {
+	    if (cursor > NyBytePos_MAX ||
+		gap > (Py_uintptr_t)(NyBytePos_MAX - cursor))
+	      goto Range;
+	    start = cursor + gap;
+	}
+	kind = head & 3;
+	n = head >> 2;
+	switch (kind) {
+	  case NyBytes_RAW:
+	  case NyBytes_ONES:
+	    if (n > (Py_uintptr_t)(NyBytePos_MAX - start))
+	      goto Range;
+	    len = n + 1;
+	    if (kind == NyBytes_ONES) {
+		if (br_run(rd, start * 8, (start + len - 1) * 8 + 7) == -1)
+		  return -1;
+		break;
+	    }
+	    if (len > end - p) {
+		PyErr_SetString(PyExc_ValueError,
+				"immbitset_frombytes: truncated data");
+		return -1;
+	    }
+	    for (i = 0; i < len; i++) {
+		if (br_byte(rd, start + i, *p++) == -1)
+		  return -1;
+	    }
+	    break;
+	  case NyBytes_BIT:
+	    if (n >= 8) {
+		PyErr_SetString(PyExc_ValueError,
+				"immbitset_frombytes: invalid bit record");
+		return -1;
+	    }
+	    len = 1;
+	    if (br_run(rd, start * 8 + n, start * 8 + n) == -1)
+	      return -1;
+	    break;
+	  default:
+	    PyErr_Format(PyExc_ValueError,
+			 "immbitset_frombytes: invalid record kind %d", kind);
+	    return -1;
+	}
+	cursor = start + len;
+	first = 0;
+    }
+    return 0;
+  Range:
+    PyErr_SetString(PyExc_ValueError, "immbitset_frombytes: bit number out of range");
+    return -1;
+}
+
+static NyImmBitSetObject *
+br_bitset(NyBytesReader *rd)
+{
+    /* Makes the bitset of the runs of rd, and of the bit NyBit_MAX if
+       it is set, in which case it is made of the fields. */
+    NyImmBitSetObject *bs;
+    NyBitField *g;
+    NyBit nf;
+    if (!rd->top) {
+	if (!rd->n) {
+	    Py_INCREF(NyImmBitSet_Empty);
+	    return NyImmBitSet_Empty;
+	}
+	return immbitset_from_runs(rd->runs, rd->n);
+    }
+    nf = runs_nfields(rd->runs, rd->n);
+    if (!(rd->n && rd->runs[rd->n - 1].hi > NyPos_MAX * NyBits_N))
+      nf++;			/* The field of the top bit is not there */
+    if (nf > NyBytes_MAXTOPFIELDS) {
+	PyErr_SetString(PyExc_ValueError,
+			"immbitset_frombytes: too many bits up to the highest bit number");
+	return 0;
+    }
+    bs = NyImmBitSet_New(nf);
+    if (!bs)
+      return 0;
+    g = bs->ob_field;
+    runs_iterate_fields(rd->runs, rd->n, runs_store_field, &g);
+    if (g == bs->ob_field + nf) {
+	g[-1].bits |= (NyBits)1 << (NyBits_N - 1);
+    } else {
+	g->pos = NyPos_MAX;
+	g->bits = (NyBits)1 << (NyBits_N - 1);
+    }
+    return bs;
+}
+
+static PyObject *
+immbitset_frombytes(PyObject *unused, PyObject *data)
+{
+    NyImmBitSetObject *bs = 0;
+    NyBytesReader rd;
+    unsigned char *p, *end;
+    char *s;
+    Py_ssize_t len;
+    Py_uintptr_t align;
+    int flags;
+    if (!PyString_Check(data)) {
+	PyErr_SetString(PyExc_TypeError, "immbitset_frombytes: argument must be a string");
+	return 0;
+    }
+    if (PyString_AsStringAndSize(data, &s, &len) == -1)
+      return 0;
+    p = (unsigned char *)s;
+    end = p + len;
+    if (len < 2) {
+	PyErr_SetString(PyExc_ValueError, "immbitset_frombytes: truncated data");
+	return 0;
+    }
+    if (p[0] != NyBytes_VERSION) {
+	PyErr_Format(PyExc_ValueError,
+		     "immbitset_frombytes: unsupported version %d", p[0]);
+	return 0;
+    }
+    flags = p[1];
+    p += 2;
+    if (flags & ~(NyBytes_CPL | NyBytes_NODES)) {
+	PyErr_Format(PyExc_ValueError,
+		     "immbitset_frombytes: unknown flags %d", flags);
+	return 0;
+    }
+    if (flags & NyBytes_NODES) {
+	if (br_varint(&p, end, &align) == -1)
+	  return 0;
+	if (!align) {
+	    PyErr_SetString(PyExc_ValueError, "immbitset_frombytes: zero alignment");
+	    return 0;
+	}
+    }
+    rd.n = 0;
+    rd.maxn = 16;
+    rd.top = 0;
+    rd.runs = PyMem_New(NyBitRun, rd.maxn);
+    if (!rd.runs) {
+	PyErr_NoMemory();
+	return 0;
+    }
+    if (br_records(p, end, &rd) != -1)
+      bs = br_bitset(&rd);
+    PyMem_Del(rd.runs);
+    if (bs && (flags & NyBytes_CPL))
+      return (PyObject *)NyCplBitSet_New_Del(bs);
+    return (PyObject *)bs;
+}
+
+/* Buffer interface: the fields, as an array of (pos, bits) structs */
+
+#if SIZEOF_VOID_P == SIZEOF_LONG
+#define NY_BITFIELD_FORMAT "lL"
+#else
+#define NY_BITFIELD_FORMAT "qL4x"
+#endif
+
+static int
+immbitset_getbuffer(NyImmBitSetObject *v, Py_buffer *view, int flags)
+{
+    if (immbitset_fields(v) == -1)
+      return -1;
+    if (PyBuffer_FillInfo(view, (PyObject *)v, v->ob_field,
+			  v->ob_size * sizeof(NyBitField), 1, flags) == -1)
+      return -1;
+    if ((flags & PyBUF_FORMAT) && (flags & PyBUF_ND)) {
+	view->itemsize = sizeof(NyBitField);
+	view->format = NY_BITFIELD_FORMAT;
+	view->smalltable[0] = v->ob_size;
+	view->shape = &view->smalltable[0];
+	if ((flags & PyBUF_STRIDES) == PyBUF_STRIDES) {
+	    view->smalltable[1] = sizeof(NyBitField);
+	    view->strides = &view->smalltable[1];
+	}
+    }
+    return 0;
+}
+
+static PyBufferProcs immbitset_as_buffer = {
+    0,					/* bf_getreadbuffer */
+    0,					/* bf_getwritebuffer */
+    0,					/* bf_getsegcount */
+    0,					/* bf_getcharbuffer */
+    (getbufferproc)immbitset_getbuffer,	/* bf_getbuffer */
+    0,					/* bf_releasebuffer */
+};
+
+static PyMethodDef immbitset_methods[] = {
+	{"mutcopy", (PyCFunction)immbitset_mutable_copy, METH_NOARGS, mutable_copy_doc},
+	{"__reduce__", (PyCFunction)immbitset_reduce, METH_NOARGS, "helper for pickle"},
+	{"tobytes", (PyCFunction)immbitset_tobytes, METH_NOARGS, tobytes_doc},
+	{NULL,		NULL}		/* sentinel */
+};
+
+
+static PySequenceMethods immbitset_as_sequence = {
+	0,/* NOT USED - can be automatically called would be slow *//* sq_length */
+	0,					/* sq_concat */
+	0,					/* sq_repeat */
+	0,					/* sq_item */
+	0,					/* sq_slice */
+	0,					/* sq_ass_item */
+	0,					/* sq_ass_slice */
+	(objobjproc)immbitset_contains,		/* sq_contains */
+	0,					/* sq_inplace_concat */
+	0,					/* sq_inplace_repeat */
+};
+
+
+static PyMappingMethods immbitset_as_mapping = {
+	immbitset_length,	       /*mp_length*/
+	(binaryfunc)immbitset_subscript, /*mp_subscript*/
+	(objobjargproc)0,	      /*mp_ass_subscript*/
+};
+
+
+static PyObject *
 immbitset_is_immutable(NyMutBitSetObject *v)
 {
     Py_INCREF(Py_True);
@@ -4009,8 +5060,11 @@ char immbitset_is_immutable_doc[] =
 "\n"
 "True since S is immutable.";
 
+static PyObject *anybitset_get_indisize(NyMutBitSetObject *v);
+
 static PyGetSetDef immbitset_getsets[] = {
     {"is_immutable", (getter)immbitset_is_immutable, (setter)0, immbitset_is_immutable_doc},
+    {"_indisize", (getter)anybitset_get_indisize, (setter)0},
     {NULL} /* Sentinel */
 };
 
@@ -4018,8 +5072,7 @@ PyTypeObject NyImmBitSet_Type = {
 	PyObject_HEAD_INIT(NULL)
 	0,					/* ob_size */
 	"guppy.sets.setsc.ImmBitSet",		/* tp_name */
-	sizeof(NyImmBitSetObject) - sizeof(NyBitField),
-	  					/* tp_basicsize */
+	offsetof(NyImmBitSetObject, ob_inline),	/* tp_basicsize */
 	sizeof(NyBitField),			/* tp_itemsize */
 	(destructor)immbitset_dealloc,		/* tp_dealloc */
 	0,					/* tp_print */
@@ -4035,9 +5088,9 @@ PyTypeObject NyImmBitSet_Type = {
         (reprfunc)0,				/* tp_str */
 	PyObject_GenericGetAttr,		/* tp_getattro */
 	0,					/* tp_setattro */
-	0,					/* tp_as_buffer */
-	Py_TPFLAGS_DEFAULT | Py_TPFLAGS_CHECKTYPES | Py_TPFLAGS_BASETYPE,
-	  					/* tp_flags */
+	&immbitset_as_buffer,			/* tp_as_buffer */
+	Py_TPFLAGS_DEFAULT | Py_TPFLAGS_CHECKTYPES | Py_TPFLAGS_BASETYPE |
+	Py_TPFLAGS_HAVE_NEWBUFFER,		/* tp_flags */
 	ImmBitSet_doc,				/* tp_doc */
 	0,					/* tp_traverse */
 	0,					/* tp_clear */
@@ -4127,9 +5180,16 @@ cplbitset_reduce(NyCplBitSetObject *self, PyObject *args)
     return immbitset_reduce_flags(cplbitset_cpl(self), NyForm_CPL);
 }
 
+static PyObject *
+cplbitset_tobytes(NyCplBitSetObject *self, PyObject *args)
+{
+    return NyImmBitSet_AsBytes(cplbitset_cpl(self), NyBytes_CPL, 0);
+}
+
 static PyMethodDef cplbitset_methods[] = {
 	{"mutcopy", (PyCFunction)cplbitset_mutable_copy, METH_NOARGS, mutable_copy_doc},
 	{"__reduce__", (PyCFunction)cplbitset_reduce, METH_NOARGS, "helper for pickle"},
+	{"tobytes", (PyCFunction)cplbitset_tobytes, METH_NOARGS, tobytes_doc},
 	{NULL,		NULL}		/* sentinel */
 };
 
@@ -4299,10 +5359,17 @@ generic_indisize(PyObject *v)
 }
 
 
-static int
+int
 immbitset_indisize(NyImmBitSetObject *v)
 {
-    return generic_indisize((PyObject *)v);
+    long size;
+    if (!NyImmBitSet_HasRuns(v))
+      return generic_indisize((PyObject *)v);
+    size = v->ob_type->tp_basicsize +
+      (NyImmBitSet_NRUNS(v) + 1) * v->ob_type->tp_itemsize;
+    if (v->ob_field)
+      size += v->ob_size * sizeof(NyBitField);
+    return size;
 }
 
 static int
@@ -4569,6 +5636,13 @@ NyImmBitSet_Range(long lo, long hi, long step)
 	return (PyObject *)NyImmBitSet_Empty;
     }
 
+    if (step == 1) {
+	NyBitRun run;
+	run.lo = lo;
+	run.hi = hi;
+	return (PyObject *)immbitset_from_runs(&run, 1);
+    }
+
     bitno = lo;
     bit = bitno_modiv(bitno, &pos);
     hibit = bitno_modiv(hi, &hipos);
@@ -4756,12 +5830,393 @@ _NyBitSet_Form(PyObject *unused, PyObject *args)
     return NyBitSet_Form(args);
 }
 
+/* Unions and intersections of many bitsets at once.
+
+   The bitsets are merged field by field in position order, making one
+   result without the intermediate sets of a sequence of binary
+   operations. Complemented bitsets are combined with the binary
+   operations. */
+
+typedef struct {
+    NyBitField *f, *end_f;
+    NySetField *sf, *end_sf;
+} NyFieldCursor;
+
+typedef struct {
+    NyBitField *f;		/* Next field of the cursor */
+    NyFieldCursor *c;
+} NyFieldHeapItem;
+
+static void
+fc_init(NyFieldCursor *c, PyObject *v)
+{
+    if (NyImmBitSet_Check(v)) {
+	NyImmBitSetObject *bs = (NyImmBitSetObject *)v;
+	c->f = &bs->ob_field[0];
+	c->end_f = &bs->ob_field[bs->ob_size];
+	c->sf = c->end_sf = 0;
+    } else {
+	NyUnionObject *root = ((NyMutBitSetObject *)v)->root;
+	c->f = c->end_f = 0;
+	c->sf = &root->ob_field[0];
+	c->end_sf = &root->ob_field[root->cur_size];
+    }
+}
+
+/* Return the next field with some bit set, or 0 at the end. */
+
+static NyBitField *
+fc_next(NyFieldCursor *c)
+{
+    for (;;) {
+	if (c->f < c->end_f) {
+	    NyBitField *f = c->f++;
+	    if (f->bits)
+	      return f;
+	} else if (c->sf < c->end_sf) {
+	    c->f = c->sf->lo;
+	    c->end_f = c->sf->hi;
+	    c->sf++;
+	} else
+	  return 0;
+    }
+}
+
+/* The number of fields of a bitset, some of which may have no bits set. */
+
+static NyBit
+fc_size(PyObject *v)
+{
+    if (NyImmBitSet_Check(v))
+      return ((NyImmBitSetObject *)v)->ob_size;
+    else {
+	NyUnionObject *root = ((NyMutBitSetObject *)v)->root;
+	NyBit n = 0;
+	int i;
+	for (i = 0; i < root->cur_size; i++)
+	  n += root->ob_field[i].hi - root->ob_field[i].lo;
+	return n;
+    }
+}
+
+/* Set *lo and *hi to the positions of the first and last field of a
+   bitset, and return 0, or return -1 if it has no fields. */
+
+static int
+fc_span(PyObject *v, NyBit *lo, NyBit *hi)
+{
+    if (NyImmBitSet_Check(v)) {
+	NyImmBitSetObject *bs = (NyImmBitSetObject *)v;
+	if (!bs->ob_size)
+	  return -1;
+	*lo = bs->ob_field[0].pos;
+	*hi = bs->ob_field[bs->ob_size - 1].pos;
+    } else {
+	NyUnionObject *root = ((NyMutBitSetObject *)v)->root;
+	NySetField *s = &root->ob_field[0];
+	NySetField *e = &root->ob_field[root->cur_size];
+	while (s < e && s->lo == s->hi)
+	  s++;
+	while (e > s && e[-1].lo == e[-1].hi)
+	  e--;
+	if (s == e)
+	  return -1;
+	*lo = s->lo->pos;
+	*hi = e[-1].hi[-1].pos;
+    }
+    return 0;
+}
+
+static void
+fc_heap_sift(NyFieldHeapItem *h, NyBit n, NyBit i)
+{
+    NyFieldHeapItem x = h[i];
+    for (;;) {
+	NyBit j = 2 * i + 1;
+	if (j >= n)
+	  break;
+	if (j + 1 < n && h[j + 1].f->pos < h[j].f->pos)
+	  j++;
+	if (x.f->pos <= h[j].f->pos)
+	  break;
+	h[i] = h[j];
+	i = j;
+    }
+    h[i] = x;
+}
+
+/* Return a new list of the bitsets of iterable, converting the items that
+   are not bitsets as immbitset() does. Set *cpl if some is complemented. */
+
+static PyObject *
+bitsets_list(PyObject *iterable, int *cpl)
+{
+    PyObject *list = PySequence_List(iterable);
+    Py_ssize_t i;
+    if (!list)
+      return 0;
+    *cpl = 0;
+    for (i = 0; i < PyList_GET_SIZE(list); i++) {
+	PyObject *x = PyList_GET_ITEM(list, i);
+	int vt;
+	anybitset_classify(x, &vt);
+	if (vt == NOSET) {
+	    x = anybitset_convert(x, &vt);
+	    if (!x)
+	      goto Err;
+	    PyList_SetItem(list, i, x);
+	    if (vt == NOSET) {
+		PyErr_SetString(PyExc_TypeError,
+				"operands must be bitsets, iterables or integers");
+		goto Err;
+	    }
+	}
+	if (vt == BITSET && immbitset_fields((NyImmBitSetObject *)x) == -1)
+	  goto Err;
+	if (vt == CPLSET || (vt == MUTSET && ((NyMutBitSetObject *)x)->cpl))
+	  *cpl = 1;
+    }
+    return list;
+  Err:
+    Py_DECREF(list);
+    return 0;
+}
+
+/* Combine the bitsets of list one by one with the binary operation. */
+
+static PyObject *
+bitsets_fold(PyObject *list, binaryfunc op)
+{
+    PyObject *r = PyList_GET_ITEM(list, 0);
+    Py_ssize_t i;
+    int vt;
+    Py_INCREF(r);
+    for (i = 1; r && i < PyList_GET_SIZE(list); i++) {
+	PyObject *x = op(r, PyList_GET_ITEM(list, i));
+	Py_DECREF(r);
+	r = x;
+    }
+    if (r && NyMutBitSet_Check(r)) {
+	PyObject *x = anybitset_convert(r, &vt);
+	Py_DECREF(r);
+	r = x;
+    }
+    return r;
+}
+
+static char immbitset_union_doc[] =
+"immbitset_union(iterable) -> ImmBitSet or CplBitSet\n"
+"\n"
+"Return an immutable bitset which is the union of all bitsets in\n"
+"iterable. Items that are not bitsets are converted as by immbitset().\n"
+"The fields are combined in a word array when they are dense, otherwise\n"
+"the bitsets are merged all at once, so the time is linear in their total\n"
+"number of fields, times the logarithm of their number.";
+
+static PyObject *
+immbitset_union(PyObject *unused, PyObject *iterable)
+{
+    PyObject *list, *r = 0;
+    NyFieldCursor *cs = 0;
+    NyFieldHeapItem *heap = 0;
+    NyBitField *fields = 0;
+    NyBits *words = 0;
+    NyBit i, k, n, z, lo, hi;
+    int cpl;
+    list = bitsets_list(iterable, &cpl);
+    if (!list)
+      return 0;
+    k = PyList_GET_SIZE(list);
+    if (cpl) {
+	r = bitsets_fold(list, PyNumber_Or);
+	goto Ret;
+    }
+    n = 0;
+    lo = NyPos_MAX;
+    hi = NyPos_MIN;
+    for (i = 0; i < k; i++) {
+	NyBit l, h;
+	n += fc_size(PyList_GET_ITEM(list, i));
+	if (fc_span(PyList_GET_ITEM(list, i), &l, &h) == 0) {
+	    if (l < lo)
+	      lo = l;
+	    if (h > hi)
+	      hi = h;
+	}
+    }
+    if (lo <= hi && (Py_uintptr_t)(hi - lo) < (Py_uintptr_t)n * 2) {
+	/* The fields are dense, so OR them into a word array */
+	NyBitField *f;
+	words = PyMem_New(NyBits, hi - lo + 1);
+	if (!words) {
+	    PyErr_NoMemory();
+	    goto Ret;
+	}
+	memset(words, 0, (hi - lo + 1) * sizeof(NyBits));
+	for (i = 0; i < k; i++) {
+	    NyFieldCursor c;
+	    fc_init(&c, PyList_GET_ITEM(list, i));
+	    while ((f = fc_next(&c)))
+	      words[f->pos - lo] |= f->bits;
+	}
+	z = 0;
+	for (i = 0; i <= hi - lo; i++) {
+	    if (words[i])
+	      z++;
+	}
+	r = (PyObject *)NyImmBitSet_New(z);
+	if (!r)
+	  goto Ret;
+	f = ((NyImmBitSetObject *)r)->ob_field;
+	for (i = 0; i <= hi - lo; i++) {
+	    if (words[i]) {
+		f->pos = lo + i;
+		f->bits = words[i];
+		f++;
+	    }
+	}
+	r = (PyObject *)immbitset_runs_if_preferred((NyImmBitSetObject *)r);
+	goto Ret;
+    }
+    cs = PyMem_New(NyFieldCursor, k ? k : 1);
+    heap = PyMem_New(NyFieldHeapItem, k ? k : 1);
+    fields = PyMem_New(NyBitField, n ? n : 1);
+    if (!(cs && heap && fields)) {
+	PyErr_NoMemory();
+	goto Ret;
+    }
+    n = 0;
+    for (i = 0; i < k; i++) {
+	fc_init(&cs[i], PyList_GET_ITEM(list, i));
+	heap[n].c = &cs[i];
+	heap[n].f = fc_next(&cs[i]);
+	if (heap[n].f)
+	  n++;
+    }
+    for (i = n / 2 - 1; i >= 0; i--)
+      fc_heap_sift(heap, n, i);
+    z = 0;
+    while (n) {
+	NyBitField *f = heap[0].f;
+	if (z && fields[z - 1].pos == f->pos)
+	  fields[z - 1].bits |= f->bits;
+	else
+	  fields[z++] = *f;
+	heap[0].f = fc_next(heap[0].c);
+	if (!heap[0].f)
+	  heap[0] = heap[--n];
+	fc_heap_sift(heap, n, 0);
+    }
+    r = (PyObject *)NyImmBitSet_New(z);
+    if (r)
+      fp_move(((NyImmBitSetObject *)r)->ob_field, fields, z);
+    r = (PyObject *)immbitset_runs_if_preferred((NyImmBitSetObject *)r);
+  Ret:
+    PyMem_Del(cs);
+    PyMem_Del(heap);
+    PyMem_Del(fields);
+    PyMem_Del(words);
+    Py_DECREF(list);
+    return r;
+}
+
+static char immbitset_intersection_doc[] =
+"immbitset_intersection(iterable) -> ImmBitSet or CplBitSet\n"
+"\n"
+"Return an immutable bitset which is the intersection of all bitsets in\n"
+"iterable, or the complement of the empty set if there are none. Items\n"
+"that are not bitsets are converted as by immbitset(). The fields of the\n"
+"bitset with the fewest fields are looked up in the others in one pass.";
+
+static PyObject *
+immbitset_intersection(PyObject *unused, PyObject *iterable)
+{
+    PyObject *list, *r = 0;
+    NyFieldCursor *cs = 0;
+    NyBitField **cur = 0;
+    NyBitField *fields = 0;
+    NyBitField *f;
+    NyBit i, k, n, s, z;
+    int cpl;
+    list = bitsets_list(iterable, &cpl);
+    if (!list)
+      return 0;
+    k = PyList_GET_SIZE(list);
+    if (!k) {
+	r = (PyObject *)NyImmBitSet_Omega;
+	Py_INCREF(r);
+	goto Ret;
+    }
+    if (cpl) {
+	r = bitsets_fold(list, PyNumber_And);
+	goto Ret;
+    }
+    /* Find the bitset s with the fewest fields */
+    s = 0;
+    n = fc_size(PyList_GET_ITEM(list, 0));
+    for (i = 1; i < k; i++) {
+	NyBit m = fc_size(PyList_GET_ITEM(list, i));
+	if (m < n) {
+	    n = m;
+	    s = i;
+	}
+    }
+    cs = PyMem_New(NyFieldCursor, k);
+    cur = PyMem_New(NyBitField *, k);
+    fields = PyMem_New(NyBitField, n ? n : 1);
+    if (!(cs && cur && fields)) {
+	PyErr_NoMemory();
+	goto Ret;
+    }
+    for (i = 0; i < k; i++) {
+	fc_init(&cs[i], PyList_GET_ITEM(list, i));
+	cur[i] = i == s ? 0 : fc_next(&cs[i]);
+    }
+    z = 0;
+    while ((f = fc_next(&cs[s]))) {
+	NyBits bits = f->bits;
+	for (i = 0; i < k && bits; i++) {
+	    if (i == s)
+	      continue;
+	    while (cur[i] && cur[i]->pos < f->pos)
+	      cur[i] = fc_next(&cs[i]);
+	    if (!cur[i])
+	      goto Done;
+	    if (cur[i]->pos == f->pos)
+	      bits &= cur[i]->bits;
+	    else
+	      bits = 0;
+	}
+	if (bits) {
+	    fields[z].pos = f->pos;
+	    fields[z].bits = bits;
+	    z++;
+	}
+    }
+  Done:
+    r = (PyObject *)NyImmBitSet_New(z);
+    if (r)
+      fp_move(((NyImmBitSetObject *)r)->ob_field, fields, z);
+    r = (PyObject *)immbitset_runs_if_preferred((NyImmBitSetObject *)r);
+  Ret:
+    PyMem_Del(cs);
+    PyMem_Del(cur);
+    PyMem_Del(fields);
+    Py_DECREF(list);
+    return r;
+}
+
 static PyMethodDef nybitset_methods[] =
 {
     {"immbit",(PyCFunction)_NyImmBitSet_Singleton, METH_O, bitsingle_doc},
     {"immbitrange",(PyCFunction)_NyImmBitSet_Range, METH_VARARGS, bitrange_doc},
     {"immbitset",(PyCFunction)immbitset, METH_KEYWORDS, immbitset_doc},
     {"_bs",(PyCFunction)_NyBitSet_Form, METH_VARARGS, bitform_doc},
+    {"immbitset_union",(PyCFunction)immbitset_union, METH_O, immbitset_union_doc},
+    {"immbitset_intersection",(PyCFunction)immbitset_intersection, METH_O,
+     immbitset_intersection_doc},
+    {"immbitset_frombytes",(PyCFunction)immbitset_frombytes, METH_O,
+     immbitset_frombytes_doc},
     {0}
 };
 
@@ -4813,20 +6268,6 @@ int fsb_dx_nybitset_init(PyObject *m)
     NyBitSet_FormMethod = PyObject_GetAttrString(m, "_bs");
     if (!NyBitSet_FormMethod)
       goto error;
-    { int i;
-      /* initialize len() helper */
-      for (i = 0; i < LEN_TAB_SIZE; i++) {
-	  unsigned b = i;
-	  int n = 0;
-	  while (b) {
-	      if (b & 1)
-		n++;
-	      b >>= 1;
-	  }
-	  len_tab[i] = n;
-      }
-    }
-
     return 0;
   error:
     return -1;
@@ -75,13 +75,29 @@ typedef struct {
     NyBits bits;	/* The bits as a mask */
 } NyBitField;
 
-/* Immutable bitset */
+typedef struct {
+    NyBit lo, hi;	/* The bits lo <= bit < hi */
+} NyBitRun;
+
+/* Immutable bitset
+
+   The fields are normally stored inline in ob_inline, with ob_field
+   pointing at them. A set that consists of few long runs of bits may
+   instead store the runs inline: ob_inline[0].pos is then the number
+   of runs, the runs follow it, and ob_field is 0 until the fields are
+   needed and made from the runs. ob_size is the number of fields in
+   either case. */
 
 typedef struct {
     PyObject_VAR_HEAD
     Py_ssize_t ob_length;	/* Result for len(), -1 if not yet calculated */
-    NyBitField ob_field[1];	/* The bit fields, ob_size of these */
+    NyBitField *ob_field;	/* The bit fields, ob_size of these */
+    NyBitField ob_inline[1];	/* The fields or the runs */
 } NyImmBitSetObject;
+
+#define NyImmBitSet_HasRuns(v)	((v)->ob_field != (v)->ob_inline)
+#define NyImmBitSet_NRUNS(v)	((v)->ob_inline[0].pos)
+#define NyImmBitSet_RUNS(v)	((NyBitRun *)&(v)->ob_inline[1])
 			      
 typedef struct {
     PyObject_HEAD
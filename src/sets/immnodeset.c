@@ -10,7 +10,11 @@ PyDoc_STRVAR(immnodeset_doc,
 "\n"
 "hash(x)    -> int\n"
 "\n"
-"Return a hash value based on the addresses of the elements."
+"Return a hash value based on the addresses of the elements.\n"
+"\n"
+"The addresses can be read without making any objects via the buffer\n"
+"interface, as memoryview(x) or numpy.asarray(x) would: a read-only\n"
+"array of the addresses of the elements, in address order."
 );
 
 
@@ -436,6 +440,36 @@ immnodeset_obj_at(NyNodeSetObject *v, PyObject *obj)
 }
 
 
+/* Buffer interface: the node array, as an array of addresses */
+
+static int
+immnodeset_getbuffer(NyNodeSetObject *v, Py_buffer *view, int flags)
+{
+    if (PyBuffer_FillInfo(view, (PyObject *)v, v->u.nodes,
+			  v->ob_size * sizeof(PyObject *), 1, flags) == -1)
+      return -1;
+    if ((flags & PyBUF_FORMAT) && (flags & PyBUF_ND)) {
+	view->itemsize = sizeof(PyObject *);
+	view->format = NY_ADDRESS_FORMAT;
+	view->smalltable[0] = v->ob_size;
+	view->shape = &view->smalltable[0];
+	if ((flags & PyBUF_STRIDES) == PyBUF_STRIDES) {
+	    view->smalltable[1] = sizeof(PyObject *);
+	    view->strides = &view->smalltable[1];
+	}
+    }
+    return 0;
+}
+
+static PyBufferProcs immnodeset_as_buffer = {
+    0,					/* bf_getreadbuffer */
+    0,					/* bf_getwritebuffer */
+    0,					/* bf_getsegcount */
+    0,					/* bf_getcharbuffer */
+    (getbufferproc)immnodeset_getbuffer,/* bf_getbuffer */
+    0,					/* bf_releasebuffer */
+};
+
 static PyMethodDef immnodeset_methods[] = {
 	{"obj_at",	(PyCFunction)immnodeset_obj_at, METH_O, immnodeset_obj_at_doc},
 	{NULL,		NULL}		/* sentinel */
@@ -464,9 +498,9 @@ PyTypeObject NyImmNodeSet_Type = {
 	0,					/* tp_str */
 	PyObject_GenericGetAttr,		/* tp_getattro */
 	0,					/* tp_setattro */
-	0,					/* tp_as_buffer */
+	&immnodeset_as_buffer,			/* tp_as_buffer */
 	Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC | Py_TPFLAGS_CHECKTYPES |
-		Py_TPFLAGS_BASETYPE,		/* tp_flags */
+		Py_TPFLAGS_BASETYPE | Py_TPFLAGS_HAVE_NEWBUFFER, /* tp_flags */
  	immnodeset_doc,				/* tp_doc */
  	(traverseproc)immnodeset_gc_traverse,	/* tp_traverse */
  	(inquiry)immnodeset_gc_clear,		/* tp_clear */
@@ -109,13 +109,26 @@ PyDoc_STRVAR(nodeset_doc,
 "bool(x)    -> bool\n"
 "\n"
 "Return True if x is not empty, False otherwise.\n"
+"\n"
+"------------------------------------------\n"
+"Address export.\n"
+"\n"
+"x.tobytes()    -> string\n"
+"\n"
+"Return the addresses of the elements of x, encoded as a bitset.\n"
 );
 
 PyDoc_STRVAR(mutnodeset_doc,
-"MutNodeSet([iterable])\n"
+"MutNodeSet([iterable, hashed])\n"
 "\n"
 "Return a new mutable nodeset with elements from iterable.\n"
 "\n"
+"If hashed is true, the elements are kept in a hash table of their\n"
+"addresses instead of in a bitset. This is faster for testing and\n"
+"changing single elements when the addresses are spread out in many\n"
+"separate areas of memory, but slower for set operations and iteration,\n"
+"which need the elements in address order.\n"
+"\n"
 "A mutable nodeset inherits the operations defined for NodeSet.\n"
 "It also supports the following methods:\n"
 "\n"
@@ -280,6 +293,171 @@ PyTypeObject NyMutNodeSetIter_Type = {
 
 
 
+/* Address hash table, used instead of the bitset by mutable nodesets
+   with flag NS_HASHED.
+
+   The bitset is searched in a tree of fields, which gets slow when the
+   addresses are spread out over many separate areas of memory. The hash
+   table has a constant expected time per operation, independent of the
+   address distribution, but does not keep the elements in address order.
+
+   It uses open addressing with linear probing, and deletes by moving
+   later entries back so it needs no deleted-entry markers. The table is
+   kept at most 2/3 full. */
+
+#define NHT_MINSIZE	8
+
+#define NHT_IS_HASHED(v) (((NyNodeSetObject *)(v))->flags & NS_HASHED)
+
+static Py_uintptr_t
+nht_hash(PyObject *obj)
+{
+    Py_uintptr_t h = (Py_uintptr_t)obj / ALIGN;
+#if SIZEOF_VOID_P > 4
+    h *= (Py_uintptr_t)0x9E3779B97F4A7C15ULL;
+    h ^= h >> 32;
+#else
+    h *= (Py_uintptr_t)0x9E3779B9UL;
+    h ^= h >> 16;
+#endif
+    return h;
+}
+
+static NyNodeHashTable *
+nht_new(void)
+{
+    NyNodeHashTable *ht = PyMem_New(NyNodeHashTable, 1);
+    if (!ht) {
+	PyErr_NoMemory();
+	return 0;
+    }
+    ht->table = PyMem_New(PyObject *, NHT_MINSIZE);
+    if (!ht->table) {
+	PyMem_Del(ht);
+	PyErr_NoMemory();
+	return 0;
+    }
+    memset(ht->table, 0, NHT_MINSIZE * sizeof(PyObject *));
+    ht->mask = NHT_MINSIZE - 1;
+    return ht;
+}
+
+static void
+nht_free(NyNodeHashTable *ht)
+{
+    PyMem_Del(ht->table);
+    PyMem_Del(ht);
+}
+
+/* Return the index of the slot of obj, or of the empty slot where it would go. */
+
+static Py_ssize_t
+nht_lookup(NyNodeHashTable *ht, PyObject *obj)
+{
+    Py_ssize_t i = nht_hash(obj) & ht->mask;
+    PyObject *e;
+    while ((e = ht->table[i]) && e != obj)
+      i = (i + 1) & ht->mask;
+    return i;
+}
+
+static int
+nht_resize(NyNodeHashTable *ht, Py_ssize_t size)
+{
+    PyObject **oldtable = ht->table;
+    Py_ssize_t oldsize = ht->mask + 1;
+    Py_ssize_t i;
+    PyObject **table = PyMem_New(PyObject *, size);
+    if (!table) {
+	PyErr_NoMemory();
+	return -1;
+    }
+    memset(table, 0, size * sizeof(PyObject *));
+    ht->table = table;
+    ht->mask = size - 1;
+    for (i = 0; i < oldsize; i++) {
+	if (oldtable[i])
+	  table[nht_lookup(ht, oldtable[i])] = oldtable[i];
+    }
+    PyMem_Del(oldtable);
+    return 0;
+}
+
+/* Remove the entry at slot i, moving back the entries that follow it
+   in its probe sequence so that they can still be found. */
+
+static void
+nht_delete(NyNodeHashTable *ht, Py_ssize_t i)
+{
+    Py_ssize_t mask = ht->mask;
+    Py_ssize_t j = i;
+    PyObject *e;
+    for (;;) {
+	Py_ssize_t k;
+	j = (j + 1) & mask;
+	e = ht->table[j];
+	if (!e)
+	  break;
+	k = nht_hash(e) & mask;
+	/* Leave e if its home slot k is cyclically in (i, j] */
+	if (i <= j ? (i < k && k <= j) : (i < k || k <= j))
+	  continue;
+	ht->table[i] = e;
+	i = j;
+    }
+    ht->table[i] = 0;
+}
+
+static int
+nht_cmp_addr(const void *a, const void *b)
+{
+    Py_uintptr_t x = *(Py_uintptr_t *)a, y = *(Py_uintptr_t *)b;
+    return x < y ? -1 : x > y;
+}
+
+/* Return a new array of the n objects in the table, in address order. */
+
+static PyObject **
+nht_sorted(NyNodeSetObject *v)
+{
+    NyNodeHashTable *ht = v->u.hashtable;
+    Py_ssize_t i, n = 0;
+    PyObject **objs = PyMem_New(PyObject *, v->ob_size ? v->ob_size : 1);
+    if (!objs) {
+	PyErr_NoMemory();
+	return 0;
+    }
+    for (i = 0; i <= ht->mask; i++) {
+	if (ht->table[i])
+	  objs[n++] = ht->table[i];
+    }
+    assert(n == v->ob_size);
+    qsort(objs, n, sizeof(PyObject *), nht_cmp_addr);
+    return objs;
+}
+
+/* Replace the table of v with newht, which may be NULL, and release the
+   objects of the old table if v holds them. */
+
+static void
+nht_replace(NyNodeSetObject *v, NyNodeHashTable *newht)
+{
+    NyNodeHashTable *ht = v->u.hashtable;
+    Py_ssize_t i;
+    v->u.hashtable = newht;
+    v->ob_size = 0;
+    if (!ht)
+      return;
+    if (v->flags & NS_HOLDOBJECTS) {
+	for (i = 0; i <= ht->mask; i++) {
+	    Py_XDECREF(ht->table[i]);
+	}
+    }
+    nht_free(ht);
+}
+
+
+
 /* NodeSet methods */
 
 NyNodeSetObject *
@@ -291,7 +469,10 @@ NyMutNodeSet_SubtypeNewFlags(PyTypeObject *type, int flags, PyObject *hiding_tag
     /*assert (flags & NS_HOLDOBJECTS); */
     v->flags = flags;
     v->ob_size = 0;
-    v->u.bitset = (PyObject *)NyMutBitSet_New();
+    if (flags & NS_HASHED)
+      v->u.hashtable = nht_new();
+    else
+      v->u.bitset = (PyObject *)NyMutBitSet_New();
     if (!v->u.bitset) {
 	Py_DECREF(v);
 	return 0;
@@ -302,9 +483,10 @@ NyMutNodeSet_SubtypeNewFlags(PyTypeObject *type, int flags, PyObject *hiding_tag
 }
 
 NyNodeSetObject *
-NyMutNodeSet_SubtypeNewIterable(PyTypeObject *type, PyObject *iterable, PyObject *hiding_tag)
+NyMutNodeSet_SubtypeNewIterableFlags(PyTypeObject *type, PyObject *iterable,
+				     PyObject *hiding_tag, int flags)
 {
-    NyNodeSetObject *ns = NyMutNodeSet_SubtypeNewFlags(type, NS_HOLDOBJECTS, hiding_tag);
+    NyNodeSetObject *ns = NyMutNodeSet_SubtypeNewFlags(type, flags, hiding_tag);
     if (!ns)
       return 0;
     if (iterable) {
@@ -318,6 +500,12 @@ NyMutNodeSet_SubtypeNewIterable(PyTypeObject *type, PyObject *iterable, PyObject
     return ns;
 }
 
+NyNodeSetObject *
+NyMutNodeSet_SubtypeNewIterable(PyTypeObject *type, PyObject *iterable, PyObject *hiding_tag)
+{
+    return NyMutNodeSet_SubtypeNewIterableFlags(type, iterable, hiding_tag, NS_HOLDOBJECTS);
+}
+
 NyNodeSetObject *
 NyMutNodeSet_NewFlags(int flags)
 {
@@ -335,6 +523,11 @@ NyMutNodeSet_NewHiding(PyObject *hiding_tag) {
     return NyMutNodeSet_SubtypeNewFlags(&NyMutNodeSet_Type, NS_HOLDOBJECTS, hiding_tag);
 }
 
+NyNodeSetObject *
+NyMutNodeSet_NewFlagsHiding(int flags, PyObject *hiding_tag) {
+    return NyMutNodeSet_SubtypeNewFlags(&NyMutNodeSet_Type, flags, hiding_tag);
+}
+
 
 
 static PyObject *
@@ -342,10 +535,13 @@ mutnodeset_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
 {
 
     PyObject *iterable = NULL;
-    static char *kwlist[] = {"iterable", 0};
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|O:MutNodeSet.__new__",kwlist, &iterable))
+    int hashed = 0;
+    static char *kwlist[] = {"iterable", "hashed", 0};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|Oi:MutNodeSet.__new__",kwlist,
+				     &iterable, &hashed))
       return 0;
-    return (PyObject *)NyMutNodeSet_SubtypeNewIterable(type, iterable, 0);
+    return (PyObject *)NyMutNodeSet_SubtypeNewIterableFlags(
+	type, iterable, 0, hashed ? NS_HOLDOBJECTS | NS_HASHED : NS_HOLDOBJECTS);
 }
 
 static NyBit
@@ -362,7 +558,21 @@ nodeset_bitno_to_obj(NyBit bitno)
 
 static PyObject *
 nodeset_bitset(NyNodeSetObject *v) {
-    if (NyMutNodeSet_Check(v)) {
+    if (NyMutNodeSet_Check(v) && NHT_IS_HASHED(v)) {
+	NyNodeHashTable *ht = v->u.hashtable;
+	Py_ssize_t i;
+	NyMutBitSetObject *bitset = NyMutBitSet_New();
+	if (!bitset)
+	  return 0;
+	for (i = 0; i <= ht->mask; i++) {
+	    if (ht->table[i] &&
+		NyMutBitSet_setbit(bitset, nodeset_obj_to_bitno(ht->table[i])) == -1) {
+		Py_DECREF(bitset);
+		return 0;
+	    }
+	}
+	return (PyObject *)bitset;
+    } else if (NyMutNodeSet_Check(v)) {
 	Py_INCREF(v->u.bitset);
 	return v->u.bitset;
     } else {
@@ -395,7 +605,9 @@ nodeset_dealloc_iter(PyObject *obj, void *v)
 static int
 mutnodeset_gc_clear(NyNodeSetObject *v)
 {
-    if (v->u.bitset) {
+    if (NHT_IS_HASHED(v)) {
+	nht_replace(v, 0);
+    } else if (v->u.bitset) {
 	PyObject *x = v->u.bitset;
 	if (v->flags & NS_HOLDOBJECTS) {
 	    NyNodeSet_iterate(v, nodeset_dealloc_iter, v);
@@ -426,7 +638,10 @@ nodeset_indisize(PyObject *v)
 {
     NyNodeSetObject *ns = (void *)v;
     int r = generic_indisize(v);
-    if (NyMutNodeSet_Check(v))
+    if (NyMutNodeSet_Check(v) && NHT_IS_HASHED(v)) {
+	if (ns->u.hashtable)
+	  r += sizeof(NyNodeHashTable) + (ns->u.hashtable->mask + 1) * sizeof(PyObject *);
+    } else if (NyMutNodeSet_Check(v))
 	r += anybitset_indisize(ns->u.bitset);
     return r;
 }
@@ -477,7 +692,18 @@ static int
 mutnodeset_gc_traverse(NyNodeSetObject *v, visitproc visit, void *arg)
 {
     int err = 0;
-    if (v->flags & NS_HOLDOBJECTS) {
+    if ((v->flags & NS_HOLDOBJECTS) && NHT_IS_HASHED(v)) {
+	/* No need for address order here */
+	NyNodeHashTable *ht = v->u.hashtable;
+	Py_ssize_t i;
+	for (i = 0; ht && i <= ht->mask; i++) {
+	    if (ht->table[i]) {
+		err = visit(ht->table[i], arg);
+		if (err)
+		  return err;
+	    }
+	}
+    } else if (v->flags & NS_HOLDOBJECTS) {
 	err = NyNodeSet_iterate(v, visit, arg);
 	if (err)
 	  return err;
@@ -528,7 +754,22 @@ NyNodeSet_iterate(NyNodeSetObject *ns, int (*visit)(PyObject *, void *),
     hia.ns = ns;
     hia.arg = arg;
     hia.visit = visit;
-    if (NyMutNodeSet_Check(ns)) {
+    if (NyMutNodeSet_Check(ns) && NHT_IS_HASHED(ns)) {
+	/* Iterate over a copy, in address order as for the other kinds,
+	   since the visitor may change the set. */
+	Py_ssize_t i, n = ns->ob_size;
+	PyObject **objs = nht_sorted(ns);
+	if (!objs)
+	  return -1;
+	for (i = 0; i < n; i++) {
+	    if (visit(objs[i], arg) == -1) {
+		PyMem_Del(objs);
+		return -1;
+	    }
+	}
+	PyMem_Del(objs);
+	return 0;
+    } else if (NyMutNodeSet_Check(ns)) {
 	return NyAnyBitSet_iterate(ns->u.bitset,
 				   (NySetVisitor)mutnodeset_iterate_visit,
 				   &hia);
@@ -554,7 +795,15 @@ mutnodeset_iter(NyNodeSetObject *v)
 	return 0;;
     }
 #endif
-    bitset_iter = v->u.bitset->ob_type->tp_iter(v->u.bitset);
+    if (NHT_IS_HASHED(v)) {
+	/* Iterate over a bitset copy, in address order */
+	PyObject *bitset = nodeset_bitset(v);
+	if (!bitset)
+	  return 0;
+	bitset_iter = bitset->ob_type->tp_iter(bitset);
+	Py_DECREF(bitset);
+    } else
+      bitset_iter = v->u.bitset->ob_type->tp_iter(v->u.bitset);
     if (!bitset_iter)
       return 0;
     iter = PyObject_New(NyMutNodeSetIterObject, &NyMutNodeSetIter_Type);
@@ -627,6 +876,9 @@ NyNodeSet_hasobj(NyNodeSetObject *v, PyObject *obj)
 	}
 	return 0;
 	
+    } else if (NHT_IS_HASHED(v)) {
+	NyNodeHashTable *ht = v->u.hashtable;
+	return ht->table[nht_lookup(ht, obj)] != 0;
     } else {
 	NyBit bitno = nodeset_obj_to_bitno(obj);
 	return NyMutBitSet_hasbit((NyMutBitSetObject *)v->u.bitset, bitno);
@@ -637,7 +889,23 @@ NyNodeSet_hasobj(NyNodeSetObject *v, PyObject *obj)
 int
 NyNodeSet_setobj(NyNodeSetObject *v, PyObject *obj)
 {
-    if (NyMutNodeSet_Check(v)) {
+    if (NyMutNodeSet_Check(v) && NHT_IS_HASHED(v)) {
+	NyNodeHashTable *ht = v->u.hashtable;
+	Py_ssize_t i = nht_lookup(ht, obj);
+	if (ht->table[i])
+	  return 1;
+	if ((v->ob_size + 1) * 3 > (ht->mask + 1) * 2) {
+	    if (nht_resize(ht, (ht->mask + 1) * 2) == -1)
+	      return -1;
+	    i = nht_lookup(ht, obj);
+	}
+	ht->table[i] = obj;
+	v->ob_size++;
+	if (v->flags & NS_HOLDOBJECTS) {
+	    Py_INCREF(obj);
+	}
+	return 0;
+    } else if (NyMutNodeSet_Check(v)) {
 	NyBit bitno = nodeset_obj_to_bitno(obj);
 	int r = NyMutBitSet_setbit((NyMutBitSetObject *)v->u.bitset, bitno);
 	if (r == -1)
@@ -659,7 +927,12 @@ NyNodeSet_setobj(NyNodeSetObject *v, PyObject *obj)
 int
 NyNodeSet_clear(NyNodeSetObject *v)
 {
-    if (NyMutNodeSet_Check(v) && v->u.bitset) {
+    if (NyMutNodeSet_Check(v) && NHT_IS_HASHED(v)) {
+	NyNodeHashTable *ht = nht_new();
+	if (!ht)
+	  return -1;
+	nht_replace(v, ht);
+    } else if (NyMutNodeSet_Check(v) && v->u.bitset) {
 	if (v->flags & NS_HOLDOBJECTS) {
 	    NyNodeSet_iterate(v, nodeset_dealloc_iter, v);
 	}
@@ -678,7 +951,18 @@ NyNodeSet_clear(NyNodeSetObject *v)
 int
 NyNodeSet_clrobj(NyNodeSetObject *v, PyObject *obj)
 {
-    if (NyMutNodeSet_Check(v)) {
+    if (NyMutNodeSet_Check(v) && NHT_IS_HASHED(v)) {
+	NyNodeHashTable *ht = v->u.hashtable;
+	Py_ssize_t i = nht_lookup(ht, obj);
+	if (!ht->table[i])
+	  return 0;
+	nht_delete(ht, i);
+	v->ob_size--;
+	if (v->flags & NS_HOLDOBJECTS) {
+	    Py_DECREF(obj);
+	}
+	return 1;
+    } else if (NyMutNodeSet_Check(v)) {
 	NyBit bitno = nodeset_obj_to_bitno(obj);
 	int r = NyMutBitSet_clrbit((NyMutBitSetObject *)v->u.bitset, bitno);
 	if (r == -1)
@@ -785,10 +1069,25 @@ nodeset_pop(NyNodeSetObject *v, PyObject *argnotused)
     if (!(NyMutNodeSet_Check(v))) {
 	PyErr_SetString(PyExc_TypeError, "pop: argument must be mutable");
 	return 0;
+    } else if (NHT_IS_HASHED(v)) {
+	/* The reference held by the set, if any, is passed to the caller */
+	NyNodeHashTable *ht = v->u.hashtable;
+	Py_ssize_t i;
+	for (i = 0; i <= ht->mask; i++) {
+	    PyObject *obj = ht->table[i];
+	    if (obj) {
+		nht_delete(ht, i);
+		v->ob_size--;
+		return obj;
+	    }
+	}
+	PyErr_SetString(PyExc_ValueError, "pop(): empty set");
+	return 0;
     } else {
 	long bitno = NyMutBitSet_pop((NyMutBitSetObject *)v->u.bitset, 0);
 	if (bitno == -1 && PyErr_Occurred())
 	  return 0;
+	v->ob_size--;
 	return nodeset_bitno_to_obj(bitno);
     }
 }
@@ -841,6 +1140,30 @@ nodeset_tac(NyNodeSetObject *v, PyObject *obj)
     return bool_from_int(NyNodeSet_clrobj(v, obj));
 }
 
+static char tobytes_doc[] =
+"S.tobytes() -> string\n"
+"\n"
+"Return the addresses of the elements of S, divided by their alignment,\n"
+"as a bitset encoded by ImmBitSet.tobytes(). It refers to no objects,\n"
+"so the addresses of nodesets from other processes or heap snapshots\n"
+"can be compared as bitsets after decoding with immbitset_frombytes().";
+
+static PyObject *
+nodeset_tobytes(NyNodeSetObject *v, PyObject *notused)
+{
+    PyObject *bs, *ibs, *r;
+    bs = nodeset_bitset(v);
+    if (!bs)
+      return 0;
+    ibs = NyMutBitSet_AsImmBitSet((NyMutBitSetObject *)bs);
+    Py_DECREF(bs);
+    if (!ibs)
+      return 0;
+    r = NyImmBitSet_AsBytes((NyImmBitSetObject *)ibs, NyBytes_NODES, ALIGN);
+    Py_DECREF(ibs);
+    return r;
+}
+
 typedef struct {
     NyNodeSetObject *ns;
     int i;
@@ -858,6 +1181,294 @@ nodeset_op_set(NyBit bitno, NSOPARG *arg)
 
 
 
+/* Cursors giving the nodes of any kind of nodeset in address order.
+
+   They let nodesets of different kinds be merged directly, walking the
+   sorted array of an immutable nodeset and the field tree of a bitset
+   side by side, instead of first converting them to bitsets. A hashed
+   nodeset is walked in a sorted copy of its table. */
+
+typedef struct {
+    NyNodeSetObject *ns;
+    PyObject **sorted;		/* Sorted copy of a hashed table, or 0 */
+    PyObject **node, **end;	/* Array position, or node == 0 for a bitset */
+    NySetField *sf, *end_sf;	/* Bitset position */
+    NyBitField *f, *end_f;
+    NyBits bits;		/* Bits of the current field not yet given */
+    NyBit bitno;		/* Bit number of the lowest bit in bits */
+} NSCursor;
+
+static void
+nsc_rewind(NSCursor *c)
+{
+    NyNodeSetObject *v = c->ns;
+    if (NyImmNodeSet_Check(v)) {
+	c->node = &v->u.nodes[0];
+	c->end = &v->u.nodes[v->ob_size];
+    } else if (c->sorted) {
+	c->node = c->sorted;
+	c->end = &c->sorted[v->ob_size];
+    } else {
+	NyUnionObject *root = ((NyMutBitSetObject *)v->u.bitset)->root;
+	c->node = 0;
+	c->sf = &root->ob_field[0];
+	c->end_sf = &root->ob_field[root->cur_size];
+	c->f = c->end_f = 0;
+	c->bits = 0;
+    }
+}
+
+static int
+nsc_init(NSCursor *c, NyNodeSetObject *v)
+{
+    c->ns = v;
+    c->sorted = 0;
+    if (NyMutNodeSet_Check(v) && NHT_IS_HASHED(v)) {
+	c->sorted = nht_sorted(v);
+	if (!c->sorted)
+	  return -1;
+    }
+    nsc_rewind(c);
+    return 0;
+}
+
+static void
+nsc_fini(NSCursor *c)
+{
+    if (c->sorted)
+      PyMem_Del(c->sorted);
+}
+
+/* The number of the lowest bit set in bits. Without the compiler builtin,
+   it is found by multiplying its mask with a de Bruijn sequence, which
+   avoids the unpredictable branches of a shift-and-test cascade. */
+
+#if defined(NyBits_CTZ)
+#define NSC_FIRST(bits) NyBits_CTZ(bits)
+#elif (NyBits_N==64)
+static const unsigned char nsc_first_tab[64] = {
+    0, 1, 48, 2, 57, 49, 28, 3, 61, 58, 50, 42, 38, 29, 17, 4,
+    62, 55, 59, 36, 53, 51, 43, 22, 45, 39, 33, 30, 24, 18, 12, 5,
+    63, 47, 56, 27, 60, 41, 37, 16, 54, 35, 52, 21, 44, 32, 23, 11,
+    46, 26, 40, 15, 34, 20, 31, 10, 25, 14, 19, 9, 13, 8, 7, 6
+};
+#define NSC_FIRST(bits) \
+    nsc_first_tab[(((bits) & -(bits)) * (NyBits)0x03f79d71b4cb0a89UL) >> 58]
+#elif (NyBits_N==32)
+static const unsigned char nsc_first_tab[32] = {
+    0, 1, 28, 2, 29, 14, 24, 3, 30, 22, 20, 15, 25, 17, 4, 8,
+    31, 27, 13, 23, 21, 19, 16, 7, 26, 12, 18, 6, 11, 5, 10, 9
+};
+#define NSC_FIRST(bits) \
+    nsc_first_tab[(((bits) & -(bits)) * (NyBits)0x077cb531UL) >> 27]
+#else
+#error "Unsupported NyBits_N"
+#endif
+
+/* Return the next node of a bitset cursor, or 0 at the end. */
+
+static PyObject *
+nsc_next_bit(NSCursor *c)
+{
+    NyBits bits = c->bits;
+    NyBit bitno;
+    while (!bits) {
+	if (c->f < c->end_f) {
+	    bits = c->f->bits;
+	    c->bitno = c->f->pos * NyBits_N;
+	    c->f++;
+	} else if (c->sf < c->end_sf) {
+	    c->f = c->sf->lo;
+	    c->end_f = c->sf->hi;
+	    c->sf++;
+	} else
+	  return 0;
+    }
+    bitno = c->bitno + NSC_FIRST(bits);
+    c->bits = bits & (bits - 1);
+    return nodeset_bitno_to_obj(bitno);
+}
+
+/* Return the next node, or 0 at the end. */
+
+#define NSC_NEXT(c) \
+    ((c)->node ? ((c)->node < (c)->end ? *(c)->node++ : 0) : nsc_next_bit(c))
+
+/* Take the next node in address order from the cursors cv and cw, which
+   have the next nodes a and b. Set pos to the node, and ina and inb to
+   whether it is in the set of cv and cw. */
+
+#define NSC_MERGE_STEP(cv, cw, a, b, pos, ina, inb)			\
+    if (a == b) {							\
+	pos = a; ina = 1; inb = 1;					\
+	a = NSC_NEXT(cv);						\
+	b = NSC_NEXT(cw);						\
+    } else if (a && (!b || (Py_uintptr_t)a < (Py_uintptr_t)b)) {	\
+	pos = a; ina = 1; inb = 0;					\
+	a = NSC_NEXT(cv);						\
+    } else {								\
+	pos = b; ina = 0; inb = 1;					\
+	b = NSC_NEXT(cw);						\
+    }
+
+static int
+nodeset_op_bits(int op, int a, int b)
+{
+    switch(op) {
+      case NyBits_AND:		return a & b;
+      case NyBits_OR:		return a | b;
+      case NyBits_XOR:		return a ^ b;
+      case NyBits_SUB:		return a & ~b;
+      default:			assert(0);
+				return 0;
+    }
+}
+
+/* Merge the nodes of cv and cw in address order, giving the nodes of the
+   result of op. If probed is not 0, it is looked up for each node of cv,
+   and cw should be empty. The nodes are stored from zf up to ze, or just
+   counted if zf is 0. Return the number of nodes. */
+
+static Py_ssize_t
+nsc_merge(NSCursor *cv, NSCursor *cw, int op, NyNodeSetObject *probed,
+	  PyObject **zf, PyObject **ze)
+{
+    Py_ssize_t z = 0;
+    PyObject *a = NSC_NEXT(cv);
+    PyObject *b = NSC_NEXT(cw);
+    PyObject *pos;
+    int ina, inb;
+    while (a || b) {
+	NSC_MERGE_STEP(cv, cw, a, b, pos, ina, inb);
+	if (probed)
+	  inb = NyNodeSet_hasobj(probed, pos);
+	if (nodeset_op_bits(op, ina, inb)) {
+	    if (zf) {
+		if (zf == ze)
+		  break;
+		*zf++ = pos;
+		Py_INCREF(pos);
+	    }
+	    z++;
+	}
+    }
+    return z;
+}
+
+/* A nodeset is probed for each node of the other operand, instead of
+   being merged with it, when it is this many times larger. */
+
+#define NS_PROBE_RATIO	32
+
+/* Return a new immutable nodeset with the result of v op w, for nodesets
+   of any kinds. */
+
+static NyNodeSetObject *
+nodeset_merge_op(NyNodeSetObject *v, NyNodeSetObject *w, int op)
+{
+    NyNodeSetObject *dst = 0;
+    NyNodeSetObject *probed = 0;
+    NSCursor cv, cw;
+    Py_ssize_t z;
+    if ((op == NyBits_AND || op == NyBits_SUB) &&
+	v->ob_size * NS_PROBE_RATIO < w->ob_size) {
+	/* Look up each node of v in w */
+	probed = w;
+    } else if (op == NyBits_AND && w->ob_size * NS_PROBE_RATIO < v->ob_size) {
+	probed = v;
+	v = w;
+    }
+    if (probed) {
+	w = NyImmNodeSet_New(0, v->_hiding_tag_);
+	if (!w)
+	  return 0;
+    } else
+      Py_INCREF(w);
+    if (nsc_init(&cv, v) == -1)
+      goto Err1;
+    if (nsc_init(&cw, w) == -1)
+      goto Err2;
+    z = nsc_merge(&cv, &cw, op, probed, 0, 0);
+    dst = NyImmNodeSet_New(z, v->_hiding_tag_);
+    if (!dst)
+      goto Err;
+    nsc_rewind(&cv);
+    nsc_rewind(&cw);
+    nsc_merge(&cv, &cw, op, probed, &dst->u.nodes[0], &dst->u.nodes[z]);
+  Err:
+    nsc_fini(&cw);
+  Err2:
+    nsc_fini(&cv);
+  Err1:
+    Py_DECREF(w);
+    return dst;
+}
+
+/* Whether v op= w is done by merging. The bitset of v is merged with
+   w, unless w is so small that it is cheaper to update v node by node. */
+
+static int
+nodeset_iop_merges(NyNodeSetObject *v, NyNodeSetObject *w, int op)
+{
+    return (NyNodeSet_Check(w) &&
+	    !NHT_IS_HASHED(v) &&
+	    !(NyMutNodeSet_Check(w) && NHT_IS_HASHED(w)) &&
+	    (w->flags & NS_HOLDOBJECTS) &&
+	    (op == NyBits_AND || w->ob_size * NS_PROBE_RATIO >= v->ob_size));
+}
+
+/* Do v op= w for a mutable nodeset v, merging it with w to find the
+   nodes to add and remove, then adding and removing them in address
+   order. */
+
+static PyObject *
+nodeset_iop_merge(NyNodeSetObject *v, NyNodeSetObject *w, int op)
+{
+    NSCursor cv, cw;
+    PyObject **buf, **add, **rem, **p;
+    PyObject *a, *b, *pos;
+    int ina, inb;
+    Py_ssize_t n = (op == NyBits_AND || op == NyBits_SUB) ? v->ob_size : w->ob_size;
+    /* Nodes to add are put from the start of buf, and to remove from its end */
+    buf = PyMem_New(PyObject *, n ? n : 1);
+    if (!buf)
+      return PyErr_NoMemory();
+    add = buf;
+    rem = buf + n;
+    if (nsc_init(&cv, v) == -1)
+      goto Err;
+    if (nsc_init(&cw, w) == -1) {
+	nsc_fini(&cv);
+	goto Err;
+    }
+    a = NSC_NEXT(&cv);
+    b = NSC_NEXT(&cw);
+    while (a || b) {
+	NSC_MERGE_STEP(&cv, &cw, a, b, pos, ina, inb);
+	if (nodeset_op_bits(op, ina, inb)) {
+	    if (!ina)
+	      *add++ = pos;
+	} else if (ina)
+	  *--rem = pos;
+    }
+    nsc_fini(&cw);
+    nsc_fini(&cv);
+    for (p = buf; p < add; p++) {
+	if (NyNodeSet_setobj(v, *p) == -1)
+	  goto Err;
+    }
+    for (p = buf + n - 1; p >= rem; p--) {
+	if (NyNodeSet_clrobj(v, *p) == -1)
+	  goto Err;
+    }
+    PyMem_Del(buf);
+    Py_INCREF(v);
+    return (PyObject *)v;
+  Err:
+    PyMem_Del(buf);
+    return 0;
+}
+
 static PyObject *
 nodeset_op(PyObject *vv, PyObject *ww, int op)
 {
@@ -892,6 +1503,13 @@ nodeset_op(PyObject *vv, PyObject *ww, int op)
 		goto err;
 	    }
 	}
+	if (!(NyMutNodeSet_Check(v) && NyMutNodeSet_Check(w) &&
+	      !NHT_IS_HASHED(v) && !NHT_IS_HASHED(w))) {
+	    /* Some operand is not a bitset, so merge them directly */
+	    ret = nodeset_merge_op(v, w, op);
+	    Py_DECREF(w);
+	    return (PyObject *)ret;
+	}
 	bsv = nodeset_bitset(v);
 	if (!bsv)
 	  goto err;
@@ -1026,6 +1644,8 @@ nodeset_iand(NyNodeSetObject *v, PyObject *w)
     if (!(NyMutNodeSet_Check(v))) {
 	return nodeset_and((PyObject *)v, w);
     }
+    if (nodeset_iop_merges(v, (NyNodeSetObject *)w, NyBits_AND))
+      return nodeset_iop_merge(v, (NyNodeSetObject *)w, NyBits_AND);
     ta.v = v;
     ta.w = (NyNodeSetObject *)w;
     if (!NyNodeSet_Check(w)) {
@@ -1057,6 +1677,8 @@ nodeset_isub(NyNodeSetObject *v, PyObject *w)
 {
     if (!(NyMutNodeSet_Check(v)))
       return nodeset_sub((PyObject *)v, w);
+    else if (nodeset_iop_merges(v, (NyNodeSetObject *)w, NyBits_SUB))
+      return nodeset_iop_merge(v, (NyNodeSetObject *)w, NyBits_SUB);
     else
       return nodeset_iop_chk_iterable(v, w, NyNodeSet_clrobj);
 }
@@ -1066,6 +1688,8 @@ nodeset_ixor(NyNodeSetObject *v, PyObject *w)
 {
     if (!(NyMutNodeSet_Check(v)))
       return nodeset_xor((PyObject *)v, w);
+    else if (nodeset_iop_merges(v, (NyNodeSetObject *)w, NyBits_XOR))
+      return nodeset_iop_merge(v, (NyNodeSetObject *)w, NyBits_XOR);
     else
       return nodeset_iop_chk_iterable(v, w, NyNodeSet_invobj);
 }
@@ -1075,6 +1699,8 @@ nodeset_ior(NyNodeSetObject *v, PyObject *w)
 {
     if (!(NyMutNodeSet_Check(v)))
       return nodeset_or((PyObject *)v, w);
+    else if (nodeset_iop_merges(v, (NyNodeSetObject *)w, NyBits_OR))
+      return nodeset_iop_merge(v, (NyNodeSetObject *)w, NyBits_OR);
     else
       return nodeset_iop_chk_iterable(v, w, NyNodeSet_setobj);
 }
@@ -1158,6 +1784,11 @@ static PySequenceMethods nodeset_as_sequence = {
 	0,					/* sq_inplace_repeat */
 };
 
+static PyMethodDef nodeset_methods[] = {
+	{"tobytes",	(PyCFunction)nodeset_tobytes, METH_NOARGS, tobytes_doc},
+	{NULL,		NULL}		/* sentinel */
+};
+
 static PyMethodDef mutnodeset_methods[] = {
 	{"add",		(PyCFunction)nodeset_add, METH_O, add_doc},
 	{"append",	(PyCFunction)nodeset_append, METH_O, append_doc},
@@ -1185,6 +1816,12 @@ nodeset_get_is_immutable(NyNodeSetObject *self, void *unused)
     return bool_from_int((NyImmNodeSet_Check(self)));
 }
 
+PyObject *
+mutnodeset_get_is_hashed(NyNodeSetObject *self, void *unused)
+{
+    return bool_from_int(NHT_IS_HASHED(self) != 0);
+}
+
 static  PyGetSetDef nodeset_getset[] = {
     {"is_immutable", (getter)nodeset_get_is_immutable, (setter)0,
 "S.is_immutable : bool\n"
@@ -1195,6 +1832,11 @@ static  PyGetSetDef nodeset_getset[] = {
 };
 
 static  PyGetSetDef mutnodeset_getset[] = {
+    {"is_hashed", (getter)mutnodeset_get_is_hashed, (setter)0,
+"S.is_hashed : bool\n"
+"\n"
+"True if S keeps its elements in an address hash table, else False\n"
+"when it keeps them in a bitset. See MutNodeSet."},
     {"is_immutable", (getter)nodeset_get_is_immutable, (setter)0,
 "S.is_immutable == False\n"
 "\n"
@@ -1234,7 +1876,7 @@ PyTypeObject NyNodeSet_Type = {
 	0,					/* tp_weaklistoffset */
 	0,					/* tp_iter */
 	0,					/* tp_iternext */
-	0,					/* tp_methods */
+	nodeset_methods,			/* tp_methods */
 	0,					/* tp_members */
 	nodeset_getset,				/* tp_getset */
 	0,					/* tp_base */
@@ -1299,6 +1941,230 @@ PyTypeObject NyMutNodeSet_Type = {
 };
 
 
+/* Unions and intersections of many nodesets at once */
+
+/* Return a new list of the nodesets of iterable, making immutable nodesets
+   of the items that are not nodesets. */
+
+static PyObject *
+nodesets_list(PyObject *iterable, PyObject *hiding_tag)
+{
+    PyObject *list = PySequence_List(iterable);
+    Py_ssize_t i;
+    if (!list)
+      return 0;
+    for (i = 0; i < PyList_GET_SIZE(list); i++) {
+	PyObject *x = PyList_GET_ITEM(list, i);
+	if (!NyNodeSet_Check(x)) {
+	    x = (PyObject *)NyImmNodeSet_SubtypeNewIterable(&NyImmNodeSet_Type,
+							    x, hiding_tag);
+	    if (!x) {
+		Py_DECREF(list);
+		return 0;
+	    }
+	    PyList_SetItem(list, i, x);
+	}
+    }
+    return list;
+}
+
+typedef struct {
+    PyObject *node;		/* Next node of the cursor */
+    NSCursor *c;
+} NSHeapItem;
+
+static void
+ns_heap_sift(NSHeapItem *h, Py_ssize_t n, Py_ssize_t i)
+{
+    NSHeapItem x = h[i];
+    for (;;) {
+	Py_ssize_t j = 2 * i + 1;
+	if (j >= n)
+	  break;
+	if (j + 1 < n && (Py_uintptr_t)h[j + 1].node < (Py_uintptr_t)h[j].node)
+	  j++;
+	if ((Py_uintptr_t)x.node <= (Py_uintptr_t)h[j].node)
+	  break;
+	h[i] = h[j];
+	i = j;
+    }
+    h[i] = x;
+}
+
+/* Return a new immutable nodeset with the n nodes at nodes. */
+
+static NyNodeSetObject *
+immnodeset_from_nodes(PyObject **nodes, Py_ssize_t n, PyObject *hiding_tag)
+{
+    NyNodeSetObject *dst = NyImmNodeSet_New(n, hiding_tag);
+    Py_ssize_t i;
+    if (!dst)
+      return 0;
+    for (i = 0; i < n; i++) {
+	dst->u.nodes[i] = nodes[i];
+	Py_INCREF(nodes[i]);
+    }
+    return dst;
+}
+
+/* The union is made by merging all the nodesets in one pass, taking the
+   next node from a heap of their cursors. */
+
+NyNodeSetObject *
+NyNodeSet_union_many(PyObject *iterable, PyObject *hiding_tag)
+{
+    PyObject *list = nodesets_list(iterable, hiding_tag);
+    NyNodeSetObject *dst = 0;
+    NSCursor *cs = 0;
+    NSHeapItem *heap = 0;
+    PyObject **nodes = 0;
+    Py_ssize_t i, k, n, z, ninit = 0;
+    if (!list)
+      return 0;
+    k = PyList_GET_SIZE(list);
+    n = 0;
+    for (i = 0; i < k; i++)
+      n += ((NyNodeSetObject *)PyList_GET_ITEM(list, i))->ob_size;
+    cs = PyMem_New(NSCursor, k ? k : 1);
+    heap = PyMem_New(NSHeapItem, k ? k : 1);
+    nodes = PyMem_New(PyObject *, n ? n : 1);
+    if (!(cs && heap && nodes)) {
+	PyErr_NoMemory();
+	goto Err;
+    }
+    for (ninit = 0; ninit < k; ninit++) {
+	if (nsc_init(&cs[ninit], (NyNodeSetObject *)PyList_GET_ITEM(list, ninit)) == -1)
+	  goto Err;
+    }
+    n = 0;
+    for (i = 0; i < k; i++) {
+	heap[n].c = &cs[i];
+	heap[n].node = NSC_NEXT(&cs[i]);
+	if (heap[n].node)
+	  n++;
+    }
+    for (i = n / 2 - 1; i >= 0; i--)
+      ns_heap_sift(heap, n, i);
+    z = 0;
+    while (n) {
+	PyObject *node = heap[0].node;
+	if (!z || nodes[z - 1] != node)
+	  nodes[z++] = node;
+	heap[0].node = NSC_NEXT(heap[0].c);
+	if (!heap[0].node)
+	  heap[0] = heap[--n];
+	ns_heap_sift(heap, n, 0);
+    }
+    dst = immnodeset_from_nodes(nodes, z, hiding_tag);
+  Err:
+    if (cs) {
+	for (i = 0; i < ninit; i++)
+	  nsc_fini(&cs[i]);
+    }
+    PyMem_Del(cs);
+    PyMem_Del(heap);
+    PyMem_Del(nodes);
+    Py_DECREF(list);
+    return dst;
+}
+
+static int
+nodeset_cmp_size(const void *a, const void *b)
+{
+    Py_ssize_t x = (*(NyNodeSetObject **)a)->ob_size;
+    Py_ssize_t y = (*(NyNodeSetObject **)b)->ob_size;
+    return x < y ? -1 : x > y;
+}
+
+/* The intersection is made by looking up each node of the smallest
+   nodeset in the others, from the smallest to the largest. */
+
+NyNodeSetObject *
+NyNodeSet_intersection_many(PyObject *iterable, PyObject *hiding_tag)
+{
+    PyObject *list = nodesets_list(iterable, hiding_tag);
+    NyNodeSetObject *dst = 0;
+    NyNodeSetObject **sets;
+    PyObject **nodes = 0;
+    PyObject *node;
+    NSCursor c;
+    Py_ssize_t i, k, z;
+    if (!list)
+      return 0;
+    k = PyList_GET_SIZE(list);
+    if (!k) {
+	PyErr_SetString(PyExc_ValueError,
+			"intersection of no nodesets");
+	goto Err;
+    }
+    sets = (NyNodeSetObject **)&PyList_GET_ITEM(list, 0);
+    qsort(sets, k, sizeof(*sets), nodeset_cmp_size);
+    nodes = PyMem_New(PyObject *, sets[0]->ob_size ? sets[0]->ob_size : 1);
+    if (!nodes) {
+	PyErr_NoMemory();
+	goto Err;
+    }
+    if (nsc_init(&c, sets[0]) == -1)
+      goto Err;
+    z = 0;
+    while ((node = NSC_NEXT(&c))) {
+	for (i = 1; i < k; i++) {
+	    if (!NyNodeSet_hasobj(sets[i], node))
+	      break;
+	}
+	if (i == k)
+	  nodes[z++] = node;
+    }
+    nsc_fini(&c);
+    dst = immnodeset_from_nodes(nodes, z, hiding_tag);
+  Err:
+    PyMem_Del(nodes);
+    Py_DECREF(list);
+    return dst;
+}
+
+static char immnodeset_union_doc[] =
+"immnodeset_union(iterable [, hiding_tag]) -> ImmNodeSet\n"
+"\n"
+"Return an immutable nodeset which is the union of all nodesets in\n"
+"iterable. Items that are not nodesets may be other iterables of\n"
+"objects. The nodesets are merged all at once, so the time is linear in\n"
+"their total size, times the logarithm of their number.";
+
+static PyObject *
+immnodeset_union(PyObject *unused, PyObject *args)
+{
+    PyObject *iterable, *hiding_tag = 0;
+    if (!PyArg_ParseTuple(args, "O|O:immnodeset_union", &iterable, &hiding_tag))
+      return 0;
+    return (PyObject *)NyNodeSet_union_many(iterable, hiding_tag);
+}
+
+static char immnodeset_intersection_doc[] =
+"immnodeset_intersection(iterable [, hiding_tag]) -> ImmNodeSet\n"
+"\n"
+"Return an immutable nodeset which is the intersection of all nodesets\n"
+"in iterable, which must not be empty. Items that are not nodesets may\n"
+"be other iterables of objects.";
+
+static PyObject *
+immnodeset_intersection(PyObject *unused, PyObject *args)
+{
+    PyObject *iterable, *hiding_tag = 0;
+    if (!PyArg_ParseTuple(args, "O|O:immnodeset_intersection", &iterable, &hiding_tag))
+      return 0;
+    return (PyObject *)NyNodeSet_intersection_many(iterable, hiding_tag);
+}
+
+static PyMethodDef nynodeset_methods[] =
+{
+    {"immnodeset_union", (PyCFunction)immnodeset_union, METH_VARARGS,
+     immnodeset_union_doc},
+    {"immnodeset_intersection", (PyCFunction)immnodeset_intersection, METH_VARARGS,
+     immnodeset_intersection_doc},
+    {0}
+};
+
 static NyNodeSet_Exports nynodeset_exports = {
     0,
     sizeof(NyNodeSet_Exports),
@@ -1314,7 +2180,7 @@ static NyNodeSet_Exports nynodeset_exports = {
     NyNodeSet_clrobj,
     NyNodeSet_hasobj,
     NyNodeSet_iterate,
-    
+    NyMutNodeSet_NewFlagsHiding,
     
 };
 
@@ -1353,6 +2219,8 @@ int fsb_dx_nynodeset_init(PyObject *m)
     if (PyDict_SetItemString(d, "ImmNodeSet",
 			 (PyObject *)&NyImmNodeSet_Type) == -1)
       goto Error;
+    if (fsb_dx_addmethods(m, nynodeset_methods, 0) == -1)
+      goto Error;
     return 0;
   Error:
     return -1;
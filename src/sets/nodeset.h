@@ -4,6 +4,14 @@
 /* Flags for NyNodeSetObject */
 
 #define NS_HOLDOBJECTS	1       /* Only to be cleared in special case with mutable nodeset. */
+#define NS_HASHED	2	/* Mutable nodeset using an address hash table, not a bitset. */
+
+/* Open addressing table of the objects in a hashed mutable nodeset */
+
+typedef struct {
+    Py_ssize_t mask;		/* Number of slots - 1, the number of slots is a power of 2 */
+    PyObject **table;		/* The slots, NULL if empty */
+} NyNodeHashTable;
 
 typedef struct {
     PyObject_VAR_HEAD
@@ -11,6 +19,7 @@ typedef struct {
     PyObject *_hiding_tag_;
     union {
 	PyObject *bitset;	/* If mutable type, a mutable bitset with addresses (divided). */
+	NyNodeHashTable *hashtable; /* If mutable type with flag NS_HASHED, instead of bitset. */
 	PyObject *nodes[1];	/* If immutable type, the start of node array, in address order. */
     } u;
 } NyNodeSetObject;
@@ -18,6 +27,7 @@ typedef struct {
 NyNodeSetObject *NyMutNodeSet_New(void);
 NyNodeSetObject *NyMutNodeSet_NewFlags(int flags);
 NyNodeSetObject *NyMutNodeSet_NewHiding(PyObject *hiding_tag);
+NyNodeSetObject *NyMutNodeSet_NewFlagsHiding(int flags, PyObject *hiding_tag);
 
 int NyNodeSet_setobj(NyNodeSetObject *v, PyObject *obj);
 int NyNodeSet_clrobj(NyNodeSetObject *v, PyObject *obj);
@@ -49,6 +59,7 @@ typedef struct {
     int (*iterate)(NyNodeSetObject *ns,
 		   int (*visit)(PyObject *, void *),
 		   void *arg);
+    NyNodeSetObject *(*newMutFlagsHiding)(int flags, PyObject *tag);
 } NyNodeSet_Exports;
 
 #endif /* Ny_NODESETOBJECT_H */
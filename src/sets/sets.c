@@ -24,6 +24,13 @@ char sets_doc[] =
 "    immbit              Immutable bitset singleton constructor.\n"
 "    immbitrange         Immutable bitset range constructor.\n"
 "    immbitset           Immutable bitset constructor.\n"
+"    immbitset_frombytes Bitset from a string made by tobytes().\n"
+"    immbitset_intersection\n"
+"                        Intersection of many bitsets.\n"
+"    immbitset_union     Union of many bitsets.\n"
+"    immnodeset_intersection\n"
+"                        Intersection of many nodesets.\n"
+"    immnodeset_union    Union of many nodesets.\n"
 "\n"
 "Data\n"
 "    NyBitSet_Exports,\n"
@@ -66,6 +73,7 @@ int fsb_dx_addmethods(PyObject *m, PyMethodDef *methods, PyObject *passthrough)
 
 static NyHeapDef nysets_heapdefs[] = {
     {0, 0, (NyHeapDef_SizeGetter) mutbitset_indisize},
+    {0, 0, (NyHeapDef_SizeGetter) immbitset_indisize},
     {0, 0, 0, cplbitset_traverse},
     {0, 0, nodeset_indisize,  nodeset_traverse, nodeset_relate},
     {0}
@@ -80,8 +88,9 @@ INITFUNC (void)
     PyObject *d;
 
     nysets_heapdefs[0].type = &NyMutBitSet_Type;
-    nysets_heapdefs[1].type = &NyCplBitSet_Type;
-    nysets_heapdefs[2].type = &NyNodeSet_Type;
+    nysets_heapdefs[1].type = &NyImmBitSet_Type;
+    nysets_heapdefs[2].type = &NyCplBitSet_Type;
+    nysets_heapdefs[3].type = &NyNodeSet_Type;
 
     m = Py_InitModule(MODNAME, module_methods);
     if (!m)
@@ -19,6 +19,20 @@ NyImmBitSetObject *NyImmBitSet_New(NyBit size);
 NyCplBitSetObject *NyCplBitSet_New(NyImmBitSetObject *v);
 NyMutBitSetObject *NyMutBitSet_New(void);
 
+/* Compiler builtins for the number of trailing and leading zero bits of a
+   nonzero NyBits word, and for its number of bits set. The popcount
+   builtin is only used where it is a machine instruction, since it is
+   otherwise a table lookup. Portable code is used where they are not
+   defined. */
+
+#if defined(__GNUC__) && (__GNUC__ > 3 || (__GNUC__ == 3 && __GNUC_MINOR__ >= 4))
+#define NyBits_CTZ(bits)	__builtin_ctzl(bits)
+#define NyBits_CLZ(bits)	__builtin_clzl(bits)
+#if defined(__POPCNT__)
+#define NyBits_POPCOUNT(bits)	__builtin_popcountl(bits)
+#endif
+#endif
+
 typedef int (*NySetVisitor)(NyBit, void *) ;
 
 typedef int (*NyIterableVisitor)(PyObject *, void *);
@@ -48,10 +62,18 @@ extern int NyMutBitSet_setbit(NyMutBitSetObject *v, NyBit bit);
 extern int NyMutBitSet_hasbit(NyMutBitSetObject *v, NyBit bit);
 extern int NyImmBitSet_hasbit(NyImmBitSetObject *v, NyBit bit);
 
+/* Flags of the encoding made by NyImmBitSet_AsBytes */
+
+#define NyBytes_CPL	1	/* The bitset is complemented */
+#define NyBytes_NODES	2	/* The bits are node addresses / alignment */
+
+extern PyObject *NyImmBitSet_AsBytes(NyImmBitSetObject *v, int flags, NyBit align);
+
 extern int NyMutBitSet_clear(NyMutBitSetObject *v);
 extern long NyMutBitSet_pop(NyMutBitSetObject *v, NyBit i);
 
 int cplbitset_traverse(NyHeapTraverse *ta);
+int immbitset_indisize(NyImmBitSetObject *v);
 int mutbitset_indisize(NyMutBitSetObject *v);
 int anybitset_indisize(PyObject *obj);
 int generic_indisize(PyObject *v);